@@ -56,6 +56,7 @@ def default_config():
         "actions": [],
         "debug_rules": False,
         "rule_optimizer": True,
+        "event_workers": 0,
         "log_level": {
             "cmk.mkeventd": cmk.utils.log.INFO,
             "cmk.mkeventd.EventServer": cmk.utils.log.INFO,
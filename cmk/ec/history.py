@@ -25,6 +25,7 @@
 # Boston, MA 02110-1301 USA.
 
 import os
+import sqlite3
 import string
 import subprocess
 import threading
@@ -48,6 +49,7 @@ class History(object):
         self._history_columns = history_columns
         self._lock = threading.Lock()
         self._mongodb = MongoDB()
+        self._sqlite = SQLite()
         self._active_history_period = ActiveHistoryPeriod()
         self.reload_configuration(config)
 
@@ -55,29 +57,39 @@ class History(object):
         self._config = config
         if self._config['archive_mode'] == 'mongodb':
             _reload_configuration_mongodb(self)
+        elif self._config['archive_mode'] == 'sqlite':
+            _reload_configuration_sqlite(self)
         else:
             _reload_configuration_files(self)
 
     def flush(self):
         if self._config['archive_mode'] == 'mongodb':
             _flush_mongodb(self)
+        elif self._config['archive_mode'] == 'sqlite':
+            _flush_sqlite(self)
         else:
             _flush_files(self)
 
     def add(self, event, what, who="", addinfo=""):
         if self._config['archive_mode'] == 'mongodb':
             _add_mongodb(self, event, what, who, addinfo)
+        elif self._config['archive_mode'] == 'sqlite':
+            _add_sqlite(self, event, what, who, addinfo)
         else:
             _add_files(self, event, what, who, addinfo)
 
     def get(self, query):
         if self._config['archive_mode'] == 'mongodb':
             return _get_mongodb(self, query)
+        if self._config['archive_mode'] == 'sqlite':
+            return _get_sqlite(self, query)
         return _get_files(self, self._logger, query)
 
     def housekeeping(self):
         if self._config['archive_mode'] == 'mongodb':
             _housekeeping_mongodb(self)
+        elif self._config['archive_mode'] == 'sqlite':
+            _housekeeping_sqlite(self)
         else:
             _housekeeping_files(self)
 
@@ -286,6 +298,238 @@ def _get_mongodb(history, query):
     return history_entries
 
 
+#.
+#   .--SQLite--------------------------------------------------------------.
+#   |                   ____   ___  _     _ _                              |
+#   |                  / ___| / _ \| |   (_) |_ ___                        |
+#   |                  \___ \| | | | |   | | __/ _ \                       |
+#   |                   ___) | |_| | |___| | ||  __/                       |
+#   |                  |____/ \__\_\_____|_|\__\___|                       |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | The Event Log Archive can be stored in a local SQLite database. It   |
+#   | has indexes on the frequently filtered columns and evaluates most    |
+#   | filters and the limit of a query in the database.                    |
+#   '----------------------------------------------------------------------'
+
+
+class SQLite(object):
+    def __init__(self):
+        super(SQLite, self).__init__()
+        self.connection = None
+
+
+# The database has one column for each column of the history table, with the
+# same name. These columns contain tuples or None, which are stored in the
+# format of the history files. Filters on them are only evaluated in Python.
+_SQLITE_SPLIT_COLUMNS = {
+    "event_match_groups",
+    "event_contact_groups",
+    "event_match_groups_syslog_application",
+}
+
+_SQLITE_INDEXED_COLUMNS = [
+    "history_time",
+    "event_id",
+    "event_host",
+    "event_rule_id",
+    "event_application",
+]
+
+_SQLITE_OPERATORS = {
+    "=": "%s = ?",
+    ">": "%s > ?",
+    "<": "%s < ?",
+    ">=": "%s >= ?",
+    "<=": "%s <= ?",
+}
+
+# Increase this when the database has to be converted on startup
+_SQLITE_SCHEMA_VERSION = 1
+
+
+def _reload_configuration_sqlite(history):
+    with history._lock:
+        if history._sqlite.connection is None:
+            history._sqlite.connection = _connect_sqlite(history)
+
+
+def _connect_sqlite(history):
+    path = history._settings.paths.history_database_file.value
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The connection is shared between the threads, but only used with the lock held
+    connection = sqlite3.connect(str(path), check_same_thread=False)
+    # With the write-ahead log, a commit does not need to sync the database file.
+    # After a crash, at most the last commits may be lost, like with the history files.
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+
+    connection.execute("CREATE TABLE IF NOT EXISTS history (%s)" % ", ".join(
+        _sqlite_column_definition(name, default) for name, default in history._history_columns))
+    existing_columns = {row[1] for row in connection.execute("PRAGMA table_info(history)")}
+    for name, default in history._history_columns:
+        if name not in existing_columns:  # Column added in a newer version
+            connection.execute(
+                "ALTER TABLE history ADD COLUMN %s" % _sqlite_column_definition(name, default))
+    for name in _SQLITE_INDEXED_COLUMNS:
+        connection.execute("CREATE INDEX IF NOT EXISTS history_%s ON history (%s)" % (name, name))
+
+    if connection.execute("PRAGMA user_version").fetchone()[0] < _SQLITE_SCHEMA_VERSION:
+        # A new database, or the import of the history files has been interrupted
+        connection.execute("DELETE FROM history")
+        _import_history_files(history, connection)
+        connection.commit()
+        connection.execute("PRAGMA user_version=%d" % _SQLITE_SCHEMA_VERSION)
+    return connection
+
+
+def _sqlite_column_definition(name, default):
+    if name == "history_line":
+        return "history_line INTEGER PRIMARY KEY AUTOINCREMENT"
+    if name in _SQLITE_SPLIT_COLUMNS or isinstance(default, six.string_types):
+        return "%s TEXT" % name
+    if isinstance(default, float):
+        return "%s REAL" % name
+    return "%s INTEGER" % name
+
+
+# Copy the entries of the history files into the database, oldest first. The
+# files are kept, they are deleted after the history lifetime as usual.
+def _import_history_files(history, connection):
+    paths = sorted(((int(str(path.name)[:-4]), path)
+                    for path in history._settings.paths.history_dir.value.glob('*.log')))
+    columns = [name for name, _default in history._history_columns[1:]]
+    statement = "INSERT INTO history (%s) VALUES (%s)" % (", ".join(columns), ", ".join(
+        "?" * len(columns)))
+    num_entries = 0
+    for _timestamp, path in paths:
+        with path.open(mode="rb") as f:
+            for line in f:
+                try:
+                    values = line.decode('utf-8').rstrip('\n').split('\t')
+                    _convert_history_line(history, values)
+                except Exception as e:
+                    history._logger.exception(
+                        "Invalid line '%s' in history file %s: %s" % (line, path, e))
+                    continue
+                connection.execute(statement, _sqlite_values(history, values))
+                num_entries += 1
+    if paths:
+        history._logger.info(
+            "Imported %d entries of %d history files into %s" %
+            (num_entries, len(paths), history._settings.paths.history_database_file.value))
+
+
+def _sqlite_values(history, values):
+    sqlite_values = []
+    for (name, _default), value in zip(history._history_columns[1:], values):
+        if name in _SQLITE_SPLIT_COLUMNS:
+            value = quote_tab(value)
+        if isinstance(value, str):
+            value = value.decode("utf-8", "replace")
+        sqlite_values.append(value)
+    return sqlite_values
+
+
+def _flush_sqlite(history):
+    with history._lock:
+        history._sqlite.connection.execute("DELETE FROM history")
+        history._sqlite.connection.commit()
+    _expire_logfiles(history._settings, history._config, history._logger, history._lock, True)
+
+
+def _housekeeping_sqlite(history):
+    with history._lock:
+        try:
+            min_time = time.time() - history._config["history_lifetime"] * 86400
+            cursor = history._sqlite.connection.execute(
+                "DELETE FROM history WHERE history_time < ?", (min_time,))
+            history._sqlite.connection.commit()
+            if cursor.rowcount:
+                history._logger.info("Deleted %d history entries older than %s" %
+                                     (cursor.rowcount, cmk.utils.render.date_and_time(min_time)))
+        except Exception as e:
+            if history._settings.options.debug:
+                raise
+            history._logger.exception("Error expiring history entries: %s" % e)
+    # Imported history files are not used anymore, but they still need to expire
+    _expire_logfiles(history._settings, history._config, history._logger, history._lock, False)
+
+
+def _add_sqlite(history, event, what, who, addinfo):
+    _log_event(history._config, history._logger, event, what, who, addinfo)
+    values = [time.time(), scrub_string(what), scrub_string(who), scrub_string(addinfo)]
+    values += [event.get(colname[6:], defval) for colname, defval in history._event_columns]
+    with history._lock:
+        history._sqlite.connection.execute(
+            "INSERT INTO history (%s) VALUES (%s)" % (", ".join(
+                name for name, _default in history._history_columns[1:]), ", ".join(
+                    "?" * len(values))), _sqlite_values(history, values))
+        history._sqlite.connection.commit()
+
+
+def _get_sqlite(history, query):
+    conditions, arguments = [], []
+    all_filters_in_database = True
+    for column_name, operator_name, _predicate, argument in query.filters:
+        condition = _sqlite_condition(column_name, operator_name, argument)
+        if condition is None:
+            all_filters_in_database = False
+        else:
+            conditions.append(condition[0])
+            arguments += condition[1]
+
+    statement = "SELECT %s FROM history" % ", ".join(
+        name for name, _default in history._history_columns)
+    if conditions:
+        statement += " WHERE " + " AND ".join(conditions)
+    statement += " ORDER BY history_line DESC"
+    if query.limit is not None and all_filters_in_database:
+        statement += " LIMIT %d" % query.limit
+    history._logger.debug("History query: %s %r", statement, arguments)
+
+    history_entries = []
+    with history._lock:
+        for row in history._sqlite.connection.execute(statement, arguments):
+            values = list(row)
+            for index, (name, _default) in enumerate(history._history_columns):
+                if name in _SQLITE_SPLIT_COLUMNS:
+                    values[index] = _unsplit(values[index])
+            values[28] = bool(values[28])  # event_host_in_downtime
+
+            if all_filters_in_database or query.filter_row(values):
+                history_entries.append(values)
+                if query.limit is not None and len(history_entries) >= query.limit:
+                    break
+
+    return history_entries
+
+
+# Returns the SQL condition and its arguments for a filter, or None when the
+# filter can not be evaluated by the database in exactly the same way as by
+# the Python predicate of the query.
+def _sqlite_condition(column_name, operator_name, argument):
+    if column_name in _SQLITE_SPLIT_COLUMNS or column_name == "event_host_in_downtime":
+        return None
+
+    if operator_name == "in":
+        arguments = [_sqlite_argument(a) for a in argument]
+        if not arguments:
+            return "0", []
+        return "%s IN (%s)" % (column_name, ", ".join("?" * len(arguments))), arguments
+
+    try:
+        return _SQLITE_OPERATORS[operator_name] % column_name, [_sqlite_argument(argument)]
+    except KeyError:
+        return None
+
+
+def _sqlite_argument(argument):
+    if isinstance(argument, str):
+        return argument.decode("utf-8")
+    return argument
+
+
 #.
 #   .--History-------------------------------------------------------------.
 #   |                   _   _ _     _                                      |
@@ -33,19 +33,26 @@
 
 import abc
 import ast
+import collections
 import errno
 import json
+import logging
+import marshal
+import multiprocessing
+import multiprocessing.pool  # pylint: disable=unused-import
 import os
 import pprint
 import re
 import select
 import signal
 import socket
+import sre_constants
+import sre_parse
 import sys
 import threading
 import time
 import traceback
-from typing import Any, Dict, List, Optional, Tuple, Union  # pylint: disable=unused-import
+from typing import Any, Dict, List, Optional, Set, Tuple, Union  # pylint: disable=unused-import
 
 import pathlib2 as pathlib
 import six
@@ -569,6 +576,11 @@ class Perfcounters(object):
         "connects",
     ]
 
+    # Current values, e.g. the number of received but not yet processed inputs
+    _gauge_names = [
+        "input_queue_length",
+    ]
+
     # Average processing times
     _weights = {
         "processing": 0.99,  # event processing
@@ -583,6 +595,7 @@ class Perfcounters(object):
 
         # Initialize counters
         self._counters = dict([(n, 0) for n in self._counter_names])
+        self._gauges = dict([(n, 0) for n in self._gauge_names])
 
         self._old_counters = {}
         self._rates = {}
@@ -592,9 +605,13 @@ class Perfcounters(object):
 
         self._logger = logger.getChild("Perfcounters")
 
-    def count(self, counter):
+    def count(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def set_gauge(self, gauge, value):
         with self._lock:
-            self._counters[counter] += 1
+            self._gauges[gauge] = value
 
     def count_time(self, counter, ptime):
         with self._lock:
@@ -636,6 +653,9 @@ class Perfcounters(object):
         for name in cls._weights:
             columns.append(("status_average_%s_time" % name, 0.0))
 
+        for name in cls._gauge_names:
+            columns.append(("status_" + name, 0))
+
         return columns
 
     def get_status(self):
@@ -650,6 +670,9 @@ class Perfcounters(object):
             for name in self._weights:
                 row.append(self._times.get(name, 0.0))
 
+            for name in self._gauge_names:
+                row.append(self._gauges[name])
+
             return row
 
 
@@ -665,6 +688,50 @@ class Perfcounters(object):
 #   |  Verarbeitung und Klassifizierung von eingehenden Events.            |
 #   '----------------------------------------------------------------------'
 
+# The event server of a worker process. The workers are forked from the event
+# server, which is passed to them when they are started.
+_worker_event_server = None  # type: Optional[EventServer]
+
+
+def _initialize_event_worker(event_server, matching_state):
+    global _worker_event_server
+    # The configuration may have been reloaded between taking the snapshot of
+    # the rules and forking the worker. Always use the snapshot.
+    event_server.__dict__.update(matching_state)
+    _worker_event_server = event_server
+    _reinitialize_logging_locks()
+
+    # Terminating the workers is up to the event server, don't use the handlers
+    # of the main process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for signum in [signal.SIGHUP, signal.SIGINT, signal.SIGQUIT]:
+        signal.signal(signum, signal.SIG_IGN)
+
+
+# Other threads of the event daemon may have held the locks of the logging
+# module while a worker was forked. They would never be released in the worker.
+def _reinitialize_logging_locks():
+    logging._lock = threading.RLock()  # pylint: disable=protected-access
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.itervalues()
+        if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        for handler in logger.handlers:
+            handler.createLock()
+
+
+def _create_and_match_events(lines):
+    results = []
+    for line, address in lines:
+        try:
+            results.append(_worker_event_server.create_and_match_event(line, address))
+        except Exception as e:
+            _worker_event_server._logger.exception(
+                'Exception handling a log line (skipping this one): %s' % e)
+            results.append(None)
+    return results
+
 
 class EventServer(ECServerThread):
     month_names = {
@@ -682,6 +749,17 @@ class EventServer(ECServerThread):
         "Dec": 12,
     }
 
+    # Maximum number of bytes read from a stream at once
+    _read_size = 65536
+    # Maximum number of datagrams received from a UDP socket in one loop iteration
+    _max_datagrams = 1000
+    # Maximum number of lines sent to a worker process at once
+    _max_worker_chunk_size = 100
+    # Maximum number of seconds to wait for the results of one chunk of lines.
+    # When a worker has died, e.g. because it has been killed, its chunk is
+    # never finished.
+    _worker_timeout = 10
+
     def __init__(self, logger, settings, config, slave_status, perfcounters, lock_configuration,
                  history, event_status, event_columns):
         super(EventServer, self).__init__(
@@ -695,8 +773,15 @@ class EventServer(ECServerThread):
         self._syslog = None
         self._syslog_tcp = None
         self._snmptrap = None
+        self._spool_files = collections.deque()  # type: collections.deque
+        self._last_spool_dir_scan = 0.0
+        self._worker_pool = None  # type: Optional[multiprocessing.pool.Pool]
+        self._worker_rules = None  # type: Optional[List[Dict[str, Any]]]
+        self._worker_rule_by_id = {}  # type: Dict[str, Dict[str, Any]]
+        self._num_workers = 0
 
         self._rules = []
+        self._rule_prefilter = RulePrefilter([])
         self._hash_stats = []
         for _unused_facility in xrange(32):
             self._hash_stats.append([0] * 8)
@@ -824,6 +909,10 @@ class EventServer(ECServerThread):
                 self._syslog.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self._syslog.bind(("0.0.0.0", endpoint.value))
                 self._logger.info("Opened builtin syslog server on UDP port %d" % endpoint.value)
+            if self._syslog is not None:
+                # Give bursts of messages some room while the rules are being processed.
+                # The kernel limits this to net.core.rmem_max.
+                self._syslog.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
         except Exception as e:
             raise Exception("Cannot start builtin syslog server: %s" % e)
 
@@ -887,50 +976,40 @@ class EventServer(ECServerThread):
     def serve(self):
         pipe_fragment = ''
         pipe = self.open_pipe()
-        listen_list = [pipe]
-
-        # Wait for incoming syslog packets via UDP
-        if self._syslog is not None:
-            listen_list.append(self._syslog.fileno())
-
-        # Wait for new connections for events via TCP socket
-        if self._syslog_tcp is not None:
-            listen_list.append(self._syslog_tcp)
+        poller = select.epoll()
+        poller.register(pipe, select.EPOLLIN)
 
-        # Wait for new connections for events via unix socket
-        if self._eventsocket:
-            listen_list.append(self._eventsocket)
-
-        # Wait for incomding SNMP traps
-        if self._snmptrap is not None:
-            listen_list.append(self._snmptrap.fileno())
+        # Wait for incoming syslog packets via UDP, for new connections for
+        # events via TCP and unix socket and for incoming SNMP traps
+        for listening_socket in [self._syslog, self._syslog_tcp, self._eventsocket, self._snmptrap]:
+            if listening_socket is not None:
+                poller.register(listening_socket.fileno(), select.EPOLLIN)
 
         # Keep list of client connections via UNIX socket and
         # read data that is not yet processed. Map from
         # fd to (fileobject, data)
         client_sockets = {}
-        select_timeout = 1
         while not self._terminate_event.is_set():
+            # Do not wait for further input while spool files are waiting to be processed
+            poll_timeout = 0 if self._spool_files else 1
             try:
-                readable = select.select(listen_list + client_sockets.keys(), [], [],
-                                         select_timeout)[0]
-            except select.error as e:
-                if e[0] == errno.EINTR:
+                readable = set(fd for fd, _mask in poller.poll(poll_timeout))
+            except IOError as e:
+                if e.errno == errno.EINTR:
                     continue
                 raise
-            data = None
 
-            # Accept new connection on event unix socket
-            if self._eventsocket in readable:
-                client_socket, address = self._eventsocket.accept()
-                # pylint: disable=no-member
-                client_sockets[client_socket.fileno()] = (client_socket, address, "")
+            # All data read in this iteration as list of (data, address). It is processed
+            # in one go after all inputs have been drained.
+            batch = []
 
-            # Same for the TCP syslog socket
-            if self._syslog_tcp and self._syslog_tcp in readable:
-                client_socket, address = self._syslog_tcp.accept()
-                # pylint: disable=no-member
-                client_sockets[client_socket.fileno()] = (client_socket, address, "")
+            # Accept new connection on event unix socket and on the TCP syslog socket
+            for listening_socket in [self._eventsocket, self._syslog_tcp]:
+                if listening_socket is not None and listening_socket.fileno() in readable:
+                    client_socket, address = listening_socket.accept()
+                    # pylint: disable=no-member
+                    client_sockets[client_socket.fileno()] = (client_socket, address, "")
+                    poller.register(client_socket.fileno(), select.EPOLLIN)
 
             # Read data from existing event unix socket connections
             # NOTE: We modify client_socket in the loop, so we need to copy below!
@@ -938,7 +1017,7 @@ class EventServer(ECServerThread):
                 if fd in readable:
                     # Receive next part of data
                     try:
-                        new_data = cs.recv(4096)
+                        new_data = cs.recv(self._read_size)
                     except Exception:
                         new_data = ""
                         address = None
@@ -953,27 +1032,28 @@ class EventServer(ECServerThread):
                         # Do we have any complete messages?
                         if '\n' in data:
                             complete, rest = data.rsplit("\n", 1)
-                            self.process_raw_lines(complete + "\n", address)
+                            batch.append((complete + "\n", address))
                         else:
                             rest = data  # keep for next time
 
                     # Only complete messages
                     else:
                         if data:
-                            self.process_raw_lines(data, address)
+                            batch.append((data, address))
                         rest = ""
 
                     # Connection still open?
                     if new_data:
                         client_sockets[fd] = (cs, address, rest)
                     else:
+                        poller.unregister(fd)
                         cs.close()
                         del client_sockets[fd]
 
             # Read data from pipe
             if pipe in readable:
                 try:
-                    data = os.read(pipe, 4096)
+                    data = os.read(pipe, self._read_size)
                     if data:
                         # Prepend previous beginning of message to read data
                         data = pipe_fragment + data
@@ -983,15 +1063,16 @@ class EventServer(ECServerThread):
                         if data[-1] != '\n':
                             if '\n' in data:  # at least one complete message contained
                                 messages, pipe_fragment = data.rsplit('\n', 1)
-                                self.process_raw_lines(messages + '\n')  # got lost in split
+                                batch.append((messages + '\n', None))  # got lost in split
                             else:
                                 pipe_fragment = data  # keep beginning of message, wait for \n
                         else:
-                            self.process_raw_lines(data)
+                            batch.append((data, None))
                     else:  # EOF
+                        poller.unregister(pipe)
                         os.close(pipe)
                         pipe = self.open_pipe()
-                        listen_list[0] = pipe
+                        poller.register(pipe, select.EPOLLIN)
                         # Pending fragments from previos reads that are not terminated
                         # by a \n are ignored.
                         if pipe_fragment:
@@ -1003,27 +1084,193 @@ class EventServer(ECServerThread):
 
             # Read events from builtin syslog server
             if self._syslog is not None and self._syslog.fileno() in readable:
-                self.process_raw_lines(*self._syslog.recvfrom(4096))
+                batch += self._drain_datagrams(self._syslog)
+
+            self._process_batch(batch)
 
             # Read events from builtin snmptrap server
             if self._snmptrap is not None and self._snmptrap.fileno() in readable:
+                for message, sender_address in self._drain_datagrams(self._snmptrap):
+                    try:
+
+                        def handler(message=message, sender_address=sender_address):
+                            self._snmp_trap_engine.process_snmptrap(message, sender_address)
+
+                        self.process_raw_data(handler)
+                    except Exception:
+                        self._logger.exception(
+                            'Exception handling a SNMP trap from "%s". Skipping this one' %
+                            sender_address[0])
+
+            # process the next spool file we get
+            spool_file = self._next_spool_file()
+            if spool_file is not None:
                 try:
-                    message, sender_address = self._snmptrap.recvfrom(65535)
-                    self.process_raw_data(lambda: self._snmp_trap_engine.process_snmptrap(
-                        message, sender_address))
-                except Exception:
-                    self._logger.exception(
-                        'Exception handling a SNMP trap from "%s". Skipping this one' %
-                        sender_address[0])
+                    data = spool_file.read_bytes()
+                except IOError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    continue  # Has been removed in the meantime
+                self.process_raw_lines(data)
+                spool_file.unlink()
 
+    # Receives all datagrams that are waiting on the given UDP socket, but at
+    # most _max_datagrams of them to give the other inputs a chance.
+    def _drain_datagrams(self, sock):
+        datagrams = []
+        while len(datagrams) < self._max_datagrams:
             try:
-                # process the first spool file we get
-                spool_file = next(self.settings.paths.spool_dir.value.glob('[!.]*'))
-                self.process_raw_lines(spool_file.read_bytes())
-                spool_file.unlink()
-                select_timeout = 0  # enable fast processing to process further files
-            except StopIteration:
-                select_timeout = 1  # restore default select timeout
+                datagrams.append(sock.recvfrom(65535, socket.MSG_DONTWAIT))
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+        return datagrams
+
+    def _process_batch(self, batch):
+        if self._get_worker_pool() is not None:
+            self._process_batch_in_workers(batch)
+            return
+
+        for nr, (data, address) in enumerate(batch):
+            self._perfcounters.set_gauge("input_queue_length", len(batch) - nr)
+            self.process_raw_lines(data, address)
+        self._perfcounters.set_gauge("input_queue_length", 0)
+
+    # Lets the worker processes create the events and find the matching rules.
+    # The results are then processed here in the order of the incoming lines.
+    # When the workers fail, the rest of the batch is processed in this process.
+    def _process_batch_in_workers(self, batch):
+        lines = [(line, address) for data, address in batch for line in data.splitlines()]
+        chunk_size = max(1, min(self._max_worker_chunk_size, -(-len(lines) // self._num_workers)))
+        chunks = [lines[nr:nr + chunk_size] for nr in xrange(0, len(lines), chunk_size)]
+
+        rule_by_id = self._worker_rule_by_id
+        async_results = [
+            self._worker_pool.apply_async(_create_and_match_events, (chunk,)) for chunk in chunks
+        ]
+
+        queue_length = len(lines)
+        for chunk, async_result in zip(chunks, async_results):
+            results = self._get_worker_results(async_result)
+            for nr, (line, address) in enumerate(chunk):
+                queue_length -= 1
+                self._perfcounters.set_gauge("input_queue_length", queue_length)
+                if results is None:
+                    self.process_raw_lines(line, address)
+                elif results[nr] is not None:
+                    self._process_worker_result(results[nr], rule_by_id)
+
+    # Returns the results of a chunk of lines, or None when the workers failed to
+    # process it. In this case the workers are stopped. They are started again
+    # for the next batch.
+    def _get_worker_results(self, async_result):
+        if self._worker_pool is None:
+            return None  # The workers have already failed for this batch
+
+        try:
+            return async_result.get(self._worker_timeout)
+        except Exception as e:
+            self._logger.exception(
+                "Event worker processes failed, processing the messages here: %s" % e)
+            self.stop_workers()
+            return None
+
+    def _process_worker_result(self, result, rule_by_id):
+        event, matches, num_tries = result
+        matches = [(rule_by_id[rule_id], match_result) for rule_id, match_result in matches]
+        try:
+
+            def handler():
+                self._process_matched_event(event, matches, num_tries)
+
+            self.process_raw_data(handler)
+        except Exception as e:
+            self._logger.exception('Exception handling a log line (skipping this one): %s' % e)
+
+    # Is called by the worker processes. Returns None for empty lines.
+    def create_and_match_event(self, line, address):
+        line = scrub_and_decode(line.rstrip())
+        if not line:
+            return None
+        event = self._create_event_from_line(line, address)
+        matches, num_tries = self._matching_rules(event)
+        return event, [(rule["id"], match_result) for rule, match_result in matches], num_tries
+
+    # Returns the pool of worker processes for the current rules, or None when the
+    # rules are processed in this process. After the rules have been compiled
+    # again, e.g. because of a reload of the configuration, the pool is replaced.
+    # This is only called by the event server thread between two batches.
+    def _get_worker_pool(self):
+        if self._worker_pool is not None and (self._worker_rules is not self._rules or
+                                              self._num_workers != self._config["event_workers"]):
+            self.stop_workers()
+
+        self.start_workers()
+        return self._worker_pool
+
+    # The workers are forked from this process and inherit a snapshot of the
+    # compiled rules. The daemon starts them before it starts its threads. Later
+    # they are never forked while holding the configuration lock, because the
+    # workers would inherit the held lock.
+    def start_workers(self):
+        num_workers = self._config["event_workers"]
+        if not num_workers or self._worker_pool is not None:
+            return
+
+        matching_state = self._matching_state()
+        self._worker_pool = multiprocessing.Pool(num_workers, _initialize_event_worker,
+                                                 (self, matching_state))
+        self._worker_rules = matching_state["_rules"]
+        self._worker_rule_by_id = matching_state["_rule_by_id"]
+        self._num_workers = num_workers
+        self._logger.info("Started %d event worker processes" % num_workers)
+
+    # The attributes needed for matching the rules. They are only changed while
+    # holding the configuration lock. Compiling the rules creates new objects
+    # instead of modifying the existing ones.
+    def _matching_state(self):
+        with self._lock_configuration:
+            return {
+                name: getattr(self, name)
+                for name in ["_config", "_rules", "_rule_by_id", "_rule_hash", "_rule_prefilter"]
+            }
+
+    def stop_workers(self):
+        if self._worker_pool is None:
+            return
+        self._worker_pool.terminate()
+        self._worker_pool.join()
+        self._worker_pool = None
+        self._worker_rules = None
+        self._worker_rule_by_id = {}
+        self._num_workers = 0
+        self._logger.info("Stopped event worker processes")
+
+    # Returns the next file of the spool directory to be processed. Instead of
+    # globbing the whole directory for every single file, the directory is
+    # read once and the files of this listing are processed one after the
+    # other. When all of them are processed, the directory is read again, but
+    # at most once per second.
+    def _next_spool_file(self):
+        if not self._spool_files:
+            now = time.time()
+            if now - self._last_spool_dir_scan < 1:
+                return None
+            self._last_spool_dir_scan = now
+
+            spool_dir = self.settings.paths.spool_dir.value
+            try:
+                file_names = sorted(f for f in os.listdir(str(spool_dir)) if not f.startswith("."))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                file_names = []
+            self._spool_files.extend(spool_dir / f for f in file_names)
+
+        if self._spool_files:
+            return self._spool_files.popleft()
+        return None
 
     # Processes incoming data, just a wrapper between the real data and the
     # handler function to record some statistics etc.
@@ -1136,6 +1383,7 @@ class EventServer(ECServerThread):
                             event["count"] = max(0, event["count"] - new_tokens)
                             event[
                                 "last_token"] = last_token + new_tokens * secs_per_token  # not now! would be unfair
+                            self._event_status.event_changed(event)
                             if event["count"] == 0:
                                 self._logger.info(
                                     "Rule %s/%s, event %d: again without allowed rate, dropping event"
@@ -1174,6 +1422,7 @@ class EventServer(ECServerThread):
                     else:
                         self._logger.info("Cannot do rule action: rule %s not present anymore." %
                                           event["rule_id"])
+                    self._event_status.event_changed(event)
 
             # Handle events with a limited lifetime
             elif "live_until" in event:
@@ -1232,9 +1481,9 @@ class EventServer(ECServerThread):
                 # First look for case 1: rule that already have at least one hit
                 # and this events in the state "counting" exist.
                 events_to_delete = []
-                events = self._event_status.events()
+                events = self._event_status.events_of_rule(rule["id"])
                 for nr, event in enumerate(events):
-                    if event["rule_id"] == rule["id"] and event["phase"] == "counting":
+                    if event["phase"] == "counting":
                         # time has elapsed. Now lets see if we have reached
                         # the neccessary count:
                         if event["count"] < expected_count:  # no -> trigger alarm
@@ -1271,10 +1520,8 @@ class EventServer(ECServerThread):
         merge_event = None
         merge = rule["expect"].get("merge", "open")
         if merge != "never":
-            for event in self._event_status.events():
-                if event["rule_id"] == rule["id"] and \
-                        (event["phase"] == "open" or
-                         (event["phase"] == "ack" and merge == "acked")):
+            for event in self._event_status.events_of_rule(rule["id"]):
+                if event["phase"] == "open" or (event["phase"] == "ack" and merge == "acked"):
                     merge_event = event
                     break
 
@@ -1287,6 +1534,7 @@ class EventServer(ECServerThread):
             # Better rewrite (again). Rule might have changed. Also we have changed
             # the text and the user might have his own text added via set_text.
             self.rewrite_event(rule, merge_event, {}, set_first=False)
+            self._event_status.reindex_event(merge_event)
             self._history.add(merge_event, "COUNTFAILED")
         else:
             # Create artifical event from scratch. Make sure that all important
@@ -1317,6 +1565,7 @@ class EventServer(ECServerThread):
             self._history.add(event, "COUNTFAILED")
             cmk.ec.actions.event_has_opened(self._history, self.settings, self._config,
                                             self._logger, self, self._event_columns, rule, event)
+            self._event_status.event_changed(event)
             if rule.get("autodelete"):
                 event["phase"] = "closed"
                 self._history.add(event, "AUTODELETE")
@@ -1411,6 +1660,11 @@ class EventServer(ECServerThread):
                         stats.append("%s(%d)" % (SyslogPriority(prio), len(entries)))
                     self._logger.info(" %-12s: %s" % (SyslogFacility(facility), " ".join(stats)))
 
+            self._rule_prefilter = RulePrefilter(self._rules)
+            self._logger.info("Rule prefilter: %d rules - %d filtered by %d literals" %
+                              (len(self._rules), self._rule_prefilter.num_filtered_rules,
+                               self._rule_prefilter.num_literals))
+
     @staticmethod
     def _compile_matching_value(key, val):
         value = val.strip()
@@ -1475,6 +1729,20 @@ class EventServer(ECServerThread):
                                                          (100.0 * count / float(total_count))))
 
     def process_line(self, line, address):
+        event = self._create_event_from_line(line, address)
+        with self._lock_configuration:
+            matches, num_tries = self._matching_rules(event)
+        self._process_matched_event(event, matches, num_tries)
+
+    def process_event(self, event):
+        self.do_translate_hostname(event)
+        with self._lock_configuration:
+            matches, num_tries = self._matching_rules(event)
+        self._process_matched_event(event, matches, num_tries)
+
+    # The stateless part of processing a line: Create the event and translate
+    # its host name. This is also done by the worker processes.
+    def _create_event_from_line(self, line, address):
         line = line.rstrip()
         if self._config["debug_rules"]:
             if address:
@@ -1483,28 +1751,35 @@ class EventServer(ECServerThread):
                 self._logger.info(u"Processing message '%s'" % line)
 
         event = self._event_creator.create_event_from_line(line, address)
-        self.process_event(event)
-
-    def process_event(self, event):
         self.do_translate_hostname(event)
+        return event
 
-        # Log all incoming messages into a syslog-like text file if that is enabled
-        if self._config["log_messages"]:
-            self.log_message(event)
-
+    # Returns the rules matching the event in the order they have to be applied
+    # together with the match results and the number of rules tried. These are
+    # all matching rules up to the first one which does not skip the rest of
+    # its rule pack. This does not depend on the state of the Event Console
+    # and is also done by the worker processes.
+    def _matching_rules(self, event):
         # Rule optimizer
         if self._config["rule_optimizer"]:
-            self._hash_stats[event["facility"]][event["priority"]] += 1
             rule_candidates = self._rule_hash.get(event["facility"], {}).get(event["priority"], [])
+            num_hashed_rules = len(rule_candidates)
+            rule_candidates = self._rule_prefilter.filter_rules(rule_candidates, event)
+            if self._config["debug_rules"]:
+                self._logger.info("  %d of %d rules left by the rule prefilter" %
+                                  (len(rule_candidates), num_hashed_rules))
         else:
             rule_candidates = self._rules
 
+        matches = []
+        num_tries = 0
         skip_pack = None
         for rule in rule_candidates:
             if skip_pack and rule["pack"] == skip_pack:
                 continue  # still in the rule pack that we want to skip
             skip_pack = None  # new pack, reset skipping
 
+            num_tries += 1
             try:
                 result = self.event_rule_matches(rule, event)
             except Exception as e:
@@ -1512,103 +1787,121 @@ class EventServer(ECServerThread):
                 result = False
 
             if result:  # A tuple with (True/False, {match_info}).. O.o
-                self._perfcounters.count("rule_hits")
-                cancelling, match_groups = result
+                matches.append((rule, result))
+                if rule.get("drop") == "skip_pack":
+                    skip_pack = rule["pack"]
+                    continue
+                break
 
-                if self._config["debug_rules"]:
-                    self._logger.info("  matching groups:\n%s" % pprint.pformat(match_groups))
+        return matches, num_tries
 
-                self._event_status.count_rule_match(rule["id"])
-                if self._config["log_rulehits"]:
-                    self._logger.info("Rule '%s/%s' hit by message %s/%s - '%s'." %
-                                      (rule["pack"], rule["id"], SyslogFacility(event["facility"]),
-                                       SyslogPriority(event["priority"]), event["text"]))
+    def _process_matched_event(self, event, matches, num_tries):
+        # Log all incoming messages into a syslog-like text file if that is enabled
+        if self._config["log_messages"]:
+            self.log_message(event)
 
-                if rule.get("drop"):
-                    if rule["drop"] == "skip_pack":
-                        skip_pack = rule["pack"]
-                        if self._config["debug_rules"]:
-                            self._logger.info("  skipping this rule pack (%s)" % skip_pack)
-                        continue
-                    else:
-                        self._perfcounters.count("drops")
-                        return
+        if self._config["rule_optimizer"]:
+            self._hash_stats[event["facility"]][event["priority"]] += 1
+        self._perfcounters.count("rule_tries", num_tries)
 
-                if cancelling:
-                    self._event_status.cancel_events(self, self._event_columns, event, match_groups,
-                                                     rule)
-                    return
-                else:
-                    # Remember the rule id that this event originated from
-                    event["rule_id"] = rule["id"]
-
-                    # Lookup the monitoring core hosts and add the core host
-                    # name to the event when one can be matched
-                    # For the moment we have no rule/condition matching on this
-                    # field. So we only add the core host info for matched events.
-                    self._add_core_host_to_new_event(event)
-
-                    # Attach optional contact group information for visibility
-                    # and eventually for notifications
-                    self._add_rule_contact_groups_to_event(rule, event)
-
-                    # Store groups from matching this event. In order to make
-                    # persistence easier, we do not safe them as list but join
-                    # them on ASCII-1.
-                    event["match_groups"] = match_groups.get("match_groups_message", ())
-                    event["match_groups_syslog_application"] = match_groups.get(
-                        "match_groups_syslog_application", ())
-                    self.rewrite_event(rule, event, match_groups)
-
-                    if "count" in rule:
-                        count = rule["count"]
-                        # Check if a matching event already exists that we need to
-                        # count up. If the count reaches the limit, the event will
-                        # be opened and its rule actions performed.
-                        existing_event = \
-                            self._event_status.count_event(self, event, rule, count)
-                        if existing_event:
-                            if "delay" in rule:
-                                if self._config["debug_rules"]:
-                                    self._logger.info("Event opening will be delayed for %d seconds"
-                                                      % rule["delay"])
-                                existing_event["delay_until"] = time.time() + rule["delay"]
-                                existing_event["phase"] = "delayed"
-                            else:
-                                cmk.ec.actions.event_has_opened(
-                                    self._history, self.settings, self._config, self._logger, self,
-                                    self._event_columns, rule, existing_event)
+        for rule, (cancelling, match_groups) in matches:
+            self._perfcounters.count("rule_hits")
 
-                            self._history.add(existing_event, "COUNTREACHED")
+            if self._config["debug_rules"]:
+                self._logger.info("  matching groups:\n%s" % pprint.pformat(match_groups))
 
-                            if "delay" not in rule and rule.get("autodelete"):
-                                existing_event["phase"] = "closed"
-                                self._history.add(existing_event, "AUTODELETE")
-                                with self._event_status.lock:
-                                    self._event_status.remove_event(existing_event)
-                    elif "expect" in rule:
-                        self._event_status.count_expected_event(self, event)
-                    else:
+            self._event_status.count_rule_match(rule["id"])
+            if self._config["log_rulehits"]:
+                self._logger.info("Rule '%s/%s' hit by message %s/%s - '%s'." %
+                                  (rule["pack"], rule["id"], SyslogFacility(event["facility"]),
+                                   SyslogPriority(event["priority"]), event["text"]))
+
+            if rule.get("drop"):
+                if rule["drop"] == "skip_pack":
+                    if self._config["debug_rules"]:
+                        self._logger.info("  skipping this rule pack (%s)" % rule["pack"])
+                    continue
+                else:
+                    self._perfcounters.count("drops")
+                    return
+
+            if cancelling:
+                self._event_status.cancel_events(self, self._event_columns, event, match_groups,
+                                                 rule)
+                return
+            else:
+                # Remember the rule id that this event originated from
+                event["rule_id"] = rule["id"]
+
+                # Lookup the monitoring core hosts and add the core host
+                # name to the event when one can be matched
+                # For the moment we have no rule/condition matching on this
+                # field. So we only add the core host info for matched events.
+                self._add_core_host_to_new_event(event)
+
+                # Attach optional contact group information for visibility
+                # and eventually for notifications
+                self._add_rule_contact_groups_to_event(rule, event)
+
+                # Store groups from matching this event. In order to make
+                # persistence easier, we do not safe them as list but join
+                # them on ASCII-1.
+                event["match_groups"] = match_groups.get("match_groups_message", ())
+                event["match_groups_syslog_application"] = match_groups.get(
+                    "match_groups_syslog_application", ())
+                self.rewrite_event(rule, event, match_groups)
+
+                if "count" in rule:
+                    count = rule["count"]
+                    # Check if a matching event already exists that we need to
+                    # count up. If the count reaches the limit, the event will
+                    # be opened and its rule actions performed.
+                    existing_event = \
+                        self._event_status.count_event(self, event, rule, count)
+                    if existing_event:
                         if "delay" in rule:
                             if self._config["debug_rules"]:
                                 self._logger.info(
                                     "Event opening will be delayed for %d seconds" % rule["delay"])
-                            event["delay_until"] = time.time() + rule["delay"]
-                            event["phase"] = "delayed"
+                            existing_event["delay_until"] = time.time() + rule["delay"]
+                            existing_event["phase"] = "delayed"
                         else:
-                            event["phase"] = "open"
-
-                        if self.new_event_respecting_limits(event):
-                            if event["phase"] == "open":
-                                cmk.ec.actions.event_has_opened(self._history, self.settings,
-                                                                self._config, self._logger, self,
-                                                                self._event_columns, rule, event)
-                                if rule.get("autodelete"):
-                                    event["phase"] = "closed"
-                                    self._history.add(event, "AUTODELETE")
-                                    with self._event_status.lock:
-                                        self._event_status.remove_event(event)
-                    return
+                            cmk.ec.actions.event_has_opened(
+                                self._history, self.settings, self._config, self._logger, self,
+                                self._event_columns, rule, existing_event)
+                        self._event_status.event_changed(existing_event)
+
+                        self._history.add(existing_event, "COUNTREACHED")
+
+                        if "delay" not in rule and rule.get("autodelete"):
+                            existing_event["phase"] = "closed"
+                            self._history.add(existing_event, "AUTODELETE")
+                            with self._event_status.lock:
+                                self._event_status.remove_event(existing_event)
+                elif "expect" in rule:
+                    self._event_status.count_expected_event(self, event)
+                else:
+                    if "delay" in rule:
+                        if self._config["debug_rules"]:
+                            self._logger.info(
+                                "Event opening will be delayed for %d seconds" % rule["delay"])
+                        event["delay_until"] = time.time() + rule["delay"]
+                        event["phase"] = "delayed"
+                    else:
+                        event["phase"] = "open"
+
+                    if self.new_event_respecting_limits(event):
+                        if event["phase"] == "open":
+                            cmk.ec.actions.event_has_opened(self._history, self.settings,
+                                                            self._config, self._logger, self,
+                                                            self._event_columns, rule, event)
+                            self._event_status.event_changed(event)
+                            if rule.get("autodelete"):
+                                event["phase"] = "closed"
+                                self._history.add(event, "AUTODELETE")
+                                with self._event_status.lock:
+                                    self._event_status.remove_event(event)
+                return
 
         # End of loop over rules.
         if self._config["archive_orphans"]:
@@ -1667,22 +1960,18 @@ class EventServer(ECServerThread):
     # if matched regex groups in either text (normal) or match_ok (cancelling)
     # match.
     def event_rule_matches(self, rule, event):
-        self._perfcounters.count("rule_tries")
-        with self._lock_configuration:
-            result = self._rule_matcher.event_rule_matches_non_inverted(rule, event)
-            if rule.get("invert_matching"):
-                if result is False:
-                    result = False, {}
-                    if self._config["debug_rules"]:
-                        self._logger.info(
-                            "  Rule would not match, but due to inverted matching does.")
-                else:
-                    result = False
-                    if self._config["debug_rules"]:
-                        self._logger.info(
-                            "  Rule would match, but due to inverted matching does not.")
+        result = self._rule_matcher.event_rule_matches_non_inverted(rule, event)
+        if rule.get("invert_matching"):
+            if result is False:
+                result = False, {}
+                if self._config["debug_rules"]:
+                    self._logger.info("  Rule would not match, but due to inverted matching does.")
+            else:
+                result = False
+                if self._config["debug_rules"]:
+                    self._logger.info("  Rule would match, but due to inverted matching does not.")
 
-            return result
+        return result
 
     # Rewrite texts and compute other fields in the event
     def rewrite_event(self, rule, event, groups, set_first=True):
@@ -2488,6 +2777,227 @@ class RuleMatcher(object):
         return True
 
 
+class RulePrefilter(object):
+    """Finds the rules that can not match an event without evaluating them
+
+    A rule can only match an event when the host name, the syslog application
+    and the message text of the event contain certain literal strings. These
+    are extracted from the patterns of the rules (e.g. "disk" and "full" are
+    needed by the regex "disk.*full"). For each field all literals of all rules
+    are searched in a single pass over the event field (Aho-Corasick). Only the
+    rules whose literals have been found need to be evaluated fully.
+
+    Rules with inverted matching and rules having patterns without any literal
+    can not be filtered. They are always returned."""
+
+    # The event fields with the rule conditions of which at least one needs to
+    # match the field. The message text is only needed when the rule has a
+    # "match" condition, the other conditions are used whenever they are set.
+    _FIELDS = [
+        ("text", "match", ["match", "match_ok"]),
+        ("host", "match_host", ["match_host"]),
+        ("application", None, ["match_application", "cancel_application"]),
+    ]
+
+    def __init__(self, rules):
+        # type: (List[Dict[str, Any]]) -> None
+        super(RulePrefilter, self).__init__()
+        self._unfiltered = set()  # type: Set[int]
+        self._needed_fields = {}  # type: Dict[int, List[str]]
+        self._rules_by_literal = {}  # type: Dict[str, Dict[str, Set[int]]]
+        self._scanners = {}  # type: Dict[str, _LiteralScanner]
+
+        for rule in rules:
+            self._add_rule(rule)
+
+        for field, rules_by_literal in self._rules_by_literal.iteritems():
+            self._scanners[field] = _LiteralScanner(rules_by_literal.keys())
+
+    def _add_rule(self, rule):
+        # type: (Dict[str, Any]) -> None
+        rule_id = id(rule)
+        literals_of_fields = {}
+        if not rule.get("invert_matching"):
+            for field, needed_key, keys in self._FIELDS:
+                if needed_key is not None and needed_key not in rule:
+                    continue
+                literals = self._literals_of_field(rule, keys)
+                if literals:
+                    literals_of_fields[field] = literals
+
+        if not literals_of_fields:
+            self._unfiltered.add(rule_id)
+            return
+
+        self._needed_fields[rule_id] = literals_of_fields.keys()
+        for field, literals in literals_of_fields.iteritems():
+            rules_by_literal = self._rules_by_literal.setdefault(field, {})
+            for literal in literals:
+                rules_by_literal.setdefault(literal, set()).add(rule_id)
+
+    def _literals_of_field(self, rule, keys):
+        # type: (Dict[str, Any], List[str]) -> Optional[Set[str]]
+        """Returns the literals of which at least one is contained in the field
+
+        In case one of the patterns has no literal, the field can not be used for
+        filtering and None is returned."""
+        patterns = [rule[key] for key in keys if key in rule]
+        if not patterns:
+            return None
+
+        literals = set()  # type: Set[str]
+        for pattern in patterns:
+            if isinstance(pattern, six.string_types):
+                literals_of_pattern = set([pattern])  # Same as match(): Plain infix search
+            else:
+                literals_of_pattern = regex_literals(pattern.pattern)
+
+            if not literals_of_pattern:
+                return None
+            literals.update(literals_of_pattern)
+        return literals
+
+    @property
+    def num_filtered_rules(self):
+        # type: () -> int
+        return len(self._needed_fields)
+
+    @property
+    def num_literals(self):
+        # type: () -> int
+        return sum(len(rules_by_literal) for rules_by_literal in self._rules_by_literal.values())
+
+    def filter_rules(self, rules, event):
+        # type: (List[Dict[str, Any]], Dict[str, Any]) -> List[Dict[str, Any]]
+        """Returns the rules that may match the event (in the given order)"""
+        found_fields = {}  # type: Dict[int, int]
+        for field, scanner in self._scanners.iteritems():
+            rules_by_literal = self._rules_by_literal[field]
+            rule_ids = set()  # type: Set[int]
+            for literal in scanner.find(event.get(field, "").lower()):
+                rule_ids.update(rules_by_literal[literal])
+            for rule_id in rule_ids:
+                found_fields[rule_id] = found_fields.get(rule_id, 0) + 1
+
+        possible = self._unfiltered.union(rule_id for rule_id, count in found_fields.iteritems()
+                                          if count == len(self._needed_fields[rule_id]))
+        return [rule for rule in rules if id(rule) in possible]
+
+
+class _LiteralScanner(object):
+    """Finds all of the given strings in a text with a single pass (Aho-Corasick)"""
+
+    def __init__(self, literals):
+        # type: (List[str]) -> None
+        super(_LiteralScanner, self).__init__()
+        self._goto = [{}]  # type: List[Dict[str, int]]
+        self._output = [[]]  # type: List[List[str]]
+        for literal in literals:
+            self._add(literal)
+        self._fail = self._compute_failure_links()
+
+    def _add(self, literal):
+        # type: (str) -> None
+        state = 0
+        for char in literal:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(literal)
+
+    def _compute_failure_links(self):
+        # type: () -> List[int]
+        fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, next_state in self._goto[state].iteritems():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = self._goto[fallback].get(char, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[fail[next_state]]
+        return fail
+
+    def find(self, text):
+        # type: (str) -> Set[str]
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()  # type: Set[str]
+        state = 0
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def regex_literals(pattern):
+    # type: (str) -> Optional[Set[str]]
+    """Returns strings of which at least one is contained in all texts matched by the regex
+
+    The literals are lower case, because the EC always matches case insensitive.
+    None is returned when no such strings could be determined."""
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except Exception:
+        return None
+    return _literals_of_sequence(parsed)
+
+
+def _literals_of_sequence(items):
+    # type: (Any) -> Optional[Set[str]]
+    candidates = []  # type: List[Set[str]]
+    chars = []  # type: List[str]
+    for op, av in items:
+        # Only ASCII characters are used, because only these are folded in the same
+        # way by the case insensitive regex matching and lower()
+        if op == sre_constants.LITERAL and 0x20 <= av < 0x7f:
+            chars.append(chr(av).lower())
+            continue
+
+        if chars:
+            candidates.append(set(["".join(chars)]))
+            chars = []
+
+        if op == sre_constants.SUBPATTERN:
+            candidate = _literals_of_sequence(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            candidate = _literals_of_sequence(av[2])
+        elif op == sre_constants.BRANCH:
+            candidate = set()
+            for branch in av[1]:
+                literals = _literals_of_sequence(branch)
+                if not literals:
+                    candidate = None
+                    break
+                candidate.update(literals)
+        else:
+            candidate = None
+
+        if candidate:
+            candidates.append(candidate)
+
+    if chars:
+        candidates.append(set(["".join(chars)]))
+
+    if not candidates:
+        return None
+
+    # Prefer the candidate with the longest strings, it is the most selective one
+    return max(candidates, key=lambda c: min(len(literal) for literal in c))
+
+
 #.
 #   .--Status Queries------------------------------------------------------.
 #   |  ____  _        _                ___                  _              |
@@ -2601,10 +3111,10 @@ class QueryGET(Query):
                 argument = argument.lstrip(" ")
 
                 if header == "OutputFormat":
-                    if argument not in ["python", "plain", "json"]:
+                    if argument not in ["python", "plain", "json", "compact_json"]:
                         raise MKClientError(
-                            "Invalid output format \"%s\" (allowed are: python, plain, json)" %
-                            argument)
+                            "Invalid output format \"%s\" (allowed are: python, plain, json, "
+                            "compact_json)" % argument)
 
                     self.output_format = argument
 
@@ -2750,6 +3260,16 @@ class StatusTable(object):
             self.column_types[name] = type(def_val)
 
         self.column_indices = dict([(name, index) for index, name in enumerate(self.column_names)])
+        self._default_row = [self.column_defaults[name] for name in self.column_names]
+
+    # Indexes of the columns needed for answering the query: The requested
+    # columns and the filtered ones. Tables may skip computing the values of
+    # all other columns and leave the default values in the rows.
+    def _needed_column_indexes(self, query):
+        indexes = set(index for index in query.requested_column_indexes() if index is not None)
+        indexes.update(self.column_indices[column_name]
+                       for column_name, _operator_name, _predicate, _argument in query.filters)
+        return sorted(indexes)
 
     def query(self, query):
         requested_column_indexes = query.requested_column_indexes()
@@ -2818,19 +3338,24 @@ class StatusTableEvents(StatusTable):
         self._event_status = event_status
 
     def _enumerate(self, query):
+        columns = [
+            (index, self.column_names[index][6:])  # drop "event_"
+            for index in self._needed_column_indexes(query)
+        ]
+        row = self._default_row[:]
         for event in self._event_status.get_events():
             # Optimize filters that are set by the check_mkevents active check. Since users
             # may have a lot of those checks running, it is a good idea to optimize this.
             if query.only_host and event["host"] not in query.only_host:
                 continue
 
-            row = []
-            for column_name in self.column_names:
+            # When the event does not have a value, the columns default value is used.
+            # The row is reused for all events, query() does not keep it.
+            for index, key in columns:
                 try:
-                    row.append(event[column_name[6:]])
+                    row[index] = event[key]
                 except KeyError:
-                    # The row does not have this value. Use the columns default value
-                    row.append(self.column_defaults[column_name])
+                    row[index] = self._default_row[index]
 
             yield row
 
@@ -2893,7 +3418,27 @@ class StatusTableStatus(StatusTable):
 #   '----------------------------------------------------------------------'
 
 
+# Serializes a list element by element, the output is terminated by a newline
+def _list_chunks(elements, serialize, separator):
+    yield "["
+    first = True
+    for element in elements:
+        if first:
+            yield serialize(element)
+            first = False
+        else:
+            yield separator + serialize(element)
+    yield "]\n"
+
+
+def _compact_json(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
 class StatusServer(ECServerThread):
+    # Responses are sent in chunks of at least this size
+    _send_buffer_size = 65536
+
     def __init__(self, logger, settings, config, slave_status, perfcounters, lock_configuration,
                  history, event_status, event_server, terminate_main_event):
         super(StatusServer, self).__init__(
@@ -3089,27 +3634,54 @@ class StatusServer(ECServerThread):
 
     # Only GET queries have customizable output formats. COMMAND is always
     # a dictionay and COMMAND is always None and always output as "python"
+    #
+    # The rows of GET queries are serialized one by one while they are
+    # produced by the table and sent in chunks of about _send_buffer_size
+    # bytes. The python and json formats produce the same output as
+    # serializing the complete list of rows at once. compact_json is json
+    # without the whitespace after the separators.
+    #
+    # When producing a row fails, the connection is closed. A partial python
+    # or json response is an unterminated list, which the client can not parse.
+    # The client could not tell a partial plain response from a complete one.
+    # These rows are collected first and nothing is sent in case of an error.
     def _answer_query(self, client_socket, query, response):
         if query.method != "GET":
             self._answer_query_python(client_socket, response)
             return
 
         if query.output_format == "plain":
-            for row in response:
-                client_socket.sendall("\t".join([cmk.ec.history.quote_tab(c) for c in row]) + "\n")
+            rows = list(response)
+            chunks = ("\t".join([cmk.ec.history.quote_tab(c) for c in row]) + "\n" for row in rows)
 
         elif query.output_format == "json":
-            client_socket.sendall(json.dumps(list(response)) + "\n")
+            chunks = _list_chunks(response, json.dumps, ", ")
+
+        elif query.output_format == "compact_json":
+            chunks = _list_chunks(response, _compact_json, ",")
 
         elif query.output_format == "python":
-            self._answer_query_python(client_socket, list(response))
+            chunks = _list_chunks(response, repr, ", ")
 
         else:
             raise NotImplementedError()
 
+        self._send_chunks(client_socket, chunks)
+
     def _answer_query_python(self, client_socket, response):
         client_socket.sendall(repr(response) + "\n")
 
+    def _send_chunks(self, client_socket, chunks):
+        buf, buf_size = [], 0
+        for chunk in chunks:
+            buf.append(chunk)
+            buf_size += len(chunk)
+            if buf_size >= self._send_buffer_size:
+                client_socket.sendall("".join(buf))
+                buf, buf_size = [], 0
+        if buf:
+            client_socket.sendall("".join(buf))
+
     # All commands are already locked with self._event_status.lock
     def handle_command_request(self, commandline):
         self._logger.info("Executing command: %s" % commandline)
@@ -3168,6 +3740,7 @@ class StatusServer(ECServerThread):
             event["contact"] = contact
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "UPDATE", user)
 
     def handle_command_create(self, arguments):
@@ -3187,6 +3760,7 @@ class StatusServer(ECServerThread):
         event["state"] = int(newstate)
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "CHANGESTATE", user)
 
     def handle_command_reload(self):
@@ -3229,6 +3803,7 @@ class StatusServer(ECServerThread):
         event = self._event_status.event(int(event_id))
         if user:
             event["owner"] = user
+            self._event_status.event_changed(event)
 
         if action_id == "@NOTIFY":
             cmk.ec.actions.do_notify(
@@ -3358,8 +3933,14 @@ def run_eventd(terminate_main_event, settings, config, lock_configuration, histo
 #   | durch ein Lock vor gleichzeitigen Zugriffen durch die Threads.       |
 #   '----------------------------------------------------------------------'
 
+# Format of the records in the status snapshot and journal files
+_MARSHAL_VERSION = 2
+
 
 class EventStatus(object):
+    # Don't write a new snapshot of the event state before the journal has this size
+    _min_compaction_size = 1024 * 1024
+
     def __init__(self, settings, config, perfcounters, history, logger):
         self.settings = settings
         self._config = config
@@ -3367,30 +3948,46 @@ class EventStatus(object):
         self.lock = threading.Lock()
         self._history = history
         self._logger = logger
+
+        # What is currently saved in the status snapshot and journal
+        self._status_generation = 0
+        self._snapshot_size = 0
+        self._journal_size = 0
+        self._saved_status_record = None  # type: Optional[str]
+
+        # What has to be written with the next save: the ids of the events
+        # that have been added or changed and of the removed events. When all
+        # events have been replaced, only a new snapshot is complete.
+        self._changed_event_ids = set()  # type: Set[int]
+        self._removed_event_ids = set()  # type: Set[int]
+        self._snapshot_needed = True
+
         self.flush()
 
     def reload_configuration(self, config):
         self._config = config
 
     def flush(self):
-        self._events = []
+        self._set_events([])
         self._next_event_id = 1
         self._rule_stats = {}
         self._interval_starts = {}  # needed for expecting rules
-        self._initialize_event_limit_status()
 
         # TODO: might introduce some performance counters, like:
         # - number of received messages
         # - number of rule hits
         # - number of rule misses
 
+    # Returns a copy of the list of the current events in the order of their
+    # creation. The caller may remove events while iterating over it.
     def events(self):
-        return self._events
+        return self._events.values()
+
+    def events_of_rule(self, rule_id):
+        return self._events_by_rule.get(rule_id, {}).values()
 
     def event(self, eid):
-        for event in self._events:
-            if event["id"] == eid:
-                return event
+        return self._events.get(eid)
 
     # Return beginning of current expectation interval. For new rules
     # we start with the next interval in future.
@@ -3434,30 +4031,116 @@ class EventStatus(object):
     def pack_status(self):
         return {
             "next_event_id": self._next_event_id,
-            "events": self._events,
+            "events": self._events.values(),
             "rule_stats": self._rule_stats,
             "interval_starts": self._interval_starts,
         }
 
     def unpack_status(self, status):
         self._next_event_id = status["next_event_id"]
-        self._events = status["events"]
+        self._set_events(status["events"])
         self._rule_stats = status["rule_stats"]
         self._interval_starts = status["interval_starts"]
 
+    # The event state is saved in a snapshot and a journal file. Both are
+    # streams of marshalled records:
+    #
+    #   ("generation", NUMBER)  first record, the journal belongs to the snapshot
+    #                           with the same generation
+    #   ("status", DICT)        next event id, rule statistics and interval starts
+    #   ("event", EVENT)        new or changed event
+    #   ("remove", EVENT_ID)    removed event
+    #
+    # Each save only appends the records for the events marked by
+    # event_changed() and remove_event() since the last save to the journal.
+    # When the journal has grown larger than the snapshot, a new snapshot is
+    # written instead and the journal starts from scratch. Loading reads the
+    # snapshot and replays the journal.
     def save_status(self):
         now = time.time()
-        status = self.pack_status()
-        path = self.settings.paths.status_file.value
+        status_record = marshal.dumps(("status", self._pack_status_without_events()),
+                                      _MARSHAL_VERSION)
+        # Other threads may mark events while saving, these are left for the next save
+        changed_event_ids = self._take_event_ids(self._changed_event_ids)
+        removed_event_ids = self._take_event_ids(self._removed_event_ids)
+
+        if self._snapshot_needed or not self._snapshot_size or \
+           self._journal_size > max(self._snapshot_size, self._min_compaction_size):
+            self._snapshot_needed = False
+            path = self._write_status_snapshot(status_record)
+            num_records = len(self._events) + 1
+        else:
+            path = self.settings.paths.status_journal_file.value
+            num_records = self._append_to_status_journal(status_record, changed_event_ids,
+                                                         removed_event_ids)
+
+        self._saved_status_record = status_record
+        elapsed = time.time() - now
+        self._logger.verbose(
+            "Saved event state to %s in %.3fms (%d records)." % (path, elapsed * 1000, num_records))
+
+    def _pack_status_without_events(self):
+        return {
+            "next_event_id": self._next_event_id,
+            "rule_stats": self._rule_stats,
+            "interval_starts": self._interval_starts,
+        }
+
+    def _take_event_ids(self, event_ids):
+        taken = []
+        while event_ids:
+            taken.append(event_ids.pop())
+        return sorted(taken)
+
+    def _append_to_status_journal(self, status_record, changed_event_ids, removed_event_ids):
+        records = []
+        if status_record != self._saved_status_record:
+            records.append(status_record)
+        for event_id in changed_event_ids:
+            event = self._events.get(event_id)
+            if event is not None:
+                records.append(marshal.dumps(("event", event), _MARSHAL_VERSION))
+        for event_id in removed_event_ids:
+            records.append(marshal.dumps(("remove", event_id), _MARSHAL_VERSION))
+        if not records:
+            return 0
+
+        if not self._journal_size:
+            records.insert(0,
+                           marshal.dumps(("generation", self._status_generation), _MARSHAL_VERSION))
+        data = "".join(records)
+        with open(str(self.settings.paths.status_journal_file.value), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(data)
+        return len(records)
+
+    def _write_status_snapshot(self, status_record):
+        generation = self._status_generation + 1
+        path = self.settings.paths.status_snapshot_file.value
         path_new = path.parent / (path.name + '.new')
-        # Believe it or not: cPickle is more than two times slower than repr()
-        with path_new.open(mode='wb') as f:
-            f.write(repr(status) + "\n")
+        with open(str(path_new), "wb") as f:
+            f.write(marshal.dumps(("generation", generation), _MARSHAL_VERSION))
+            f.write(status_record)
+            for event in self._events.itervalues():
+                f.write(marshal.dumps(("event", event), _MARSHAL_VERSION))
             f.flush()
             os.fsync(f.fileno())
+            self._snapshot_size = f.tell()
         path_new.rename(path)
-        elapsed = time.time() - now
-        self._logger.verbose("Saved event state to %s in %.3fms." % (path, elapsed * 1000))
+
+        # The old journal does not belong to the new snapshot anymore, so it is
+        # ignored when loading, even if removing it fails now.
+        self._status_generation = generation
+        self._journal_size = 0
+        for obsolete_path in [
+                self.settings.paths.status_journal_file.value,
+                self.settings.paths.status_file.value,  # from versions without journal
+        ]:
+            if obsolete_path.exists():
+                obsolete_path.unlink()
+        return path
 
     def reset_counters(self, rule_id):
         if rule_id:
@@ -3469,37 +4152,197 @@ class EventStatus(object):
 
     def load_status(self, event_server):
         path = self.settings.paths.status_file.value
-        if path.exists():
+        if self.settings.paths.status_snapshot_file.value.exists():
+            self._load_status_snapshot_and_journal()
+        elif path.exists():
             try:
                 status = ast.literal_eval(path.read_bytes())
                 self._next_event_id = status["next_event_id"]
-                self._events = status["events"]
+                self._set_events(status["events"])
                 self._rule_stats = status["rule_stats"]
                 self._interval_starts = status.get("interval_starts", {})
-                self._initialize_event_limit_status()
                 self._logger.info("Loaded event state from %s." % path)
             except Exception as e:
                 self._logger.exception("Error loading event state from %s: %s" % (path, e))
                 raise
 
-        # Add new columns
-        for event in self._events:
-            event.setdefault("ipaddress", "")
+        self._add_new_columns(event_server)
+
+    def _load_status_snapshot_and_journal(self):
+        snapshot_path = self.settings.paths.status_snapshot_file.value
+        journal_path = self.settings.paths.status_journal_file.value
+        status = {}
+        events = collections.OrderedDict()
+        try:
+            generation, self._snapshot_size = self._replay_status_records(
+                snapshot_path, status, events)
+            journal_generation, self._journal_size = self._replay_status_records(
+                journal_path, status, events, generation)
+            if journal_generation is None:
+                if journal_path.exists():
+                    journal_path.unlink()
+            else:
+                # Drop a truncated record, new records are appended after the valid ones
+                with open(str(journal_path), "r+b") as f:
+                    f.truncate(self._journal_size)
+
+            self._status_generation = generation
+            self._next_event_id = status["next_event_id"]
+            self._set_events(events.values())
+            self._rule_stats = status["rule_stats"]
+            self._interval_starts = status["interval_starts"]
+        except Exception as e:
+            self._logger.exception("Error loading event state from %s: %s" % (snapshot_path, e))
+            raise
+
+        self._saved_status_record = marshal.dumps(("status", self._pack_status_without_events()),
+                                                  _MARSHAL_VERSION)
+        self._snapshot_needed = False
+        self._logger.info(
+            "Loaded event state from %s (%d events)." % (snapshot_path, len(self._events)))
+
+    # Applies the records of a snapshot or journal file to the given status and
+    # events. Returns the generation of the file and the size of all records
+    # read. The generation is None when the file does not exist or belongs to
+    # a different snapshot. Reading stops at a truncated record, which is left
+    # over when writing has been interrupted.
+    def _replay_status_records(self, path, status, events, expected_generation=None):
+        try:
+            f = open(str(path), "rb")
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None, 0
+            raise
+
+        with f:
+            generation = None
+            size = 0
+            while True:
+                try:
+                    kind, value = marshal.load(f)
+                except EOFError:
+                    break
+                except (ValueError, TypeError):
+                    self._logger.warning("Ignoring truncated record at the end of %s" % path)
+                    break
+
+                if kind == "generation":
+                    if expected_generation is not None and value != expected_generation:
+                        return None, 0
+                    generation = value
+                elif kind == "status":
+                    status.update(value)
+                elif kind == "event":
+                    events[value["id"]] = value
+                elif kind == "remove":
+                    events.pop(value, None)
+                size = f.tell()
+
+        return generation, size
+
+    def _add_new_columns(self, event_server):
+        for event in self._events.itervalues():
+            if "ipaddress" not in event:
+                event["ipaddress"] = ""
+                self.event_changed(event)
 
             if "core_host" not in event:
                 event_server.add_core_host_to_event(event)
                 event["host_in_downtime"] = False
+                self.event_changed(event)
+
+    # Replaces all current events and builds the indexes and the event limit
+    # state from scratch. The indexes and the counters are updated during
+    # runtime on every insertion, removal and host change of an event.
+    #
+    # _events keeps all events by their id in the order of their creation,
+    # which is the order of the status table and the "oldest first" order
+    # for the event limits. The other indexes hold the same events grouped
+    # by rule, by host and by rule and host, each group in the same order.
+    def _set_events(self, events):
+        self._events = collections.OrderedDict()  # type: Dict[int, Dict[str, Any]]
+        self._events_by_rule = {}  # type: Dict[str, collections.OrderedDict]
+        self._events_by_host = {}  # type: Dict[str, collections.OrderedDict]
+        self._events_by_rule_and_host = {}  # type: Dict[Tuple[str, str], collections.OrderedDict]
+        self._index_keys = {}  # type: Dict[int, Tuple[str, str]]
+        self._positions = {}  # type: Dict[int, int]
+        self._next_position = 0
+        self._initialize_event_limit_status()
+        for event in events:
+            self._add_event(event)
+        self._changed_event_ids.clear()
+        self._removed_event_ids.clear()
+        self._snapshot_needed = True
 
     # Called on Event Console initialization from status file to initialize
     # the current event limit state -> Sets internal counters which are
     # updated during runtime.
     def _initialize_event_limit_status(self):
-        self.num_existing_events = len(self._events)
-
+        self.num_existing_events = 0
         self.num_existing_events_by_host = {}
         self.num_existing_events_by_rule = {}
-        for event in self._events:
-            self._count_event_add(event)
+
+    def _add_event(self, event):
+        event_id = event["id"]
+        self._events[event_id] = event
+        self._positions[event_id] = self._next_position
+        self._next_position += 1
+        self._index_event(event)
+        self.num_existing_events += 1
+        self._count_event_add(event)
+        self.event_changed(event)
+
+    # Needs to be called after an existing event has been changed in place to
+    # write it with the next save of the event state.
+    def event_changed(self, event):
+        self._changed_event_ids.add(event["id"])
+
+    def _index_event(self, event):
+        rule_id, host = event["rule_id"], event["host"]
+        self._index_keys[event["id"]] = (rule_id, host)
+        self._insert_into_index(self._events_by_rule, rule_id, event)
+        self._insert_into_index(self._events_by_host, host, event)
+        self._insert_into_index(self._events_by_rule_and_host, (rule_id, host), event)
+
+    def _insert_into_index(self, index, key, event):
+        group = index.setdefault(key, collections.OrderedDict())
+        event_id = event["id"]
+        if group and self._positions[next(reversed(group))] > self._positions[event_id]:
+            # Only happens when an older event changes its host: restore the order
+            items = group.items() + [(event_id, event)]
+            items.sort(key=lambda item: self._positions[item[0]])
+            group.clear()
+            group.update(items)
+        else:
+            group[event_id] = event
+
+    def _unindex_event(self, event_id):
+        rule_id, host = self._index_keys.pop(event_id)
+        for index, key in [
+            (self._events_by_rule, rule_id),
+            (self._events_by_host, host),
+            (self._events_by_rule_and_host, (rule_id, host)),
+        ]:
+            group = index[key]
+            del group[event_id]
+            if not group:
+                del index[key]
+
+    # Needs to be called after the host or the rule of an existing event has
+    # been changed in place to keep the indexes and the event limit counters
+    # in sync with the event.
+    def reindex_event(self, event):
+        self.event_changed(event)
+        event_id = event["id"]
+        old_rule_id, old_host = self._index_keys[event_id]
+        if (old_rule_id, old_host) == (event["rule_id"], event["host"]):
+            return
+
+        self._unindex_event(event_id)
+        self._index_event(event)
+        self.num_existing_events_by_host[old_host] -= 1
+        self.num_existing_events_by_rule[old_rule_id] -= 1
+        self._count_event_add(event)
 
     def _count_event_add(self, event):
         if event["host"] not in self.num_existing_events_by_host:
@@ -3521,9 +4364,7 @@ class EventStatus(object):
         self._perfcounters.count("events")
         event["id"] = self._next_event_id
         self._next_event_id += 1
-        self._events.append(event)
-        self.num_existing_events += 1
-        self._count_event_add(event)
+        self._add_event(event)
         self._history.add(event, "NEW")
 
     def archive_event(self, event):
@@ -3535,21 +4376,21 @@ class EventStatus(object):
 
     def remove_event(self, event):
         try:
-            self._events.remove(event)
-            self._count_event_remove(event)
-        except ValueError:
+            del self._events[event["id"]]
+        except KeyError:
             self._logger.exception("Cannot remove event %d: not present" % event["id"])
-
-    # protected by self.lock
-    def _remove_event_by_nr(self, index):
-        event = self._events.pop(index)
+            return
+        del self._positions[event["id"]]
+        self._unindex_event(event["id"])
         self._count_event_remove(event)
+        self._changed_event_ids.discard(event["id"])
+        self._removed_event_ids.add(event["id"])
 
     # protected by self.lock
     def remove_oldest_event(self, ty, event):
         if ty == "overall":
             self._logger.verbose("  Removing oldest event")
-            self._remove_event_by_nr(0)
+            self._remove_oldest_event_of(self._events)
         elif ty == "by_rule":
             self._logger.verbose("  Removing oldest event of rule \"%s\"" % event["rule_id"])
             self._remove_oldest_event_of_rule(event["rule_id"])
@@ -3559,17 +4400,15 @@ class EventStatus(object):
 
     # protected by self.lock
     def _remove_oldest_event_of_rule(self, rule_id):
-        for event in self._events:
-            if event["rule_id"] == rule_id:
-                self.remove_event(event)
-                return
+        self._remove_oldest_event_of(self._events_by_rule.get(rule_id))
 
     # protected by self.lock
     def _remove_oldest_event_of_host(self, hostname):
-        for event in self._events:
-            if event["host"] == hostname:
-                self.remove_event(event)
-                return
+        self._remove_oldest_event_of(self._events_by_host.get(hostname))
+
+    def _remove_oldest_event_of(self, events):
+        if events:
+            self.remove_event(events[next(iter(events))])
 
     # protected by self.lock
     def get_num_existing_events_by(self, ty, event):
@@ -3587,48 +4426,47 @@ class EventStatus(object):
     def cancel_events(self, event_server, event_columns, new_event, match_groups, rule):
         with self.lock:
             to_delete = []
-            for nr, event in enumerate(self._events):
-                if event["rule_id"] == rule["id"]:
-                    if self.cancelling_match(match_groups, new_event, event, rule):
-                        # Fill a few fields of the cancelled event with data from
-                        # the cancelling event so that action scripts have useful
-                        # values and the logfile entry if more relevant.
-                        previous_phase = event["phase"]
-                        event["phase"] = "closed"
-                        # TODO: Why do we use OK below and not new_event["state"]???
-                        event["state"] = 0  # OK
-                        event["text"] = new_event["text"]
-                        # TODO: This is a hack and partial copy-n-paste from rewrite_events...
-                        if "set_text" in rule:
-                            event["text"] = replace_groups(rule["set_text"], event["text"],
-                                                           match_groups)
-                        event["time"] = new_event["time"]
-                        event["last"] = new_event["time"]
-                        event["priority"] = new_event["priority"]
-                        self._history.add(event, "CANCELLED")
-                        actions = rule.get("cancel_actions", [])
-                        if actions:
-                            if previous_phase != "open" \
-                               and rule.get("cancel_action_phases", "always") == "open":
-                                self._logger.info(
-                                    "Do not execute cancelling actions, event %s's phase "
-                                    "is not 'open' but '%s'" % (event["id"], previous_phase))
-                            else:
-                                cmk.ec.actions.do_event_actions(
-                                    self._history,
-                                    self.settings,
-                                    self._config,
-                                    self._logger,
-                                    event_server,
-                                    event_columns,
-                                    actions,
-                                    event,
-                                    is_cancelling=True)
-
-                        to_delete.append(nr)
-
-            for nr in to_delete[::-1]:
-                self._remove_event_by_nr(nr)
+            for event in self.events_of_rule(rule["id"]):
+                if self.cancelling_match(match_groups, new_event, event, rule):
+                    # Fill a few fields of the cancelled event with data from
+                    # the cancelling event so that action scripts have useful
+                    # values and the logfile entry if more relevant.
+                    previous_phase = event["phase"]
+                    event["phase"] = "closed"
+                    # TODO: Why do we use OK below and not new_event["state"]???
+                    event["state"] = 0  # OK
+                    event["text"] = new_event["text"]
+                    # TODO: This is a hack and partial copy-n-paste from rewrite_events...
+                    if "set_text" in rule:
+                        event["text"] = replace_groups(rule["set_text"], event["text"],
+                                                       match_groups)
+                    event["time"] = new_event["time"]
+                    event["last"] = new_event["time"]
+                    event["priority"] = new_event["priority"]
+                    self._history.add(event, "CANCELLED")
+                    actions = rule.get("cancel_actions", [])
+                    if actions:
+                        if previous_phase != "open" \
+                           and rule.get("cancel_action_phases", "always") == "open":
+                            self._logger.info(
+                                "Do not execute cancelling actions, event %s's phase "
+                                "is not 'open' but '%s'" % (event["id"], previous_phase))
+                        else:
+                            cmk.ec.actions.do_event_actions(
+                                self._history,
+                                self.settings,
+                                self._config,
+                                self._logger,
+                                event_server,
+                                event_columns,
+                                actions,
+                                event,
+                                is_cancelling=True)
+
+                    to_delete.append(event)
+
+            for event in to_delete:
+                self.remove_event(event)
 
     def cancelling_match(self, match_groups, new_event, event, rule):
         debug = self._config["debug_rules"]
@@ -3724,10 +4562,11 @@ class EventStatus(object):
                 preserve["contact"] = found["contact"]
         found.update(event)
         found.update(preserve)
+        self.reindex_event(found)
 
     def count_expected_event(self, event_server, event):
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"] and ev["phase"] == "counting":
+        for ev in self._events_by_rule.get(event["rule_id"], {}).itervalues():
+            if ev["phase"] == "counting":
                 self.count_event_up(ev, event)
                 return
 
@@ -3742,31 +4581,35 @@ class EventStatus(object):
         # we do never modify events that are already in the state "open"
         # since the event has been created because the count was too
         # low in the specified period of time.
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"]:
-                if ev["phase"] == "ack" and not count["count_ack"]:
-                    continue  # skip acknowledged events
+        if count["separate_host"]:
+            candidates = self._events_by_rule_and_host.get((event["rule_id"], event["host"]), {})
+        else:
+            candidates = self._events_by_rule.get(event["rule_id"], {})
 
-                if count["separate_host"] and ev["host"] != event["host"]:
-                    continue  # treat events with separated hosts separately
+        for ev in candidates.itervalues():
+            if ev["phase"] == "ack" and not count["count_ack"]:
+                continue  # skip acknowledged events
 
-                if count["separate_application"] and ev["application"] != event["application"]:
-                    continue  # same for application
+            if count["separate_host"] and ev["host"] != event["host"]:
+                continue  # treat events with separated hosts separately
 
-                if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
-                    continue
+            if count["separate_application"] and ev["application"] != event["application"]:
+                continue  # same for application
 
-                if count.get("count_duration"
-                            ) is not None and ev["first"] + count["count_duration"] < event["time"]:
-                    # Counting has been discontinued on this event after a certain time
-                    continue
+            if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
+                continue
 
-                if ev["host_in_downtime"] != event["host_in_downtime"]:
-                    continue  # treat events with different downtime states separately
+            if count.get("count_duration"
+                        ) is not None and ev["first"] + count["count_duration"] < event["time"]:
+                # Counting has been discontinued on this event after a certain time
+                continue
 
-                found = ev
-                self.count_event_up(found, event)
-                break
+            if ev["host_in_downtime"] != event["host_in_downtime"]:
+                continue  # treat events with different downtime states separately
+
+            found = ev
+            self.count_event_up(found, event)
+            break
         else:
             event["count"] = 1
             event["phase"] = "counting"
@@ -3776,23 +4619,23 @@ class EventStatus(object):
         # Did we just count the event that was just one too much?
         if found["phase"] == "counting" and found["count"] >= count["count"]:
             found["phase"] = "open"
+            self.event_changed(found)
             return found  # do event action, return found copy of event
         return False  # do not do event action
 
     # locked with self.lock
     def delete_event(self, event_id, user):
-        for nr, event in enumerate(self._events):
-            if event["id"] == event_id:
-                event["phase"] = "closed"
-                if user:
-                    event["owner"] = user
-                self._history.add(event, "DELETE", user)
-                self._remove_event_by_nr(nr)
-                return
-        raise MKClientError("No event with id %s" % event_id)
+        event = self._events.get(event_id)
+        if event is None:
+            raise MKClientError("No event with id %s" % event_id)
+        event["phase"] = "closed"
+        if user:
+            event["owner"] = user
+        self._history.add(event, "DELETE", user)
+        self.remove_event(event)
 
     def get_events(self):
-        return self._events
+        return self._events.values()
 
     def get_rule_stats(self):
         return sorted(self._rule_stats.iteritems(), key=lambda x: x[0])
@@ -4154,6 +4997,9 @@ def main():
         signal.signal(signal.SIGQUIT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
 
+        # Fork the worker processes before any other thread is started
+        event_server.start_workers()
+
         # Now let's go...
         run_eventd(terminate_main_event, settings, config, lock_configuration, history,
                    perfcounters, event_status, event_server, status_server, slave_status, logger)
@@ -4182,6 +5028,9 @@ def main():
         logger.verbose("Output hash stats")
         event_server.output_hash_stats()
 
+        logger.verbose("Stopping event worker processes")
+        event_server.stop_workers()
+
         logger.verbose("Closing fds which might be still open")
         for fd in [
                 settings.options.syslog_udp, settings.options.syslog_tcp,
@@ -24,6 +24,9 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import array
+import itertools
+import marshal
 import time
 import os
 
@@ -33,7 +36,9 @@ import cmk.utils.store as store
 
 import cmk.gui.utils as utils
 import cmk.gui.bi as bi
+import cmk.gui.config as config
 import cmk.gui.sites as sites
+import cmk.gui.gui_background_job as gui_background_job
 from cmk.gui.valuespec import (
     Integer,
     Age,
@@ -630,39 +635,21 @@ def get_availability_rawdata(what, context, filterheaders, only_sites, av_object
 
     time_range, _range_title = avoptions["range"]
 
-    av_filter = "Filter: time >= %d\nFilter: time < %d\n" % time_range
     if av_object:
         tl_site, tl_host, tl_service = av_object
-        av_filter += "Filter: host_name = %s\nFilter: service_description = %s\n" % (tl_host,
-                                                                                     tl_service)
+        object_filter = "Filter: host_name = %s\nFilter: service_description = %s\n" % (tl_host,
+                                                                                        tl_service)
         only_sites = [tl_site]
     elif what == "service":
-        av_filter += "Filter: service_description !=\n"
+        object_filter = "Filter: service_description !=\n"
     else:
-        av_filter += "Filter: service_description =\n"
-
-    query = "GET statehist\n" + av_filter
-    query += "Timelimit: %d\n" % avoptions["timelimit"]
-    logrow_limit = avoptions["logrow_limit"]
-    if logrow_limit:
-        query += "Limit: %d\n" % (logrow_limit + 1)
+        object_filter = "Filter: service_description =\n"
 
     # Add Columns needed for object identification
     columns = ["host_name", "service_description"]
 
     # Columns for availability
-    columns += [
-        "duration",
-        "from",
-        "until",
-        "state",
-        "host_down",
-        "in_downtime",
-        "in_host_downtime",
-        "in_notification_period",
-        "in_service_period",
-        "is_flapping",
-    ]
+    columns += availability_columns
     if include_output:
         columns.append("log_output")
     if include_long_output:
@@ -676,56 +663,228 @@ def get_availability_rawdata(what, context, filterheaders, only_sites, av_object
     if avoptions["grouping"] not in [None, "host"]:
         columns.append(avoptions["grouping"])
 
-    query += "Columns: %s\n" % " ".join(columns)
-    query += filterheaders
-
-    sites.live().set_prepend_site(True)
-    sites.live().set_only_sites(only_sites)
-    data = sites.live().query(query)
-    sites.live().set_only_sites(None)
-    sites.live().set_prepend_site(False)
     columns = ["site"] + columns
-    spans = [dict(zip(columns, span)) for span in data]
+    logrow_limit = avoptions["logrow_limit"]
+
+    def statehist_query(query_range, query_columns):
+        query = "GET statehist\nFilter: time >= %d\nFilter: time < %d\n" % query_range
+        query += object_filter
+        query += "Timelimit: %d\n" % avoptions["timelimit"]
+        if logrow_limit:
+            query += "Limit: %d\n" % (logrow_limit + 1)
+        query += "Columns: %s\n" % " ".join(query_columns[1:])
+        query += filterheaders
+        return query
 
     # When a group filter is set, only care about these groups in the group fields
+    group_filter = None
     if avoptions["grouping"] not in [None, "host"]:
-        filter_groups_of_entries(context, avoptions, spans)
+        only_groups = get_only_groups(context, avoptions["grouping"])
+        if only_groups is not None:
+            group_filter = columns.index(avoptions["grouping"]), only_groups
+
+    # Use the rollups of whole days, if they exist. The timeline of a single object,
+    # the plugin output and unmerged spans need the complete state history.
+    if config.availability_rollup_days and not av_object and not include_output \
+            and not include_long_output and not avoptions["dont_merge"]:
+        site_ids = only_sites or sites.live().alive_sites()
+        rollup_range = get_rollup_range(time_range, site_ids)
+        if rollup_range:
+            av_rawdata = get_rollup_rawdata(what, time_range, rollup_range, columns,
+                                            statehist_query, site_ids, only_sites, group_filter,
+                                            filterheaders, logrow_limit)
+            if av_rawdata is not None:
+                return av_rawdata, False
+
+    # The state history can be huge. Decode it row by row from the fast JSON format
+    # instead of keeping the complete response in memory.
+    av_rawdata = {}
+    num_spans, last_row = add_spans(
+        av_rawdata, columns, query_statehist_rows(statehist_query(time_range, columns), only_sites),
+        group_filter)
 
     # Now we find out if the log row limit was exceeded or
     # if the log's length is the limit by accident.
     # If this limit was exceeded then we cut off the last element
     # in spans_by_object because it might be incomplete.
     logrow_limit_reached_entry = None
-    if logrow_limit and len(data) >= logrow_limit + 1:
-        logrow_limit_reached_entry = dict(zip(columns, data[-1]))
+    if logrow_limit and num_spans >= logrow_limit + 1:
+        logrow_limit_reached_entry = dict(zip(columns, last_row))
+        remove_incomplete_object(av_rawdata, logrow_limit_reached_entry)
+
+    return av_rawdata, logrow_limit_reached_entry is not None
+
+
+# The columns of the state history the availability is computed of
+availability_columns = [
+    "duration",
+    "from",
+    "until",
+    "state",
+    "host_down",
+    "in_downtime",
+    "in_host_downtime",
+    "in_notification_period",
+    "in_service_period",
+    "is_flapping",
+]
 
-    return spans_by_object(spans, logrow_limit_reached_entry)
+
+# Streams the rows of a statehist query. The site is prepended to each row.
+def query_statehist_rows(query, only_sites):
+    sites.live().set_prepend_site(True)
+    sites.live().set_only_sites(only_sites)
+    sites.live().set_output_format("json")
+    try:
+        for row in sites.live().query_rows(query):
+            yield row
+    finally:
+        sites.live().set_output_format("python")
+        sites.live().set_only_sites(None)
+        sites.live().set_prepend_site(False)
+
+
+# Sort the rows into columnar spans by site/host and service, while keeping
+# native order. Returns the number of rows and the last row.
+def add_spans(av_rawdata, columns, rows, group_filter):
+    num_spans = 0
+    last_row = None
+    for last_row in rows:
+        num_spans += 1
+        if group_filter is not None:
+            group_index, only_groups = group_filter
+            last_row[group_index] = list(set(last_row[group_index]).intersection(only_groups))
+
+        service_entries = av_rawdata.setdefault((last_row[0], last_row[1]), {})
+        spans = service_entries.get(last_row[2])
+        if spans is None:
+            spans = service_entries[last_row[2]] = AVSpans(columns)
+        spans.append(last_row)
+    return num_spans, last_row
+
+
+class AVSpans(object):
+    """The spans of the state history of one object
+
+    The spans are stored column by column, the numeric columns in arrays,
+    which needs only a fraction of the memory of one dict per span and lets
+    compute_availability() classify the spans without creating dicts. The
+    spans can be accessed like a list of span dicts, which are created on
+    demand."""
+
+    # Type codes of the arrays of the numeric columns. The other columns are
+    # stored in lists.
+    _typecodes = {
+        "duration": "l",
+        "from": "l",
+        "until": "l",
+        "state": "b",
+        "host_down": "b",
+        "in_downtime": "b",
+        "in_host_downtime": "b",
+        "in_notification_period": "b",
+        "in_service_period": "b",
+        "is_flapping": "b",
+    }
+    _no_state = -128  # Stored for the state None
+
+    def __init__(self, columns):
+        super(AVSpans, self).__init__()
+        self._columns = {}
+        self._appenders = []
+        for column in columns:
+            if column in self._typecodes:
+                values = array.array(self._typecodes[column])
+            else:
+                values = []
+            self._columns[column] = values
+            self._appenders.append(values.append)
+        self._state_index = columns.index("state")
+
+    def append(self, row):
+        if row[self._state_index] is None:
+            row = row[:]
+            row[self._state_index] = self._no_state
+        for append, value in zip(self._appenders, row):
+            append(value)
+
+    def __len__(self):
+        return len(self._columns["duration"])
+
+    def __getitem__(self, index):
+        span = {column: values[index] for column, values in self._columns.iteritems()}
+        if span["state"] == self._no_state:
+            span["state"] = None
+        return span
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def column(self, column):
+        return self._columns[column]
+
+    def last_value(self, column, default):
+        values = self._columns.get(column)
+        if not values:
+            return default
+        return values[-1]
+
+    def classification_rows(self):
+        """Iterate over the index, duration, from, until and the values needed
+        for classify_span() of all spans"""
+        columns = self._columns
+        return itertools.izip(
+            itertools.count(),
+            columns["duration"],
+            columns["from"],
+            columns["until"],
+            itertools.imap(lambda state: None if state == self._no_state else state,
+                           columns["state"]),
+            columns["in_service_period"],
+            columns["in_notification_period"],
+            itertools.imap(lambda d, h: d or h, columns["in_downtime"],
+                           columns["in_host_downtime"]),
+            columns["host_down"],
+            columns["is_flapping"],
+        )
 
 
 def filter_groups_of_entries(context, avoptions, spans):
     group_by = avoptions["grouping"]
+    only_groups = get_only_groups(context, group_by)
+    if only_groups is None:
+        return
 
+    for span in spans:
+        filtered_groups = list(set(span[group_by]).intersection(only_groups))
+        span[group_by] = filtered_groups
+
+
+# Returns the groups the group fields of the spans are restricted to by the
+# group filters of the context or None, if they are not restricted
+def get_only_groups(context, group_by):
     only_groups = set()
     # TODO: This is a dirty hack. The logic of the filters needs to be moved to the filters.
     # They need to be able to filter the list of all groups.
     # TODO: Negated filters are not handled here. :(
     if group_by == "service_groups":
         if "servicegroups" not in context and "optservicegroup" not in context:
-            return
+            return None
 
         # Extract from context:
         # 'servicegroups': {'servicegroups': 'cpu|disk', 'neg_servicegroups': 'off'},
         # 'optservicegroup': {'optservice_group': '', 'neg_optservice_group': 'off'},
         negated = context.get("servicegroups", {}).get("neg_servicegroups") == "on"
         if negated:
-            return
+            return None
 
         only_groups.update(
             [e for e in context.get("servicegroups", {}).get("servicegroups", "").split("|") if e])
 
         negated = context.get("optservicegroup", {}).get("neg_optservice_group") == "on"
         if negated:
-            return
+            return None
 
         group_name = context.get("optservicegroup", {}).get("optservice_group")
         if group_name and not negated:
@@ -733,18 +892,18 @@ def filter_groups_of_entries(context, avoptions, spans):
 
     elif group_by == "host_groups":
         if "hostgroups" not in context and "opthostgroup" not in context:
-            return
+            return None
 
         negated = context.get("hostgroups", {}).get("neg_hostgroups") == "on"
         if negated:
-            return
+            return None
 
         only_groups.update(
             [e for e in context.get("hostgroups", {}).get("hostgroups", "").split("|") if e])
 
         negated = context.get("opthostgroup", {}).get("neg_opthost_group") == "on"
         if negated:
-            return
+            return None
 
         group_name = context.get("opthostgroup", {}).get("opthost_group")
         if group_name and not negated:
@@ -753,9 +912,7 @@ def filter_groups_of_entries(context, avoptions, spans):
     else:
         raise NotImplementedError()
 
-    for span in spans:
-        filtered_groups = list(set(span[group_by]).intersection(only_groups))
-        span[group_by] = filtered_groups
+    return only_groups
 
 
 # Sort the raw spans into a tree of dicts, so that we
@@ -770,16 +927,20 @@ def spans_by_object(spans, logrow_limit_reached_entry):
         av_rawdata[site_host].setdefault(service, []).append(span)
 
     if logrow_limit_reached_entry:
-        site_host = (logrow_limit_reached_entry["site"], logrow_limit_reached_entry["host_name"])
-        if logrow_limit_reached_entry["service_description"]:
-            del av_rawdata[site_host][logrow_limit_reached_entry["service_description"]]
-        else:
-            del av_rawdata[site_host]
+        remove_incomplete_object(av_rawdata, logrow_limit_reached_entry)
 
     # We have to remember if rawdata was modified
     return av_rawdata, logrow_limit_reached_entry is not None
 
 
+def remove_incomplete_object(av_rawdata, logrow_limit_reached_entry):
+    site_host = (logrow_limit_reached_entry["site"], logrow_limit_reached_entry["host_name"])
+    if logrow_limit_reached_entry["service_description"]:
+        del av_rawdata[site_host][logrow_limit_reached_entry["service_description"]]
+    else:
+        del av_rawdata[site_host]
+
+
 # Compute an availability table. what is one of "bi", "host", "service".
 def compute_availability(what, av_rawdata, avoptions):
     reclassified_rawdata = reclassify_by_annotations(what, av_rawdata)
@@ -816,76 +977,43 @@ def compute_availability(what, av_rawdata, avoptions):
                 group_ids = None
 
             # First compute timeline
-            timeline_rows = []
-            total_duration = 0
-            considered_duration = 0
-            for span in service_entry:
+            if isinstance(service_entry, AVSpans):
+                timeline_rows, total_duration, considered_duration = \
+                    compute_columnar_timeline(what, service_entry, avoptions)
 
                 # Information about host/service groups are in the actual entries
                 if grouping and grouping != "host" and what != "bi":
-                    group_ids.update(span[grouping])  # List of host/service groups
-
-                display_name = span.get("service_display_name", service)
-                state = span["state"]
-                host_alias = span.get("host_alias", site_host[1])
-                consider = True
-
-                if avoptions["service_period"] != "ignore" and \
-                    (( span["in_service_period"] and avoptions["service_period"] != "honor" )
-                    or \
-                    ( not span["in_service_period"] and avoptions["service_period"] == "honor" )):
-                    s = "outof_service_period"
-                    consider = False
-                elif state == -1:
-                    s = "unmonitored"
-                    if not avoptions["consider"]["unmonitored"]:
-                        consider = False
-                elif state is None:
-                    # state is None means that this element was not known at this given time
-                    # So there is no reason for creating a fake pending state
-                    consider = False
-                elif span["in_notification_period"] == 0 and avoptions[
-                        "notification_period"] == "exclude":
-                    consider = False
-
-                elif span["in_notification_period"] == 0 and avoptions[
-                        "notification_period"] == "honor":
-                    s = "outof_notification_period"
-
-                elif (span["in_downtime"] or span["in_host_downtime"]) and not \
-                    (avoptions["downtimes"]["exclude_ok"] and state == 0) and not \
-                    avoptions["downtimes"]["include"] == "ignore":
-                    if avoptions["downtimes"]["include"] == "exclude":
-                        consider = False
-                    else:
-                        s = "in_downtime"
-                elif what != "host" and span["host_down"] and avoptions["consider"]["host_down"]:
-                    # Reclassification due to state grouping
-                    s = avoptions["state_grouping"].get("host_down", "host_down")
+                    for groups in service_entry.column(grouping):
+                        group_ids.update(groups)  # List of host/service groups
 
-                elif span["is_flapping"] and avoptions["consider"]["flapping"]:
-                    s = "flapping"
-                else:
-                    if what in ["service", "bi"]:
-                        s = {0: "ok", 1: "warn", 2: "crit", 3: "unknown"}.get(state, "unmonitored")
-                    else:
-                        s = {0: "up", 1: "down", 2: "unreach"}.get(state, "unmonitored")
-
-                    # Reclassification due to state grouping
-                    if s in avoptions["state_grouping"]:
-                        s = avoptions["state_grouping"][s]
-
-                    elif s in avoptions["host_state_grouping"]:
-                        s = avoptions["host_state_grouping"][s]
-
-                total_duration += span["duration"]
-                if consider:
-                    timeline_rows.append((span, s))
-                    considered_duration += span["duration"]
+                display_name = service_entry.last_value("service_display_name", service)
+                host_alias = service_entry.last_value("host_alias", site_host[1])
 
-            # Now merge consecutive rows with identical state
-            if not avoptions["dont_merge"]:
-                merge_timeline(timeline_rows)
+            else:
+                timeline_rows = []
+                total_duration = 0
+                considered_duration = 0
+                for span in service_entry:
+
+                    # Information about host/service groups are in the actual entries
+                    if grouping and grouping != "host" and what != "bi":
+                        group_ids.update(span[grouping])  # List of host/service groups
+
+                    display_name = span.get("service_display_name", service)
+                    host_alias = span.get("host_alias", site_host[1])
+                    s, consider = classify_span(what, span["state"], span["in_service_period"],
+                                                span["in_notification_period"],
+                                                span["in_downtime"] or span["in_host_downtime"],
+                                                span["host_down"], span["is_flapping"], avoptions)
+
+                    total_duration += span["duration"]
+                    if consider:
+                        timeline_rows.append((span, s))
+                        considered_duration += span["duration"]
+
+                # Now merge consecutive rows with identical state
+                if not avoptions["dont_merge"]:
+                    merge_timeline(timeline_rows)
 
             # Melt down short intervals
             if avoptions["short_intervals"]:
@@ -934,6 +1062,99 @@ def compute_availability(what, av_rawdata, avoptions):
     return filtered_table
 
 
+# Returns the state a span is accounted to and whether or not it is considered
+def classify_span(what, state, in_service_period, in_notification_period, in_downtime, host_down,
+                  is_flapping, avoptions):
+    s = None
+    consider = True
+
+    if avoptions["service_period"] != "ignore" and \
+        (( in_service_period and avoptions["service_period"] != "honor" )
+        or \
+        ( not in_service_period and avoptions["service_period"] == "honor" )):
+        s = "outof_service_period"
+        consider = False
+    elif state == -1:
+        s = "unmonitored"
+        if not avoptions["consider"]["unmonitored"]:
+            consider = False
+    elif state is None:
+        # state is None means that this element was not known at this given time
+        # So there is no reason for creating a fake pending state
+        consider = False
+    elif in_notification_period == 0 and avoptions["notification_period"] == "exclude":
+        consider = False
+
+    elif in_notification_period == 0 and avoptions["notification_period"] == "honor":
+        s = "outof_notification_period"
+
+    elif in_downtime and not \
+        (avoptions["downtimes"]["exclude_ok"] and state == 0) and not \
+        avoptions["downtimes"]["include"] == "ignore":
+        if avoptions["downtimes"]["include"] == "exclude":
+            consider = False
+        else:
+            s = "in_downtime"
+    elif what != "host" and host_down and avoptions["consider"]["host_down"]:
+        # Reclassification due to state grouping
+        s = avoptions["state_grouping"].get("host_down", "host_down")
+
+    elif is_flapping and avoptions["consider"]["flapping"]:
+        s = "flapping"
+    else:
+        if what in ["service", "bi"]:
+            s = {0: "ok", 1: "warn", 2: "crit", 3: "unknown"}.get(state, "unmonitored")
+        else:
+            s = {0: "up", 1: "down", 2: "unreach"}.get(state, "unmonitored")
+
+        # Reclassification due to state grouping
+        if s in avoptions["state_grouping"]:
+            s = avoptions["state_grouping"][s]
+
+        elif s in avoptions["host_state_grouping"]:
+            s = avoptions["host_state_grouping"][s]
+
+    return s, consider
+
+
+# Computes the timeline of columnar spans like the loop over the span dicts
+# in compute_availability(). Each distinct combination of state and flags is
+# only classified once and consecutive spans are merged before span dicts are
+# created for the timeline rows.
+def compute_columnar_timeline(what, spans, avoptions):
+    merge = not avoptions["dont_merge"]
+    classifications = {}
+    runs = []  # index of first span, state, until, duration
+    total_duration = 0
+    considered_duration = 0
+    for row in spans.classification_rows():
+        index, duration, from_time, until_time = row[:4]
+        total_duration += duration
+
+        key = row[4:]
+        classification = classifications.get(key)
+        if classification is None:
+            classification = classifications[key] = classify_span(what, *(key + (avoptions,)))
+        s, consider = classification
+        if not consider:
+            continue
+
+        considered_duration += duration
+        if merge and runs and runs[-1][1] == s and runs[-1][2] == from_time:
+            runs[-1][2] = until_time
+            runs[-1][3] += duration
+        else:
+            runs.append([index, s, until_time, duration])
+
+    timeline_rows = []
+    for index, s, until_time, duration in runs:
+        span = spans[index]
+        span["until"] = until_time
+        span["duration"] = duration
+        timeline_rows.append((span, s))
+    return timeline_rows, total_duration, considered_duration
+
+
 # Note: Reclassifications of host/service periods do currently *not* have
 # any impact on BI aggregations.
 def reclassify_by_annotations(what, av_rawdata):
@@ -1121,6 +1342,291 @@ def melt_short_intervals(entries, duration, dont_merge):
         melt_short_intervals(entries, duration, dont_merge)
 
 
+#.
+#   .--Rollups-------------------------------------------------------------.
+#   |                   ____       _ _                                     |
+#   |                  |  _ \ ___ | | |_   _ _ __  ___                     |
+#   |                  | |_) / _ \| | | | | | '_ \/ __|                    |
+#   |                  |  _ < (_) | | | |_| | |_) \__ \                    |
+#   |                  |_| \_\___/|_|_|\__,_| .__/|___/                    |
+#   |                                       |_|                            |
+#   +----------------------------------------------------------------------+
+#   |  The state history of whole days is rolled up per site and day by a  |
+#   |  background job, so that long time ranges do not need to be read     |
+#   |  from the state history again and again. The rollups keep the        |
+#   |  unclassified spans of each object, where consecutive spans with     |
+#   |  the same state and flags are merged. Annotations and the options    |
+#   |  are applied to them just like to the spans of the state history.    |
+#   '----------------------------------------------------------------------'
+
+# The columns which are kept of the last span of an object per day
+rollup_object_columns = [
+    "host_alias",
+    "service_display_name",
+    "host_groups",
+    "service_groups",
+]
+
+
+def rollup_dir():
+    return os.path.join(cmk.utils.paths.var_dir, "availability_rollups")
+
+
+def rollup_path(site_id, day):
+    return os.path.join(rollup_dir(), site_id, time.strftime("%Y-%m-%d", time.localtime(day)))
+
+
+def day_start(t):
+    lt = time.localtime(t)
+    return int(time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+
+def next_day_start(day):
+    # Days have between 23 and 25 hours due to daylight saving time
+    return day_start(day + 30 * 3600)
+
+
+# Returns the longest range of whole days within the time range for which
+# the rollups of all given sites exist or None
+def get_rollup_range(time_range, site_ids):
+    if not site_ids:
+        return None
+
+    from_time, until_time = time_range
+    day = day_start(from_time)
+    if day < from_time:
+        day = next_day_start(day)
+
+    rollup_range, current_range = None, None
+    while True:
+        next_day = next_day_start(day)
+        if next_day > until_time:
+            break
+
+        if all(os.path.exists(rollup_path(site_id, day)) for site_id in site_ids):
+            current_range = (current_range[0] if current_range else day, next_day)
+            if not rollup_range or \
+                    current_range[1] - current_range[0] > rollup_range[1] - rollup_range[0]:
+                rollup_range = current_range
+        else:
+            current_range = None
+        day = next_day
+
+    return rollup_range
+
+
+# The rollups contain all objects of a site. They can only be used as they are,
+# when neither the filters nor the permissions of the user restrict the objects.
+def rollup_objects_visible(filterheaders):
+    return not filterheaders and config.user.may("general.see_all") \
+        and not html.request.var("force_authuser")
+
+
+# Gets the raw availability data like get_availability_rawdata() does, but takes
+# the whole days in rollup_range from the rollups and only queries the state
+# history of the partial days at the edges of the time range. The objects are
+# taken from the queried state history, which is restricted by the filters and
+# the permissions of the user. Objects which only exist within the rolled up
+# days are taken from the rollups when all objects are visible. Otherwise None is
+# returned, just like when the log row limit is reached.
+def get_rollup_rawdata(what, time_range, rollup_range, columns, statehist_query, site_ids,
+                       only_sites, group_filter, filterheaders, logrow_limit):
+    objects = set()
+    edge_rows = []
+    for query_range, probe_range in [
+        ((time_range[0], rollup_range[0]), (rollup_range[0], rollup_range[0] + 1)),
+        ((rollup_range[1], time_range[1]), (rollup_range[1] - 1, rollup_range[1])),
+    ]:
+        if query_range[0] < query_range[1]:
+            rows = list(query_statehist_rows(statehist_query(query_range, columns), only_sites))
+            object_rows = rows
+        else:
+            # Nothing to query at this edge, but the objects at the edge of the
+            # rollups need to be known
+            rows = []
+            object_rows = list(
+                query_statehist_rows(statehist_query(probe_range, columns[:3]), only_sites))
+
+        if logrow_limit and len(object_rows) >= logrow_limit + 1:
+            return None
+        objects.update(tuple(row[:3]) for row in object_rows)
+        edge_rows.append(rows)
+
+    inner_objects = rollup_objects(what, rollup_range, site_ids) - objects
+    if inner_objects:
+        if not rollup_objects_visible(filterheaders):
+            return None
+        objects.update(inner_objects)
+
+    av_rawdata = {}
+    add_spans(av_rawdata, columns, edge_rows[0], group_filter)
+    add_spans(av_rawdata, columns, rollup_rows(rollup_range, columns, objects), group_filter)
+    add_spans(av_rawdata, columns, edge_rows[1], group_filter)
+    return av_rawdata
+
+
+# Returns the site, host name and service description of the hosts or services
+# of the rollups of the days in rollup_range
+def rollup_objects(what, rollup_range, site_ids):
+    objects = set()
+    day = rollup_range[0]
+    while day < rollup_range[1]:
+        for site_id in site_ids:
+            for host_name, service_description in load_rollups(site_id, day):
+                if bool(service_description) == (what == "service"):
+                    objects.add((site_id, host_name, service_description))
+        day = next_day_start(day)
+    return objects
+
+
+# Creates state history rows with the given columns of the given objects from
+# the rollups of the days in rollup_range
+def rollup_rows(rollup_range, columns, objects):
+    objects_by_site = {}
+    for site_id, host_name, service_description in objects:
+        objects_by_site.setdefault(site_id, []).append((host_name, service_description))
+
+    object_columns = columns[3 + len(availability_columns):]
+    day = rollup_range[0]
+    while day < rollup_range[1]:
+        for site_id, site_objects in objects_by_site.iteritems():
+            rollups = load_rollups(site_id, day)
+            for host_name, service_description in site_objects:
+                rollup = rollups.get((host_name, service_description))
+                if rollup is None:
+                    continue
+
+                runs, object_values = rollup
+                object_row = [object_values.get(column) for column in object_columns]
+                for run in runs:
+                    yield [site_id, host_name, service_description] + list(run) + object_row
+        day = next_day_start(day)
+
+
+def load_rollups(site_id, day):
+    with open(rollup_path(site_id, day), "rb") as f:
+        return marshal.load(f)
+
+
+def save_rollups(site_id, day, rollups):
+    path = rollup_path(site_id, day)
+    store.makedirs(os.path.dirname(path))
+    tmp_path = path + ".new"
+    with open(tmp_path, "wb") as f:
+        marshal.dump(rollups, f)
+    os.rename(tmp_path, path)
+
+
+# Rolls up the state history of those of the last num_days days which have not
+# been rolled up yet, starting with the most recent day, and removes the rollups
+# of older days. Returns the number of rolled up days.
+def update_rollups(num_days, logger):
+    days = [day_start(time.time())]
+    for _unused in xrange(num_days):
+        days.append(day_start(days[-1] - 1))
+    days = days[1:]
+
+    num_rolled_up = 0
+    for day in days:
+        site_ids = [
+            site_id for site_id in sites.live().alive_sites()
+            if not os.path.exists(rollup_path(site_id, day))
+        ]
+        if not site_ids:
+            continue
+
+        logger.info("Rolling up the state history of %s of the sites %s" % (time.strftime(
+            "%Y-%m-%d", time.localtime(day)), ", ".join(site_ids)))
+        query = "GET statehist\nFilter: time >= %d\nFilter: time < %d\nColumns: %s\n" % (
+            day, next_day_start(day), " ".join(["host_name", "service_description"] +
+                                               availability_columns + rollup_object_columns))
+
+        site_rollups = {site_id: {} for site_id in site_ids}
+        for row in query_statehist_rows(query, site_ids):
+            add_to_rollups(site_rollups[row[0]], row)
+
+        # Sites which failed to answer are rolled up by one of the next runs
+        for site_id in sites.live().alive_sites():
+            if site_id in site_rollups:
+                save_rollups(site_id, day, site_rollups[site_id])
+        num_rolled_up += 1
+
+    if days:
+        remove_old_rollups(days[-1])
+    return num_rolled_up
+
+
+def add_to_rollups(rollups, row):
+    num_span_columns = len(availability_columns)
+    span = tuple(row[3:3 + num_span_columns])
+    rollup = rollups.get((row[1], row[2]))
+    if rollup is None:
+        rollup = rollups[(row[1], row[2])] = ([], {})
+    runs, object_values = rollup
+
+    # Merge consecutive spans with the same state and flags
+    if runs and runs[-1][2] == span[1] and runs[-1][3:] == span[3:]:
+        last_run = runs[-1]
+        runs[-1] = (last_run[0] + span[0], last_run[1], span[2]) + span[3:]
+    else:
+        runs.append(span)
+
+    object_values.update(zip(rollup_object_columns, row[3 + num_span_columns:]))
+
+
+def remove_old_rollups(oldest_day):
+    oldest_name = os.path.basename(rollup_path("", oldest_day))
+    for site_id in os.listdir(rollup_dir()):
+        site_dir = os.path.join(rollup_dir(), site_id)
+        if not os.path.isdir(site_dir):
+            continue
+        for name in os.listdir(site_dir):
+            if name < oldest_name:
+                os.unlink(os.path.join(site_dir, name))
+
+
+def execute_rollup_job():
+    """This function is called by the GUI cron job once a minute.
+
+    The rollups are updated once an hour, when they are enabled."""
+    if not config.availability_rollup_days:
+        return
+
+    last_run_path = os.path.join(rollup_dir(), "last_run")
+    if os.path.exists(last_run_path) and time.time() - os.stat(last_run_path).st_mtime < 3600:
+        return
+
+    job = AvailabilityRollupBackgroundJob()
+    if job.is_running():
+        return
+
+    store.makedirs(rollup_dir())
+    open(last_run_path, "w").close()  # touches the file
+    job.set_function(job.do_execute)
+    job.start()
+
+
+@gui_background_job.job_registry.register
+class AvailabilityRollupBackgroundJob(gui_background_job.GUIBackgroundJob):
+    job_prefix = "availability_rollups"
+
+    @classmethod
+    def gui_title(cls):
+        return _("Availability rollups")
+
+    def __init__(self):
+        kwargs = {}
+        kwargs["title"] = self.gui_title()
+        kwargs["deletable"] = False
+        kwargs["stoppable"] = True
+
+        super(AvailabilityRollupBackgroundJob, self).__init__(self.job_prefix, **kwargs)
+
+    def do_execute(self, job_interface):
+        num_days = update_rollups(config.availability_rollup_days, job_interface.get_logger())
+        job_interface.send_result_message(_("Rolled up the state history of %d days") % num_days)
+
+
 #.
 #   .--Annotations---------------------------------------------------------.
 #   |         _                      _        _   _                        |
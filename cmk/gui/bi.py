@@ -24,6 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import bisect
 import hashlib
 import re
 import pprint
@@ -176,6 +177,8 @@ g_bi_job_manager = None
 g_services_items = None
 g_services = {}
 g_services_by_hostname = {}
+g_host_index = None  # BIHostIndex of g_services
+g_compile_stats = {"hosts": 0, "services": 0}  # Hosts and services examined by the rules
 g_assumptions = {}
 g_remaining_refs = []
 # dictionary with hosts and its compiled services
@@ -183,6 +186,7 @@ g_compiled_services_leafes = {}
 
 g_tree_cache = {}
 g_config_information = None  # for invalidating cache after config change
+g_incremental_states = {}  # user id -> BIIncrementalState, see bi_incremental_evaluation
 did_compilation = False  # Is set to true if anything has been compiled
 
 regex_host_hit_cache = set()
@@ -357,11 +361,15 @@ class JobWorker(multiprocessing.Process):
                     job["id"],
                 ))
                 new_data = self.compile_job(job["id"], job["info"])
-                log("[%s] Compilation finished %r - took %.3f sec" % (
-                    self._parent_pid,
-                    job["id"],
-                    time.time() - start_time,
-                ))
+                log("[%s] Compilation finished %r - took %.3f sec, examined %d hosts and %d "
+                    "services for %d aggregations" % (
+                        self._parent_pid,
+                        job["id"],
+                        time.time() - start_time,
+                        g_compile_stats["hosts"],
+                        g_compile_stats["services"],
+                        len(new_data["aggr_ref"]),
+                    ))
             except Exception:
                 log("[%s] MP-Worker Exception %s" % (self._parent_pid, traceback.format_exc()))
                 self._compilation_errors.append("Aggregation error: %s" % traceback.format_exc())
@@ -417,6 +425,7 @@ class JobWorker(multiprocessing.Process):
                     g_services_by_hostname[key] = values
 
         g_services_items = g_services.items()
+        g_compile_stats.update(hosts=0, services=0)
 
         log("Compiling aggregation %d/%d: %r with %d hosts" % (
             aggr_type,
@@ -1399,10 +1408,15 @@ def api_get_aggregation_state(filter_names=None, filter_groups=None):
             tree_lookup.setdefault(aggr_title, {"tree": tree, "groups": set()})["groups"].add(group)
 
     # Prefetch data for later usage - this saves lots of redundant livestatus queries
-    status_info = get_status_info(required_hosts)
+    incremental_state = get_incremental_state()
+    if incremental_state:
+        status_info = incremental_state.update(required_hosts)
+    else:
+        status_info = get_status_info(required_hosts)
 
     for aggr_title in required_trees:
-        aggr_tree = create_aggregation_row(tree_lookup[aggr_title]["tree"], status_info)
+        aggr_tree = create_aggregation_row(tree_lookup[aggr_title]["tree"], status_info,
+                                           incremental_state)
         if aggr_tree["aggr_state"]["state"] is None:
             continue  # Not yet monitored, aggregation is not displayed
 
@@ -1588,12 +1602,16 @@ def find_matching_services(aggr_type, what, calllist):
     matches = set([])
 
     if isinstance(host_spec, tuple):
-        host_spec, honor_site, entries = get_services_filtered_by_host_alias(host_spec)
+        host_spec, honor_site, entries = get_services_filtered_by_host_alias(
+            host_spec, required_tags)
     else:
-        host_spec, honor_site, entries = get_services_filtered_by_host_name(host_spec)
+        host_spec, honor_site, entries = get_services_filtered_by_host_name(
+            host_spec, required_tags)
 
-    # TODO: Hier könnte man - wenn der Host bekannt ist, effektiver arbeiten, als komplett alles durchzugehen.
+    host_index = get_host_index()
+    service_prefix = regex_literal_prefix(service_re)
     for (site, hostname), (tags, services, childs, parents, alias) in entries:
+        g_compile_stats["hosts"] += 1
         # Skip already compiled hosts
         if aggr_type == AGGR_HOST and (site, hostname) in g_tree_cache.get('compiled_hosts', []):
             continue
@@ -1624,7 +1642,8 @@ def find_matching_services(aggr_type, what, calllist):
                 matches.add(((hostname, alias), host_matches))
                 continue
 
-            for service in services:
+            for service in host_index.services_with_prefix(services, service_prefix):
+                g_compile_stats["services"] += 1
                 mo = (service_re, service)
                 if mo in regex_svc_miss_cache:
                     continue
@@ -1645,14 +1664,15 @@ def find_matching_services(aggr_type, what, calllist):
     return sorted(list(matches))
 
 
-def get_services_filtered_by_host_alias(host_spec):
+def get_services_filtered_by_host_alias(host_spec, required_tags=None):
     honor_site = SITE_SEP in host_spec[1]
-    if g_services_items:
-        return host_spec, honor_site, g_services_items
-    return host_spec, honor_site, g_services.items()
+    if not honor_site and regex_literal_prefix(host_spec[1]) == host_spec[1]:
+        # Exact alias match
+        return host_spec, honor_site, get_host_index().hosts_with_alias(host_spec[1])
+    return host_spec, honor_site, get_all_host_entries(required_tags)
 
 
-def get_services_filtered_by_host_name(host_re):
+def get_services_filtered_by_host_name(host_re, required_tags=None):
     honor_site = SITE_SEP in host_re
 
     if host_re.startswith("^(") and host_re.endswith(")$"):
@@ -1668,15 +1688,89 @@ def get_services_filtered_by_host_name(host_re):
         entries = [((e[0], host_re), e[1]) for e in g_services_by_hostname.get(host_re, [])]
 
     else:
-        # All services
-        if g_services_items:
-            entries = g_services_items
-        else:
-            entries = g_services.items()
+        entries = get_all_host_entries(required_tags)
 
     return host_re, honor_site, entries
 
 
+def get_all_host_entries(required_tags=None):
+    """Return the entries of all hosts which may have the required tags"""
+    if required_tags:
+        hosts = get_host_index().hosts_with_tags(required_tags)
+        if hosts is not None:
+            return [(key, g_services[key]) for key in hosts]
+    if g_services_items:
+        return g_services_items
+    return g_services.items()
+
+
+def get_host_index():
+    global g_host_index
+    if g_host_index is None or g_host_index.services is not g_services:
+        g_host_index = BIHostIndex(g_services)
+    return g_host_index
+
+
+class BIHostIndex(object):
+    """Indexes the hosts of g_services by their tags and aliases
+
+    The services of the hosts are sorted in place, so that the services
+    starting with a literal prefix can be found by bisection."""
+
+    def __init__(self, services):
+        super(BIHostIndex, self).__init__()
+        self.services = services
+        self._hosts_by_tag = {}
+        self._hosts_by_alias = {}
+        for key, entry in services.iteritems():
+            tags, host_services, _childs, _parents, alias = entry
+            for tag in tags:
+                self._hosts_by_tag.setdefault(tag, set()).add(key)
+            self._hosts_by_alias.setdefault(alias, []).append((key, entry))
+            host_services.sort()
+
+    def hosts_with_tags(self, required_tags):
+        """Return the keys of the hosts having all required tags which are not
+        negated, or None if all tags are negated"""
+        hosts = None
+        for tag in required_tags:
+            if tag.startswith('!'):
+                continue
+            tagged_hosts = self._hosts_by_tag.get(tag, set())
+            hosts = tagged_hosts if hosts is None else hosts & tagged_hosts
+        return hosts
+
+    def hosts_with_alias(self, alias):
+        return self._hosts_by_alias.get(alias, [])
+
+    def services_with_prefix(self, services, prefix):
+        """Return the services of a host starting with the prefix"""
+        if not prefix:
+            return services
+        start = end = bisect.bisect_left(services, prefix)
+        while end < len(services) and services[end].startswith(prefix):
+            end += 1
+        return services[start:end]
+
+
+def regex_literal_prefix(pattern):
+    """Return the literal text that all texts matched by the pattern start with
+
+    Only plain ASCII prefixes are returned, they can be compared with byte
+    strings and unicode strings alike."""
+    if not isinstance(pattern, six.string_types) or '|' in pattern:
+        return ""
+
+    prefix = ""
+    for c in pattern:
+        if c in "*?{":
+            return prefix[:-1]  # The preceding character is optional
+        if c in ".^$+}[]\\()" or not ' ' <= c <= '~':
+            break
+        prefix += c
+    return prefix
+
+
 def do_match(reg, text):
     mo = regex(reg).match(text)
     if not mo:
@@ -2039,8 +2133,10 @@ def compile_leaf_node(host_re, service_re=config.HOST_STATE):
         else:
             entries = g_services.items()
 
-    # TODO: If we already know the host we deal with, we could avoid this loop
+    host_index = get_host_index()
+    service_prefix = regex_literal_prefix(service_re)
     for (site, hostname), (_tags, services, _childs, _parents, _alias) in entries:
+        g_compile_stats["hosts"] += 1
         # For regex to have '$' anchor for end. Users might be surprised
         # to get a prefix match on host names. This is almost never what
         # they want. For services this is useful, however.
@@ -2084,7 +2180,8 @@ def compile_leaf_node(host_re, service_re=config.HOST_STATE):
                 "host": (site, hostname)
             })
         else:
-            for service in services:
+            for service in host_index.services_with_prefix(services, service_prefix):
+                g_compile_stats["services"] += 1
                 mo = (service_re, service)
                 if mo in regex_svc_miss_cache:
                     continue
@@ -2136,15 +2233,17 @@ def compile_leaf_node(host_re, service_re=config.HOST_STATE):
 # Execution of the trees. Returns a tree object reflecting
 # the states of all nodes
 def execute_tree(tree, status_info=None):
-    aggregation_options = {
-        "use_hard_states": tree["use_hard_states"],
-        "downtime_aggr_warn": tree["downtime_aggr_warn"],
-    }
-
     if status_info is None:
         required_hosts = tree["reqhosts"]
         status_info = get_status_info(required_hosts)
-    return execute_node(tree, status_info, aggregation_options)
+    return execute_node(tree, status_info, get_aggregation_options(tree))
+
+
+def get_aggregation_options(tree):
+    return {
+        "use_hard_states": tree["use_hard_states"],
+        "downtime_aggr_warn": tree["downtime_aggr_warn"],
+    }
 
 
 def execute_node(node, status_info, aggregation_options):
@@ -2247,7 +2346,7 @@ def execute_leaf_node(node, status_info, aggregation_options):
         return (state, assumed_state, node)
 
 
-def execute_rule_node(node, status_info, aggregation_options):
+def execute_rule_node(node, status_info, aggregation_options, execute_subnode=execute_node):
     # get aggregation function
     funcspec = node["func"]
     parts = funcspec.split('!')
@@ -2269,7 +2368,7 @@ def execute_rule_node(node, status_info, aggregation_options):
     one_assumption = False
     for n in node["nodes"]:
         # state, assumed_state, node [, subtrees]
-        result = execute_node(n, status_info, aggregation_options)
+        result = execute_subnode(n, status_info, aggregation_options)
 
         if result[0][
                 "state"] is None:  # Omit this node (used in availability for unmonitored things)
@@ -2377,6 +2476,144 @@ def get_status_info(required_hosts):
     return dict([((e[0], e[1]), e[2:]) for e in data])
 
 
+# Get a fingerprint of the state of all hosts of the given sites. It changes
+# whenever the state, downtime, acknowledgement or service period of the
+# host or one of its services changes, or when services are added or removed.
+# The plugin outputs are not part of the fingerprint.
+#
+# The services are only aggregated per host. Sums of their flags stay the same
+# when changes cancel out each other, e.g. one service is acknowledged while
+# the acknowledgement of another one is removed. Acknowledgements and downtimes
+# are therefore covered by the ids of the comments and downtimes of the host,
+# which are never reused. Service periods of two services changing in
+# opposite directions at the same time are only noticed with the next change.
+def get_status_fingerprints(required_sites):
+    sites.live().set_auth_domain('bi')
+    sites.live().set_only_sites(list(required_sites))
+    sites.live().set_prepend_site(True)
+    try:
+        host_rows = sites.live().query(
+            "GET hosts\n"
+            "Columns: name state hard_state has_been_checked last_state_change "
+            "last_hard_state_change scheduled_downtime_depth acknowledged in_service_period\n")
+        service_rows = sites.live().query("GET services\n"
+                                          "Columns: host_name\n"
+                                          "Stats: state >= 0\n"
+                                          "Stats: max last_state_change\n"
+                                          "Stats: max last_hard_state_change\n"
+                                          "Stats: sum has_been_checked\n"
+                                          "Stats: sum scheduled_downtime_depth\n"
+                                          "Stats: sum acknowledged\n"
+                                          "Stats: sum in_service_period\n")
+        comment_rows = sites.live().query("GET comments\nColumns: host_name id\n")
+        downtime_rows = sites.live().query("GET downtimes\nColumns: host_name id\n")
+    finally:
+        sites.live().set_auth_domain('read')
+        sites.live().set_only_sites(None)
+        sites.live().set_prepend_site(False)
+
+    fingerprints = dict([((e[0], e[1]), tuple(e[2:])) for e in host_rows])
+    for e in service_rows:
+        key = (e[0], e[1])
+        if key in fingerprints:
+            fingerprints[key] += tuple(e[2:])
+
+    for rows in [comment_rows, downtime_rows]:
+        ids = {}
+        for site, host_name, entry_id in rows:
+            ids.setdefault((site, host_name), []).append(entry_id)
+        for key in fingerprints:
+            fingerprints[key] += (tuple(sorted(ids.get(key, []))),)
+    return fingerprints
+
+
+def get_incremental_state():
+    """Return the incremental evaluation state of the current user or None
+    if the incremental evaluation is disabled"""
+    if not config.bi_incremental_evaluation:
+        return None
+
+    incremental_state = g_incremental_states.get(config.user.id)
+    if incremental_state is None:
+        # Don't keep the states of all users who ever used this apache process
+        if len(g_incremental_states) >= 10:
+            g_incremental_states.clear()
+        incremental_state = g_incremental_states[config.user.id] = BIIncrementalState()
+    return incremental_state
+
+
+class BIIncrementalState(object):
+    """Keeps the host states and the results of the aggregation nodes of a user
+    between the requests handled by an apache process
+
+    For each request only the hosts whose fingerprint has changed since the
+    last request are fetched, and only the nodes that depend on these hosts
+    are executed again. The plugin outputs of hosts and services are only
+    updated together with their state, acknowledgement or downtime."""
+
+    def __init__(self):
+        super(BIIncrementalState, self).__init__()
+        self._tree_cache = None
+        self._status_info = {}
+        self._fingerprints = {}
+        self._assumptions = {}
+        self._generation = 0
+        self._host_changes = {}  # (site, host) -> generation of the last change
+        self._results = {}  # id(node) -> (node, generation, result)
+
+    def update(self, required_hosts):
+        """Fetch the changed hosts and return the status info of all known hosts"""
+        self._generation += 1
+        if g_tree_cache is not self._tree_cache:
+            # The forest has been compiled again, forget the results of the old nodes
+            self._tree_cache = g_tree_cache
+            self._results = {}
+
+        if required_hosts:
+            fingerprints = get_status_fingerprints(set(site for site, _host in required_hosts))
+        else:
+            fingerprints = {}
+
+        changed_hosts = set(sitehost for sitehost in required_hosts
+                            if sitehost not in self._fingerprints or
+                            self._fingerprints[sitehost] != fingerprints.get(sitehost))
+        if changed_hosts:
+            status_info = get_status_info(changed_hosts)
+            for sitehost in changed_hosts:
+                self._fingerprints[sitehost] = fingerprints.get(sitehost)
+                if sitehost in status_info:
+                    self._status_info[sitehost] = status_info[sitehost]
+                else:
+                    self._status_info.pop(sitehost, None)
+                self._host_changes[sitehost] = self._generation
+
+        # The assumptions of the user are part of the results of the leaf nodes
+        for key in set(g_assumptions).symmetric_difference(self._assumptions):
+            self._host_changes[key[:2]] = self._generation
+        for key, assumed_state in g_assumptions.iteritems():
+            if self._assumptions.get(key, assumed_state) != assumed_state:
+                self._host_changes[key[:2]] = self._generation
+        self._assumptions = dict(g_assumptions)
+
+        return self._status_info
+
+    def execute_tree(self, tree, status_info):
+        return self._execute_node(tree, status_info, get_aggregation_options(tree))
+
+    def _execute_node(self, node, status_info, aggregation_options):
+        cached = self._results.get(id(node))
+        if cached is not None and cached[0] is node and \
+           all(self._host_changes.get(sitehost, 0) <= cached[1] for sitehost in node["reqhosts"]):
+            return cached[2]
+
+        if node["type"] == NT_LEAF:
+            result = execute_leaf_node(node, status_info, aggregation_options)
+        else:
+            result = execute_rule_node(node, status_info, aggregation_options, self._execute_node)
+        self._results[id(node)] = (node, self._generation, result)
+        return result
+
+
 # This variant of the function is configured not with a list of
 # hosts but with a livestatus filter header and a list of columns
 # that need to be fetched in any case
@@ -3190,8 +3427,11 @@ class FoldableTreeRendererTopDown(FoldableTreeRendererTable):
 #
 
 
-def create_aggregation_row(tree, status_info=None):
-    tree_state = execute_tree(tree, status_info)
+def create_aggregation_row(tree, status_info=None, incremental_state=None):
+    if incremental_state:
+        tree_state = incremental_state.execute_tree(tree, status_info)
+    else:
+        tree_state = execute_tree(tree, status_info)
 
     # TODO: the tree state may include hosts the current user has
     #       no access to. Reason: The BI aggregation is always compiled
@@ -3286,7 +3526,12 @@ def table(view, columns, query, only_sites, limit, all_active_filters):
             if not is_tree_required(tree):
                 continue
             required_hosts.update(tree.get("reqhosts"))
-    status_info = get_status_info(required_hosts)
+
+    incremental_state = get_incremental_state()
+    if incremental_state:
+        status_info = incremental_state.update(required_hosts)
+    else:
+        status_info = get_status_info(required_hosts)
 
     for group, trees in items.iteritems():
         if only_group not in [None, group]:
@@ -3299,7 +3544,7 @@ def table(view, columns, query, only_sites, limit, all_active_filters):
             if not is_tree_required(tree):
                 continue
 
-            row = create_aggregation_row(tree, status_info)
+            row = create_aggregation_row(tree, status_info, incremental_state)
             if row["aggr_state"]["state"] is None:
                 continue  # Not yet monitored, aggregation is not displayed
 
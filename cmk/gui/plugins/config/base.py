@@ -98,6 +98,10 @@ quicksearch_search_order = [("h", "continue"), ("al", "continue"), ("ad", "conti
 
 failed_notification_horizon = 7 * 60 * 60 * 24
 
+# Number of days the state history is rolled up for the availability
+# computation by a background job. 0 disables the rollups.
+availability_rollup_days = 0
+
 #    _     _           _ _
 #   | |   (_)_ __ ___ (_) |_ ___
 #   | |   | | '_ ` _ \| | __/ __|
@@ -488,6 +492,9 @@ host_aggregations = []
 bi_packs = {}
 bi_precompile_on_demand = True
 bi_use_legacy_compilation = False
+# Keep the host states and aggregation results in the apache processes and
+# only fetch and execute again what has changed since the last request
+bi_incremental_evaluation = False
 
 # Deprecated. Kept for compatibility.
 bi_compile_log = None
@@ -52,6 +52,12 @@ from cmk.gui.plugins.views.utils import (
     cmp_string_list,
     declare_1to1_sorter,
     declare_simple_sorter,
+    key_custom_variable,
+    key_ip_address,
+    key_num_split,
+    key_simple_number,
+    key_simple_string,
+    key_string_list,
     display_options,
     do_query_data,
     EmptyCell,
@@ -43,6 +43,8 @@ from cmk.gui.plugins.views import (
     cmp_service_name_equiv,
     cmp_string_list,
     cmp_ip_address,
+    key_custom_variable,
+    key_num_split,
     get_tag_groups,
     get_labels,
     get_perfdata_nth_value,
@@ -84,6 +86,10 @@ class SorterSvcstate(Sorter):
     def cmp(self, r1, r2):
         return cmp(cmp_state_equiv(r1), cmp_state_equiv(r2))
 
+    @property
+    def key(self):
+        return cmp_state_equiv
+
 
 @sorter_registry.register
 class SorterHoststate(Sorter):
@@ -102,6 +108,10 @@ class SorterHoststate(Sorter):
     def cmp(self, r1, r2):
         return cmp(cmp_host_state_equiv(r1), cmp_host_state_equiv(r2))
 
+    @property
+    def key(self):
+        return cmp_host_state_equiv
+
 
 @sorter_registry.register
 class SorterSiteHost(Sorter):
@@ -120,6 +130,10 @@ class SorterSiteHost(Sorter):
     def cmp(self, r1, r2):
         return cmp(r1["site"], r2["site"]) or cmp_num_split("host_name", r1, r2)
 
+    @property
+    def key(self):
+        return lambda r: (r["site"], key_num_split("host_name", r))
+
 
 @sorter_registry.register
 class SorterHostName(Sorter):
@@ -138,6 +152,10 @@ class SorterHostName(Sorter):
     def cmp(self, r1, r2):
         return cmp_num_split("host_name", r1, r2)
 
+    @property
+    def key(self):
+        return lambda r: key_num_split("host_name", r)
+
 
 @sorter_registry.register
 class SorterSitealias(Sorter):
@@ -156,6 +174,10 @@ class SorterSitealias(Sorter):
     def cmp(self, r1, r2):
         return cmp(config.site(r1["site"])["alias"], config.site(r2["site"])["alias"])
 
+    @property
+    def key(self):
+        return lambda r: config.site(r["site"])["alias"]
+
 
 class ABCTagSorter(Sorter):
     __metaclass__ = abc.ABCMeta
@@ -169,6 +191,10 @@ class ABCTagSorter(Sorter):
         tag_groups_2 = sorted(get_tag_groups(r2, self.object_type).items())
         return cmp(tag_groups_1, tag_groups_2)
 
+    @property
+    def key(self):
+        return lambda r: sorted(get_tag_groups(r, self.object_type).items())
+
 
 @sorter_registry.register
 class SorterHost(ABCTagSorter):
@@ -220,6 +246,10 @@ class ABCLabelSorter(Sorter):
         labels_2 = sorted(get_labels(r2, self.object_type).items())
         return cmp(labels_1, labels_2)
 
+    @property
+    def key(self):
+        return lambda r: sorted(get_labels(r, self.object_type).items())
+
 
 @sorter_registry.register
 class SorterHostLabels(ABCTagSorter):
@@ -276,14 +306,23 @@ class SorterServicelevel(Sorter):
     def cmp(self, r1, r2):
         return cmp_custom_variable(r1, r2, 'EC_SL', cmp_simple_number)
 
+    @property
+    def key(self):
+        return lambda r: key_custom_variable(r, 'EC_SL')
+
 
 def cmp_service_name(column, r1, r2):
     return cmp(cmp_service_name_equiv(r1[column]), cmp_service_name_equiv(r2[column])) or \
            cmp_num_split(column, r1, r2)
 
 
+def key_service_name(column, r):
+    return cmp_service_name_equiv(r[column]), key_num_split(column, r)
+
+
 #                      name                      title                              column                       sortfunction
-declare_simple_sorter("svcdescr", _("Service description"), "service_description", cmp_service_name)
+declare_simple_sorter("svcdescr", _("Service description"), "service_description", cmp_service_name,
+                      key_service_name)
 declare_simple_sorter("svcdispname", _("Service alternative display name"), "service_display_name",
                       cmp_simple_string)
 declare_simple_sorter("svcoutput", _("Service plugin output"), "service_plugin_output",
@@ -336,9 +375,14 @@ class PerfValSorter(Sorter):
         return ['service_perf_data']
 
     def cmp(self, r1, r2):
-        return cmp(
-            utils.savefloat(get_perfdata_nth_value(r1, self._num - 1, True)),
-            utils.savefloat(get_perfdata_nth_value(r2, self._num - 1, True)))
+        return cmp(self._perf_value(r1), self._perf_value(r2))
+
+    @property
+    def key(self):
+        return self._perf_value
+
+    def _perf_value(self, r):
+        return utils.savefloat(get_perfdata_nth_value(r, self._num - 1, True))
 
 
 @sorter_registry.register
@@ -442,19 +486,20 @@ class SorterHostIpv4Address(Sorter):
         return ['host_custom_variable_names', 'host_custom_variable_values']
 
     def cmp(self, r1, r2):
-        def get_address(row):
-            custom_vars = dict(
-                zip(row["host_custom_variable_names"], row["host_custom_variable_values"]))
-            return custom_vars.get("ADDRESS_4", "")
+        return cmp(self._address(r1), self._address(r2))
 
-        def split_ip(ip):
-            try:
-                return tuple(int(part) for part in ip.split('.'))
-            except:
-                return ip
+    @property
+    def key(self):
+        return self._address
 
-        v1, v2 = split_ip(get_address(r1)), split_ip(get_address(r2))
-        return cmp(v1, v2)
+    def _address(self, row):
+        custom_vars = dict(
+            zip(row["host_custom_variable_names"], row["host_custom_variable_values"]))
+        ip = custom_vars.get("ADDRESS_4", "")
+        try:
+            return tuple(int(part) for part in ip.split('.'))
+        except:
+            return ip
 
 
 @sorter_registry.register
@@ -472,9 +517,14 @@ class SorterNumProblems(Sorter):
         return ['host_num_services', 'host_num_services_ok', 'host_num_services_pending']
 
     def cmp(self, r1, r2):
-        return cmp(
-            r1["host_num_services"] - r1["host_num_services_ok"] - r1["host_num_services_pending"],
-            r2["host_num_services"] - r2["host_num_services_ok"] - r2["host_num_services_pending"])
+        return cmp(self._num_problems(r1), self._num_problems(r2))
+
+    @property
+    def key(self):
+        return self._num_problems
+
+    def _num_problems(self, r):
+        return r["host_num_services"] - r["host_num_services_ok"] - r["host_num_services_pending"]
 
 
 # Hostgroup
@@ -539,6 +589,10 @@ def cmp_log_what(col, a, b):
     return cmp(log_what(a[col]), log_what(b[col]))
 
 
+def key_log_what(col, r):
+    return log_what(r[col])
+
+
 def log_what(t):
     if "HOST" in t:
         return 1
@@ -547,7 +601,7 @@ def log_what(t):
     return 0
 
 
-declare_1to1_sorter("log_what", cmp_log_what)
+declare_1to1_sorter("log_what", cmp_log_what, key_func=key_log_what)
 
 
 def get_day_start_timestamp(t):
@@ -850,6 +850,16 @@ class Sorter(object):
         one service, etc."""
         raise NotImplementedError()
 
+    @property
+    def key(self):
+        # type: () -> Optional[Callable[[dict], Any]]
+        """Optional key function. It is called once for each data row and
+        returns a value the rows are sorted by, which is much faster than
+        calling cmp for each comparison of two rows. The values must order
+        the rows exactly like cmp does. Sorters without key function are
+        sorted with cmp."""
+        return None
+
     @property
     def _args(self):
         # type: () -> Optional[List]
@@ -887,6 +897,7 @@ def register_sorter(ident, spec):
             "columns": property(lambda s: s._spec["columns"]),
             "load_inv": property(lambda s: s._spec.get("load_inv", False)),
             "cmp": spec["cmp"],
+            "key": property(lambda s: s._spec.get("key")),
         })
     sorter_registry.register(cls)
 
@@ -1067,27 +1078,35 @@ def paint_nagiosflag(row, field, bold_if_nonzero):
     return "goodflag", yesno
 
 
-def declare_simple_sorter(name, title, column, func):
-    register_sorter(name, {
-        "title": title,
-        "columns": [column],
-        "cmp": lambda self, r1, r2: func(column, r1, r2)
-    })
+# The key function of the sorter is taken from key_func or, if it is not given,
+# derived from the cmp functions below
+def declare_simple_sorter(name, title, column, func, key_func=None):
+    spec = {"title": title, "columns": [column], "cmp": lambda self, r1, r2: func(column, r1, r2)}
+
+    key_func = key_func or _key_functions.get(func)
+    if key_func:
+        spec["key"] = lambda r: key_func(column, r)
 
+    register_sorter(name, spec)
 
-def declare_1to1_sorter(painter_name, func, col_num=0, reverse=False):
+
+def declare_1to1_sorter(painter_name, func, col_num=0, reverse=False, key_func=None):
     painter = painter_registry[painter_name]()
+    spec = {
+        "title": painter.title,
+        "columns": painter.columns,
+    }
 
     if not reverse:
-        cmp_func = lambda self, r1, r2: func(painter.columns[col_num], r1, r2)
+        spec["cmp"] = lambda self, r1, r2: func(painter.columns[col_num], r1, r2)
+
+        key_func = key_func or _key_functions.get(func)
+        if key_func:
+            spec["key"] = lambda r: key_func(painter.columns[col_num], r)
     else:
-        cmp_func = lambda self, r1, r2: func(painter.columns[col_num], r2, r1)
+        spec["cmp"] = lambda self, r1, r2: func(painter.columns[col_num], r2, r1)
 
-    register_sorter(painter_name, {
-        "title": painter.title,
-        "columns": painter.columns,
-        "cmp": cmp_func,
-    })
+    register_sorter(painter_name, spec)
     return painter_name
 
 
@@ -1138,14 +1157,50 @@ def cmp_custom_variable(r1, r2, key, cmp_func):
 
 
 def cmp_ip_address(column, r1, r2):
-    def split_ip(ip):
-        try:
-            return tuple(int(part) for part in ip.split('.'))
-        except:
-            return ip
+    return cmp(key_ip_address(column, r1), key_ip_address(column, r2))
+
 
-    v1, v2 = split_ip(r1.get(column, '')), split_ip(r2.get(column, ''))
-    return cmp(v1, v2)
+# The key functions order the rows like the cmp functions above do
+def key_simple_number(column, r):
+    return r.get(column)
+
+
+def key_num_split(column, r):
+    return cmk.gui.utils.num_split(r[column].lower())
+
+
+def key_simple_string(column, r):
+    return key_insensitive_string(r.get(column, ''))
+
+
+def key_insensitive_string(v):
+    # Equal spelling with different case is ordered like in cmp_insensitive_string()
+    return v.lower(), v
+
+
+def key_string_list(column, r):
+    return key_insensitive_string(''.join(r.get(column, [])))
+
+
+def key_custom_variable(r, key):
+    return get_custom_var(r, key)
+
+
+def key_ip_address(column, r):
+    ip = r.get(column, '')
+    try:
+        return tuple(int(part) for part in ip.split('.'))
+    except:
+        return ip
+
+
+_key_functions = {
+    cmp_simple_number: key_simple_number,
+    cmp_num_split: key_num_split,
+    cmp_simple_string: key_simple_string,
+    cmp_string_list: key_string_list,
+    cmp_ip_address: key_ip_address,
+}
 
 
 def get_custom_var(row, key):
@@ -2447,6 +2447,88 @@ class ConfigVariablePiggybackMaxCachefileAge(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariablePiggybackStorage(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "piggyback_storage"
+
+    def valuespec(self):
+        return DropdownChoice(
+            title=_("Piggyback storage"),
+            help=_("Choose how the piggyback data received from the source hosts is stored. "
+                   "The file based storage writes one file per piggybacked host and source "
+                   "host. The indexed storage keeps one file per source host and an index of "
+                   "all piggybacked hosts, which needs far less file system operations on sites "
+                   "with many piggybacked hosts. After changing this setting you may execute "
+                   "<tt>cmk --migrate-piggyback</tt> to move the already received piggyback data "
+                   "to the new storage."),
+            choices=[
+                ("files", _("One file per piggybacked host and source host")),
+                ("indexed", _("Indexed storage")),
+            ],
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableCountersStorage(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "counters_storage"
+
+    def valuespec(self):
+        return DropdownChoice(
+            title=_("Counters storage"),
+            help=_("Choose how the checks store their counters and other states between two "
+                   "check cycles. The text storage rewrites all counters of a host after each "
+                   "check cycle. The binary storage only writes the changed counters, which "
+                   "saves time on hosts with many interfaces or disks. After changing this "
+                   "setting you may execute <tt>cmk --migrate-counters</tt> to keep the current "
+                   "counters. Otherwise the rate computing checks need one additional cycle "
+                   "before they produce results."),
+            choices=[
+                ("text", _("Text files")),
+                ("binary", _("Binary files with incremental updates")),
+            ],
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableFetchDataSourcesConcurrently(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "fetch_data_sources_concurrently"
+
+    def valuespec(self):
+        return Checkbox(
+            title=_("Fetch data sources concurrently"),
+            label=_("Fetch the agent and program data sources of a host at the same time"),
+            help=_("By default the data sources of a host, e.g. the Check_MK agent, SNMP, the "
+                   "management board and special agents, are executed one after another. When "
+                   "this option is enabled, the TCP agent and the programs (datasource programs "
+                   "and special agents) are fetched in separate threads while the other data "
+                   "sources are executed. This reduces the time needed to check hosts with "
+                   "multiple data sources to roughly the time of the slowest one. Please note "
+                   "that the check timeout of the Check_MK helpers does not abort external "
+                   "programs which are executed in such a thread."),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableCheckMKPerfdataWithTimes(ConfigVariable):
     def group(self):
@@ -2719,6 +2801,50 @@ class ConfigVariableInventoryCheckAutotrigger(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableDiscoveryMaxNumProcesses(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupServiceDiscovery
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "discovery_max_num_processes"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Parallel processes for the service discovery"),
+            help=_("The service discovery of all hosts (<tt>cmk -I</tt>) and the automatic "
+                   "rediscovery of hosts marked by the service discovery check are done one "
+                   "host after another by default. With a higher number of processes the data "
+                   "sources of several hosts are fetched and evaluated at the same time. The "
+                   "found services are still written by a single process."),
+            minvalue=1,
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableDiscoveryHostTimeout(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupServiceDiscovery
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "discovery_host_timeout"
+
+    def valuespec(self):
+        return Age(
+            title=_("Timeout for the parallel discovery of a host"),
+            help=_("When the service discovery is done by several processes, the discovery "
+                   "of a single host is aborted after this time. The services of the host are "
+                   "left unchanged in this case."),
+            minvalue=1,
+        )
+
+
 #.
 #   .--Rulesets------------------------------------------------------------.
 #   |                ____        _                _                        |
@@ -4588,6 +4714,31 @@ class RulespecNonInlineSnmpHosts(BinaryHostRulespec):
                  "hosts.")
 
 
+@rulespec_registry.register
+class RulespecNativeSnmpHosts(BinaryHostRulespec):
+    @property
+    def group(self):
+        return RulespecGroupAgentSNMP
+
+    @property
+    def name(self):
+        return "native_snmp_hosts"
+
+    @property
+    def title(self):
+        return _("Hosts using the native SNMP implementation")
+
+    @property
+    def help(self):
+        return _(
+            "The native SNMP implementation talks SNMP v1 and v2c to the devices directly from "
+            "within the Check_MK process using a single UDP socket per host. Multiple columns "
+            "of SNMP tables are fetched with a single request and multiple requests are sent "
+            "to the device without waiting for the previous answers. This reduces the time "
+            "needed to fetch large tables significantly. Hosts using SNMPv3 are always "
+            "monitored with Inline SNMP or classic SNMP.")
+
+
 @rulespec_registry.register
 class RulespecUsewalkHosts(BinaryHostRulespec):
     @property
@@ -25,6 +25,7 @@
 # Boston, MA 02110-1301 USA.
 
 import abc
+import functools
 import time
 import os
 import pprint
@@ -1858,35 +1859,50 @@ def ajax_count_button():
 # for same objects (e.g. host_name in table services and
 # simply name in table hosts)
 def sort_data(data, sorters):
+    """Sort the rows by the given sorters
+
+    The keys of consecutive sorters with the same direction are combined into
+    one tuple, which is computed once for each row. The rows are sorted by these
+    tuples, starting with the last one. The sorting is stable, so that the rows
+    which are equal by one tuple keep the order of the following ones."""
     if not sorters:
         return
 
-    # Handle case where join columns are not present for all rows
-    def save_compare(compfunc, row1, row2):
-        if row1 is None and row2 is None:
-            return 0
-        elif row1 is None:
-            return -1
-        elif row2 is None:
-            return 1
+    key_groups = []  # List of pairs of negate and the key functions of the sorters
+    for entry in sorters:
+        if key_groups and key_groups[-1][0] == entry.negate:
+            key_groups[-1][1].append(_sort_key_function(entry))
+        else:
+            key_groups.append((entry.negate, [_sort_key_function(entry)]))
 
-        return compfunc(row1, row2)
+    for negate, key_functions in reversed(key_groups):
+        data.sort(key=_combined_sort_key_function(key_functions), reverse=negate)
 
-    def multisort(e1, e2):
-        for entry in sorters:
-            neg = -1 if entry.negate else 1
 
-            if entry.join_key:  # Sorter for join column, use JOIN info
-                c = neg * save_compare(entry.sorter.cmp, e1["JOIN"].get(entry.join_key),
-                                       e2["JOIN"].get(entry.join_key))
-            else:
-                c = neg * entry.sorter.cmp(e1, e2)
+def _combined_sort_key_function(key_functions):
+    if len(key_functions) == 1:
+        return key_functions[0]
+    return lambda row: tuple([key_function(row) for key_function in key_functions])
+
+
+def _sort_key_function(entry):
+    key_function = entry.sorter.key
+    if key_function is None:
+        # Legacy sorters only provide a cmp function
+        key_function = functools.cmp_to_key(entry.sorter.cmp)
+
+    if not entry.join_key:
+        return key_function
 
-            if c != 0:
-                return c
-        return 0  # equal
+    # Sorter for join column, use JOIN info. Handle case where join columns are
+    # not present for all rows: These rows are sorted first.
+    def join_key_function(row):
+        joined_row = row["JOIN"].get(entry.join_key)
+        if joined_row is None:
+            return (False,)
+        return (True, key_function(joined_row))
 
-    data.sort(multisort)
+    return join_key_function
 
 
 def sorters_of_datasource(ds_name):
@@ -3014,6 +3014,32 @@ class ConfigVariableEventConsoleRuleOptimizer(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableEventConsoleEventWorkers(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupEventConsoleGeneric
+
+    def domain(self):
+        return ConfigDomainEventConsole
+
+    def ident(self):
+        return "event_workers"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Worker processes for rule matching"),
+            help=_("Incoming messages are usually processed by a single thread of the Event "
+                   "Console, which can use only one CPU core. With this option the events are "
+                   "created from the incoming messages and matched against the rules by the "
+                   "given number of worker processes. Counting, cancelling, event limits and "
+                   "actions are still handled by the Event Console itself in the order in which "
+                   "the messages arrived. Set this to <tt>0</tt> to disable the workers."),
+            minvalue=0,
+            maxvalue=256,
+            unit=_("processes"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableEventConsoleActions(ConfigVariable):
     def group(self):
@@ -77,6 +77,21 @@ def pop_phase():
     del phase_stack[-1]
 
 
+def add_phase_duration(phase, duration):
+    # type: (str, float) -> None
+    """Account the run time of a phase that was executed in another thread
+
+    Only the wall clock time is added to the phase. The CPU times of the
+    threads of the process can not be told apart, they are accounted to the
+    phase of the main thread. The TOTAL is left unchanged, it already covers
+    the time the other thread was running."""
+    if _is_not_tracking():
+        return
+
+    phase_times = times.get(phase, [0.0] * len(last_time_snapshot))
+    times[phase] = phase_times[:4] + [phase_times[4] + duration]
+
+
 def get_times():
     # type: () -> Dict[str, List[float]]
     return times
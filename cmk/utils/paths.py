@@ -61,6 +61,7 @@ autochecks_dir = _omd_path("var/check_mk/autochecks")
 precompiled_hostchecks_dir = _omd_path("var/check_mk/precompiled")
 snmpwalks_dir = _omd_path("var/check_mk/snmpwalks")
 counters_dir = _omd_path("tmp/check_mk/counters")
+counters_binary_dir = _omd_path("tmp/check_mk/counters_binary")
 tcp_cache_dir = _omd_path("tmp/check_mk/cache")
 data_source_cache_dir = _omd_path("tmp/check_mk/data_source_cache")
 snmp_scan_cache_dir = _omd_path("tmp/check_mk/snmp_scan_cache")
@@ -87,6 +88,7 @@ discovered_host_labels_dir = Path(_omd_path("var/check_mk/discovered_host_labels
 discovered_service_labels_dir = Path(_omd_path("var/check_mk/discovered_service_labels"))
 piggyback_dir = Path(tmp_dir) / "piggyback"
 piggyback_source_dir = Path(tmp_dir) / "piggyback_sources"
+piggyback_index_dir = Path(tmp_dir) / "piggyback_index"
 
 share_dir = _omd_path("share/check_mk")
 checks_dir = _omd_path("share/check_mk/checks")
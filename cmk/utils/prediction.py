@@ -133,35 +133,59 @@ def get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime
           x---v---v---v---v---y
 
     """
+    return get_rrd_data_of_timespans(hostname, service_description, varname, cf,
+                                     [(fromtime, untiltime)], max_entries)[0]
 
+
+def get_rrd_data_of_timespans(hostname,
+                              service_description,
+                              varname,
+                              cf,
+                              timespans,
+                              max_entries=400):
+    """Fetch RRD historic metrics data of a specific service for multiple time ranges
+
+    returns a list of TimeSeries objects, one for each (fromtime, untiltime)
+    pair of timespans, see get_rrd_data. The queries for all time ranges are
+    sent at once over a pooled livestatus connection.
+    """
     step = 1
     rpn = "%s.%s" % (varname, cf.lower())  # "MAX" -> "max"
 
-    lql = "GET services\n" \
-          "Columns: rrddata:m1:%s:%s:%s:%s:%s\n" \
-          "OutputFormat: python\n" \
-          "Filter: host_name = %s\n" \
-          "Filter: description = %s\n" % tuple(map(livestatus.lqencode,
-                                                   map(str, (rpn, fromtime, untiltime, step, max_entries,
-                                                             hostname, service_description))))
+    lqls = []
+    for fromtime, untiltime in timespans:
+        lqls.append("GET services\n"
+                    "Columns: rrddata:m1:%s:%s:%s:%s:%s\n"
+                    "OutputFormat: python\n"
+                    "Filter: host_name = %s\n"
+                    "Filter: description = %s\n" % tuple(
+                        map(
+                            livestatus.lqencode,
+                            map(str, (rpn, fromtime, untiltime, step, max_entries, hostname,
+                                      service_description)))))
 
     try:
         connection = livestatus.SingleSiteConnection(
-            "unix:%s" % cmk.utils.paths.livestatus_unix_socket)
-        response = connection.query_value(lql)
+            "unix:%s" % cmk.utils.paths.livestatus_unix_socket, pooled=True)
+        timeseries = []
+        for lql, response in zip(lqls, connection.query_pipelined(lqls)):
+            try:
+                timeseries.append(TimeSeries(response[0][0]))
+            except IndexError:
+                raise MKLivestatusNotFoundError(lql)
     except MKLivestatusNotFoundError as e:
         if cmk.utils.debug.enabled():
             raise
         raise MKGeneralException("Cannot get historic metrics via Livestatus: %s" % e)
 
-    return TimeSeries(response)
+    return timeseries
 
 
 def rrd_datacolum(hostname, service_description, varname, cf):
-    "Partial helper function to get rrd data"
+    "Partial helper function to get rrd data of multiple time ranges"
 
-    def time_boundaries(fromtime, untiltime):
-        return get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime)
+    def time_boundaries(timespans):
+        return get_rrd_data_of_timespans(hostname, service_description, varname, cf, timespans)
 
     return time_boundaries
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2016             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Bitmask based matching of the tag conditions of the tuple rulesets
+
+Each tag used by any host gets a bit assigned and the tags of each host are
+stored as integer bitmask. A tag condition (a list of tags that may be negated
+with "!" and may end with "+" for prefix matching) is compiled once to bitmasks
+and then evaluated with a few bitwise operations per host.
+
+To evaluate a condition for all hosts, the hosts are grouped by their tags
+(without their folder). The condition is then only evaluated once per group.
+This way the effort depends on the number of different tag combinations
+instead of the number of hosts.
+"""
+
+from typing import Dict, Iterable, Optional, Set, Tuple  # pylint: disable=unused-import
+
+# all tags, no tag, at least one tag of each of the masks
+CompiledTagCondition = Tuple[int, int, Tuple[int, ...]]
+
+
+class HostTagMatcher(object):
+    def __init__(self, host_tags, host_folders):
+        # type: (Dict[str, Iterable[str]], Dict[str, str]) -> None
+        """host_tags maps the host names to their tags. host_folders maps the host names to
+        their folder tag, which is part of their tags."""
+        super(HostTagMatcher, self).__init__()
+        self._tag_bits = {}  # type: Dict[str, int]
+        self._host_masks = {}  # type: Dict[str, int]
+        self._hosts_by_mask_without_folder = {}  # type: Dict[int, Set[str]]
+        self._compiled_conditions = {
+        }  # type: Dict[Tuple[Tuple[str, ...], bool], Optional[CompiledTagCondition]]
+
+        for hostname, tags in host_tags.iteritems():
+            mask = 0
+            for tag in tags:
+                mask |= self._get_tag_bit(tag)
+            self._host_masks[hostname] = mask
+
+            folder = host_folders.get(hostname)
+            mask_without_folder = mask & ~self._tag_bits.get(folder, 0)
+            self._hosts_by_mask_without_folder.setdefault(mask_without_folder, set()).add(hostname)
+
+    def _get_tag_bit(self, tag):
+        # type: (str) -> int
+        try:
+            return self._tag_bits[tag]
+        except KeyError:
+            bit = self._tag_bits[tag] = 1 << len(self._tag_bits)
+            return bit
+
+    def compile(self, tags, prefix_match=True):
+        # type: (Iterable[str], bool) -> Optional[CompiledTagCondition]
+        """Returns the bitmasks of the given tag condition
+
+        None is returned for conditions that can not match any host. In case prefix_match
+        is False, tags ending with "+" are handled like regular tags."""
+        cache_id = tuple(tags), prefix_match
+        try:
+            return self._compiled_conditions[cache_id]
+        except KeyError:
+            pass
+
+        all_mask, none_mask, any_masks = 0, 0, []
+        for tag in cache_id[0]:
+            negate = tag[:1] == "!"
+            if negate:
+                tag = tag[1:]
+
+            if prefix_match and tag[-1:] == "+":
+                mask = self._get_prefix_mask(tag[:-1])
+                if negate:
+                    none_mask |= mask
+                elif not mask:
+                    break  # No host has a tag with this prefix
+                else:
+                    any_masks.append(mask)
+                continue
+
+            bit = self._tag_bits.get(tag, 0)
+            if negate:
+                none_mask |= bit
+            elif not bit:
+                break  # No host has this tag
+            else:
+                all_mask |= bit
+        else:
+            condition = all_mask, none_mask, tuple(
+                any_masks)  # type: Optional[CompiledTagCondition]
+            self._compiled_conditions[cache_id] = condition
+            return condition
+
+        self._compiled_conditions[cache_id] = None
+        return None
+
+    def _get_prefix_mask(self, prefix):
+        # type: (str) -> int
+        mask = 0
+        for tag, bit in self._tag_bits.iteritems():
+            if tag.startswith(prefix):
+                mask |= bit
+        return mask
+
+    def host_matches(self, hostname, tags, prefix_match=True):
+        # type: (str, Iterable[str], bool) -> bool
+        """Whether or not the tags of the host fulfill the tag condition
+
+        Does the same as cmk_base.config.hosttags_match_taglist() with the tags of the host."""
+        condition = self.compile(tags, prefix_match)
+        if condition is None:
+            return False
+        return _mask_matches(self._host_masks[hostname], condition)
+
+    def matching_hosts(self, tags, valid_hosts, prefix_match=True):
+        # type: (Iterable[str], Set[str], bool) -> Set[str]
+        """Returns the valid hosts that fulfill the tag condition"""
+        condition = self.compile(tags, prefix_match)
+        if condition is None:
+            return set()
+
+        if any(tag.lstrip("!")[:1] == "/" for tag in tags):
+            # Folder tags need to be checked with the tags of each host
+            host_masks = self._host_masks
+            return set(
+                hostname for hostname in valid_hosts
+                if _mask_matches(host_masks[hostname], condition))
+
+        matching = set()  # type: Set[str]
+        for mask, hosts in self._hosts_by_mask_without_folder.iteritems():
+            if _mask_matches(mask, condition):
+                matching.update(hosts)
+        return matching.intersection(valid_hosts)
+
+
+def _mask_matches(mask, condition):
+    # type: (int, CompiledTagCondition) -> bool
+    all_mask, none_mask, any_masks = condition
+    if mask & all_mask != all_mask or mask & none_mask:
+        return False
+
+    for any_mask in any_masks:
+        if not mask & any_mask:
+            return False
+    return True
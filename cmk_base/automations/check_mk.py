@@ -742,6 +742,7 @@ class AutomationDeleteHosts(Automation):
                 "%s/%s.py" % (cmk.utils.paths.precompiled_hostchecks_dir, hostname),
                 "%s/%s.mk" % (cmk.utils.paths.autochecks_dir, hostname),
                 "%s/%s" % (cmk.utils.paths.counters_dir, hostname),
+                "%s/%s" % (cmk.utils.paths.counters_binary_dir, hostname),
                 "%s/%s" % (cmk.utils.paths.tcp_cache_dir, hostname),
                 "%s/persisted/%s" % (cmk.utils.paths.var_dir, hostname),
                 "%s/inventory/%s" % (cmk.utils.paths.var_dir, hostname),
@@ -1256,6 +1257,7 @@ class AutomationDiagHost(Automation):
                     character_encoding=snmp_config.character_encoding,
                     is_usewalk_host=snmp_config.is_usewalk_host,
                     is_inline_snmp_host=snmp_config.is_inline_snmp_host,
+                    is_native_snmp_host=snmp_config.is_native_snmp_host,
                 )
 
                 data = snmp.get_snmp_table(
@@ -49,6 +49,7 @@ import cmk.utils.rulesets.tuple_rulesets as tuple_rulesets
 import cmk.utils.store as store
 import cmk.utils
 from cmk.utils.rulesets.ruleset_matcher import RulesetMatchObject, RulesetMatcher
+from cmk.utils.rulesets.host_tag_matcher import HostTagMatcher
 from cmk.utils.exceptions import MKGeneralException, MKTerminate
 
 import cmk_base
@@ -58,7 +59,9 @@ import cmk_base.check_utils
 import cmk_base.utils
 import cmk_base.check_api_utils as check_api_utils
 import cmk_base.cleanup
+import cmk_base.item_state as item_state
 import cmk_base.piggyback as piggyback
+import cmk_base.ruleset_match_index as ruleset_match_index
 import cmk_base.snmp_utils
 from cmk_base.discovered_labels import DiscoveredHostLabelsStore
 
@@ -195,6 +198,10 @@ def _perform_post_config_loading_actions():
     # First cleanup things (needed for e.g. reloading the config)
     cmk_base.config_cache.clear_all()
 
+    # Needs to be known before the host configurations ask for piggyback data
+    piggyback.set_storage(piggyback_storage)
+    item_state.set_storage(counters_storage)
+
     get_config_cache().initialize()
 
     # In case the checks are not loaded yet it seems the current mode
@@ -2284,6 +2291,8 @@ class HostConfig(object):
             character_encoding=self._snmp_character_encoding(),
             is_usewalk_host=self.is_usewalk_host,
             is_inline_snmp_host=self._is_inline_snmp_host(),
+            is_native_snmp_host=self._config_cache.in_binary_hostlist(self.hostname,
+                                                                      native_snmp_hosts),
         )
 
     def _snmp_credentials(self):
@@ -2832,11 +2841,10 @@ class ConfigCache(object):
         self._hosttags = {}
         self._hosttags_without_folder = {}
 
-        # Reference hosttags_without_folder -> list of hosts
-        # Provides a list of hosts with the same hosttags, excluding the folder
-        self._hosts_grouped_by_tags = {}
         # Reference hostname -> tag group reference
         self._host_grouped_ref = {}
+        # Matches the tag conditions of the rules with the host tags
+        self._host_tag_matcher = HostTagMatcher({}, {})
 
         # Autochecks cache
         self._autochecks_cache = {}
@@ -2844,6 +2852,12 @@ class ConfigCache(object):
         # Cache for all_matching_host
         self._all_matching_hosts_match_cache = {}
 
+        # The persisted matches of the host conditions (see cmk_base.ruleset_match_index). It is
+        # loaded on demand and only usable as long as only active hosts are processed.
+        self._ruleset_match_index = None
+        self._ruleset_match_index_loaded = False
+        self._ruleset_match_index_usable = True
+
         # Caches for host_extra_conf
         self._host_extra_conf_ruleset_cache = {}
         self._host_extra_conf_match_cache = {}
@@ -2864,11 +2878,6 @@ class ConfigCache(object):
         self._clusters_of_cache = {}
         self._nodes_of_cache = {}
 
-        # A factor which indicates how much hosts share the same host tag configuration (excluding folders).
-        # len(all_processed_hosts) / len(different tag combinations)
-        # It is used to determine the best rule evualation method
-        self._all_processed_hosts_similarity = 1
-
         # Keep HostConfig instances created with the current configuration cache
         self._host_configs = {}
 
@@ -3077,17 +3086,8 @@ class ConfigCache(object):
         # lookup are iterated one by one later on in all_matching_hosts
         self._folder_host_lookup = {}
 
-        self._adjust_processed_hosts_similarity()
-
-    def _adjust_processed_hosts_similarity(self):
-        """ This function computes the tag similarities between of the processed hosts
-        The result is a similarity factor, which helps finding the most perfomant operation
-        for the current hostset """
-        used_groups = set()
-        for hostname in self._all_processed_hosts:
-            used_groups.add(self._host_grouped_ref[hostname])
-        self._all_processed_hosts_similarity = (
-            1.0 * len(self._all_processed_hosts) / len(used_groups))
+        self._ruleset_match_index_usable = self._all_processed_hosts.issubset(
+            self._all_active_hosts)
 
     def _initialize_host_lookup(self):
         for hostname in self._all_configured_hosts:
@@ -3115,9 +3115,10 @@ class ConfigCache(object):
 
         # Determine hosts with same tag setup (ignoring folder tag)
         for hostname in self._all_configured_hosts:
-            group_ref = tuple(sorted(self._hosttags_without_folder[hostname]))
-            self._hosts_grouped_by_tags.setdefault(group_ref, set()).add(hostname)
-            self._host_grouped_ref[hostname] = group_ref
+            self._host_grouped_ref[hostname] = tuple(
+                sorted(self._hosttags_without_folder[hostname]))
+
+        self._host_tag_matcher = HostTagMatcher(self._hosttags, self._host_paths)
 
     def get_hosts_within_folder(self, folder_path, with_foreign_hosts):
         cache_id = with_foreign_hosts, folder_path
@@ -3167,9 +3168,6 @@ class ConfigCache(object):
             self._cache_is_tcp_check[check_plugin_name] = result
             return result
 
-    def filter_hosts_with_same_tags_as_host(self, hostname, hosts):
-        return self._hosts_grouped_by_tags[self._host_grouped_ref[hostname]].intersection(hosts)
-
     def all_matching_hosts(self, tags, hostlist, with_foreign_hosts):
         """Returns a set containing the names of hosts that match the given
         tags and hostlist conditions."""
@@ -3180,6 +3178,12 @@ class ConfigCache(object):
         except KeyError:
             pass
 
+        if not with_foreign_hosts:
+            matching = self._get_matching_hosts_from_index(cache_id[:2])
+            if matching is not None:
+                self._all_matching_hosts_match_cache[cache_id] = matching
+                return matching
+
         if with_foreign_hosts:
             valid_hosts = self._all_configured_hosts
         else:
@@ -3222,51 +3226,58 @@ class ConfigCache(object):
             else:
                 hosts_to_check = valid_hosts
 
+            # When no tag matching is requested, do not filter by tags. Accept all hosts
+            # and filter only by hostlist
+            if tags:
+                hosts_to_check = self._host_tag_matcher.matching_hosts(
+                    tags_set_without_folder, hosts_to_check)
+
             for hostname in hosts_to_check:
-                # When no tag matching is requested, do not filter by tags. Accept all hosts
-                # and filter only by hostlist
-                if (not tags or
-                        hosttags_match_taglist(self._hosttags[hostname], tags_set_without_folder)):
-                    if in_extraconf_hostlist(hostlist, hostname):
-                        matching.add(hostname)
+                if in_extraconf_hostlist(hostlist, hostname):
+                    matching.add(hostname)
 
         self._all_matching_hosts_match_cache[cache_id] = matching
         return matching
 
-    def _match_hosts_by_tags(self, cache_id, valid_hosts, tags_set_without_folder):
-        matching = set([])
-        has_specific_folder_tag = sum([x[0] == "/" for x in tags_set_without_folder])
-        negative_match_tags = set()
-        positive_match_tags = set()
-        for tag in tags_set_without_folder:
-            if tag[0] == "!":
-                negative_match_tags.add(tag[1:])
-            else:
-                positive_match_tags.add(tag)
+    def _get_matching_hosts_from_index(self, condition):
+        if not self._ruleset_match_index_usable:
+            return None
 
-        if has_specific_folder_tag or self._all_processed_hosts_similarity < 3:
-            # Without shared folders
-            for hostname in valid_hosts:
-                if not positive_match_tags - self._hosttags[hostname]:
-                    if not negative_match_tags.intersection(self._hosttags[hostname]):
-                        matching.add(hostname)
+        if not self._ruleset_match_index_loaded:
+            self._ruleset_match_index = ruleset_match_index.load(
+                self._ruleset_match_index_fingerprint())
+            self._ruleset_match_index_loaded = True
+
+        if self._ruleset_match_index is None:
+            return None
 
-            self._all_matching_hosts_match_cache[cache_id] = matching
+        # The index contains the matches of all active hosts
+        matching = self._ruleset_match_index.get_matching_hosts(condition)
+        if matching is None or len(self._all_processed_hosts) == len(self._all_active_hosts):
             return matching
+        return matching.intersection(self._all_processed_hosts)
 
-        # With shared folders
-        checked_hosts = set()
-        for hostname in valid_hosts:
-            if hostname in checked_hosts:
-                continue
+    def _ruleset_match_index_fingerprint(self):
+        return ruleset_match_index.compute_fingerprint(
+            ((hostname, self._host_grouped_ref[hostname], self._host_paths[hostname])
+             for hostname in self._all_active_hosts), self._folder_path_set)
 
-            hosts_with_same_tag = self.filter_hosts_with_same_tags_as_host(hostname, valid_hosts)
-            checked_hosts.update(hosts_with_same_tag)
+    def save_ruleset_match_index(self):
+        """Persists the host condition matches computed by this process for other processes"""
+        if self._all_processed_hosts != self._all_active_hosts:
+            return
 
-            if not positive_match_tags - self._hosttags[hostname]:
-                if not negative_match_tags.intersection(self._hosttags[hostname]):
-                    matching.update(hosts_with_same_tag)
+        matches = {
+            cache_id[:2]: matching
+            for cache_id, matching in self._all_matching_hosts_match_cache.iteritems()
+            if not cache_id[2]
+        }
+        ruleset_match_index.save(self._ruleset_match_index_fingerprint(), self._all_active_hosts,
+                                 matches)
 
+    def _match_hosts_by_tags(self, cache_id, valid_hosts, tags_set_without_folder):
+        matching = self._host_tag_matcher.matching_hosts(
+            tags_set_without_folder, valid_hosts, prefix_match=False)
         self._all_matching_hosts_match_cache[cache_id] = matching
         return matching
 
@@ -235,6 +235,9 @@ def create_core_config(core):
     core.create_config()
     cmk.utils.password_store.save(config.stored_passwords)
 
+    # Let the other processes reuse the rule matches computed while creating the configuration
+    config.get_config_cache().save_ruleset_match_index()
+
     return get_configuration_warnings()
 
 
@@ -260,10 +260,7 @@ class DataSources(object):
             import cmk_base.data_sources.abstract as abstract
             abstract.DataSource.set_may_use_cache_file()
 
-        # Special agents can produce data for the same check_plugin_name on the same host, in this case
-        # the section lines need to be extended
-        multi_host_sections = MultiHostSections()
-        for this_hostname, this_ipaddress, these_sources, this_max_cachefile_age in hosts:
+        for _unused_hostname, _unused_ipaddress, these_sources, this_max_cachefile_age in hosts:
             # In case a max_cachefile_age is given with the function call, always use this one
             # instead of the host individual one. This is only used in discovery mode.
             if max_cachefile_age is not None:
@@ -271,11 +268,28 @@ class DataSources(object):
             else:
                 these_sources.set_max_cachefile_age(this_max_cachefile_age)
 
+            # Let the data sources which wait for sockets or programs fetch their data
+            # while the other data sources are executed one after another
+            if config.fetch_data_sources_concurrently:
+                for source in these_sources.get_data_sources():
+                    if source.fetch_in_background_supported():
+                        source.start_fetching_in_background()
+
+        # Special agents can produce data for the same check_plugin_name on the same host, in this case
+        # the section lines need to be extended
+        multi_host_sections = MultiHostSections()
+        for this_hostname, this_ipaddress, these_sources, _unused_age in hosts:
+            # The data sources fetching in background are executed last to give them as much
+            # time as possible. The host sections are added in the regular order.
+            host_sections_of_sources = {}
+            for source in sorted(
+                    these_sources.get_data_sources(), key=lambda s: s.is_fetching_in_background()):
+                host_sections_of_sources[source.id()] = source.run()
+
             for source in these_sources.get_data_sources():
-                host_sections_from_source = source.run()
                 host_sections = multi_host_sections.add_or_get_host_sections(
                     this_hostname, this_ipaddress)
-                host_sections.update(host_sections_from_source)
+                host_sections.update(host_sections_of_sources[source.id()])
 
             # Store piggyback information received from all sources of this host. This
             # also implies a removal of piggyback files received during previous calls.
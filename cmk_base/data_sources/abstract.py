@@ -27,8 +27,13 @@
 import errno
 import os
 import socket
+import sys
+import threading
 import time
 import abc
+from typing import Any, Optional, Tuple  # pylint: disable=unused-import
+
+import six
 
 import cmk.utils.log
 
@@ -48,6 +53,7 @@ from cmk_base.exceptions import MKAgentError, MKEmptyAgentData, MKSNMPError, \
                                 MKIPAddressLookupError
 
 from .host_sections import HostSections
+from .agent_parser import AgentOutputParser
 
 
 class DataSource(object):
@@ -55,6 +61,10 @@ class DataSource(object):
     __metaclass__ = abc.ABCMeta
 
     _for_mgmt_board = False
+    # Data sources which only wait for a socket or an external program while
+    # fetching their raw data. These can be fetched in a separate thread while
+    # the other data sources of the host are executed.
+    _fetch_in_background_supported = False
 
     # TODO: Clean these options up! We need to change all call sites to use
     #       a single DataSources() object during processing first. Then we
@@ -88,6 +98,11 @@ class DataSource(object):
         self._host_sections = None
         self._persisted_sections = None
 
+        # Managed by self.start_fetching_in_background()
+        self._fetch_thread = None  # type: Optional[threading.Thread]
+        self._fetch_result = None  # type: Optional[Tuple[Any, Any, float]]
+        self._fetch_generation = 0
+
         self._config_cache = config.get_config_cache()
         self._host_config = self._config_cache.get_host_config(self._hostname)
 
@@ -122,13 +137,15 @@ class DataSource(object):
         self._host_sections = None
         self._persisted_sections = None
 
+        self._wait_for_background_fetching()
+
         try:
             cpu_tracking.push_phase(self._cpu_tracking_id())
 
             persisted_sections_from_disk = self._load_persisted_sections()
             self._persisted_sections = persisted_sections_from_disk
 
-            raw_data, is_cached_data = self._get_raw_data()
+            raw_data, is_cached_data = self._get_fetched_raw_data()
 
             self._host_sections = host_sections = self._convert_to_sections(raw_data)
             assert isinstance(host_sections, HostSections)
@@ -158,6 +175,86 @@ class DataSource(object):
             return ""
         return HostSections()
 
+    def fetch_in_background_supported(self):
+        # type: () -> bool
+        return self._fetch_in_background_supported
+
+    def start_fetching_in_background(self):
+        # type: () -> None
+        """Fetch the raw data of this data source in a separate thread
+
+        The next call of self.run() waits for the thread and processes the
+        fetched raw data. Exceptions that occured while fetching are raised by
+        self.run() and are handled as if the data source had been executed
+        by self.run() itself.
+
+        The thread does not write any files. The cache file is written by
+        self.run() once it uses the fetched raw data."""
+        assert self._fetch_in_background_supported
+        self._fetch_result = None
+        self._fetch_generation += 1
+        self._fetch_thread = threading.Thread(
+            target=self._fetch_in_background,
+            args=(self._fetch_generation,),
+            name="fetch-%s-%s" % (self._hostname, self.id()))
+        self._fetch_thread.daemon = True
+        self._fetch_thread.start()
+
+    def is_fetching_in_background(self):
+        # type: () -> bool
+        return self._fetch_thread is not None
+
+    def _fetch_in_background(self, generation):
+        # type: (int) -> None
+        start_time = time.time()
+        try:
+            result = self._fetch_raw_data(), None, time.time() - start_time
+        except Exception:
+            result = None, sys.exc_info(), time.time() - start_time
+
+        # The result of a thread that has been given up on is discarded
+        if generation == self._fetch_generation:
+            self._fetch_result = result
+
+    def _wait_for_background_fetching(self):
+        # type: () -> None
+        if self._fetch_thread is None:
+            return
+
+        # A join() without timeout can not be interrupted by signals, which
+        # would break the timeout handling of the keepalive mode
+        try:
+            while self._fetch_thread.is_alive():
+                self._fetch_thread.join(0.5)
+        except:
+            # E.g. a MKTimeout of the keepalive mode. The thread is left
+            # running, but its result must not be used by a later cycle.
+            self._fetch_generation += 1
+            self._fetch_result = None
+            raise
+        finally:
+            self._fetch_thread = None
+
+        # The thread waited for the data source independent of the phase the
+        # main thread was in. Account the whole fetching time to the phase
+        # of this data source.
+        assert self._fetch_result is not None
+        cpu_tracking.add_phase_duration(self._cpu_tracking_id(), self._fetch_result[2])
+
+    def _get_fetched_raw_data(self):
+        if self._fetch_result is None:
+            return self._get_raw_data()
+
+        fetched, exc_info, _duration = self._fetch_result
+        self._fetch_result = None
+        if exc_info is not None:
+            six.reraise(*exc_info)
+
+        raw_data, is_cached_data = fetched
+        if not is_cached_data:
+            self._write_cache_file(raw_data)
+        return raw_data, is_cached_data
+
     def _get_raw_data(self):
         """Returns the current raw data of this data source
 
@@ -168,6 +265,13 @@ class DataSource(object):
         CheckMKAgentDataSource sources. The SNMPDataSource source already
         return the final info data structure.
         """
+        raw_data, is_cached_data = self._fetch_raw_data()
+        if not is_cached_data:
+            self._write_cache_file(raw_data)
+        return raw_data, is_cached_data
+
+    def _fetch_raw_data(self):
+        """Like self._get_raw_data(), but does not write the cache file"""
         raw_data = self._read_cache_file()
         if raw_data:
             self._logger.verbose("Use cached data")
@@ -177,9 +281,7 @@ class DataSource(object):
             raise MKAgentError("Got no data (Simulation mode enabled and no cachefile present)")
 
         self._logger.verbose("Execute data source")
-        raw_data = self._execute()
-        self._write_cache_file(raw_data)
-        return raw_data, False
+        return self._execute(), False
 
     def run_raw(self):
         """Small wrapper for self.run() which always returns raw data source data"""
@@ -564,98 +666,7 @@ class CheckMKAgentDataSource(DataSource):
         if config.agent_simulator:
             raw_data = cmk_base.agent_simulator.process(raw_data)
 
-        return self._parse_info(raw_data.split("\n"))
-
-    def _parse_info(self, lines):
-        """Split agent output in chunks, splits lines by whitespaces.
-
-        Returns a HostSections() object.
-        """
-        sections = {}
-        # Unparsed info for other hosts. A dictionary, indexed by the piggybacked host name.
-        # The value is a list of lines which were received for this host.
-        piggybacked_raw_data = {}
-        persisted_sections = {}  # handle sections with option persist(...)
-        host = None
-        section_content = []
-        section_options = {}
-        agent_cache_info = {}
-        separator = None
-        encoding = None
-        for line in lines:
-            line = line.rstrip("\r")
-            stripped_line = line.strip()
-            if stripped_line[:4] == '<<<<' and stripped_line[-4:] == '>>>>':
-                host = stripped_line[4:-4]
-                if not host:
-                    host = None
-                else:
-                    host = config.translate_piggyback_host(self._hostname, host)
-                    if host == self._hostname:
-                        host = None  # unpiggybacked "normal" host
-
-                    # Protect Check_MK against unallowed host names. Normally source scripts
-                    # like agent plugins should care about cleaning their provided host names
-                    # up, but we need to be sure here to prevent bugs in Check_MK code.
-                    # a) Replace spaces by underscores
-                    if host:
-                        host = host.replace(" ", "_")
-
-            elif host:  # processing data for an other host
-                piggybacked_raw_data.setdefault(host, []).append(line)
-
-            # Found normal section header
-            # section header has format <<<name:opt1(args):opt2:opt3(args)>>>
-            elif stripped_line[:3] == '<<<' and stripped_line[-3:] == '>>>':
-                section_header = stripped_line[3:-3]
-                headerparts = section_header.split(":")
-                section_name = headerparts[0]
-                section_options = {}
-                for o in headerparts[1:]:
-                    opt_parts = o.split("(")
-                    opt_name = opt_parts[0]
-                    if len(opt_parts) > 1:
-                        opt_args = opt_parts[1][:-1]
-                    else:
-                        opt_args = None
-                    section_options[opt_name] = opt_args
-
-                section_content = sections.get(section_name, None)
-                if section_content is None:  # section appears in output for the first time
-                    section_content = []
-                    sections[section_name] = section_content
-                try:
-                    separator = chr(int(section_options["sep"]))
-                except:
-                    separator = None
-
-                # Split of persisted section for server-side caching
-                if "persist" in section_options:
-                    until = int(section_options["persist"])
-                    cached_at = int(time.time())  # Estimate age of the data
-                    cache_interval = int(until - cached_at)
-                    agent_cache_info[section_name] = (cached_at, cache_interval)
-                    persisted_sections[section_name] = (cached_at, until, section_content)
-
-                if "cached" in section_options:
-                    agent_cache_info[section_name] = tuple(
-                        map(int, section_options["cached"].split(",")))
-
-                # The section data might have a different encoding
-                encoding = section_options.get("encoding")
-
-            elif stripped_line != '':
-                if "nostrip" not in section_options:
-                    line = stripped_line
-
-                if encoding:
-                    line = config.decode_incoming_string(line, encoding)
-                else:
-                    line = config.decode_incoming_string(line)
-
-                section_content.append(line.split(separator))
-
-        return HostSections(sections, agent_cache_info, piggybacked_raw_data, persisted_sections)
+        return AgentOutputParser(self._hostname).parse(raw_data)
 
     # TODO: refactor
     def _summary_result(self, for_checking):
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Parser for the Check_MK agent output format
+
+The parser works on the raw byte string received from the agent. Instead of
+looking at every line, it only searches for the section and piggyback headers
+and remembers the byte ranges of the section bodies in between. A section body
+is decoded as a whole and split into lines and columns when it is accessed for
+the first time (see LazySections()). Sections that are not needed by any check
+are never decoded.
+"""
+
+import codecs
+import time
+
+import cmk_base.config as config
+
+from .host_sections import HostSections, LazySections, LazySectionContent
+
+# The characters str.strip() removes from agent output lines
+_WHITESPACE = " \t\n\r\x0b\x0c"
+_WHITESPACE_UNICODE = u" \t\n\r\x0b\x0c"
+
+_ascii_compatible_encodings = {}
+
+
+def _is_ascii_compatible(encoding):
+    """Whether or not a whole section may be decoded at once with the given encoding
+
+    This is the case for all stateless encodings which encode the ASCII
+    whitespace characters the same way ASCII does. Then decoding, stripping and
+    splitting a section leads to the same result as processing it line by line.
+    """
+    try:
+        return _ascii_compatible_encodings[encoding]
+    except KeyError:
+        pass
+
+    try:
+        codec_name = codecs.lookup(encoding).name
+        compatible = not codec_name.startswith(("iso2022", "utf-7", "utf_7", "hz")) \
+            and _WHITESPACE_UNICODE.encode(encoding) == _WHITESPACE
+    except (LookupError, UnicodeError):
+        compatible = False
+
+    _ascii_compatible_encodings[encoding] = compatible
+    return compatible
+
+
+def _iter_header_lines(raw_data):
+    """Yields (line_start, line_end, stripped_line) for all header candidates
+
+    Header candidates are all lines that start with "<<<" and end with ">>>"
+    (ignoring surrounding whitespace). This covers both section and piggyback
+    headers."""
+    find, rfind = raw_data.find, raw_data.rfind
+    data_len = len(raw_data)
+    pos = find("<<<")
+    while pos != -1:
+        line_start = rfind("\n", 0, pos) + 1
+        line_end = find("\n", pos)
+        if line_end == -1:
+            line_end = data_len
+
+        stripped_line = raw_data[line_start:line_end].strip()
+        if stripped_line[:3] == "<<<" and stripped_line[-3:] == ">>>":
+            yield line_start, line_end, stripped_line
+
+        pos = find("<<<", line_end)
+
+
+class _SectionChunk(object):
+    """Byte ranges of a section that share the same section header options"""
+    __slots__ = ["_raw_data", "_spans", "separator", "encoding", "nostrip"]
+
+    def __init__(self, raw_data, separator, encoding, nostrip):
+        super(_SectionChunk, self).__init__()
+        self._raw_data = raw_data
+        self._spans = []
+        self.separator = separator
+        self.encoding = encoding
+        self.nostrip = nostrip
+
+    def add_span(self, start, end):
+        self._spans.append((start, end))
+
+    def get_lines(self):
+        raw_data = self._raw_data
+        if not self._spans:
+            return []
+        elif len(self._spans) == 1:
+            start, end = self._spans[0]
+            data = raw_data[start:end]
+        else:
+            data = "\n".join(raw_data[start:end] for start, end in self._spans)
+
+        encoding = self.encoding or "utf-8"
+        if not _is_ascii_compatible(encoding):
+            return self._get_lines_individually_decoded(data)
+
+        try:
+            text = data.decode(encoding)
+        except Exception:
+            # At least one line can not be decoded with the requested encoding. Fall back
+            # to the line based processing which uses the fallback encoding per line.
+            return self._get_lines_individually_decoded(data)
+
+        if self.nostrip:
+            lines = [
+                line.rstrip(u"\r") for line in text.split(u"\n") if line.strip(_WHITESPACE_UNICODE)
+            ]
+        else:
+            lines = [
+                line for line in (line.strip(_WHITESPACE_UNICODE) for line in text.split(u"\n"))
+                if line
+            ]
+
+        separator = self.separator
+        return [line.split(separator) for line in lines]
+
+    def _get_lines_individually_decoded(self, data):
+        encoding = self.encoding or "utf-8"
+        separator = self.separator
+        lines = []
+        for line in data.split("\n"):
+            stripped_line = line.strip()
+            if not stripped_line:
+                continue
+
+            if self.nostrip:
+                line = line.rstrip("\r")
+            else:
+                line = stripped_line
+
+            lines.append(config.decode_incoming_string(line, encoding).split(separator))
+        return lines
+
+
+class AgentSectionContent(LazySectionContent):
+    """The not yet decoded content of an agent section
+
+    A section may appear several times in the agent output, each time with
+    possibly different header options. The content is the concatenation of all
+    these occurrences."""
+    __slots__ = ["_chunks"]
+
+    def __init__(self):
+        super(AgentSectionContent, self).__init__()
+        self._chunks = []
+
+    def get_chunk(self, raw_data, separator, encoding, nostrip):
+        """Returns the chunk new data of a section occurrence with the given options is added to"""
+        if self._chunks:
+            chunk = self._chunks[-1]
+            if (chunk.separator, chunk.encoding, chunk.nostrip) == (separator, encoding, nostrip):
+                return chunk
+
+        chunk = _SectionChunk(raw_data, separator, encoding, nostrip)
+        self._chunks.append(chunk)
+        return chunk
+
+    def materialize(self):
+        section_content = []
+        for chunk in self._chunks:
+            section_content += chunk.get_lines()
+        return section_content
+
+
+class AgentOutputParser(object):
+    """Splits the agent output into sections and piggybacked data
+
+    The result is a HostSections() object which is equal to the result of
+    processing the agent output line by line. Only the header lines are looked
+    at during parsing, the section contents are processed lazily."""
+
+    def __init__(self, hostname):
+        super(AgentOutputParser, self).__init__()
+        self._hostname = hostname
+        self._piggybacked_hostnames = {}
+
+    def parse(self, raw_data):
+        sections = LazySections()
+        contents = {}
+        # Unparsed info for other hosts. A dictionary, indexed by the piggybacked host name.
+        # The value is a list of lines which were received for this host.
+        piggybacked_raw_data = {}
+        persisted_sections = {}  # handle sections with option persist(...)
+        agent_cache_info = {}
+
+        piggybacked_hostname = None
+        chunk = None  # Lines before the first section header are dropped
+        body_start = 0
+
+        for line_start, line_end, stripped_line in _iter_header_lines(raw_data):
+            if stripped_line[:4] == "<<<<" and stripped_line[-4:] == ">>>>":
+                self._add_body(raw_data, body_start, line_start, chunk, piggybacked_hostname,
+                               piggybacked_raw_data)
+                piggybacked_hostname = self._get_piggybacked_hostname(stripped_line[4:-4])
+
+            elif piggybacked_hostname:
+                continue  # Section headers of other hosts are part of the piggybacked data
+
+            else:
+                self._add_body(raw_data, body_start, line_start, chunk, piggybacked_hostname,
+                               piggybacked_raw_data)
+
+                # section header has format <<<name:opt1(args):opt2:opt3(args)>>>
+                section_name, section_options = self._parse_section_header(stripped_line[3:-3])
+
+                section_content = contents.get(section_name)
+                if section_content is None:  # section appears in output for the first time
+                    section_content = contents[section_name] = AgentSectionContent()
+                    sections[section_name] = section_content
+
+                try:
+                    separator = chr(int(section_options["sep"]))
+                except:
+                    separator = None
+
+                # Split of persisted section for server-side caching
+                if "persist" in section_options:
+                    until = int(section_options["persist"])
+                    cached_at = int(time.time())  # Estimate age of the data
+                    cache_interval = int(until - cached_at)
+                    agent_cache_info[section_name] = (cached_at, cache_interval)
+                    persisted_sections[section_name] = (cached_at, until)
+
+                if "cached" in section_options:
+                    agent_cache_info[section_name] = tuple(
+                        map(int, section_options["cached"].split(",")))
+
+                # The section data might have a different encoding
+                chunk = section_content.get_chunk(raw_data, separator,
+                                                  section_options.get("encoding"),
+                                                  "nostrip" in section_options)
+
+            body_start = line_end + 1
+
+        self._add_body(raw_data, body_start,
+                       len(raw_data) + 1, chunk, piggybacked_hostname, piggybacked_raw_data)
+
+        # The persisted sections need the complete content of the section
+        for section_name, (cached_at, until) in persisted_sections.items():
+            persisted_sections[section_name] = (cached_at, until, sections[section_name])
+
+        return HostSections(sections, agent_cache_info, piggybacked_raw_data, persisted_sections)
+
+    def _add_body(self, raw_data, start, end, chunk, piggybacked_hostname, piggybacked_raw_data):
+        """Adds the lines from start until the line break before end to the current target"""
+        if start >= end:
+            return  # No lines between two headers
+
+        if piggybacked_hostname:
+            piggybacked_raw_data.setdefault(piggybacked_hostname, []).extend(
+                line.rstrip("\r") for line in raw_data[start:end - 1].split("\n"))
+
+        elif chunk is not None:
+            chunk.add_span(start, end - 1)
+
+    def _get_piggybacked_hostname(self, raw_hostname):
+        if not raw_hostname:
+            return None
+
+        try:
+            return self._piggybacked_hostnames[raw_hostname]
+        except KeyError:
+            pass
+
+        hostname = config.translate_piggyback_host(self._hostname, raw_hostname)
+        if hostname == self._hostname:
+            hostname = None  # unpiggybacked "normal" host
+
+        # Protect Check_MK against unallowed host names. Normally source scripts
+        # like agent plugins should care about cleaning their provided host names
+        # up, but we need to be sure here to prevent bugs in Check_MK code.
+        # a) Replace spaces by underscores
+        if hostname:
+            hostname = hostname.replace(" ", "_")
+
+        self._piggybacked_hostnames[raw_hostname] = hostname
+        return hostname
+
+    def _parse_section_header(self, section_header):
+        headerparts = section_header.split(":")
+        section_options = {}
+        for o in headerparts[1:]:
+            opt_parts = o.split("(")
+            opt_name = opt_parts[0]
+            if len(opt_parts) > 1:
+                opt_args = opt_parts[1][:-1]
+            else:
+                opt_args = None
+            section_options[opt_name] = opt_args
+        return headerparts[0], section_options
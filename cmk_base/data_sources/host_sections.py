@@ -24,6 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import abc
 import sys
 
 import cmk.utils.debug
@@ -37,13 +38,132 @@ import cmk_base.check_utils
 from cmk_base.exceptions import MKParseFunctionError
 
 
+class LazySectionContent(object):
+    """Base class for section contents that are computed on first access
+
+    The data sources may put instances of this class into the sections of
+    HostSections() objects to defer the costly processing of a section until a
+    check really asks for it."""
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def materialize(self):
+        """Returns the section content as list of rows"""
+        raise NotImplementedError()
+
+
+class ConcatenatedSectionContent(LazySectionContent):
+    """Section content that is made of the contents of multiple sources"""
+
+    def __init__(self, parts):
+        super(ConcatenatedSectionContent, self).__init__()
+        self._parts = parts
+
+    def materialize(self):
+        section_content = []
+        for part in self._parts:
+            if isinstance(part, LazySectionContent):
+                part = part.materialize()
+            section_content += part
+        return section_content
+
+
+class LazySections(dict):
+    """Dictionary from section name to section content which resolves lazy contents
+
+    Values that are LazySectionContent() instances are replaced with their
+    materialized content once they are accessed. Iterating the section names or
+    checking for the presence of a section does not materialize anything."""
+
+    def __getitem__(self, section_name):
+        section_content = dict.__getitem__(self, section_name)
+        if isinstance(section_content, LazySectionContent):
+            section_content = section_content.materialize()
+            dict.__setitem__(self, section_name, section_content)
+        return section_content
+
+    def get(self, section_name, default=None):
+        if section_name in self:
+            return self[section_name]
+        return default
+
+    def setdefault(self, section_name, default=None):
+        if section_name not in self:
+            dict.__setitem__(self, section_name, default)
+        return self[section_name]
+
+    def pop(self, section_name, *args):
+        if section_name in self:
+            section_content = self[section_name]
+            dict.__delitem__(self, section_name)
+            return section_content
+        return dict.pop(self, section_name, *args)
+
+    def popitem(self):
+        section_name = next(iter(self))
+        return section_name, self.pop(section_name)
+
+    def values(self):
+        return [self[section_name] for section_name in self]
+
+    def itervalues(self):
+        return (self[section_name] for section_name in self)
+
+    def items(self):
+        return [(section_name, self[section_name]) for section_name in self]
+
+    def iteritems(self):
+        return ((section_name, self[section_name]) for section_name in self)
+
+    def copy(self):
+        return LazySections(self.iteritems())
+
+    def iteritems_unmaterialized(self):
+        """Iterates the sections without materializing the lazy section contents"""
+        return dict.iteritems(self)
+
+    def extend_section(self, section_name, section_content):
+        """Appends the given content to the section, keeping lazy contents lazy
+
+        The section is created in case it does not exist yet. Materialized contents
+        are copied to not share the lists with the origin of the section content."""
+        if not isinstance(section_content, LazySectionContent):
+            section_content = list(section_content)
+
+        if section_name not in self:
+            dict.__setitem__(self, section_name, section_content)
+            return
+
+        current_content = dict.__getitem__(self, section_name)
+        if isinstance(current_content, LazySectionContent) \
+                or isinstance(section_content, LazySectionContent):
+            dict.__setitem__(self, section_name,
+                             ConcatenatedSectionContent([current_content, section_content]))
+        else:
+            current_content.extend(section_content)
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "LazySections(%r)" % dict(self.iteritems())
+
+
 class HostSections(object):
     """A wrapper class for the host information read by the data sources
 
     It contains the following information:
 
         1. sections:                A dictionary from section_name to a list of rows,
-                                    the section content
+                                    the section content (see LazySections)
         2. piggybacked_raw_data:    piggy-backed data for other hosts
         3. persisted_sections:      Sections to be persisted for later usage
         4. cache_info:              Agent cache information
@@ -56,7 +176,11 @@ class HostSections(object):
                  piggybacked_raw_data=None,
                  persisted_sections=None):
         super(HostSections, self).__init__()
-        self.sections = sections if sections is not None else {}
+        if sections is None:
+            sections = LazySections()
+        elif not isinstance(sections, LazySections):
+            sections = LazySections(sections)
+        self.sections = sections
         self.cache_info = cache_info if cache_info is not None else {}
         self.piggybacked_raw_data = piggybacked_raw_data if piggybacked_raw_data is not None else {}
         self.persisted_sections = persisted_sections if persisted_sections is not None else {}
@@ -67,9 +191,12 @@ class HostSections(object):
     # TODO: checking.execute_check() is using the oldest cached_at and the largest interval.
     #       Would this be correct here?
     def update(self, host_sections):
-        """Update this host info object with the contents of another one"""
-        for section_name, lines in host_sections.sections.items():
-            self.sections.setdefault(section_name, []).extend(lines)
+        """Update this host info object with the contents of another one
+
+        The sections of the other object are not materialized. They are processed
+        once a check asks for them."""
+        for section_name, section_content in host_sections.sections.iteritems_unmaterialized():
+            self.sections.extend_section(section_name, section_content)
 
         for hostname, lines in host_sections.piggybacked_raw_data.items():
             self.piggybacked_raw_data.setdefault(hostname, []).extend(lines)
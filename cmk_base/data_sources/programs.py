@@ -54,6 +54,8 @@ from .abstract import CheckMKAgentDataSource
 class ProgramDataSource(CheckMKAgentDataSource):
     """Abstract base class for all data source classes that execute external programs"""
 
+    _fetch_in_background_supported = True
+
     def _cpu_tracking_id(self):
         return "ds"
 
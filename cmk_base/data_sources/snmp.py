@@ -216,6 +216,7 @@ class SNMPDataSource(DataSource):
 
             info[section_name] = check_info
 
+        snmp.show_subtree_cache_statistics()
         return info
 
     def _sort_check_plugin_names(self, check_plugin_names):
@@ -71,6 +71,7 @@ def _normalize_ip_addresses(ip_addresses):
 
 class TCPDataSource(CheckMKAgentDataSource):
     _use_only_cache = False
+    _fetch_in_background_supported = True
 
     def __init__(self, hostname, ipaddress):
         super(TCPDataSource, self).__init__(hostname, ipaddress)
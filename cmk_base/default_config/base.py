@@ -51,9 +51,12 @@ agent_min_version = 0  # warn, if plugin has not at least version
 default_host_group = 'check_mk'
 
 check_max_cachefile_age = 0  # per default do not use cache files when checking
+fetch_data_sources_concurrently = False  # fetch agents and programs in threads
+counters_storage = "text"  # also possible: "binary"
 cluster_max_cachefile_age = 90  # secs.
 piggyback_max_cachefile_age = 3600  # secs
 piggyback_translation = []  # Ruleset for translating piggyback host names
+piggyback_storage = "files"  # also possible: "indexed"
 service_description_translation = []  # Ruleset for translating service descriptions
 simulation_mode = False
 fake_dns = None  # type: _typing.Optional[str]
@@ -76,6 +79,7 @@ http_proxies = {}  # Global setting for managing HTTP proxy configs
 use_inline_snmp = True
 non_inline_snmp_hosts = []  # Ruleset to disable Inline-SNMP per host when
 # use_inline_snmp is enabled.
+native_snmp_hosts = []  # Ruleset to use the native SNMP v1/v2c implementation per host
 
 snmp_limit_oid_range = []  # Ruleset to recduce fetched OIDs of a check, only inline SNMP
 snmp_bulk_size = []  # Ruleset to customize bulk size
@@ -106,6 +110,8 @@ inventory_check_severity = 1  # warning
 inventory_check_do_scan = True  # include SNMP scan for SNMP devices
 inventory_max_cachefile_age = 120  # seconds
 inventory_check_autotrigger = True  # Automatically trigger inv-check after automation-inventory
+discovery_max_num_processes = 1  # > 1: Discover the hosts in parallel worker processes
+discovery_host_timeout = 300  # secs, limit for a single host in the discovery worker pool
 # TODO: Remove this already deprecated option
 always_cleanup_autochecks = None  # For compatiblity with old configuration
 
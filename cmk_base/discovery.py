@@ -24,10 +24,14 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import math
 import os
 import socket
 import time
 import signal
+import multiprocessing
+import multiprocessing.pool  # pylint: disable=unused-import
+import traceback
 from typing import Callable, List, Text, Optional, Dict, Tuple  # pylint: disable=unused-import
 from pathlib2 import Path
 
@@ -35,6 +39,7 @@ from cmk.utils.regex import regex
 import cmk.utils.tty as tty
 import cmk.utils.debug
 import cmk.utils.paths
+import cmk.utils.cpu_tracking as cpu_tracking
 from cmk.utils.exceptions import MKGeneralException, MKTimeout
 import cmk.utils.store as store
 
@@ -57,6 +62,10 @@ import cmk_base.snmp_scan as snmp_scan
 # Run the discovery queued by check_discovery() - if any
 _marked_host_discovery_timeout = 120
 
+# Additional seconds to wait for a worker process after discovery_host_timeout
+# until its host is reported as failed
+_worker_timeout_margin = 10
+
 #   .--cmk -I--------------------------------------------------------------.
 #   |                                  _           ___                     |
 #   |                    ___ _ __ ___ | | __      |_ _|                    |
@@ -97,36 +106,25 @@ def do_discovery(hostnames, check_plugin_names, only_new):
     hostnames = list(set([h for h in hostnames if not config_cache.get_host_config(h).is_cluster]))
     hostnames.sort()
 
-    # Now loop through all hosts
-    for hostname in hostnames:
-        console.section_begin(hostname)
-
-        try:
-            if cmk.utils.debug.enabled():
-                on_error = "raise"
-            else:
-                on_error = "warn"
-
-            ipaddress = ip_lookup.lookup_ip_address(hostname)
-
-            # Usually we disable SNMP scan if cmk -I is used without a list of
-            # explicity hosts. But for host that have never been service-discovered
-            # yet (do not have autochecks), we enable SNMP scan.
-            do_snmp_scan = not use_caches or not _has_autochecks(hostname)
-
-            sources = _get_sources_for_discovery(hostname, ipaddress, check_plugin_names,
-                                                 do_snmp_scan, on_error)
-            multi_host_sections = _get_host_sections_for_discovery(sources, use_caches=use_caches)
+    if config.discovery_max_num_processes > 1 and len(hostnames) > 1:
+        _do_discovery_in_worker_pool(hostnames, check_plugin_names, only_new, use_caches)
+    else:
+        # Now loop through all hosts
+        for hostname in hostnames:
+            console.section_begin(hostname)
 
-            _do_discovery_for(hostname, ipaddress, sources, multi_host_sections, check_plugin_names,
-                              only_new, on_error)
+            try:
+                final_items, stats, num_services = _discover_autochecks_of(
+                    hostname, check_plugin_names, only_new, use_caches)
+                _save_autochecks_file(hostname, final_items)
+                _show_discovery_stats(stats, num_services, only_new)
 
-        except Exception as e:
-            if cmk.utils.debug.enabled():
-                raise
-            console.section_error("%s" % e)
-        finally:
-            cmk_base.cleanup.cleanup_globals()
+            except Exception as e:
+                if cmk.utils.debug.enabled():
+                    raise
+                console.section_error("%s" % e)
+            finally:
+                cmk_base.cleanup.cleanup_globals()
 
     # Check whether or not the cluster host autocheck files are still
     # existant. Remove them. The autochecks are only stored in the nodes
@@ -135,8 +133,29 @@ def do_discovery(hostnames, check_plugin_names, only_new):
         _remove_autochecks_file(hostname)
 
 
-def _do_discovery_for(hostname, ipaddress, sources, multi_host_sections, check_plugin_names,
-                      only_new, on_error):
+def _discover_autochecks_of(hostname, check_plugin_names, only_new, use_caches):
+    if cmk.utils.debug.enabled():
+        on_error = "raise"
+    else:
+        on_error = "warn"
+
+    ipaddress = ip_lookup.lookup_ip_address(hostname)
+
+    # Usually we disable SNMP scan if cmk -I is used without a list of
+    # explicity hosts. But for host that have never been service-discovered
+    # yet (do not have autochecks), we enable SNMP scan.
+    do_snmp_scan = not use_caches or not _has_autochecks(hostname)
+
+    sources = _get_sources_for_discovery(hostname, ipaddress, check_plugin_names, do_snmp_scan,
+                                         on_error)
+    multi_host_sections = _get_host_sections_for_discovery(sources, use_caches=use_caches)
+
+    return _get_discovered_autochecks(hostname, ipaddress, sources, multi_host_sections,
+                                      check_plugin_names, only_new, on_error)
+
+
+def _get_discovered_autochecks(hostname, ipaddress, sources, multi_host_sections,
+                               check_plugin_names, only_new, on_error):
     if not check_plugin_names and not only_new:
         old_items = []  # do not even read old file
     else:
@@ -188,8 +207,10 @@ def _do_discovery_for(hostname, ipaddress, sources, multi_host_sections, check_p
     for (check_plugin_name, item), paramstring in result.items():
         final_items.append((check_plugin_name, item, paramstring))
     final_items.sort()
-    _save_autochecks_file(hostname, final_items)
+    return final_items, stats, num_services
 
+
+def _show_discovery_stats(stats, num_services, only_new):
     found_check_plugin_names = stats.keys()
     found_check_plugin_names.sort()
 
@@ -216,6 +237,25 @@ def discover_on_host(config_cache,
                      use_caches,
                      on_error="ignore",
                      service_filter=None):
+    counts, new_items, err = _discover_autochecks_on_host(
+        config_cache, host_config, mode, do_snmp_scan, use_caches, on_error, service_filter)
+    if new_items is not None:
+        try:
+            _save_discovered_autochecks(host_config, mode, new_items)
+        except MKTimeout:
+            raise  # let general timeout through
+        except Exception as e:
+            if cmk.utils.debug.enabled():
+                raise
+            err = str(e)
+
+    return counts, err
+
+
+# Computes the new autochecks of the host without writing them. The new items
+# are None in case of an error.
+def _discover_autochecks_on_host(config_cache, host_config, mode, do_snmp_scan, use_caches,
+                                 on_error, service_filter):
     hostname = host_config.hostname
     counts = {
         "self_new": 0,
@@ -227,19 +267,19 @@ def discover_on_host(config_cache,
     }
 
     if hostname not in config_cache.all_active_realhosts():
-        return counts, ""
+        return counts, None, ""
 
     if service_filter is None:
         service_filter = lambda hostname, check_plugin_name, item: True
 
-    err = None
+    err, new_items = None, None
 
     try:
-        # in "refresh" mode we first need to remove all previously discovered
-        # checks of the host, so that _get_host_services() does show us the
-        # new discovered check parameters.
+        # in "refresh" mode all previously discovered checks of the host are
+        # ignored, so that _get_host_services() does show us the new discovered
+        # check parameters. They are removed when the new items are saved.
         if mode == "refresh":
-            counts["self_removed"] += remove_autochecks_of(host_config)  # this is cluster-aware!
+            counts["self_removed"] += _count_own_autochecks(host_config)  # this is cluster-aware!
 
         if host_config.is_cluster:
             ipaddress = None
@@ -257,7 +297,12 @@ def discover_on_host(config_cache,
 
         # Compute current state of new and existing checks
         services = _get_host_services(
-            host_config, ipaddress, sources, multi_host_sections, on_error=on_error)
+            host_config,
+            ipaddress,
+            sources,
+            multi_host_sections,
+            on_error=on_error,
+            refresh=mode == "refresh")
 
         # Create new list of checks
         new_items = {}
@@ -295,7 +340,6 @@ def discover_on_host(config_cache,
 
             else:
                 raise MKGeneralException("Unknown check source '%s'" % check_source)
-        set_autochecks_of(host_config, new_items)
 
     except MKTimeout:
         raise  # let general timeout through
@@ -303,10 +347,202 @@ def discover_on_host(config_cache,
     except Exception as e:
         if cmk.utils.debug.enabled():
             raise
-        err = str(e)
+        err, new_items = str(e), None
 
     counts["self_total"] = counts["self_new"] + counts["self_kept"]
-    return counts, err
+    return counts, new_items, err
+
+
+#.
+#   .--Pool----------------------------------------------------------------.
+#   |                          ____             _                          |
+#   |                         |  _ \ ___   ___ | |                         |
+#   |                         | |_) / _ \ / _ \| |                         |
+#   |                         |  __/ (_) | (_) | |                         |
+#   |                         |_|   \___/ \___/|_|                         |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   |  Discover many hosts in parallel worker processes                    |
+#   '----------------------------------------------------------------------'
+
+
+def _do_discovery_in_worker_pool(hostnames, check_plugin_names, only_new, use_caches):
+    throughput = DiscoveryThroughput()
+    for hostname, result, error, phase_times in _run_in_worker_pool(
+            _discover_autochecks_of, hostnames, (check_plugin_names, only_new, use_caches)):
+        throughput.add(error, phase_times)
+        console.section_begin(hostname)
+
+        if error is not None:
+            console.section_error(error)
+            continue
+
+        final_items, stats, num_services = result
+        try:
+            _save_autochecks_file(hostname, final_items)
+        except Exception as e:
+            if cmk.utils.debug.enabled():
+                raise
+            console.section_error("%s" % e)
+            continue
+        _show_discovery_stats(stats, num_services, only_new)
+
+    throughput.show()
+
+
+def _run_in_worker_pool(job_function, hostnames, args, deadline=None):
+    """Executes job_function(hostname, *args) for all hosts in worker processes
+
+    The workers are forked from the current process and use the already loaded
+    configuration. The results are yielded in the order of completion as tuples
+    of hostname, the result of the job, an error message or None and the
+    cpu_tracking times of the job. The autochecks files must only be written
+    by the calling process while handling the results.
+
+    Each job is limited to discovery_host_timeout, but not beyond the deadline.
+    Once the deadline is reached no further jobs are started. A job which has
+    not finished some seconds after its timeout, e.g. because its worker died,
+    is reported as failed. The pool is then replaced after the other running
+    jobs have finished."""
+    num_processes = min(config.discovery_max_num_processes, len(hostnames))
+    console.verbose("Discovering %d hosts with %d processes\n" % (len(hostnames), num_processes))
+
+    pending = list(hostnames)
+    running = {}  # type: Dict[str, Tuple[multiprocessing.pool.AsyncResult, float, int]]
+    replace_pool = False
+
+    pool = multiprocessing.Pool(num_processes)
+    try:
+        while pending or running:
+            if replace_pool and not running:
+                pool.terminate()
+                pool.join()
+                pool = multiprocessing.Pool(num_processes)
+                replace_pool = False
+
+            while pending and len(running) < num_processes and not replace_pool and (
+                    deadline is None or time.time() < deadline):
+                hostname = pending.pop(0)
+                timeout = _get_job_timeout(deadline)
+                running[hostname] = (pool.apply_async(_execute_job_in_worker,
+                                                      (job_function, hostname, args, timeout)),
+                                     time.time(), timeout)
+
+            if not running:
+                break
+
+            finished, timed_out = _wait_for_worker_results(running)
+            for entry in finished:
+                yield entry
+
+            for hostname, timeout in timed_out:
+                replace_pool = True
+                yield hostname, None, "Worker process did not finish within %d seconds" % (
+                    timeout + _worker_timeout_margin), {}
+    finally:
+        # Don't wait for workers that may never finish their jobs
+        pool.terminate()
+        pool.join()
+
+
+def _get_job_timeout(deadline):
+    # type: (Optional[float]) -> int
+    if deadline is None:
+        return config.discovery_host_timeout
+    return max(1, min(config.discovery_host_timeout, int(math.ceil(deadline - time.time()))))
+
+
+def _wait_for_worker_results(running):
+    """Waits until at least one of the running jobs has finished or timed out
+
+    Returns the results of the finished jobs and the names and timeouts of the
+    hosts whose jobs have timed out. These jobs are removed from running."""
+    while True:
+        now = time.time()
+        finished, timed_out = [], []
+        for hostname, (async_result, start_time, timeout) in running.items():
+            if async_result.ready():
+                finished.append(_get_worker_result(hostname, async_result))
+            elif start_time < now - timeout - _worker_timeout_margin:
+                timed_out.append((hostname, timeout))
+
+        if finished or timed_out:
+            for hostname in [entry[0] for entry in finished + timed_out]:
+                del running[hostname]
+            return finished, timed_out
+
+        # A blocking wait without timeout can not be interrupted by signals
+        time.sleep(0.1)
+
+
+def _get_worker_result(hostname, async_result):
+    try:
+        return async_result.get()
+    except Exception as e:
+        # E.g. the result of the job could not be pickled
+        return hostname, None, "%s" % e, {}
+
+
+def _execute_job_in_worker(job_function, hostname, args, timeout):
+    result, error = None, None
+
+    cpu_tracking.start("busy")
+    signal.signal(signal.SIGALRM, _handle_discovery_timeout)
+    signal.alarm(timeout)
+    try:
+        result = job_function(hostname, *args)
+    except DiscoveryTimeout:
+        error = "Timed out after %d seconds" % timeout
+    except Exception as e:
+        # The exception can not be raised in the parent process, so at least
+        # hand over the details in debug mode
+        if cmk.utils.debug.enabled():
+            error = traceback.format_exc()
+        else:
+            error = "%s" % e
+    finally:
+        signal.alarm(0)
+        cpu_tracking.end()
+        cmk_base.cleanup.cleanup_globals()
+
+    return hostname, result, error, cpu_tracking.get_times()
+
+
+class DiscoveryThroughput(object):
+    """Collects the statistics of the hosts handled by the worker pool"""
+
+    def __init__(self):
+        super(DiscoveryThroughput, self).__init__()
+        self._start_time = time.time()
+        self._num_hosts = 0
+        self._num_failed = 0
+        self._phase_durations = {}  # type: Dict[str, float]
+
+    def add(self, error, phase_times):
+        # type: (Optional[str], Dict[str, List[float]]) -> None
+        self._num_hosts += 1
+        if error is not None:
+            self._num_failed += 1
+
+        for phase, times in phase_times.items():
+            if phase != "TOTAL":
+                self._phase_durations.setdefault(phase, 0.0)
+                self._phase_durations[phase] += times[4]
+
+    def show(self):
+        # type: () -> None
+        duration = max(time.time() - self._start_time, 0.001)
+        console.output("Discovered %d hosts (%d failed) in %.1f sec (%.1f hosts/sec)\n" %
+                       (self._num_hosts, self._num_failed, duration, self._num_hosts / duration))
+
+        if not self._num_hosts:
+            return
+
+        console.output("Average time per host: %s\n" % ", ".join([
+            "%s %.2f sec" % ("discovery" if phase == "busy" else phase,
+                             self._phase_durations[phase] / self._num_hosts)
+            for phase in sorted(self._phase_durations)
+        ]))
 
 
 #.
@@ -452,7 +688,7 @@ class DiscoveryTimeout(Exception):
     pass
 
 
-def _handle_discovery_timeout():
+def _handle_discovery_timeout(signum, stack_frame):
     raise DiscoveryTimeout()
 
 
@@ -492,6 +728,11 @@ def discover_marked_hosts(core):
     host_states = _fetch_host_states()
     activation_required = False
 
+    if config.discovery_max_num_processes > 1 and len(hosts) > 1:
+        activation_required = _discover_marked_hosts_in_worker_pool(
+            config_cache, hosts, host_states, now_ts, end_time_ts, oldest_queued)
+        hosts = []
+
     try:
         _set_discovery_timeout()
         for hostname in hosts:
@@ -551,13 +792,27 @@ def _discover_marked_host_exists(config_cache, hostname):
 
 
 def _discover_marked_host(config_cache, host_config, now_ts, oldest_queued):
-    hostname = host_config.hostname
-    services_changed = False
+    console.verbose("%s%s%s:\n" % (tty.bold, host_config.hostname, tty.normal))
 
-    mode_table = {0: "new", 1: "remove", 2: "fixall", 3: "refresh"}
+    why_not = _may_rediscover(host_config.discovery_check_parameters, now_ts, oldest_queued)
+    if why_not:
+        console.verbose("  skipped: %s\n" % why_not)
+        return False
 
-    console.verbose("%s%s%s:\n" % (tty.bold, hostname, tty.normal))
-    host_flag_path = os.path.join(_get_autodiscovery_dir(), hostname)
+    mode, do_snmp_scan, item_filters = _get_rediscovery_options(host_config)
+    console.verbose("  Doing discovery with mode '%s'...\n" % mode)
+    result, error = discover_on_host(
+        config_cache,
+        host_config,
+        mode,
+        do_snmp_scan=do_snmp_scan,
+        use_caches=True,
+        service_filter=item_filters)
+    return _handle_marked_host_discovery_result(host_config, result, error)
+
+
+def _get_rediscovery_options(host_config):
+    mode_table = {0: "new", 1: "remove", 2: "fixall", 3: "refresh"}
 
     params = host_config.discovery_check_parameters
     params_rediscovery = params.get("inventory_rediscovery", {})
@@ -573,56 +828,140 @@ def _discover_marked_host(config_cache, host_config, now_ts, oldest_queued):
     else:
         item_filters = None
 
-    why_not = _may_rediscover(params, now_ts, oldest_queued)
-    if not why_not:
-        redisc_params = params["inventory_rediscovery"]
-        console.verbose("  Doing discovery with mode '%s'...\n" % mode_table[redisc_params["mode"]])
-        result, error = discover_on_host(
-            config_cache,
-            host_config,
-            mode_table[redisc_params["mode"]],
-            do_snmp_scan=params["inventory_check_do_scan"],
-            use_caches=True,
-            service_filter=item_filters)
-        if error is not None:
-            if error:
-                console.verbose("failed: %s\n" % error)
-            else:
-                # for offline hosts the error message is empty. This is to remain
-                # compatible with the automation code
-                console.verbose("  failed: host is offline\n")
-        else:
-            if result["self_new"] == 0 and\
-               result["self_removed"] == 0 and\
-               result["self_kept"] == result["self_total"] and\
-               result["clustered_new"] == 0 and\
-               result["clustered_vanished"] == 0:
-                console.verbose("  nothing changed.\n")
-            else:
-                console.verbose("  %(self_new)s new, %(self_removed)s removed, "\
-                                "%(self_kept)s kept, %(self_total)s total services. "\
-                                "clustered new %(clustered_new)s, clustered vanished %(clustered_vanished)s" % result)
+    return mode_table[params_rediscovery["mode"]], params["inventory_check_do_scan"], item_filters
 
-                # Note: Even if the actual mark-for-discovery flag may have been created by a cluster host,
-                #       the activation decision is based on the discovery configuration of the node
-                if redisc_params["activation"]:
-                    services_changed = True
 
-                # Now ensure that the discovery service is updated right after the changes
-                schedule_discovery_check(hostname)
+def _handle_marked_host_discovery_result(host_config, result, error):
+    hostname = host_config.hostname
+    services_changed = False
 
-        # delete the file even in error case, otherwise we might be causing the same error
-        # every time the cron job runs
-        try:
-            os.remove(host_flag_path)
-        except OSError:
-            pass
+    if error is not None:
+        if error:
+            console.verbose("failed: %s\n" % error)
+        else:
+            # for offline hosts the error message is empty. This is to remain
+            # compatible with the automation code
+            console.verbose("  failed: host is offline\n")
     else:
-        console.verbose("  skipped: %s\n" % why_not)
+        if result["self_new"] == 0 and\
+           result["self_removed"] == 0 and\
+           result["self_kept"] == result["self_total"] and\
+           result["clustered_new"] == 0 and\
+           result["clustered_vanished"] == 0:
+            console.verbose("  nothing changed.\n")
+        else:
+            console.verbose("  %(self_new)s new, %(self_removed)s removed, "\
+                            "%(self_kept)s kept, %(self_total)s total services. "\
+                            "clustered new %(clustered_new)s, clustered vanished %(clustered_vanished)s" % result)
+
+            # Note: Even if the actual mark-for-discovery flag may have been created by a cluster host,
+            #       the activation decision is based on the discovery configuration of the node
+            if host_config.discovery_check_parameters["inventory_rediscovery"]["activation"]:
+                services_changed = True
+
+            # Now ensure that the discovery service is updated right after the changes
+            schedule_discovery_check(hostname)
+
+    # delete the file even in error case, otherwise we might be causing the same error
+    # every time the cron job runs
+    try:
+        os.remove(os.path.join(_get_autodiscovery_dir(), hostname))
+    except OSError:
+        pass
 
     return services_changed
 
 
+def _discover_marked_hosts_in_worker_pool(config_cache, hosts, host_states, now_ts, end_time_ts,
+                                          oldest_queued):
+    activation_required = False
+
+    # The discovery of a cluster changes the autochecks of its nodes. To
+    # prevent concurrent modifications of these files, the clusters are
+    # discovered after the worker pool has finished.
+    pool_hosts, cluster_hosts = [], []
+    for hostname in hosts:
+        if not _discover_marked_host_exists(config_cache, hostname):
+            continue
+
+        # Only try to discover hosts with UP state
+        if host_states and host_states.get(hostname) != 0:
+            continue
+
+        host_config = config_cache.get_host_config(hostname)
+        if host_config.is_cluster:
+            cluster_hosts.append(host_config)
+            continue
+
+        why_not = _may_rediscover(host_config.discovery_check_parameters, now_ts, oldest_queued)
+        if why_not:
+            console.verbose("%s%s%s:\n" % (tty.bold, hostname, tty.normal))
+            console.verbose("  skipped: %s\n" % why_not)
+            continue
+
+        pool_hosts.append(hostname)
+
+    throughput = DiscoveryThroughput()
+    for hostname, result, error, phase_times in _run_in_worker_pool(
+            _discover_marked_host_in_worker, pool_hosts, (), deadline=end_time_ts):
+        throughput.add(error, phase_times)
+        host_config = config_cache.get_host_config(hostname)
+        console.verbose("%s%s%s:\n" % (tty.bold, hostname, tty.normal))
+
+        counts = None
+        if error is None:
+            counts, new_items, error = result
+            if new_items is not None:
+                try:
+                    mode = _get_rediscovery_options(host_config)[0]
+                    _save_discovered_autochecks(host_config, mode, new_items)
+                except Exception as e:
+                    if cmk.utils.debug.enabled():
+                        raise
+                    error = str(e)
+
+        if _handle_marked_host_discovery_result(host_config, counts, error):
+            activation_required = True
+
+    for host_config in cluster_hosts:
+        if time.time() > end_time_ts:
+            break
+
+        signal.signal(signal.SIGALRM, _handle_discovery_timeout)
+        signal.alarm(_get_job_timeout(end_time_ts))
+        try:
+            if _discover_marked_host(config_cache, host_config, now_ts, oldest_queued):
+                activation_required = True
+        except DiscoveryTimeout:
+            break
+        finally:
+            _clear_discovery_timeout()
+
+    if pool_hosts:
+        throughput.show()
+
+    if time.time() > end_time_ts:
+        console.verbose("  Timeout of %d seconds reached. Lets do the remaining hosts next time." %
+                        _marked_host_discovery_timeout)
+
+    return activation_required
+
+
+# Only computes the new autochecks. They are written by the calling process.
+def _discover_marked_host_in_worker(hostname):
+    config_cache = config.get_config_cache()
+    host_config = config_cache.get_host_config(hostname)
+    mode, do_snmp_scan, item_filters = _get_rediscovery_options(host_config)
+    return _discover_autochecks_on_host(
+        config_cache,
+        host_config,
+        mode,
+        do_snmp_scan,
+        use_caches=True,
+        on_error="ignore",
+        service_filter=item_filters)
+
+
 def _queue_age():
     autodiscovery_dir = _get_autodiscovery_dir()
     oldest = time.time()
@@ -920,19 +1259,28 @@ DiscoveredServicesTable = Dict[Tuple[str, str], Tuple[str, str]]
 #    "clustered_new" : New service found on a node that belongs to a cluster
 #    "clustered_old" : Old service found on a node that belongs to a cluster
 # This function is cluster-aware
-def _get_host_services(host_config, ipaddress, sources, multi_host_sections, on_error):
-    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str) -> DiscoveredServicesTable
+# In "refresh" mode the autochecks of the host are ignored, except the clustered ones
+def _get_host_services(host_config,
+                       ipaddress,
+                       sources,
+                       multi_host_sections,
+                       on_error,
+                       refresh=False):
+    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str, bool) -> DiscoveredServicesTable
     if host_config.is_cluster:
-        return _get_cluster_services(host_config, ipaddress, sources, multi_host_sections, on_error)
+        return _get_cluster_services(host_config, ipaddress, sources, multi_host_sections, on_error,
+                                     refresh)
 
-    return _get_node_services(host_config, ipaddress, sources, multi_host_sections, on_error)
+    return _get_node_services(host_config, ipaddress, sources, multi_host_sections, on_error,
+                              refresh)
 
 
 # Do the actual work for a non-cluster host or node
-def _get_node_services(host_config, ipaddress, sources, multi_host_sections, on_error):
-    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str) -> DiscoveredServicesTable
+def _get_node_services(host_config, ipaddress, sources, multi_host_sections, on_error, refresh):
+    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str, bool) -> DiscoveredServicesTable
     hostname = host_config.hostname
-    services = _get_discovered_services(hostname, ipaddress, sources, multi_host_sections, on_error)
+    services = _get_discovered_services(hostname, ipaddress, sources, multi_host_sections, on_error,
+                                        refresh)
 
     config_cache = config.get_config_cache()
     # Identify clustered services
@@ -957,8 +1305,8 @@ def _get_node_services(host_config, ipaddress, sources, multi_host_sections, on_
 
 
 # Part of _get_node_services that deals with discovered services
-def _get_discovered_services(hostname, ipaddress, sources, multi_host_sections, on_error):
-    # type: (str, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str) -> DiscoveredServicesTable
+def _get_discovered_services(hostname, ipaddress, sources, multi_host_sections, on_error, refresh):
+    # type: (str, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str, bool) -> DiscoveredServicesTable
     # Create a dict from check_plugin_name/item to check_source/paramstring
     services = {}  # type: DiscoveredServicesTable
 
@@ -977,6 +1325,8 @@ def _get_discovered_services(hostname, ipaddress, sources, multi_host_sections,
 
     # Match with existing items -> "old" and "vanished"
     old_items = parse_autochecks_file(hostname)
+    if refresh:
+        old_items = _clustered_autochecks(hostname, old_items)
     for check_plugin_name, item, paramstring in old_items:
         if (check_plugin_name, item) not in services:
             services[(check_plugin_name, item)] = ("vanished", paramstring)
@@ -1032,8 +1382,8 @@ def _merge_manual_services(host_config, services, on_error):
     return services
 
 
-def _get_cluster_services(host_config, ipaddress, sources, multi_host_sections, on_error):
-    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str) -> DiscoveredServicesTable
+def _get_cluster_services(host_config, ipaddress, sources, multi_host_sections, on_error, refresh):
+    # type: (config.HostConfig, Optional[str], data_sources.DataSources, data_sources.MultiHostSections, str, bool) -> DiscoveredServicesTable
     config_cache = config.get_config_cache()
 
     # Get setting from cluster SNMP data source
@@ -1059,7 +1409,7 @@ def _get_cluster_services(host_config, ipaddress, sources, multi_host_sections,
         )
 
         services = _get_discovered_services(node, node_ipaddress, node_sources, multi_host_sections,
-                                            on_error)
+                                            on_error, refresh)
         for (check_plugin_name, item), (check_source, paramstring) in services.items():
             descr = config.service_description(host_config.hostname, check_plugin_name, item)
             if host_config.hostname == config_cache.host_of_clustered_service(node, descr):
@@ -1406,14 +1756,32 @@ def remove_autochecks_of(host_config):
 
 def _remove_autochecks_of_host(hostname):
     old_items = parse_autochecks_file(hostname)
-    removed = 0
-    new_items = []
-    config_cache = config.get_config_cache()
-    for check_plugin_name, item, paramstring in old_items:
-        descr = config.service_description(hostname, check_plugin_name, item)
-        if hostname != config_cache.host_of_clustered_service(hostname, descr):
-            new_items.append((check_plugin_name, item, paramstring))
-        else:
-            removed += 1
+    new_items = _clustered_autochecks(hostname, old_items)
     _save_autochecks_file(hostname, new_items)
+    return len(old_items) - len(new_items)
+
+
+# Counts the autochecks remove_autochecks_of() would remove
+def _count_own_autochecks(host_config):
+    removed = 0
+    for hostname in host_config.nodes or [host_config.hostname]:
+        old_items = parse_autochecks_file(hostname)
+        removed += len(old_items) - len(_clustered_autochecks(hostname, old_items))
     return removed
+
+
+# Returns the autochecks of the host which belong to a cluster
+def _clustered_autochecks(hostname, items):
+    config_cache = config.get_config_cache()
+    return [(check_plugin_name, item, paramstring)
+            for check_plugin_name, item, paramstring in items
+            if hostname != config_cache.host_of_clustered_service(
+                hostname, config.service_description(hostname, check_plugin_name, item))]
+
+
+# The "refresh" mode replaces all autochecks of the host, also the parameters
+# of the kept ones
+def _save_discovered_autochecks(host_config, mode, new_items):
+    if mode == "refresh":
+        remove_autochecks_of(host_config)
+    set_autochecks_of(host_config, new_items)
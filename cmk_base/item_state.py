@@ -37,6 +37,10 @@ item. The value is free form.
 Note: The item state is kept in tmpfs and not reboot-persistant.
 Do not store long-time things here. Also do not store complex
 structures like log files or stuff.
+
+The item states are either stored as Python literals (text storage)
+or in the binary format of cmk_base.item_state_binary, depending on
+the configuration option counters_storage.
 """
 
 import os
@@ -46,6 +50,7 @@ import cmk.utils.paths
 import cmk.utils.store
 from cmk.utils.exceptions import MKGeneralException
 import cmk_base.cleanup
+import cmk_base.item_state_binary as item_state_binary
 
 # Constants for counters
 SKIP = None
@@ -57,6 +62,26 @@ g_suppress_on_wrap = True  # Suppress check on wrap (raise an exception)
 
 # e.g. do not suppress this check on check_mk -nv
 
+_storage = "text"
+
+
+def set_storage(storage):
+    # type: (str) -> None
+    global _storage
+    if storage not in ["text", "binary"]:
+        raise MKGeneralException("Invalid counters storage: %r" % storage)
+    _storage = storage
+
+
+def migrate_storage():
+    # type: () -> int
+    """Moves existing item states to the currently configured storage
+
+    Returns the number of migrated hosts."""
+    if _storage == "binary":
+        return item_state_binary.import_counter_files()
+    return item_state_binary.export_counter_files()
+
 
 class MKCounterWrapped(Exception):
     def __init__(self, reason):
@@ -84,8 +109,14 @@ class CachedItemStates(object):
         self._last_mtime = None  # timestamp of last modification
         self._removed_item_state_keys = []
         self._updated_item_states = {}
+        self._binary_file = None
 
     def load(self, hostname):
+        if _storage == "binary":
+            self._binary_file = item_state_binary.BinaryItemStateFile(hostname)
+            self._item_states = self._binary_file.load()
+            return
+
         filename = cmk.utils.paths.counters_dir + "/" + hostname
         try:
             # TODO: refactoring. put these two values into a named tuple
@@ -104,6 +135,10 @@ class CachedItemStates(object):
         Afterwards only the actual modifications (update/remove) are applied to the updated cached
         data before it is written back to disk.
         """
+        if _storage == "binary":
+            self._save_binary(hostname)
+            return
+
         filename = cmk.utils.paths.counters_dir + "/" + hostname
         if not self._removed_item_state_keys and not self._updated_item_states:
             return
@@ -133,6 +168,23 @@ class CachedItemStates(object):
         finally:
             cmk.utils.store.release_lock(filename)
 
+    def _save_binary(self, hostname):
+        """Only the changed keys are written. The binary file applies them to the current
+        data on disk, so there is no need to reload the file in case it has been changed."""
+        changed_keys = set(self._removed_item_state_keys)
+        changed_keys.update(self._updated_item_states)
+        if not changed_keys:
+            return
+
+        if self._binary_file is None:
+            self._binary_file = item_state_binary.BinaryItemStateFile(hostname)
+
+        try:
+            self._binary_file.save(self._item_states, changed_keys)
+        except Exception:
+            raise MKGeneralException(
+                "Cannot write counters of %s: %s" % (hostname, traceback.format_exc()))
+
     def clear_item_state(self, user_key):
         key = self.get_unique_item_state_key(user_key)
         self.remove_full_key(key)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Binary storage for the item states (counters) of the hosts
+
+The text storage (see cmk_base.item_state) writes all item states of a host as
+Python literal to tmp/check_mk/counters/<host>. Each check cycle has to parse
+the whole file and rewrite it, even if only a few counters changed.
+
+This storage keeps one file per host in tmp/check_mk/counters_binary which is
+a sequence of entries. Each entry is made of a header (kind, key length, value
+length), the marshalled key and the value:
+
+a) The typical counter values, pairs of floats and ints like (timestamp, value),
+   are struct packed to 16 bytes. Their kind tells which combination of float
+   and int is used.
+b) All other values are marshalled.
+
+The latest entry of a key wins. Saving the item states only touches the
+changed keys: Counters are overwritten in place, other values are appended and
+the outdated entry is marked as removed. The file is rewritten once it mostly
+consists of removed entries.
+
+Readers and writers serialize by locking the file of the host.
+"""
+
+import errno
+import marshal
+import os
+import struct
+
+import cmk.utils.paths
+import cmk.utils.store as store
+
+_MAGIC = "CMKIS\x00\x00\x01"
+
+# kind, length of the marshalled key, length of the value
+_ENTRY_HEADER = struct.Struct("<BHI")
+
+_KIND_REMOVED = 0
+_KIND_MARSHAL = 1
+
+_PAIR_STRUCTS = {
+    2: struct.Struct("<dd"),
+    3: struct.Struct("<dq"),
+    4: struct.Struct("<qd"),
+    5: struct.Struct("<qq"),
+}
+
+_PAIR_KINDS = {
+    (float, float): 2,
+    (float, int): 3,
+    (int, float): 4,
+    (int, int): 5,
+}
+
+# Files are rewritten once they are larger than _COMPACTION_FACTOR times the size of the
+# entries that are still in use. Small files are left as they are.
+_COMPACTION_FACTOR = 2
+_COMPACTION_MIN_SIZE = 64 * 1024
+
+
+def _counters_path(hostname):
+    # type: (str) -> str
+    return os.path.join(cmk.utils.paths.counters_binary_dir, hostname)
+
+
+def _encode_value(value):
+    if type(value) is tuple and len(value) == 2:
+        kind = _PAIR_KINDS.get((type(value[0]), type(value[1])))
+        if kind is not None:
+            return kind, _PAIR_STRUCTS[kind].pack(*value)
+    return _KIND_MARSHAL, marshal.dumps(value)
+
+
+def _decode_value(kind, data, offset, length):
+    if kind == _KIND_MARSHAL:
+        return marshal.loads(data[offset:offset + length])
+    return _PAIR_STRUCTS[kind].unpack_from(data, offset)
+
+
+def _encode_entry(kind, key_data, value_data):
+    return _ENTRY_HEADER.pack(kind, len(key_data), len(value_data)) + key_data + value_data
+
+
+class BinaryItemStateFile(object):
+    """The binary item state file of a single host
+
+    The entry table maps the keys to (offset, kind, entry length) of the valid
+    entries of the file. It is used to update the file without parsing the
+    values again.
+    """
+
+    def __init__(self, hostname):
+        super(BinaryItemStateFile, self).__init__()
+        self._path = _counters_path(hostname)
+        self._entries = {}
+        self._end = 0
+        self._removed_bytes = 0
+        self._last_stat = None
+
+    def load(self):
+        """Returns the item states stored in the file"""
+        store.aquire_lock(self._path)
+        try:
+            return self._read(decode_values=True)
+        finally:
+            store.release_lock(self._path)
+
+    def _read(self, decode_values=False):
+        self._entries = {}
+        self._end = 0
+        self._removed_bytes = 0
+        self._last_stat = None
+
+        try:
+            with open(self._path, "rb") as f:
+                data = f.read()
+                self._last_stat = self._stat(f.fileno())
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}
+
+        # Item states are transient. In case of doubt simply start from scratch.
+        if not data.startswith(_MAGIC):
+            return {}
+
+        item_states = {}
+        offset = self._end = len(_MAGIC)
+        while offset + _ENTRY_HEADER.size <= len(data):
+            kind, key_length, value_length = _ENTRY_HEADER.unpack_from(data, offset)
+            key_offset = offset + _ENTRY_HEADER.size
+            value_offset = key_offset + key_length
+            entry_length = _ENTRY_HEADER.size + key_length + value_length
+            if value_offset + value_length > len(data):
+                break  # Incomplete entry of an interrupted write
+
+            if kind == _KIND_REMOVED:
+                self._removed_bytes += entry_length
+            else:
+                key = marshal.loads(data[key_offset:value_offset])
+                if key in self._entries:
+                    self._removed_bytes += self._entries[key][2]
+                self._entries[key] = (offset, kind, entry_length)
+                if decode_values:
+                    item_states[key] = _decode_value(kind, data, value_offset, value_length)
+
+            offset += entry_length
+            self._end = offset
+
+        return item_states
+
+    def _stat(self, fd):
+        st = os.fstat(fd)
+        return (st.st_ino, st.st_mtime, st.st_size)
+
+    def save(self, item_states, changed_keys):
+        """Writes the given keys of the item states to the file
+
+        Keys that are not part of item_states are removed from the file. The other
+        keys of the file are kept as they are."""
+        if not changed_keys:
+            return
+
+        store.makedirs(cmk.utils.paths.counters_binary_dir)
+        store.aquire_lock(self._path)
+        try:
+            with open(self._path, "r+b") as f:
+                if self._stat(f.fileno()) != self._last_stat:
+                    self._read()
+                self._write_changes(f, item_states, changed_keys)
+                self._last_stat = self._stat(f.fileno())
+
+            if self._end > _COMPACTION_MIN_SIZE \
+               and self._end > _COMPACTION_FACTOR * (self._end - self._removed_bytes):
+                self._compact()
+        finally:
+            store.release_lock(self._path)
+
+    def _write_changes(self, f, item_states, changed_keys):
+        if self._end == 0:
+            f.write(_MAGIC)
+            self._end = len(_MAGIC)
+        # Drop the incomplete entry of an interrupted write
+        f.truncate(self._end)
+
+        appended = []
+        for key in changed_keys:
+            entry = self._entries.get(key)
+            if key not in item_states:
+                if entry is not None:
+                    self._remove_entry(f, key, entry)
+                continue
+
+            kind, value_data = _encode_value(item_states[key])
+            # The length of the marshalled key depends on the interning of its strings.
+            # Entries can only be overwritten in place when the length stays the same.
+            entry_data = _encode_entry(kind, marshal.dumps(key), value_data)
+            if entry is not None and entry[1] in _PAIR_STRUCTS and kind in _PAIR_STRUCTS \
+               and len(entry_data) == entry[2]:
+                f.seek(entry[0])
+                f.write(entry_data)
+                self._entries[key] = (entry[0], kind, entry[2])
+                continue
+
+            if entry is not None:
+                self._remove_entry(f, key, entry)
+
+            self._entries[key] = (self._end, kind, len(entry_data))
+            self._end += len(entry_data)
+            appended.append(entry_data)
+
+        if appended:
+            f.seek(0, 2)
+            f.write("".join(appended))
+
+    def _remove_entry(self, f, key, entry):
+        f.seek(entry[0])
+        f.write(chr(_KIND_REMOVED))
+        self._removed_bytes += entry[2]
+        del self._entries[key]
+
+    def _compact(self):
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        entries = []
+        end = len(_MAGIC)
+        for key, (offset, kind, entry_length) in sorted(
+                self._entries.items(), key=lambda e: e[1][0]):
+            entries.append(data[offset:offset + entry_length])
+            self._entries[key] = (end, kind, entry_length)
+            end += entry_length
+
+        store.save_file(self._path, _MAGIC + "".join(entries))
+        self._end = end
+        self._removed_bytes = 0
+        self._last_stat = None
+
+
+def remove_counters_file(hostname):
+    """Removes the binary item state file of the given host. Returns True if it existed."""
+    try:
+        os.remove(_counters_path(hostname))
+        return True
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return False
+
+
+def import_counter_files():
+    """Moves the item states of the text storage to the binary storage
+
+    Item states that have already been stored in the binary storage are kept. The
+    imported files are removed. Returns the number of imported hosts."""
+    num_imported = 0
+    for hostname in _list_dir(cmk.utils.paths.counters_dir):
+        path = os.path.join(cmk.utils.paths.counters_dir, hostname)
+        try:
+            item_states = store.load_data_from_file(path, default={}, lock=True)
+
+            binary_file = BinaryItemStateFile(hostname)
+            known_keys = binary_file.load()
+            binary_file.save(item_states, [key for key in item_states if key not in known_keys])
+
+            _remove_file(path)
+        finally:
+            store.release_lock(path)
+        num_imported += 1
+    return num_imported
+
+
+def export_counter_files():
+    """Moves the item states of the binary storage to the text storage
+
+    Item states that have already been stored in the text storage are kept. Returns
+    the number of exported hosts."""
+    num_exported = 0
+    for hostname in _list_dir(cmk.utils.paths.counters_binary_dir):
+        binary_file = BinaryItemStateFile(hostname)
+        path = os.path.join(cmk.utils.paths.counters_dir, hostname)
+        try:
+            item_states = store.load_data_from_file(path, default={}, lock=True)
+            for key, value in binary_file.load().iteritems():
+                item_states.setdefault(key, value)
+
+            store.makedirs(cmk.utils.paths.counters_dir)
+            store.save_data_to_file(path, item_states, pretty=False)
+
+            remove_counters_file(hostname)
+        finally:
+            store.release_lock(path)
+        num_exported += 1
+    return num_exported
+
+
+def _list_dir(path):
+    try:
+        return sorted(name for name in os.listdir(path) if not name.startswith("."))
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
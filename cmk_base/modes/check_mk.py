@@ -42,6 +42,7 @@ import cmk_base.discovery as discovery
 import cmk_base.inventory as inventory
 import cmk_base.inventory_plugins as inventory_plugins
 import cmk_base.check_api as check_api
+import cmk_base.item_state_binary as item_state_binary
 import cmk_base.piggyback as piggyback
 import cmk_base.snmp as snmp
 import cmk_base.ip_lookup as ip_lookup
@@ -740,6 +741,26 @@ modes.register(
         short_help="Cleanup outdated piggyback files",
     ))
 
+
+def mode_migrate_piggyback():
+    num_migrated = piggyback.migrate_storage()
+    console.output("Migrated %d piggyback files to the %s piggyback storage.\n" %
+                   (num_migrated, config.piggyback_storage))
+
+
+modes.register(
+    Mode(
+        long_option="migrate-piggyback",
+        handler_function=mode_migrate_piggyback,
+        short_help="Move piggyback data to the configured piggyback storage",
+        long_help=[
+            "Moves the currently stored piggyback data to the piggyback storage configured "
+            "with piggyback_storage. Execute this after changing the piggyback storage to "
+            "make the already received piggyback data available without waiting for the "
+            "piggyback sources to deliver new data.",
+        ],
+    ))
+
 #.
 #   .--scan-parents--------------------------------------------------------.
 #   |                                                         _            |
@@ -935,6 +956,13 @@ def mode_flush(hosts):
         except:
             pass
 
+        try:
+            if item_state_binary.remove_counters_file(host):
+                console.output(tty.bold + tty.blue + " counters")
+                flushed = True
+        except:
+            pass
+
         # cache files
         d = 0
         cache_dir = cmk.utils.paths.tcp_cache_dir
@@ -1007,6 +1035,27 @@ modes.register(
         ],
     ))
 
+
+def mode_migrate_counters():
+    import cmk_base.item_state as item_state
+    num_migrated = item_state.migrate_storage()
+    console.output("Migrated the counters of %d hosts to the %s counters storage.\n" %
+                   (num_migrated, config.counters_storage))
+
+
+modes.register(
+    Mode(
+        long_option="migrate-counters",
+        handler_function=mode_migrate_counters,
+        short_help="Move the counters to the configured counters storage",
+        long_help=[
+            "Moves the currently stored counters and other item states of the checks to the "
+            "counters storage configured with counters_storage. Execute this after changing "
+            "the counters storage to keep the counters of the hosts. Otherwise the checks "
+            "start with fresh counters.",
+        ],
+    ))
+
 #.
 #   .--nagios-config-------------------------------------------------------.
 #   |                     _                                  __ _          |
@@ -1428,8 +1477,19 @@ modes.register(
 #   |                                                                      |
 #   '----------------------------------------------------------------------'
 
+discovery_procs_option = Option(
+    long_option="procs",
+    argument=True,
+    argument_descr="N",
+    argument_conv=int,
+    short_help="Discover up to N hosts in parallel processes",
+)
+
+
+def mode_discover_marked_hosts(options):
+    if "procs" in options:
+        config.discovery_max_num_processes = options["procs"]
 
-def mode_discover_marked_hosts():
     discovery.discover_marked_hosts(create_core())
 
 
@@ -1444,6 +1504,9 @@ modes.register(
             "check-discovery. The results of this discovery may be activated "
             "automatically if configured.",
         ],
+        sub_options=[
+            discovery_procs_option,
+        ],
     ))
 
 #.
@@ -1497,6 +1560,9 @@ def mode_discover(options, args):
         data_sources.abstract.DataSource.set_may_use_cache_file(
             not data_sources.abstract.DataSource.is_agent_cache_disabled())
 
+    if "procs" in options:
+        config.discovery_max_num_processes = options["procs"]
+
     discovery.do_discovery(hostnames, options.get("checks"), options["discover"] == 1)
 
 
@@ -1535,6 +1601,7 @@ modes.register(
                 argument_descr="C",
                 argument_conv=lambda x: config.check_info.keys() if x == "@all" else x.split(","),
             ),
+            discovery_procs_option,
         ]))
 
 #.
@@ -0,0 +1,633 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""SNMP backend that talks SNMP v1/v2c to the devices from within the Check_MK process
+
+In contrast to the classic backend no snmpwalk / snmpget process is executed
+per request. All requests to a host are sent through a single UDP socket. When
+fetching SNMP tables, multiple columns are requested with a single GETBULK (or
+GETNEXT for SNMP v1) PDU and multiple of these requests are sent to the device
+without waiting for the answers of the previous ones.
+
+SNMPv3 is not supported by this backend. These hosts are handled by the other
+backends (see snmp.SNMPBackendFactory).
+"""
+
+import binascii
+import random
+import select
+import socket
+import time
+from typing import Dict, List, Optional, Tuple  # pylint: disable=unused-import
+
+import cmk_base.console as console
+import cmk_base.snmp_utils as snmp_utils
+from cmk_base.exceptions import MKSNMPError
+
+# Number of table columns that are requested with a single PDU
+_MAX_COLUMNS_PER_REQUEST = 10
+# Number of requests that are sent to a device without having received an answer
+_MAX_REQUESTS_IN_FLIGHT = 8
+# Large enough for the biggest UDP datagram
+_MAX_RESPONSE_SIZE = 65535
+
+_TAG_INTEGER = 0x02
+_TAG_OCTET_STRING = 0x04
+_TAG_NULL = 0x05
+_TAG_OID = 0x06
+_TAG_SEQUENCE = 0x30
+_TAG_IP_ADDRESS = 0x40
+_TAG_COUNTER32 = 0x41
+_TAG_GAUGE32 = 0x42
+_TAG_TIMETICKS = 0x43
+_TAG_OPAQUE = 0x44
+_TAG_COUNTER64 = 0x46
+_TAG_NO_SUCH_OBJECT = 0x80
+_TAG_NO_SUCH_INSTANCE = 0x81
+_TAG_END_OF_MIB_VIEW = 0x82
+
+_PDU_GET = 0xa0
+_PDU_GETNEXT = 0xa1
+_PDU_RESPONSE = 0xa2
+_PDU_GETBULK = 0xa5
+
+_ERROR_TOO_BIG = 1
+_ERROR_NO_SUCH_NAME = 2
+
+_UNSIGNED_TAGS = (_TAG_COUNTER32, _TAG_GAUGE32, _TAG_TIMETICKS, _TAG_COUNTER64)
+_EXCEPTION_TAGS = (_TAG_NO_SUCH_OBJECT, _TAG_NO_SUCH_INSTANCE, _TAG_END_OF_MIB_VIEW)
+
+_ERROR_NAMES = {
+    1: "tooBig",
+    2: "noSuchName",
+    3: "badValue",
+    4: "readOnly",
+    5: "genErr",
+    6: "noAccess",
+    16: "authorizationError",
+}
+
+_PRINTABLE_CHARS = frozenset([chr(c) for c in range(0x20, 0x7f)] + list("\t\n\r\x0b\x0c"))
+
+Varbind = Tuple[str, int, str]  # OID, value tag, raw value
+Response = Tuple[int, int, List[Varbind]]  # error status, error index, varbinds
+Request = Tuple[int, int, int, List[str]]  # PDU type, error status / non repeaters,
+# error index / max repetitions, OIDs
+
+# One session (UDP socket) per host that is reused for all requests to it
+_sessions = {}  # type: Dict[Tuple, _Session]
+
+
+def cleanup_sessions():
+    # type: () -> None
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+
+
+def is_supported(snmp_config):
+    # type: (snmp_utils.SNMPHostConfig) -> bool
+    return not snmp_utils.is_snmpv3_host(snmp_config)
+
+
+class NativeSNMPBackend(snmp_utils.ABCSNMPBackend):
+    def get(self, snmp_config, oid, context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, str, Optional[str]) -> Optional[str]
+        if oid.endswith(".*"):
+            oid_prefix = oid[:-2]
+            pdu_type = _PDU_GETNEXT
+        else:
+            oid_prefix = oid
+            pdu_type = _PDU_GET
+
+        try:
+            error_status, _error_index, varbinds = \
+                _get_session(snmp_config).exchange([(pdu_type, 0, 0, [oid_prefix])])[0]
+        except MKSNMPError as e:
+            console.verbose("SNMP error: %s\n" % e)
+            return None
+
+        if error_status or not varbinds:
+            return None
+
+        value_oid, tag, raw = varbinds[0]
+        if tag in _EXCEPTION_TAGS:
+            return None
+
+        if pdu_type == _PDU_GETNEXT and not value_oid.startswith(oid_prefix + "."):
+            return None
+
+        # The classic backend hands over the output of snmpget which does not
+        # convert hex strings
+        if tag == _TAG_OCTET_STRING and not _is_printable(raw):
+            return "".join("%02X " % ord(c) for c in raw)
+
+        return _format_value(tag, raw)
+
+    def walk(self, snmp_config, oid, check_plugin_name=None, table_base_oid=None,
+             context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, str, Optional[str], Optional[str], Optional[str]) -> snmp_utils.SNMPRowInfo
+        return self.walk_columns(snmp_config, [oid], check_plugin_name, table_base_oid,
+                                 context_name)[0]
+
+    def walk_columns(self,
+                     snmp_config,
+                     oids,
+                     check_plugin_name=None,
+                     table_base_oid=None,
+                     context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, List[str], Optional[str], Optional[str], Optional[str]) -> List[snmp_utils.SNMPRowInfo]
+        session = _get_session(snmp_config)
+        use_bulk = snmp_config.is_bulkwalk_host
+        max_repetitions = max(1, snmp_config.bulk_walk_size_of)
+        columns = [_ColumnWalk(oid) for oid in oids]
+
+        console.vverbose("Walking %d columns of %s (%s)\n" % (len(oids), snmp_config.ipaddress,
+                                                              "GETBULK" if use_bulk else "GETNEXT"))
+
+        while True:
+            active = [c for c in columns if not c.finished]
+            if not active:
+                break
+
+            groups = [
+                active[index:index + _MAX_COLUMNS_PER_REQUEST]
+                for index in xrange(0, len(active), _MAX_COLUMNS_PER_REQUEST)
+            ]
+            requests = []  # type: List[Request]
+            for group in groups:
+                next_oids = [c.next_oid for c in group]
+                if use_bulk:
+                    requests.append((_PDU_GETBULK, 0, max_repetitions, next_oids))
+                else:
+                    requests.append((_PDU_GETNEXT, 0, 0, next_oids))
+
+            for group, response in zip(groups, session.exchange(requests)):
+                error_status, error_index, varbinds = response
+
+                if error_status == _ERROR_TOO_BIG and use_bulk and max_repetitions > 1:
+                    max_repetitions = max(1, max_repetitions / 2)
+                    console.vverbose(
+                        "Response too big. Reducing bulk size to %d\n" % max_repetitions)
+                    continue
+
+                if error_status == _ERROR_NO_SUCH_NAME and 0 < error_index <= len(group):
+                    # SNMP v1 agents report the end of the MIB this way. The other
+                    # columns of the request are requested again.
+                    group[error_index - 1].finished = True
+                    continue
+
+                if error_status:
+                    raise MKSNMPError(
+                        "SNMP Error on %s: %s" % (snmp_config.ipaddress,
+                                                  _ERROR_NAMES.get(error_status, error_status)))
+
+                if not varbinds:
+                    for column in group:
+                        column.finished = True
+                    continue
+
+                # The varbinds of the columns are interleaved: The response contains
+                # the first repetition of all columns, then the second one and so on.
+                for index, (value_oid, tag, raw) in enumerate(varbinds):
+                    group[index % len(group)].add(value_oid, tag, raw)
+
+        # snmpwalk requests the OID itself, in case the walk did not return anything.
+        # This makes it possible to "walk" single scalar values
+        empty = [c for c in columns if not c.rows]
+        if empty:
+            requests = [(_PDU_GET, 0, 0, [c.oid]) for c in empty]
+            for column, (error_status, _error_index, varbinds) in zip(empty,
+                                                                      session.exchange(requests)):
+                if not error_status and varbinds and varbinds[0][1] not in _EXCEPTION_TAGS:
+                    value_oid, tag, raw = varbinds[0]
+                    column.rows.append((value_oid, _format_value(tag, raw)))
+
+        return [c.rows for c in columns]
+
+
+class _ColumnWalk(object):
+    """State of the walk of a single column (subtree)"""
+
+    def __init__(self, oid):
+        # type: (str) -> None
+        super(_ColumnWalk, self).__init__()
+        self.oid = oid
+        self.next_oid = oid
+        self.finished = False
+        self.rows = []  # type: snmp_utils.SNMPRowInfo
+        self._prefix = oid + "."
+        self._seen_oids = set()  # type: set
+
+    def add(self, value_oid, tag, raw):
+        # type: (str, int, str) -> None
+        if self.finished:
+            return
+
+        if tag == _TAG_END_OF_MIB_VIEW or not value_oid.startswith(self._prefix):
+            self.finished = True
+            return
+
+        # Like the classic backend we accept OIDs that are not increasing, but
+        # stop when the agent returns an OID twice to prevent endless walks
+        if value_oid in self._seen_oids:
+            console.vverbose("Duplicate OID %s. Stopping walk of %s.\n" % (value_oid, self.oid))
+            self.finished = True
+            return
+        self._seen_oids.add(value_oid)
+
+        self.next_oid = value_oid
+        if tag not in _EXCEPTION_TAGS:
+            self.rows.append((value_oid, _format_value(tag, raw)))
+
+
+def _get_session(snmp_config):
+    # type: (snmp_utils.SNMPHostConfig) -> _Session
+    key = (snmp_config.hostname, snmp_config.ipaddress, snmp_config.port, snmp_config.credentials,
+           _snmp_version(snmp_config))
+    try:
+        return _sessions[key]
+    except KeyError:
+        session = _sessions[key] = _Session(snmp_config)
+        return session
+
+
+def _snmp_version(snmp_config):
+    # type: (snmp_utils.SNMPHostConfig) -> int
+    if snmp_config.is_bulkwalk_host or snmp_config.is_snmpv2or3_without_bulkwalk_host:
+        return 1  # SNMP v2c
+    return 0  # SNMP v1
+
+
+class _Session(object):
+    """The UDP socket to a single device and the requests sent through it"""
+
+    def __init__(self, snmp_config):
+        # type: (snmp_utils.SNMPHostConfig) -> None
+        super(_Session, self).__init__()
+        if not is_supported(snmp_config):
+            raise MKSNMPError("SNMPv3 is not supported by the native SNMP backend")
+
+        self._ipaddress = snmp_config.ipaddress
+        self._version = _snmp_version(snmp_config)
+        self._community = snmp_config.credentials
+        self._timeout = float(snmp_config.timing.get("timeout", 1))
+        self._retries = int(snmp_config.timing.get("retries", 5))
+        self._next_request_id = random.randint(1, 0x3fffffff)
+
+        family = socket.AF_INET6 if snmp_config.is_ipv6_primary else socket.AF_INET
+        try:
+            address = socket.getaddrinfo(snmp_config.ipaddress, snmp_config.port, family,
+                                         socket.SOCK_DGRAM)[0][4]
+        except socket.gaierror as e:
+            raise MKSNMPError("SNMP Error on %s: Unknown host (%s)" % (self._ipaddress, e))
+
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.connect(address)
+
+    def close(self):
+        # type: () -> None
+        self._socket.close()
+
+    def exchange(self, requests):
+        # type: (List[Request]) -> List[Response]
+        """Send the requests to the device and return the responses in the same order
+
+        Up to _MAX_REQUESTS_IN_FLIGHT requests are sent without waiting for the
+        answers. Requests that are not answered within the timeout are sent again
+        (with a new request ID) until the configured number of retries is exceeded.
+        """
+        responses = [None] * len(requests)  # type: List[Optional[Response]]
+        attempts = [0] * len(requests)
+        sent_at = [0.0] * len(requests)
+        unsent = list(reversed(xrange(len(requests))))
+        waiting = set()  # type: set
+        request_indices = {}  # type: Dict[int, int]
+
+        while unsent or waiting:
+            while unsent and len(waiting) < _MAX_REQUESTS_IN_FLIGHT:
+                index = unsent.pop()
+                self._send(requests[index], index, request_indices)
+                attempts[index] += 1
+                sent_at[index] = time.time()
+                waiting.add(index)
+
+            now = time.time()
+            for index in list(waiting):
+                if now - sent_at[index] < self._timeout:
+                    continue
+                if attempts[index] > self._retries:
+                    raise MKSNMPError("SNMP Error on %s: Timeout: No Response from %s" %
+                                      (self._ipaddress, self._ipaddress))
+                self._send(requests[index], index, request_indices)
+                attempts[index] += 1
+                sent_at[index] = now
+
+            wait_time = min(sent_at[index] for index in waiting) + self._timeout - now
+            readable = select.select([self._socket], [], [], max(0.0, wait_time))[0]
+            if not readable:
+                continue
+
+            response = self._receive()
+            if response is None:
+                continue
+
+            request_id, response_data = response
+            index = request_indices.pop(request_id, None)
+            if index is None or responses[index] is not None:
+                continue  # Late answer to a request that has already been answered
+
+            responses[index] = response_data
+            waiting.discard(index)
+
+        return responses  # type: ignore
+
+    def _send(self, request, index, request_indices):
+        # type: (Request, int, Dict[int, int]) -> None
+        request_id = self._next_request_id
+        self._next_request_id = request_id % 0x3fffffff + 1
+        request_indices[request_id] = index
+
+        pdu_type, error_status, error_index, oids = request
+        try:
+            self._socket.send(
+                encode_request(self._version, self._community, pdu_type, request_id, error_status,
+                               error_index, oids))
+        except socket.error as e:
+            raise MKSNMPError("SNMP Error on %s: %s" % (self._ipaddress, e))
+
+    def _receive(self):
+        # type: () -> Optional[Tuple[int, Response]]
+        try:
+            data = self._socket.recv(_MAX_RESPONSE_SIZE)
+        except socket.error as e:
+            # E.g. "connection refused" reported by ICMP. Handle it like a
+            # missing answer to get the same behaviour as the other backends.
+            console.vverbose("Failed to receive SNMP response: %s\n" % e)
+            return None
+
+        try:
+            return decode_response(data)
+        except (IndexError, ValueError) as e:
+            console.vverbose("Ignoring invalid SNMP response: %s\n" % e)
+            return None
+
+
+def _is_printable(raw):
+    # type: (str) -> bool
+    return all(c in _PRINTABLE_CHARS for c in raw)
+
+
+def _format_value(tag, raw):
+    # type: (int, str) -> str
+    """Format the values in the same way the classic backend does"""
+    if tag == _TAG_OCTET_STRING:
+        text = raw[:-1] if raw.endswith("\0") else raw
+        if _is_printable(text):
+            return text.strip()
+        return raw
+
+    if tag == _TAG_INTEGER:
+        return str(_decode_integer(raw))
+
+    if tag in _UNSIGNED_TAGS:
+        return str(_decode_unsigned(raw))
+
+    if tag == _TAG_OID:
+        return _decode_oid(raw)
+
+    if tag == _TAG_IP_ADDRESS:
+        return ".".join(str(ord(c)) for c in raw)
+
+    if tag == _TAG_NULL:
+        return ""
+
+    return raw
+
+
+#
+# Encoding and decoding of the SNMP messages (BER)
+#
+
+
+def encode_request(version, community, pdu_type, request_id, error_status, error_index, oids):
+    # type: (int, str, int, int, int, int, List[str]) -> str
+    varbinds = "".join(
+        _encode_tlv(_TAG_SEQUENCE,
+                    _encode_oid(oid) + _encode_tlv(_TAG_NULL, "")) for oid in oids)
+    pdu = _encode_integer(request_id) + _encode_integer(error_status) \
+        + _encode_integer(error_index) + _encode_tlv(_TAG_SEQUENCE, varbinds)
+    return _encode_tlv(
+        _TAG_SEQUENCE,
+        _encode_integer(version) + _encode_tlv(_TAG_OCTET_STRING, community) + _encode_tlv(
+            pdu_type, pdu))
+
+
+def decode_response(data):
+    # type: (str) -> Tuple[int, Response]
+    """Decode an SNMP response message
+
+    Returns the request ID and the tuple of error status, error index and the
+    varbinds of the response. Raises ValueError or IndexError on invalid messages.
+    """
+    _tag, offset, end = _decode_tlv(data, 0, _TAG_SEQUENCE)
+    _tag, _start, offset = _decode_tlv(data, offset, _TAG_INTEGER)  # version
+    _tag, _start, offset = _decode_tlv(data, offset, _TAG_OCTET_STRING)  # community
+    _tag, offset, end = _decode_tlv(data, offset, _PDU_RESPONSE)
+
+    integers = []
+    for _unused in range(3):
+        _tag, start, offset = _decode_tlv(data, offset, _TAG_INTEGER)
+        integers.append(_decode_integer(data[start:offset]))
+    request_id, error_status, error_index = integers
+
+    varbinds = []  # type: List[Varbind]
+    _tag, offset, end = _decode_tlv(data, offset, _TAG_SEQUENCE)
+    while offset < end:
+        _tag, offset, varbind_end = _decode_tlv(data, offset, _TAG_SEQUENCE)
+        _tag, start, offset = _decode_tlv(data, offset, _TAG_OID)
+        oid = _decode_oid(data[start:offset])
+        tag, start, offset = _decode_tlv(data, offset)
+        varbinds.append((oid, tag, data[start:offset]))
+        offset = varbind_end
+
+    return request_id, (error_status, error_index, varbinds)
+
+
+def encode_response(version, community, request_id, error_status, error_index, varbinds):
+    # type: (int, str, int, int, int, List[Varbind]) -> str
+    """Create a response message. This is only needed for testing purposes"""
+    encoded_varbinds = "".join(
+        _encode_tlv(_TAG_SEQUENCE,
+                    _encode_oid(oid) + _encode_tlv(tag, raw)) for oid, tag, raw in varbinds)
+    pdu = _encode_integer(request_id) + _encode_integer(error_status) \
+        + _encode_integer(error_index) + _encode_tlv(_TAG_SEQUENCE, encoded_varbinds)
+    return _encode_tlv(
+        _TAG_SEQUENCE,
+        _encode_integer(version) + _encode_tlv(_TAG_OCTET_STRING, community) + _encode_tlv(
+            _PDU_RESPONSE, pdu))
+
+
+def decode_request(data):
+    # type: (str) -> Tuple[int, str, int, int, int, int, List[str]]
+    """Decode a request message. This is only needed for testing purposes"""
+    _tag, offset, _end = _decode_tlv(data, 0, _TAG_SEQUENCE)
+    _tag, start, offset = _decode_tlv(data, offset, _TAG_INTEGER)
+    version = _decode_integer(data[start:offset])
+    _tag, start, offset = _decode_tlv(data, offset, _TAG_OCTET_STRING)
+    community = data[start:offset]
+    pdu_type, offset, _end = _decode_tlv(data, offset)
+
+    integers = []
+    for _unused in range(3):
+        _tag, start, offset = _decode_tlv(data, offset, _TAG_INTEGER)
+        integers.append(_decode_integer(data[start:offset]))
+
+    oids = []
+    _tag, offset, end = _decode_tlv(data, offset, _TAG_SEQUENCE)
+    while offset < end:
+        _tag, offset, varbind_end = _decode_tlv(data, offset, _TAG_SEQUENCE)
+        _tag, start, offset = _decode_tlv(data, offset, _TAG_OID)
+        oids.append(_decode_oid(data[start:offset]))
+        offset = varbind_end
+
+    return (version, community, pdu_type) + tuple(integers) + (oids,)  # type: ignore
+
+
+def encode_value(tag, value):
+    # type: (int, object) -> str
+    """Return the raw value of the given type. This is only needed for testing purposes"""
+    if tag == _TAG_INTEGER or tag in _UNSIGNED_TAGS:
+        return _encode_integer(int(value))[2:]  # type: ignore
+    if tag == _TAG_OID:
+        return _encode_oid(str(value))[2:]
+    if tag == _TAG_IP_ADDRESS:
+        return "".join(chr(int(p)) for p in str(value).split("."))
+    return str(value)
+
+
+def _encode_length(length):
+    # type: (int) -> str
+    if length < 0x80:
+        return chr(length)
+
+    encoded = ""
+    while length:
+        encoded = chr(length & 0xff) + encoded
+        length >>= 8
+    return chr(0x80 | len(encoded)) + encoded
+
+
+def _encode_tlv(tag, value):
+    # type: (int, str) -> str
+    return chr(tag) + _encode_length(len(value)) + value
+
+
+def _encode_integer(value):
+    # type: (int) -> str
+    encoded = [value & 0xff]
+    value >>= 8
+    # Add bytes until the remaining value is only the sign extension of the last byte
+    while not ((value == 0 and not encoded[0] & 0x80) or (value == -1 and encoded[0] & 0x80)):
+        encoded.insert(0, value & 0xff)
+        value >>= 8
+    return _encode_tlv(_TAG_INTEGER, "".join(map(chr, encoded)))
+
+
+def _encode_oid(oid):
+    # type: (str) -> str
+    arcs = [int(p) for p in oid.strip(".").split(".")]
+    if len(arcs) < 2:
+        arcs.append(0)
+
+    encoded = []  # type: List[int]
+    for arc in [arcs[0] * 40 + arcs[1]] + arcs[2:]:
+        chunk = [arc & 0x7f]
+        arc >>= 7
+        while arc:
+            chunk.insert(0, 0x80 | (arc & 0x7f))
+            arc >>= 7
+        encoded += chunk
+    return _encode_tlv(_TAG_OID, "".join(map(chr, encoded)))
+
+
+def _decode_tlv(data, offset, expected_tag=None):
+    # type: (str, int, Optional[int]) -> Tuple[int, int, int]
+    """Returns the tag and the start and end offset of the value"""
+    tag = ord(data[offset])
+    if expected_tag is not None and tag != expected_tag:
+        raise ValueError(
+            "Expected tag 0x%02x at offset %d, got 0x%02x" % (expected_tag, offset, tag))
+
+    length = ord(data[offset + 1])
+    offset += 2
+    if length & 0x80:
+        num_bytes = length & 0x7f
+        length = int(binascii.hexlify(data[offset:offset + num_bytes]) or "0", 16)
+        offset += num_bytes
+
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated message")
+    return tag, offset, end
+
+
+def _decode_unsigned(raw):
+    # type: (str) -> int
+    if not raw:
+        return 0
+    return int(binascii.hexlify(raw), 16)
+
+
+def _decode_integer(raw):
+    # type: (str) -> int
+    value = _decode_unsigned(raw)
+    if raw and ord(raw[0]) & 0x80:
+        value -= 1 << (8 * len(raw))
+    return value
+
+
+def _decode_oid(raw):
+    # type: (str) -> str
+    arcs = []  # type: List[int]
+    value = 0
+    for c in raw:
+        byte = ord(c)
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            arcs.append(value)
+            value = 0
+
+    if not arcs:
+        return ""
+
+    first = arcs[0]
+    if first < 40:
+        head = [0, first]
+    elif first < 80:
+        head = [1, first - 40]
+    else:
+        head = [2, first - 80]
+    return "." + ".".join(str(arc) for arc in head + arcs[1:])
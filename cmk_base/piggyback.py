@@ -35,6 +35,29 @@ from cmk.utils.exceptions import MKGeneralException
 
 import cmk_base.utils
 import cmk_base.console as console
+import cmk_base.piggyback_index as piggyback_index
+
+# The piggyback storage to use: "files" (one file per piggybacked host and source host)
+# or "indexed" (see cmk_base.piggyback_index). Set from the configuration.
+_storage = "files"
+
+
+def set_storage(storage):
+    # type: (str) -> None
+    global _storage
+    if storage not in ["files", "indexed"]:
+        raise MKGeneralException("Invalid piggyback storage: %r" % storage)
+    _storage = storage
+
+
+def migrate_storage():
+    # type: () -> int
+    """Moves existing piggyback data to the currently configured piggyback storage
+
+    Returns the number of migrated piggyback files."""
+    if _storage == "indexed":
+        return piggyback_index.import_piggyback_files()
+    return piggyback_index.export_piggyback_files()
 
 
 def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
@@ -47,6 +70,9 @@ def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
     if not hostname:
         return []
 
+    if _storage == "indexed":
+        return piggyback_index.get_piggyback_raw_data(piggyback_max_cachefile_age, hostname)
+
     piggyback_data = []
     for source_host, piggyback_file_path in get_piggyback_files(piggyback_max_cachefile_age,
                                                                 hostname):
@@ -63,6 +89,8 @@ def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
 
 
 def has_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
+    if _storage == "indexed":
+        return piggyback_index.has_piggyback_raw_data(piggyback_max_cachefile_age, hostname)
     return get_piggyback_files(piggyback_max_cachefile_age, hostname) != []
 
 
@@ -156,11 +184,18 @@ def remove_source_status_file(source_host):
     # type: (str) -> bool
     """Remove the source_status_file of this piggyback host which will
     mark the piggyback data from this source as outdated."""
+    if _storage == "indexed":
+        return piggyback_index.remove_source_status_file(source_host)
+
     source_status_path = _piggyback_source_status_path(source_host)
     return _remove_piggyback_file(source_status_path)
 
 
 def store_piggyback_raw_data(source_host, piggybacked_raw_data):
+    if _storage == "indexed":
+        piggyback_index.store_piggyback_raw_data(source_host, piggybacked_raw_data)
+        return
+
     piggyback_file_paths = []
     for piggybacked_host, lines in piggybacked_raw_data.items():
         piggyback_file_path = str(cmk.utils.paths.piggyback_dir / piggybacked_host / source_host)
@@ -220,6 +255,10 @@ def cleanup_piggyback_files(piggyback_max_cachefile_age):
     functions. Therefor all these functions needs to deal with suddenly vanishing or
     updated files/directories.
     """
+    if _storage == "indexed":
+        piggyback_index.cleanup_piggyback_files(piggyback_max_cachefile_age)
+        return
+
     _cleanup_old_source_status_files(piggyback_max_cachefile_age)
     _cleanup_old_piggybacked_files(piggyback_max_cachefile_age)
 
@@ -0,0 +1,764 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Indexed storage for piggyback data
+
+The file based piggyback storage (see cmk_base.piggyback) writes one file per
+piggybacked host and source host and needs to list directories and stat the
+piggyback and source status files for every lookup. This storage keeps
+
+a) one append-only segment file per source host below
+   tmp/check_mk/piggyback_index/segments which holds the piggyback data of
+   all hosts sent by this source,
+b) an index file tmp/check_mk/piggyback_index/index which maps the
+   piggybacked host names to the location of their data in the segments and
+   holds the time of the last update of each source and
+c) an append-only journal tmp/check_mk/piggyback_index/journal.<id> of the
+   changes made to the index since it has been written. Each record holds the
+   complete state of a single source.
+
+Looking up piggyback data is a lookup in the index, followed by a read from the
+memory mapped segment. A process only reads the records which have been
+appended to the journal since its last lookup. The index is only reloaded once
+it has been replaced. Writers serialize by locking the index file and only
+append the state of the changed source to the journal. Once the journal is
+larger than the index, the journal is merged into a new index.
+
+The outdated data semantics are the same as in the file based storage: The
+time of the last update of a source replaces the mtime of the source status
+file and each index entry carries the mtime the piggyback file would have.
+"""
+
+import errno
+import marshal
+import mmap
+import os
+import struct
+import time
+
+import cmk.utils.paths
+import cmk.utils.store as store
+
+import cmk_base.console as console
+
+_INDEX_VERSION = 2
+
+# Segments are rewritten once they are larger than _COMPACTION_FACTOR times the size of
+# the data that is still referenced by the index. Small segments are left as they are.
+_COMPACTION_FACTOR = 2
+_COMPACTION_MIN_SIZE = 1024 * 1024
+
+# The journal is merged into a new index once it is larger than _JOURNAL_FACTOR times
+# the size of the index. Small journals are left as they are.
+_JOURNAL_FACTOR = 1
+_JOURNAL_MIN_SIZE = 64 * 1024
+
+# Length of the marshalled source state of a journal record
+_JOURNAL_RECORD_HEADER = struct.Struct("<I")
+
+# Index and memory mapped segments of this process. The index is reloaded once the index
+# file has been replaced by a writer.
+_cached_index = None  # type: ignore
+_cached_index_stat = None  # type: ignore
+_mapped_segments = {}  # type: ignore
+
+
+def _index_path():
+    # type: () -> str
+    return str(cmk.utils.paths.piggyback_index_dir / "index")
+
+
+def _journal_path(journal_id):
+    # type: (int) -> str
+    return str(cmk.utils.paths.piggyback_index_dir / ("journal.%d" % journal_id))
+
+
+def _segment_dir():
+    # type: () -> str
+    return str(cmk.utils.paths.piggyback_index_dir / "segments")
+
+
+def _segment_path(segment_name):
+    # type: (str) -> str
+    return os.path.join(_segment_dir(), segment_name)
+
+
+class PiggybackIndex(object):
+    """The index of the piggyback data
+
+    sources:  source host name -> time of the last update by this source
+    segments: source host name -> (name of the current segment, name of the previous segment)
+    hosts:    piggybacked host name -> {source host name -> (segment, offset, length, mtime)}
+
+    The segment names are never reused. This makes it possible for the readers to keep
+    the segments mapped as long as they are referenced by the index.
+
+    The index knows the id of its journal and how much of it has been applied already.
+    The piggybacked hosts of each source are tracked to update a source without
+    looking at the entries of all hosts.
+    """
+
+    def __init__(self, sources=None, segments=None, hosts=None, generation=0, journal_id=0):
+        super(PiggybackIndex, self).__init__()
+        self.sources = sources if sources is not None else {}
+        self.segments = segments if segments is not None else {}
+        self.hosts = hosts if hosts is not None else {}
+        self.generation = generation
+        self.journal_id = journal_id
+        self.journal_offset = 0
+
+        self._source_hosts = {}
+        for piggybacked_host, entries in self.hosts.iteritems():
+            for source_host in entries:
+                self._source_hosts.setdefault(source_host, set()).add(piggybacked_host)
+
+    @classmethod
+    def from_serialized(cls, serialized):
+        if not serialized:
+            return cls()
+
+        # Piggyback data is transient. In case of doubt simply start from scratch.
+        try:
+            data = marshal.loads(serialized)
+        except (ValueError, EOFError, TypeError):
+            return cls()
+
+        if not isinstance(data, dict) or data.get("version") != _INDEX_VERSION:
+            return cls()
+        return cls(data["sources"], data["segments"], data["hosts"], data["generation"],
+                   data["journal_id"])
+
+    def serialize(self):
+        return marshal.dumps({
+            "version": _INDEX_VERSION,
+            "sources": self.sources,
+            "segments": self.segments,
+            "hosts": self.hosts,
+            "generation": self.generation,
+            "journal_id": self.journal_id,
+        })
+
+    def serialize_source(self, source_host):
+        """Returns the journal record of the current state of the source"""
+        return marshal.dumps((source_host, self.sources.get(source_host),
+                              self.segments.get(source_host), self.get_source_entries(source_host),
+                              self.generation))
+
+    def apply_source(self, serialized):
+        """Replaces the state of a source with the state of the journal record"""
+        source_host, source_updated, segment_names, entries, generation = \
+            marshal.loads(serialized)
+
+        self.remove_source_entries(source_host)
+        for piggybacked_host, entry in entries.iteritems():
+            self.set_entry(piggybacked_host, source_host, entry)
+
+        for values, value in [(self.sources, source_updated), (self.segments, segment_names)]:
+            if value is None:
+                values.pop(source_host, None)
+            else:
+                values[source_host] = value
+
+        self.generation = max(self.generation, generation)
+
+    def get_entries(self, piggybacked_host):
+        """Returns the list of (source host, segment, offset, length, mtime) of the given host"""
+        return [(source_host,) + entry
+                for source_host, entry in sorted(self.hosts.get(piggybacked_host, {}).items())]
+
+    def get_source_entries(self, source_host):
+        """Returns the entries of the source by piggybacked host"""
+        return {
+            piggybacked_host: self.hosts[piggybacked_host][source_host]
+            for piggybacked_host in self._source_hosts.get(source_host, ())
+        }
+
+    def set_entry(self, piggybacked_host, source_host, entry):
+        self.hosts.setdefault(piggybacked_host, {})[source_host] = entry
+        self._source_hosts.setdefault(source_host, set()).add(piggybacked_host)
+
+    def remove_entry(self, piggybacked_host, source_host):
+        entries = self.hosts[piggybacked_host]
+        del entries[source_host]
+        if not entries:
+            del self.hosts[piggybacked_host]
+
+        piggybacked_hosts = self._source_hosts[source_host]
+        piggybacked_hosts.discard(piggybacked_host)
+        if not piggybacked_hosts:
+            del self._source_hosts[source_host]
+
+    def new_segment_name(self, source_host):
+        self.generation += 1
+        return "%s.%d" % (source_host, self.generation)
+
+    def used_segment_names(self):
+        return set(segment_name for segment_names in self.segments.itervalues()
+                   for segment_name in segment_names if segment_name is not None)
+
+    def has_source(self, source_host):
+        return source_host in self.sources or source_host in self.segments \
+            or source_host in self._source_hosts
+
+    def remove_source_entries(self, source_host):
+        for piggybacked_host in list(self._source_hosts.get(source_host, ())):
+            self.remove_entry(piggybacked_host, source_host)
+
+    def referenced_bytes(self, source_host):
+        return sum(entry[2] for entry in self.get_source_entries(source_host).itervalues())
+
+
+def is_outdated(piggyback_max_cachefile_age, index, source_host, mtime, now):
+    """Returns the reason why the given piggyback data is outdated or None"""
+    age = now - mtime
+    if age > piggyback_max_cachefile_age:
+        return "%d seconds too old" % (age - piggyback_max_cachefile_age)
+
+    source_updated = index.sources.get(source_host)
+    if source_updated is None:
+        return "Source not sending piggyback"
+
+    if source_updated > mtime:
+        return "Not updated by source"
+
+    return None
+
+
+#.
+#   .--Reading-------------------------------------------------------------.
+#   |               ____                _ _                                |
+#   |              |  _ \ ___  __ _  __| (_)_ __   __ _                    |
+#   |              | |_) / _ \/ _` |/ _` | | '_ \ / _` |                   |
+#   |              |  _ <  __/ (_| | (_| | | | | | (_| |                   |
+#   |              |_| \_\___|\__,_|\__,_|_|_| |_|\__, |                   |
+#   |                                             |___/                    |
+#   '----------------------------------------------------------------------'
+
+
+def load_index():
+    """Returns the current index, reusing the already loaded one if it is still valid"""
+    global _cached_index, _cached_index_stat
+
+    while True:
+        index_stat = _get_index_stat()
+        if _cached_index is None or index_stat != _cached_index_stat:
+            if index_stat is None:
+                _cached_index = PiggybackIndex()
+            else:
+                _cached_index = PiggybackIndex.from_serialized(_read_file(_index_path()))
+            _cached_index_stat = index_stat
+            _read_journal(_cached_index)
+            _unmap_unused_segments(_cached_index)
+        elif _read_journal(_cached_index):
+            _unmap_unused_segments(_cached_index)
+
+        # The journal is removed once it has been merged into a new index. Make sure
+        # that the journal which has been read belongs to the loaded index.
+        if _get_index_stat() == index_stat:
+            return _cached_index
+
+
+def _get_index_stat():
+    try:
+        st = os.stat(_index_path())
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+
+def _read_journal(index):
+    """Applies the records appended to the journal since the last call
+
+    Returns the number of applied records."""
+    try:
+        with open(_journal_path(index.journal_id), "rb") as f:
+            if os.fstat(f.fileno()).st_size <= index.journal_offset:
+                return 0
+            f.seek(index.journal_offset)
+            data = f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return 0
+
+    num_records = 0
+    offset = 0
+    while offset + _JOURNAL_RECORD_HEADER.size <= len(data):
+        length = _JOURNAL_RECORD_HEADER.unpack_from(data, offset)[0]
+        record_offset = offset + _JOURNAL_RECORD_HEADER.size
+        if record_offset + length > len(data):
+            break  # Incomplete record of an interrupted or ongoing write
+
+        # Piggyback data is transient. Records following a broken one are dropped by
+        # the next writer.
+        try:
+            index.apply_source(data[record_offset:record_offset + length])
+        except (ValueError, EOFError, TypeError):
+            break
+        offset = record_offset + length
+        num_records += 1
+
+    index.journal_offset += offset
+    return num_records
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return ""
+
+
+def _unmap_unused_segments(index):
+    used_segments = index.used_segment_names()
+    for segment_name in _mapped_segments.keys():
+        if segment_name not in used_segments:
+            _mapped_segments.pop(segment_name).close()
+
+
+def _read_from_segment(segment_name, offset, length):
+    if not length:
+        return ""
+
+    mapped = _mapped_segments.get(segment_name)
+    if mapped is None or len(mapped) < offset + length:
+        if mapped is not None:
+            mapped.close()
+        with open(_segment_path(segment_name), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _mapped_segments[segment_name] = mapped
+    return mapped[offset:offset + length]
+
+
+def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
+    index = load_index()
+    now = time.time()
+
+    piggyback_data = []
+    for source_host, segment_name, offset, length, mtime in index.get_entries(hostname):
+        reason = is_outdated(piggyback_max_cachefile_age, index, source_host, mtime, now)
+        if reason:
+            console.verbose("Piggyback data from host %s is outdated (%s). Skip processing.\n" %
+                            (source_host, reason))
+            continue
+
+        try:
+            raw_data = _read_from_segment(segment_name, offset, length)
+        except (IOError, OSError) as e:
+            console.verbose("Cannot read piggyback raw data from host %s: %s\n" % (source_host, e))
+            continue
+
+        console.verbose("Using piggyback raw data from host %s.\n" % source_host)
+        piggyback_data.append((source_host, raw_data))
+
+    return piggyback_data
+
+
+def has_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
+    index = load_index()
+    now = time.time()
+    for source_host, _segment_name, _offset, _length, mtime in index.get_entries(hostname):
+        if not is_outdated(piggyback_max_cachefile_age, index, source_host, mtime, now):
+            return True
+    return False
+
+
+#.
+#   .--Writing-------------------------------------------------------------.
+#   |               __        __    _ _   _                                |
+#   |               \ \      / / __(_) |_(_)_ __   __ _                    |
+#   |                \ \ /\ / / '__| | __| | '_ \ / _` |                   |
+#   |                 \ V  V /| |  | | |_| | | | | (_| |                   |
+#   |                  \_/\_/ |_|  |_|\__|_|_| |_|\__, |                   |
+#   |                                             |___/                    |
+#   '----------------------------------------------------------------------'
+
+
+def _load_index_for_update():
+    """Locks the index file and returns the current index
+
+    The lock is released by _save_index(), _save_sources() or _abort_index_update()."""
+    store.makedirs(_segment_dir())
+    store.aquire_lock(_index_path())
+    try:
+        return load_index()
+    except:
+        _abort_index_update()
+        raise
+
+
+def _save_index(index):
+    """Writes the complete index and starts a new journal"""
+    global _cached_index
+
+    old_journal_id = index.journal_id
+    index.journal_id += 1
+    index.journal_offset = 0
+    try:
+        # A journal may be left over from an index that could not be read
+        _remove_file(_journal_path(index.journal_id))
+        store.save_file(_index_path(), index.serialize())
+    finally:
+        # The index is reloaded from the written file
+        _cached_index = None
+        store.release_lock(_index_path())
+    _remove_file(_journal_path(old_journal_id))
+
+
+def _save_sources(index, source_hosts):
+    """Appends the current state of the given sources to the journal
+
+    The journal is merged into a new index once it has become too large."""
+    try:
+        records = []
+        for source_host in source_hosts:
+            record = index.serialize_source(source_host)
+            records.append(_JOURNAL_RECORD_HEADER.pack(len(record)) + record)
+        data = "".join(records)
+
+        with open(_journal_path(index.journal_id), "ab") as f:
+            # Drop the incomplete or broken records of an interrupted write
+            f.truncate(index.journal_offset)
+            f.write(data)
+        index.journal_offset += len(data)
+    except:
+        _abort_index_update()
+        raise
+
+    index_size = _cached_index_stat[2] if _cached_index_stat is not None else 0
+    if index.journal_offset > max(_JOURNAL_MIN_SIZE, _JOURNAL_FACTOR * index_size):
+        _save_index(index)
+    else:
+        store.release_lock(_index_path())
+
+
+def _abort_index_update():
+    """Releases the lock and forgets the changes made to the index"""
+    global _cached_index
+    _cached_index = None
+    store.release_lock(_index_path())
+
+
+def store_piggyback_raw_data(source_host, piggybacked_raw_data):
+    if not piggybacked_raw_data:
+        # Like removing the source status file: All data of this source is outdated now.
+        # This is the case for most hosts on every check cycle, so don't lock and change
+        # the index unless the source is known to it.
+        if not load_index().has_source(source_host):
+            return
+
+        index = _load_index_for_update()
+        try:
+            if not index.has_source(source_host):
+                _abort_index_update()
+                return
+            _remove_source(index, source_host)
+        except:
+            _abort_index_update()
+            raise
+
+        _save_sources(index, [source_host])
+        return
+
+    index = _load_index_for_update()
+    try:
+        now = time.time()
+        index.remove_source_entries(source_host)
+        segment_name = _get_segment_name(index, source_host)
+
+        with open(_segment_path(segment_name), "ab") as f:
+            for piggybacked_host, lines in piggybacked_raw_data.items():
+                console.verbose("Storing piggyback data for: %s\n" % piggybacked_host)
+                offset = f.tell()
+                f.write("\n".join(lines) + "\n")
+                index.set_entry(piggybacked_host, source_host,
+                                (segment_name, offset, f.tell() - offset, now))
+            segment_size = f.tell()
+
+        # Store the last contact with this piggyback source to be able to filter outdated data
+        index.sources[source_host] = now
+
+        if segment_size > _COMPACTION_MIN_SIZE \
+           and segment_size > _COMPACTION_FACTOR * index.referenced_bytes(source_host):
+            _compact_segment(index, source_host)
+    except:
+        _abort_index_update()
+        raise
+
+    _save_sources(index, [source_host])
+
+
+def _get_segment_name(index, source_host):
+    try:
+        return index.segments[source_host][0]
+    except KeyError:
+        segment_name = index.new_segment_name(source_host)
+        index.segments[source_host] = (segment_name, None)
+        return segment_name
+
+
+def _compact_segment(index, source_host):
+    """Rewrites the segment of the source with the data still referenced by the index
+
+    The new segment gets a new name. The previous segment is kept until the next
+    compaction to not break processes that did not reload the index yet."""
+    current_segment_name, previous_segment_name = index.segments[source_host]
+    new_segment_name = index.new_segment_name(source_host)
+
+    with open(_segment_path(new_segment_name), "wb") as f:
+        for piggybacked_host, entry in sorted(index.get_source_entries(source_host).items()):
+            segment_name, offset, length, mtime = entry
+            offset_new = f.tell()
+            f.write(_read_from_segment(segment_name, offset, length))
+            index.set_entry(piggybacked_host, source_host,
+                            (new_segment_name, offset_new, length, mtime))
+
+    index.segments[source_host] = (new_segment_name, current_segment_name)
+    if previous_segment_name is not None:
+        _remove_segment(previous_segment_name)
+
+
+def _remove_source(index, source_host):
+    """Removes the source status and all data of the source. Returns whether the source existed"""
+    existed = index.sources.pop(source_host, None) is not None
+    index.remove_source_entries(source_host)
+    for segment_name in index.segments.pop(source_host, []):
+        if segment_name is not None:
+            _remove_segment(segment_name)
+    return existed
+
+
+def _remove_segment(segment_name):
+    mapped = _mapped_segments.pop(segment_name, None)
+    if mapped is not None:
+        mapped.close()
+
+    try:
+        os.remove(_segment_path(segment_name))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def remove_source_status_file(source_host):
+    # type: (str) -> bool
+    index = _load_index_for_update()
+    try:
+        if not index.has_source(source_host):
+            _abort_index_update()
+            return False
+        existed = _remove_source(index, source_host)
+    except:
+        _abort_index_update()
+        raise
+
+    _save_sources(index, [source_host])
+    return existed
+
+
+def cleanup_piggyback_files(piggyback_max_cachefile_age):
+    """Removes the outdated data from the index and compacts all segments"""
+    index = _load_index_for_update()
+    try:
+        now = time.time()
+        for source_host, source_updated in index.sources.items():
+            if now - source_updated > piggyback_max_cachefile_age:
+                console.verbose("Removing outdated piggyback source %s\n" % source_host)
+                del index.sources[source_host]
+
+        for piggybacked_host, entries in index.hosts.items():
+            for source_host, (_segment_name, _offset, _length, mtime) in entries.items():
+                reason = is_outdated(piggyback_max_cachefile_age, index, source_host, mtime, now)
+                if reason:
+                    console.verbose("Removing outdated piggyback data (%s) of %s from %s\n" %
+                                    (reason, piggybacked_host, source_host))
+                    index.remove_entry(piggybacked_host, source_host)
+
+        for source_host in index.segments.keys():
+            if index.referenced_bytes(source_host):
+                _compact_segment(index, source_host)
+            else:
+                del index.segments[source_host]
+
+        _remove_unknown_segments(index)
+    except:
+        _abort_index_update()
+        raise
+
+    _save_index(index)
+
+
+def _remove_unknown_segments(index):
+    known_segments = index.used_segment_names()
+    for segment_name in os.listdir(_segment_dir()):
+        if segment_name not in known_segments:
+            _remove_segment(segment_name)
+
+
+#.
+#   .--Migration-----------------------------------------------------------.
+#   |            __  __ _                 _   _                            |
+#   |           |  \/  (_) __ _ _ __ __ _| |_(_) ___  _ __                 |
+#   |           | |\/| | |/ _` | '__/ _` | __| |/ _ \| '_ \                |
+#   |           | |  | | | (_| | | | (_| | |_| | (_) | | | |               |
+#   |           |_|  |_|_|\__, |_|  \__,_|\__|_|\___/|_| |_|               |
+#   |                     |___/                                            |
+#   '----------------------------------------------------------------------'
+
+
+def import_piggyback_files():
+    """Moves the data of the file based piggyback storage into the index
+
+    Data that has already been stored in the index by a source is kept. The imported
+    files are removed. Returns the number of imported piggyback files."""
+    index = _load_index_for_update()
+    try:
+        num_imported = _import_piggyback_files(index)
+    except:
+        _abort_index_update()
+        raise
+
+    _save_index(index)
+    _remove_file_storage()
+    return num_imported
+
+
+def _import_piggyback_files(index):
+    for source_host, status_file_path in _list_dir(cmk.utils.paths.piggyback_source_dir):
+        if source_host not in index.sources:
+            index.sources[source_host] = _get_mtime(status_file_path)
+
+    imported_sources = set(index.segments)
+    num_imported = 0
+    for piggybacked_host, host_dir in _list_dir(cmk.utils.paths.piggyback_dir):
+        for source_host, piggyback_file_path in _list_dir(host_dir):
+            if source_host in imported_sources:
+                continue  # The source already updated the index
+
+            mtime = _get_mtime(piggyback_file_path)
+            raw_data = _read_file(str(piggyback_file_path))
+            if mtime is None:
+                continue  # Vanished meanwhile
+
+            segment_name = _get_segment_name(index, source_host)
+            with open(_segment_path(segment_name), "ab") as f:
+                offset = f.tell()
+                f.write(raw_data)
+            index.set_entry(piggybacked_host, source_host,
+                            (segment_name, offset, len(raw_data), mtime))
+            num_imported += 1
+
+    return num_imported
+
+
+def _list_dir(path):
+    try:
+        return [(e.name, e) for e in path.iterdir() if not e.name.startswith(".")]
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def _get_mtime(path):
+    # The file based storage compares the mtimes in seconds (see _is_piggyback_file_outdated())
+    try:
+        return os.stat(str(path))[8]
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+
+def _remove_file_storage():
+    for _piggybacked_host, host_dir in _list_dir(cmk.utils.paths.piggyback_dir):
+        for _source_host, piggyback_file_path in _list_dir(host_dir):
+            _remove_file(piggyback_file_path)
+        _remove_dir(host_dir)
+
+    for _source_host, status_file_path in _list_dir(cmk.utils.paths.piggyback_source_dir):
+        _remove_file(status_file_path)
+
+
+def export_piggyback_files():
+    """Writes the data of the index to the file based piggyback storage and removes the index
+
+    Returns the number of written piggyback files."""
+    index = _load_index_for_update()
+    try:
+        num_exported = 0
+        for piggybacked_host, source_host, raw_data, mtime in _iter_index_data(index):
+            piggyback_file_path = str(
+                cmk.utils.paths.piggyback_dir / piggybacked_host / source_host)
+            store.makedirs(os.path.dirname(piggyback_file_path))
+            store.save_file(piggyback_file_path, raw_data)
+            os.utime(piggyback_file_path, (mtime, mtime))
+            num_exported += 1
+
+        store.makedirs(str(cmk.utils.paths.piggyback_source_dir))
+        for source_host, source_updated in index.sources.items():
+            status_file_path = str(cmk.utils.paths.piggyback_source_dir / source_host)
+            store.save_file(status_file_path, "")
+            os.utime(status_file_path, (source_updated, source_updated))
+
+        for segment_name in index.used_segment_names():
+            _remove_segment(segment_name)
+        _save_index(PiggybackIndex(generation=index.generation, journal_id=index.journal_id))
+    except:
+        _abort_index_update()
+        raise
+
+    return num_exported
+
+
+def _iter_index_data(index):
+    for piggybacked_host in sorted(index.hosts):
+        for source_host, segment_name, offset, length, mtime in index.get_entries(piggybacked_host):
+            try:
+                raw_data = _read_from_segment(segment_name, offset, length)
+            except (IOError, OSError):
+                continue
+            yield piggybacked_host, source_host, raw_data, mtime
+
+
+def _remove_file(path):
+    try:
+        os.remove(str(path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _remove_dir(path):
+    try:
+        os.rmdir(str(path))
+    except OSError as e:
+        if e.errno not in [errno.ENOENT, errno.ENOTEMPTY]:
+            raise
@@ -131,7 +131,8 @@ def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
     "Collect all time slices and up-sample them to same resolution"
     from_time = time_windows[0][0]
 
-    slices = [(rrd_column(start, end), from_time - start) for start, end in time_windows]
+    slices = [(timeseries, from_time - start)
+              for timeseries, (start, _end) in zip(rrd_column(time_windows), time_windows)]
 
     # The resolutions of the different time ranges differ. We upsample
     # to the best resolution. We assume that the youngest slice has the
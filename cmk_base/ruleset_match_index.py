@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Persistent index of the hosts matching the host conditions of the rules
+
+Matching the host conditions (tags and host lists) of all rules against all
+hosts is one of the most expensive parts of loading the configuration in large
+sites. Each process (check helpers, automations, discovery, ...) computed the
+matches again for every ruleset it uses.
+
+When creating the core configuration (cmk -U, cmk -O, cmk -R) the matches that
+have been computed for the active hosts of the site are written to this index.
+The other processes load it lazily and use the stored matches instead of
+computing them again.
+
+The file consists of a header, the marshalled host names, the marshalled
+table of host conditions and the encoded matches, which are only decoded when
+a condition is looked up. The header contains a fingerprint of everything the
+matching depends on except of the conditions themselves (the active hosts,
+their tags and folders and the existing folders). The index is ignored in case
+the fingerprint does not match the current configuration. Changed rules simply
+result in conditions that are not in the index.
+"""
+
+import array
+import errno
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+
+import cmk.utils.paths
+import cmk.utils.store as store
+
+_MAGIC = "CMKRMIDX"
+_INDEX_VERSION = 1
+
+# magic, version, fingerprint, offset and length of the host names and of the condition table
+_HEADER = struct.Struct("<8sI20sIIII")
+
+_MATCH_ALL = 0
+_MATCH_INDICES = 1
+_MATCH_BITMAP = 2
+
+# The positions of the set bits of all byte values (bit 0 first)
+_BIT_POSITIONS = [tuple(bit for bit in range(8) if value & (1 << bit)) for value in range(256)]
+
+
+def _index_path():
+    # type: () -> str
+    return os.path.join(cmk.utils.paths.var_dir, "base", "ruleset_match_index")
+
+
+def compute_fingerprint(host_entries, folder_paths):
+    """Returns the fingerprint of the matching relevant configuration
+
+    host_entries is an iterable of (host name, tags, folder path) of the hosts matched
+    against the rules and folder_paths is the collection of all existing folders."""
+    data = marshal.dumps((sorted(host_entries), sorted(folder_paths)))
+    return hashlib.sha1(data).digest()
+
+
+def save(fingerprint, hostnames, matches):
+    """Writes a new index
+
+    hostnames is the collection of the hosts matched against the rules. matches is a
+    dict mapping host conditions (tags, host list) to the set of matching hosts."""
+    hostnames = sorted(hostnames)
+    host_indices = {hostname: index for index, hostname in enumerate(hostnames)}
+
+    table = {}
+    payloads = []
+    offset = 0
+    for condition, matching in matches.iteritems():
+        try:
+            marshal.dumps(condition)
+        except ValueError:
+            continue  # Can not be stored. Will be computed by the processes as before.
+
+        kind, payload = _encode_matches(matching, host_indices)
+        table[condition] = (kind, offset, len(payload))
+        payloads.append(payload)
+        offset += len(payload)
+
+    hosts_data = marshal.dumps(hostnames)
+    table_data = marshal.dumps(table)
+    hosts_offset = _HEADER.size
+    table_offset = hosts_offset + len(hosts_data)
+    header = _HEADER.pack(_MAGIC, _INDEX_VERSION, fingerprint, hosts_offset, len(hosts_data),
+                          table_offset, len(table_data))
+
+    store.makedirs(os.path.dirname(_index_path()))
+    store.save_file(_index_path(), header + hosts_data + table_data + "".join(payloads))
+
+
+def _encode_matches(matching, host_indices):
+    if len(matching) == len(host_indices):
+        return _MATCH_ALL, ""
+
+    indices = sorted(host_indices[hostname] for hostname in matching)
+    # Sparse matches are stored as list of host indices, the others as bitmap
+    if len(indices) * 32 < len(host_indices):
+        return _MATCH_INDICES, array.array("I", indices).tostring()
+
+    bitmap = bytearray((len(host_indices) + 7) // 8)
+    for index in indices:
+        bitmap[index >> 3] |= 1 << (index & 7)
+    return _MATCH_BITMAP, str(bitmap)
+
+
+def load(fingerprint):
+    """Returns the index in case it exists and matches the given fingerprint, otherwise None"""
+    try:
+        with open(_index_path(), "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError) as e:
+        # ValueError: Empty files can not be mapped
+        if isinstance(e, ValueError) or e.errno == errno.ENOENT:
+            return None
+        raise
+
+    if len(data) < _HEADER.size:
+        return None
+
+    magic, version, index_fingerprint, hosts_offset, hosts_length, table_offset, table_length = \
+        _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _INDEX_VERSION or index_fingerprint != fingerprint:
+        return None
+
+    hostnames = marshal.loads(data[hosts_offset:hosts_offset + hosts_length])
+    table = marshal.loads(data[table_offset:table_offset + table_length])
+    return RulesetMatchIndex(data, table_offset + table_length, hostnames, table)
+
+
+class RulesetMatchIndex(object):
+    def __init__(self, data, payload_offset, hostnames, table):
+        super(RulesetMatchIndex, self).__init__()
+        self._data = data
+        self._payload_offset = payload_offset
+        self._hostnames = hostnames
+        self._table = table
+
+    def get_matching_hosts(self, condition):
+        """Returns the set of hosts matching the given host condition or None if it is unknown"""
+        try:
+            kind, offset, length = self._table[condition]
+        except KeyError:
+            return None
+
+        if kind == _MATCH_ALL:
+            return set(self._hostnames)
+
+        offset += self._payload_offset
+        payload = self._data[offset:offset + length]
+        if kind == _MATCH_INDICES:
+            indices = array.array("I")
+            indices.fromstring(payload)
+            return set(map(self._hostnames.__getitem__, indices))
+
+        hostnames = self._hostnames
+        matching = set()
+        for byte_index, value in enumerate(bytearray(payload)):
+            if value:
+                base = byte_index << 3
+                matching.update(hostnames[base + bit] for bit in _BIT_POSITIONS[value])
+        return matching
@@ -37,6 +37,7 @@ import cmk_base.utils
 import cmk_base.config as config
 import cmk_base.console as console
 import cmk_base.classic_snmp as classic_snmp
+import cmk_base.native_snmp as native_snmp
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.agent_simulator
 from cmk_base.exceptions import MKSNMPError
@@ -56,6 +57,10 @@ _g_single_oid_ipaddress = None
 _g_single_oid_cache = None
 # TODO: Move to StoredWalkSNMPBackend?
 _g_walk_cache = {}  # type: Dict[str, List[str]]
+# Subtrees walked during the current cycle. Later requests of OIDs within these
+# subtrees are answered from memory.
+_g_subtree_cache = {}  # type: Dict[Tuple, Dict[str, snmp_utils.SNMPRowInfo]]
+_g_subtree_cache_stats = {"hits": 0, "misses": 0}
 
 #.
 #   .--caching-------------------------------------------------------------.
@@ -118,13 +123,69 @@ def _load_single_oid_cache(snmp_config):
 
 def cleanup_host_caches():
     # type: () -> None
-    global _g_walk_cache
+    global _g_walk_cache, _g_subtree_cache
     _g_walk_cache = {}
+    _g_subtree_cache = {}
+    _g_subtree_cache_stats.update(hits=0, misses=0)
     _clear_other_hosts_oid_cache(None)
+    native_snmp.cleanup_sessions()
     if inline_snmp:
         inline_snmp.cleanup_inline_snmp_globals()
 
 
+def _get_subtree_cache(snmp_config, check_plugin_name):
+    # type: (snmp_utils.SNMPHostConfig, Optional[str]) -> Dict[str, snmp_utils.SNMPRowInfo]
+    """Returns the cache of the subtrees walked on the device of the host
+
+    The walks are shared between all check plugins and all hosts that fetch
+    their data from the same device. Only the SNMPv3 contexts and the OID range
+    limits, which are configured per check plugin, may lead to other results."""
+    if snmp_config.is_usewalk_host or _enforce_stored_walks:
+        device = ("usewalk", snmp_config.hostname)  # type: Tuple
+    else:
+        device = (snmp_config.ipaddress, snmp_config.port, snmp_config.credentials)
+
+    if snmp_utils.is_snmpv3_host(snmp_config):
+        contexts = tuple(_snmpv3_contexts_of(snmp_config, check_plugin_name))
+    else:
+        contexts = None
+
+    limited_plugin_name = check_plugin_name if snmp_config.oid_range_limits else None
+
+    return _g_subtree_cache.setdefault((device, contexts, limited_plugin_name), {})
+
+
+def _get_from_subtree_cache(subtree_cache, fetchoid):
+    # type: (Dict[str, snmp_utils.SNMPRowInfo], str) -> Optional[snmp_utils.SNMPRowInfo]
+    rows = subtree_cache.get(fetchoid)
+    if rows is not None:
+        return rows[:]
+
+    for parent_oid in _parent_oids(fetchoid):
+        rows = subtree_cache.get(parent_oid)
+        if rows is not None:
+            prefix = fetchoid + "."
+            return [(o, value) for o, value in rows if o == fetchoid or o.startswith(prefix)]
+
+    return None
+
+
+def _parent_oids(oid):
+    # type: (str) -> List[str]
+    parts = oid.split(".")
+    return [".".join(parts[:length]) for length in xrange(len(parts) - 1, 1, -1)]
+
+
+def show_subtree_cache_statistics():
+    # type: () -> None
+    if not cmk.utils.debug.enabled():
+        return
+
+    console.vverbose("  SNMP walk cache: %d hits, %d misses, %d subtrees cached\n" %
+                     (_g_subtree_cache_stats["hits"], _g_subtree_cache_stats["misses"],
+                      sum(len(c) for c in _g_subtree_cache.values())))
+
+
 def _clear_other_hosts_oid_cache(hostname):
     # type: (Optional[str]) -> None
     global _g_single_oid_cache, _g_single_oid_ipaddress, _g_single_oid_hostname
@@ -185,6 +246,7 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
         # Detect missing (empty columns)
         max_len = 0
         max_len_col = -1
+        walk_columns = []
 
         for colno, column in enumerate(targetcolumns):
             fetchoid, value_encoding = _compute_fetch_oid(oid, suboid, column)
@@ -210,10 +272,16 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
                 index_format = column
                 continue
 
-            rowinfo = _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column,
-                                    use_snmpwalk_cache)
+            # The data of all other columns is fetched at once below
+            columns.append((fetchoid, [], value_encoding))
+            walk_columns.append((colno, fetchoid, column))
 
-            columns.append((fetchoid, rowinfo, value_encoding))
+        rowinfos = _get_snmpwalks(
+            snmp_config, check_plugin_name, oid,
+            [(walk_oid, walk_column) for _walk_colno, walk_oid, walk_column in walk_columns],
+            use_snmpwalk_cache)
+        for (colno, fetchoid, column), rowinfo in zip(walk_columns, rowinfos):
+            columns[colno] = (fetchoid, rowinfo, columns[colno][2])
             number_of_rows = len(rowinfo)
             if number_of_rows > max_len:
                 max_len = number_of_rows
@@ -320,6 +388,9 @@ class SNMPBackendFactory(object):
         if enforce_stored_walks or snmp_config.is_usewalk_host:
             return StoredWalkSNMPBackend()
 
+        if snmp_config.is_native_snmp_host and native_snmp.is_supported(snmp_config):
+            return native_snmp.NativeSNMPBackend()
+
         if snmp_config.is_inline_snmp_host:
             return inline_snmp.InlineSNMPBackend()
 
@@ -444,8 +515,10 @@ class StoredWalkSNMPBackend(snmp_utils.ABCSNMPBackend):
 
 def walk_for_export(snmp_config, oid):
     # type: (snmp_utils.SNMPHostConfig, str) -> List[Tuple[str, str]]
-    if snmp_config.is_inline_snmp_host:
-        backend = inline_snmp.InlineSNMPBackend()  # type: snmp_utils.ABCSNMPBackend
+    if snmp_config.is_native_snmp_host and native_snmp.is_supported(snmp_config):
+        backend = native_snmp.NativeSNMPBackend()  # type: snmp_utils.ABCSNMPBackend
+    elif snmp_config.is_inline_snmp_host:
+        backend = inline_snmp.InlineSNMPBackend()
     else:
         backend = classic_snmp.ClassicSNMPBackend()
 
@@ -527,25 +600,54 @@ def _snmpv3_contexts_of(snmp_config, check_plugin_name):
     return [None]
 
 
-def _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column, use_snmpwalk_cache):
-    is_cachable = _is_snmpwalk_cachable(column)
-    rowinfo = None
-    if is_cachable and use_snmpwalk_cache:
-        # Returns either the cached SNMP walk or None when nothing is cached
-        rowinfo = _get_cached_snmpwalk(snmp_config.hostname, fetchoid)
+def _get_snmpwalks(snmp_config, check_plugin_name, oid, fetch_columns, use_snmpwalk_cache):
+    """Get the rows of all given (fetchoid, column) pairs
+
+    Columns that are not found in the SNMP walk cache (on disk) or within the
+    subtrees that have already been walked during this cycle are walked together,
+    which allows the backend to fetch them with less requests."""
+    rowinfos = [None] * len(fetch_columns)  # type: List[Optional[snmp_utils.SNMPRowInfo]]
+    if use_snmpwalk_cache:
+        for index, (fetchoid, column) in enumerate(fetch_columns):
+            if _is_snmpwalk_cachable(column):
+                # Returns either the cached SNMP walk or None when nothing is cached
+                rowinfos[index] = _get_cached_snmpwalk(snmp_config.hostname, fetchoid)
+
+    subtree_cache = _get_subtree_cache(snmp_config, check_plugin_name)
+    missing = []
+    for index, rowinfo in enumerate(rowinfos):
+        if rowinfo is None:
+            rowinfos[index] = _get_from_subtree_cache(subtree_cache, fetch_columns[index][0])
+            if rowinfos[index] is None:
+                missing.append(index)
+            else:
+                _g_subtree_cache_stats["hits"] += 1
+
+    if missing:
+        # Only walk the outermost of the requested subtrees. The columns within
+        # them are answered from the subtree cache.
+        missing_oids = set(fetch_columns[index][0] for index in missing)
+        walk_oids = sorted(
+            o for o in missing_oids if not any(p in missing_oids for p in _parent_oids(o)))
+        _g_subtree_cache_stats["misses"] += len(walk_oids)
+        _g_subtree_cache_stats["hits"] += len(missing) - len(walk_oids)
+
+        walked = _perform_snmpwalks(snmp_config, check_plugin_name, oid, walk_oids)
+        subtree_cache.update(zip(walk_oids, walked))
 
-    if rowinfo is None:
-        rowinfo = _perform_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid)
+        for index in missing:
+            fetchoid, column = fetch_columns[index]
+            rowinfos[index] = _get_from_subtree_cache(subtree_cache, fetchoid)
 
-        if is_cachable:
-            _save_snmpwalk_cache(snmp_config.hostname, fetchoid, rowinfo)
+            if _is_snmpwalk_cachable(column):
+                _save_snmpwalk_cache(snmp_config.hostname, fetchoid, rowinfos[index])
 
-    return rowinfo
+    return rowinfos
 
 
-def _perform_snmpwalk(snmp_config, check_plugin_name, base_oid, fetchoid):
-    added_oids = set([])
-    rowinfo = []
+def _perform_snmpwalks(snmp_config, check_plugin_name, base_oid, fetchoids):
+    added_oids = [set([]) for _fetchoid in fetchoids]
+    rowinfos = [[] for _fetchoid in fetchoids]  # type: List[snmp_utils.SNMPRowInfo]
     if snmp_utils.is_snmpv3_host(snmp_config):
         snmp_contexts = _snmpv3_contexts_of(snmp_config, check_plugin_name)
     else:
@@ -555,30 +657,31 @@ def _perform_snmpwalk(snmp_config, check_plugin_name, base_oid, fetchoid):
         snmp_backend = SNMPBackendFactory().factory(
             snmp_config, enforce_stored_walks=_enforce_stored_walks)
 
-        rows = snmp_backend.walk(
+        rows_of_columns = snmp_backend.walk_columns(
             snmp_config,
-            fetchoid,
+            fetchoids,
             check_plugin_name=check_plugin_name,
             table_base_oid=base_oid,
             context_name=context_name)
 
-        # I've seen a broken device (Mikrotik Router), that broke after an
-        # update to RouterOS v6.22. It would return 9 time the same OID when
-        # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
-        # by removing any duplicate OID information
-        if len(rows) > 1 and rows[0][0] == rows[1][0]:
-            console.vverbose(
-                "Detected broken SNMP agent. Ignoring duplicate OID %s.\n" % rows[0][0])
-            rows = rows[:1]
-
-        for row_oid, val in rows:
-            if row_oid in added_oids:
-                console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
-            else:
-                rowinfo.append((row_oid, val))
-                added_oids.add(row_oid)
+        for rows, rowinfo, added in zip(rows_of_columns, rowinfos, added_oids):
+            # I've seen a broken device (Mikrotik Router), that broke after an
+            # update to RouterOS v6.22. It would return 9 time the same OID when
+            # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
+            # by removing any duplicate OID information
+            if len(rows) > 1 and rows[0][0] == rows[1][0]:
+                console.vverbose(
+                    "Detected broken SNMP agent. Ignoring duplicate OID %s.\n" % rows[0][0])
+                rows = rows[:1]
+
+            for row_oid, val in rows:
+                if row_oid in added:
+                    console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
+                else:
+                    rowinfo.append((row_oid, val))
+                    added.add(row_oid)
 
-    return rowinfo
+    return rowinfos
 
 
 def _compute_fetch_oid(oid, suboid, column):
@@ -102,6 +102,7 @@ SNMPHostConfig = NamedTuple(
         ("character_encoding", Optional[str]),
         ("is_usewalk_host", bool),
         ("is_inline_snmp_host", bool),
+        ("is_native_snmp_host", bool),
     ])
 
 SNMPRowInfo = List[Tuple[str, str]]
@@ -126,6 +127,27 @@ class ABCSNMPBackend(object):
         # type: (SNMPHostConfig, str, Optional[str], Optional[str], Optional[str]) -> SNMPRowInfo
         return []
 
+    def walk_columns(self,
+                     snmp_config,
+                     oids,
+                     check_plugin_name=None,
+                     table_base_oid=None,
+                     context_name=None):
+        # type: (SNMPHostConfig, List[str], Optional[str], Optional[str], Optional[str]) -> List[SNMPRowInfo]
+        """Walk several OIDs (e.g. the columns of a table) of the given host
+
+        Returns the rows of each OID in the order of the given OIDs. Backends
+        may override this to fetch the columns with less requests.
+        """
+        return [
+            self.walk(
+                snmp_config,
+                oid,
+                check_plugin_name=check_plugin_name,
+                table_base_oid=table_base_oid,
+                context_name=context_name) for oid in oids
+        ]
+
 
 class MutexScanRegistry(object):
     """Register scan functions that are checked before a fallback is used
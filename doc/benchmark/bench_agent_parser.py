@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark for the agent output parser of the Check_MK agent data sources
+
+Usage: bench_agent_parser.py [-n RUNS] [-s SCALE] AGENT_OUTPUT_FILE...
+
+The agent output files can be taken from the agent cache of a site
+(tmp/check_mk/cache/HOSTNAME). Each dump is parsed RUNS times. SCALE
+concatenates the dump with itself to simulate hosts with more lines.
+
+Two numbers are reported per dump: The time needed for parsing alone (which
+is what checking pays for sections no check is interested in) and the time
+needed to parse the output and to materialize all sections.
+
+Must be executed in a site context or with the repository root in PYTHONPATH.
+"""
+
+import getopt
+import sys
+import time
+
+import cmk_base.config as config
+from cmk_base.data_sources.agent_parser import AgentOutputParser
+
+
+def _measure(func, runs):
+    best = None
+    for _unused in xrange(runs):
+        before = time.time()
+        func()
+        duration = time.time() - before
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def _parse(raw_data):
+    return AgentOutputParser("benchmark").parse(raw_data)
+
+
+def _parse_and_materialize(raw_data):
+    host_sections = _parse(raw_data)
+    return host_sections.sections.items()
+
+
+def main(args):
+    opts, files = getopt.getopt(args, "n:s:")
+    runs, scale = 10, 1
+    for o, a in opts:
+        if o == "-n":
+            runs = int(a)
+        elif o == "-s":
+            scale = int(a)
+
+    if not files:
+        sys.stderr.write(__doc__)
+        return 1
+
+    # Don't let the piggyback translation depend on the configuration of the site
+    config.translate_piggyback_host = lambda sourcehost, backedhost: backedhost
+
+    sys.stdout.write(
+        "%-50s %8s %8s %12s %12s\n" % ("Dump", "Lines", "Sections", "Parse [ms]", "All [ms]"))
+    for path in files:
+        raw_data = open(path).read() * scale
+        num_sections = len(_parse(raw_data).sections)
+        parse_time = _measure(lambda: _parse(raw_data), runs)
+        all_time = _measure(lambda: _parse_and_materialize(raw_data), runs)
+        sys.stdout.write(
+            "%-50s %8d %8d %12.2f %12.2f\n" % (path[-50:], raw_data.count("\n"), num_sections,
+                                               parse_time * 1000, all_time * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark for the worker processes of the Event Console
+
+Usage: bench_ec_workers.py [-r RULES] [-m MESSAGES] [-w WORKERS,...]
+
+Creates an event server with RULES rules in a temporary directory and lets it
+process MESSAGES syslog messages once for each of the given numbers of worker
+processes (default: 0,1,2,4,8, where 0 means processing without workers).
+The rule optimizer is disabled, so that every message is matched against all
+rules and matching dominates the processing time. About every tenth message
+is matched by a rule and creates an event.
+
+The message rate and the number of created events are reported for each run.
+The number of events must be the same for all runs.
+
+Must be executed with the repository root in PYTHONPATH.
+"""
+
+import getopt
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from pathlib2 import Path
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.settings
+from cmk.ec.main import ECLock, EventServer, EventStatus, Perfcounters, StatusTableEvents
+
+
+class _NoHistory(object):
+    def add(self, event, what, who="", addinfo=""):
+        pass
+
+
+def _rules(num_rules):
+    return [{
+        "id": "rule%d" % nr,
+        "state": 1,
+        "match": r"^\w+ (\w+)\[\d+\] %d-\d+$" % nr,
+        "sl": {
+            "value": 0,
+            "precedence": "message",
+        },
+        "actions": [],
+        "disabled": False,
+        "description": "",
+        "comment": "",
+        "docu_url": "",
+    } for nr in xrange(num_rules)]
+
+
+def _messages(num_messages, num_rules):
+    random.seed(0)
+    return [
+        "<78>Oct 18 10:00:00 host%d app[12]: word service[%d] %d-%d" % (random.randint(
+            0, 100), nr, random.randint(0, num_rules * 10), nr) for nr in xrange(num_messages)
+    ]
+
+
+def _event_server(omd_root, config):
+    settings = cmk.ec.settings.settings("benchmark", omd_root, omd_root, ["mkeventd"])
+    for path in settings.paths:
+        path.value.parent.mkdir(parents=True, exist_ok=True)
+
+    logger = cmk.utils.log.get_logger("mkeventd")
+    perfcounters = Perfcounters(logger)
+    event_status = EventStatus(settings, config, perfcounters, _NoHistory(), logger)
+    event_server = EventServer(logger, settings, config, {"mode": "master"}, perfcounters,
+                               ECLock(logger), _NoHistory(), event_status,
+                               StatusTableEvents.columns)
+    return event_server, event_status
+
+
+def main(args):
+    opts, rest = getopt.getopt(args, "r:m:w:")
+    num_rules, num_messages, worker_counts = 500, 20000, [0, 1, 2, 4, 8]
+    for o, a in opts:
+        if o == "-r":
+            num_rules = int(a)
+        elif o == "-m":
+            num_messages = int(a)
+        elif o == "-w":
+            worker_counts = [int(n) for n in a.split(",")]
+
+    if rest:
+        sys.stderr.write(__doc__)
+        return 1
+
+    config = cmk.ec.defaults.default_config()
+    config["rule_optimizer"] = False
+    config["event_limit"]["overall"]["limit"] = num_messages
+    config["event_limit"]["by_host"]["limit"] = num_messages
+    config["event_limit"]["by_rule"]["limit"] = num_messages
+
+    omd_root = Path(tempfile.mkdtemp())
+    try:
+        event_server, event_status = _event_server(omd_root, config)
+        event_server.compile_rules([], [{
+            "id": "benchmark",
+            "title": "Benchmark",
+            "disabled": False,
+            "rules": _rules(num_rules),
+        }])
+
+        messages = _messages(num_messages, num_rules)
+        batch = [
+            ("\n".join(messages[nr:nr + 100]) + "\n", None) for nr in xrange(0, len(messages), 100)
+        ]
+
+        sys.stdout.write("%8s %12s %8s\n" % ("Workers", "Messages/s", "Events"))
+        for num_workers in worker_counts:
+            event_status.flush()
+            config["event_workers"] = num_workers
+            event_server._get_worker_pool()  # Don't measure the start of the workers
+
+            before = time.time()
+            event_server._process_batch(batch)
+            duration = time.time() - before
+
+            sys.stdout.write("%8d %12.0f %8d\n" % (num_workers, num_messages / duration,
+                                                   len(event_status.events())))
+        event_server.stop_workers()
+    finally:
+        shutil.rmtree(str(omd_root))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark for decoding livestatus responses in the Python API
+
+Usage: bench_livestatus_decoding.py [-r ROWS]
+
+Renders a response of ROWS rows (default: 200000) shaped like the rows of a
+"GET services" query in the python and the json output format of livestatus.
+Then it decodes the response with SingleSiteConnection.query() and
+SingleSiteConnection.query_rows() in both formats. Each run is done in a
+separate process, which reports the decoding time and the memory it needed
+in addition to the rendered response.
+
+Must be executed with livestatus/api/python in PYTHONPATH.
+"""
+
+import getopt
+import json
+import os
+import resource
+import sys
+import time
+
+import livestatus
+
+
+class _ResponseSocket(object):
+    """Hands out a rendered response like a socket connected to livestatus"""
+
+    def __init__(self, response):
+        self._response = response
+        self._offset = 0
+
+    def settimeout(self, timeout):
+        pass
+
+    def send(self, data):
+        return len(data)
+
+    def recv(self, size):
+        data = self._response[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+
+def _rows(num_rows):
+    return [[
+        u"host%d" % (nr / 20),
+        u"Service number %d" % nr,
+        nr % 4,
+        1558878301.0 + nr,
+        u"OK - Everything is fine, üptime is %d days" % nr,
+        [u"cpu", u"linux"],
+        {
+            u"os": u"linux"
+        },
+        None,
+    ] for nr in xrange(num_rows)]
+
+
+def _render(rows, output_format):
+    if output_format == "json":
+        rendered = [json.dumps(row, separators=(",", ":")) for row in rows]
+    else:
+        rendered = [repr(row) for row in rows]
+    data = ("[" + ",\n".join(rendered) + "]\n").encode("utf-8")
+    return b"200 %11d\n" % len(data) + data
+
+
+def _decode(response, output_format, streaming):
+    connection = livestatus.SingleSiteConnection("unix:/dev/null")
+    connection.set_output_format(output_format)
+    connection.socket = _ResponseSocket(response)
+    if streaming:
+        num_rows = 0
+        for _row in connection.query_rows("GET services\n"):
+            num_rows += 1
+        return num_rows
+    return len(connection.query("GET services\n"))
+
+
+def _measure(response, output_format, streaming):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        before = time.time()
+        num_rows = _decode(response, output_format, streaming)
+        duration = time.time() - before
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - maxrss_before
+        os.write(write_fd, repr((num_rows, duration, maxrss)))
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        result = eval(f.read())  # pylint: disable=eval-used
+    os.waitpid(pid, 0)
+    return result
+
+
+def main(args):
+    opts, rest = getopt.getopt(args, "r:")
+    num_rows = 200000
+    for o, a in opts:
+        if o == "-r":
+            num_rows = int(a)
+
+    if rest:
+        sys.stderr.write(__doc__)
+        return 1
+
+    rows = _rows(num_rows)
+    responses = {
+        "python": _render(rows, "python"),
+        "json": _render(rows, "json"),
+    }
+    del rows
+
+    sys.stdout.write(
+        "%-8s %-10s %8s %10s %12s\n" % ("Format", "Method", "Rows", "Seconds", "Memory (MB)"))
+    for output_format in ["python", "json"]:
+        for streaming in [False, True]:
+            num_rows, duration, maxrss = _measure(responses[output_format], output_format,
+                                                  streaming)
+            sys.stdout.write(
+                "%-8s %-10s %8d %10.3f %12.1f\n" % (output_format, "query_rows" if streaming else
+                                                    "query", num_rows, duration, maxrss / 1024.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark for fetching SNMP tables with the different SNMP backends
+
+Usage: bench_snmp_backends.py [-n RUNS] [-p PORT] [-c COMMUNITY] [-b BULK_SIZE] [-1]
+                              ADDRESS BASE_OID COLUMN...
+
+Fetches the table BASE_OID with the given COLUMNs RUNS times from the SNMP
+agent at ADDRESS with each available backend (classic, inline, native) and
+reports the best time of each backend. Use -1 to use SNMP v1 (GETNEXT)
+instead of GETBULK.
+
+An agent simulating the devices of the integration tests can be started with
+snmpsimd.py using tests/integration/cmk_base/snmp/snmp_data. For example:
+
+    bench_snmp_backends.py -p 1337 127.0.0.1 .1.3.6.1.2.1.2.2.1 1 2 3 4 5 6 7 8 10 16
+
+Must be executed in a site context or with the repository root in PYTHONPATH.
+"""
+
+import getopt
+import sys
+import time
+
+import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
+
+
+def _snmp_config(backend_name, address, port, community, bulk_size, use_bulk):
+    return snmp_utils.SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname="benchmark",
+        ipaddress=address,
+        credentials=community,
+        port=port,
+        is_bulkwalk_host=use_bulk,
+        is_snmpv2or3_without_bulkwalk_host=False,
+        bulk_walk_size_of=bulk_size,
+        timing={},
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=False,
+        is_inline_snmp_host=backend_name == "inline",
+        is_native_snmp_host=backend_name == "native",
+    )
+
+
+def _measure(func, runs):
+    best = None
+    for _unused in xrange(runs):
+        before = time.time()
+        func()
+        duration = time.time() - before
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def main(args):
+    opts, args = getopt.getopt(args, "n:p:c:b:1")
+    runs, port, community, bulk_size, use_bulk = 10, 161, "public", 10, True
+    for o, a in opts:
+        if o == "-n":
+            runs = int(a)
+        elif o == "-p":
+            port = int(a)
+        elif o == "-c":
+            community = a
+        elif o == "-b":
+            bulk_size = int(a)
+        elif o == "-1":
+            use_bulk = False
+
+    if len(args) < 3:
+        sys.stderr.write(__doc__)
+        return 1
+    address, base_oid, columns = args[0], args[1], args[2:]
+
+    backend_names = ["classic", "native"]
+    if snmp.inline_snmp:
+        backend_names.insert(1, "inline")
+
+    sys.stdout.write("%-10s %8s %12s\n" % ("Backend", "Rows", "Best [ms]"))
+    for backend_name in backend_names:
+        snmp_config = _snmp_config(backend_name, address, port, community, bulk_size, use_bulk)
+
+        def fetch():
+            table = snmp.get_snmp_table(
+                snmp_config, None, (base_oid, columns), use_snmpwalk_cache=False)
+            snmp.cleanup_host_caches()
+            return table
+
+        try:
+            num_rows = len(fetch())
+        except Exception as e:
+            sys.stdout.write("%-10s %s\n" % (backend_name, e))
+            continue
+
+        sys.stdout.write(
+            "%-10s %8d %12.2f\n" % (backend_name, num_rows, _measure(fetch, runs) * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
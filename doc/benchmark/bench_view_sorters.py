@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark for the sorting of view rows
+
+Usage: bench_view_sorters.py [-r ROWS]
+
+Creates ROWS service rows (default: 50000) and sorts them with the sorters of
+some typical views. Each sorting is done once with the comparison functions of
+the sorters, like the GUI did before it used the sort keys, and once with
+cmk.gui.views.sort_data().
+
+The duration of both is reported for each case. Both must produce the same
+order of the rows.
+
+Must be executed as site user with the repository root in PYTHONPATH.
+"""
+
+import getopt
+import random
+import sys
+import time
+
+import cmk.gui.views
+from cmk.gui.plugins.views.utils import sorter_registry
+
+_CASES = [
+    [("svcstate", True), ("site_host", False), ("svcdescr", False)],
+    [("site_host", False), ("svcdescr", False)],
+    [("svcoutput", False)],
+    [("svc_check_age", False), ("svcdescr", True)],
+    [("svc_next_check", False)],  # Sorter without sort key
+    [("host_address", False), ("svcdescr", False)],
+]
+
+
+def _rows(num_rows):
+    random.seed(0)
+    services = ["CPU load", "Memory", "Check_MK"] + ["Interface %d" % nr for nr in xrange(1, 25)] \
+               + ["Filesystem /srv/%d" % nr for nr in xrange(1, 10)]
+    rows = []
+    for nr in xrange(num_rows):
+        host_nr = random.randint(1, num_rows / len(services) + 1)
+        rows.append({
+            "site": "site%d" % (host_nr % 3),
+            "host_name": "host%d" % host_nr,
+            "host_address": "10.0.%d.%d" % (host_nr / 256 % 256, host_nr % 256),
+            "service_description": random.choice(services),
+            "service_state": random.choice([0, 0, 0, 0, 1, 2, 3]),
+            "service_has_been_checked": random.choice([0, 1, 1, 1, 1]),
+            "service_plugin_output": random.choice(["OK", "WARN", "CRIT", "ok"]) +
+                                     " - %d" % random.randint(0, 100),
+            "service_last_check": 1571400000 - random.randint(0, 300),
+            "service_next_check": 1571400000 + random.randint(0, 300),
+            "JOIN": {},
+            "id": nr,
+        })
+    return rows
+
+
+def _sort_with_cmp(data, sorters):
+    def multisort(e1, e2):
+        for entry in sorters:
+            c = entry.sorter.cmp(e1, e2)
+            if c != 0:
+                return -c if entry.negate else c
+        return 0
+
+    data.sort(multisort)
+
+
+def main(args):
+    opts, rest = getopt.getopt(args, "r:")
+    num_rows = 50000
+    for o, a in opts:
+        if o == "-r":
+            num_rows = int(a)
+
+    if rest:
+        sys.stderr.write(__doc__)
+        return 1
+
+    rows = _rows(num_rows)
+
+    sys.stdout.write("%-50s %10s %10s\n" % ("Sorters", "cmp [s]", "key [s]"))
+    for case in _CASES:
+        sorters = [
+            cmk.gui.views.SorterEntry(sorter=sorter_registry[name](), negate=negate, join_key=None)
+            for name, negate in case
+        ]
+
+        by_cmp = list(rows)
+        before = time.time()
+        _sort_with_cmp(by_cmp, sorters)
+        cmp_duration = time.time() - before
+
+        by_key = list(rows)
+        before = time.time()
+        cmk.gui.views.sort_data(by_key, sorters)
+        key_duration = time.time() - before
+
+        if [r["id"] for r in by_cmp] != [r["id"] for r in by_key]:
+            sys.stderr.write("Different order of the rows for %r\n" % case)
+            return 1
+
+        title = ", ".join(("-" if negate else "") + name for name, negate in case)
+        sys.stdout.write("%-50s %10.3f %10.3f\n" % (title, cmp_duration, key_duration))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -29,9 +29,13 @@ import socket
 import time
 import re
 import os
+import errno
 import ast
+import json
 import ssl
-from typing import Tuple, Union, Dict, Pattern, Optional  # pylint: disable=unused-import
+import select
+import threading
+from typing import Tuple, Union, Dict, List, Pattern, Optional, Set  # pylint: disable=unused-import
 
 #   .--Globals-------------------------------------------------------------.
 #   |                    ____ _       _           _                        |
@@ -52,6 +56,106 @@ persistent_connections = {}  # type: Dict[str, socket.socket]
 remove_cache_regex = re.compile("\nCache:[^\n]*")  # type: Pattern
 
 
+class ConnectionPool(object):
+    """Idle sockets of pooled livestatus connections, by socket URL
+
+    A pooled SingleSiteConnection hands its socket over to the pool after each
+    complete response. Later connections to the same socket URL reuse it
+    instead of connecting again. At most max_idle_per_site sockets are kept
+    per socket URL and sockets which have been idle for more than
+    max_idle_time seconds are closed, even if the pool is not used anymore.
+    Sockets which have been closed by the livestatus server in the meantime
+    are detected before they are reused.
+
+    Each idle socket occupies one client thread of the livestatus server
+    (num_client_threads, 20 by default). Many processes with idle sockets,
+    e.g. apache processes or keepalive helpers, can block all of them. This
+    is why only few sockets are kept for a short time. The limits are per
+    process."""
+
+    def __init__(self, max_idle_per_site=1, max_idle_time=5.0):
+        # type: (int, float) -> None
+        super(ConnectionPool, self).__init__()
+        self.max_idle_per_site = max_idle_per_site
+        self.max_idle_time = max_idle_time
+        self._idle = {}  # type: Dict[str, List[Tuple[float, socket.socket]]]
+        self._lock = threading.Lock()
+        self._expiry_timer = None  # type: Optional[threading.Timer]
+
+    def get(self, socketurl):
+        # type: (str) -> Optional[socket.socket]
+        """Returns an idle socket connected to the given URL or None"""
+        with self._lock:
+            idle = self._idle.get(socketurl, [])
+            self._close_expired(idle)
+            while idle:
+                _released_at, sock = idle.pop()
+                if _is_reusable(sock):
+                    return sock
+                sock.close()
+        return None
+
+    def put(self, socketurl, sock):
+        # type: (str, socket.socket) -> None
+        with self._lock:
+            idle = self._idle.setdefault(socketurl, [])
+            self._close_expired(idle)
+            if len(idle) >= self.max_idle_per_site:
+                sock.close()
+                return
+            idle.append((time.time(), sock))
+            self._schedule_expiry()
+
+    def _close_expired(self, idle):
+        # type: (List[Tuple[float, socket.socket]]) -> None
+        min_released_at = time.time() - self.max_idle_time
+        while idle and idle[0][0] < min_released_at:
+            idle.pop(0)[1].close()
+
+    def _schedule_expiry(self):
+        # type: () -> None
+        """Closes the expired sockets in the background. Needs the lock"""
+        if self._expiry_timer is not None:
+            return
+        self._expiry_timer = threading.Timer(max(self.max_idle_time, 0.0), self._expire)
+        self._expiry_timer.daemon = True
+        self._expiry_timer.start()
+
+    def _expire(self):
+        # type: () -> None
+        with self._lock:
+            self._expiry_timer = None
+            for idle in self._idle.values():
+                self._close_expired(idle)
+            if any(self._idle.values()):
+                self._schedule_expiry()
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            if self._expiry_timer is not None:
+                self._expiry_timer.cancel()
+                self._expiry_timer = None
+            for idle in self._idle.values():
+                for _released_at, sock in idle:
+                    sock.close()
+            self._idle.clear()
+
+
+def _is_reusable(sock):
+    # type: (socket.socket) -> bool
+    """After a complete response nothing can be read from a socket, unless
+    the livestatus server has closed the connection"""
+    try:
+        return not select.select([sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return False
+
+
+# The idle sockets of all pooled connections of this process
+connection_pool = ConnectionPool()
+
+
 def ensure_unicode(text):
     if hasattr(text, "decode"):
         try:
@@ -281,6 +385,91 @@ class Query(object):
 #   '----------------------------------------------------------------------'
 
 
+class _ResponseReader(object):
+    """Reads the response to a query from the socket of a connection
+
+    Each call of read() only receives the data which is available on the
+    socket, so that the responses of multiple connections can be read
+    concurrently. When streaming, the rows are decoded line by line while
+    they arrive, otherwise the complete response is decoded at once after
+    it has been received."""
+
+    def __init__(self, connection, streaming):
+        self._connection = connection
+        self._streaming = streaming
+        self._header = b""
+        self._code = None  # type: Optional[str]
+        self._remaining = 0
+        self._packets = []  # type: List[bytes]
+        self._first_line = True
+        self.received_data = False
+        self.complete = False
+
+    def read(self):
+        # type: () -> List
+        """Receive the available data and return the rows decoded from it"""
+        sock = self._connection.socket
+        rows = []  # type: List
+        while True:
+            packet = sock.recv(65536)
+            if not packet:
+                raise MKLivestatusSocketClosed(
+                    "Read zero data from socket, nagios server closed connection")
+            self.received_data = True
+            rows += self._process(packet)
+
+            # A TLS socket may have buffered decrypted data, select() does not
+            # report the socket as readable in this case.
+            if self.complete or not (isinstance(sock, ssl.SSLSocket) and sock.pending()):
+                return rows
+
+    def _process(self, packet):
+        if self._code is None:
+            self._header += packet
+            if len(self._header) < 16:
+                return []
+            header, packet = self._header[:16], self._header[16:]
+            self._code = header[0:3].decode("ascii", "replace")
+            try:
+                self._remaining = int(header[4:15].lstrip())
+            except ValueError:
+                raise MKLivestatusSocketError(
+                    "Malformed output. Livestatus TCP socket might be unreachable or wrong"
+                    "encryption settings are used.")
+
+        self._remaining -= len(packet)
+        self._packets.append(packet)
+        if self._remaining <= 0:
+            self.complete = True
+            self._connection._pending_responses -= 1
+            self._connection._release_socket()
+
+        if self._code != "200" or not self._streaming:
+            if not self.complete:
+                return []
+            data = b"".join(self._packets).decode("utf-8")
+            if self._code != "200":
+                self._connection._raise_error_response(self._code, data)
+            try:
+                return self._connection._decode(data)
+            except Exception:
+                raise MKLivestatusSocketError("Malformed output")
+
+        if b"\n" not in packet:
+            return []
+        lines = b"".join(self._packets).split(b"\n")
+        self._packets = [lines.pop()]
+        rows = []
+        for line in lines:
+            if self._first_line:
+                line = line[1:]
+                self._first_line = False
+            row = self._connection._decode_row_line(line)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+
 class SingleSiteConnection(Helpers):
     def __init__(self,
                  socketurl,
@@ -288,9 +477,13 @@ class SingleSiteConnection(Helpers):
                  allow_cache=False,
                  tls=False,
                  verify=True,
-                 ca_file_path=None):
-        # type: (str, bool, bool, bool, bool, Optional[str]) -> None
-        """Create a new connection to a MK Livestatus socket"""
+                 ca_file_path=None,
+                 pooled=False):
+        # type: (str, bool, bool, bool, bool, Optional[str], bool) -> None
+        """Create a new connection to a MK Livestatus socket
+
+        A pooled connection takes its socket from the connection_pool and
+        hands it back after each complete response, see ConnectionPool."""
         super(SingleSiteConnection, self).__init__()
         self.prepend_site = False
         self.auth_users = {}  # type: Dict[str, str]
@@ -305,6 +498,10 @@ class SingleSiteConnection(Helpers):
         self.socket = None
         self.timeout = None
         self.successful_persistence = False
+        self.pooled = pooled
+        # Number of queries sent, but whose response has not been read yet
+        self._pending_responses = 0
+        self.output_format = "python"
 
         # Whether to establish an encrypted connection
         self.tls = tls
@@ -338,6 +535,12 @@ class SingleSiteConnection(Helpers):
             self.successful_persistence = True
             return
 
+        if self.pooled:
+            self.socket = connection_pool.get(self.socketurl)
+            if self.socket is not None:
+                self.successful_persistence = True
+                return
+
         self.successful_persistence = False
         family, address = self._parse_socket_url(self.socketurl)
         self.socket = self._create_socket(family)
@@ -410,14 +613,22 @@ class SingleSiteConnection(Helpers):
 
     def disconnect(self):
         self.socket = None
+        self._pending_responses = 0
         if self.persist:
             try:
                 del persistent_connections[self.socketurl]
             except KeyError:
                 pass
 
+    def _release_socket(self):
+        """Hand over the socket of a pooled connection to the connection pool
+        when all responses have been read"""
+        if self.pooled and self.socket is not None and self._pending_responses == 0:
+            connection_pool.put(self.socketurl, self.socket)
+            self.socket = None
+
     def receive_data(self, size):
-        result = u""
+        packets = []
         # Timeout is only honored when connecting
         self.socket.settimeout(None)
         while size > 0:
@@ -426,38 +637,44 @@ class SingleSiteConnection(Helpers):
                 raise MKLivestatusSocketClosed(
                     "Read zero data from socket, nagios server closed connection")
             size -= len(packet)
-            result += packet.decode("utf-8")
-        return result
+            packets.append(packet)
+        return b"".join(packets).decode("utf-8")
 
     def do_query(self, query, add_headers=""):
         self.send_query(query, add_headers)
         return self.recv_response(query, add_headers)
 
-    def send_query(self, query_obj, add_headers="", do_reconnect=True):
-        orig_query = query_obj
-
+    def build_query(self, query_obj, add_headers=""):
+        """Returns the complete text of a query as sent to the livestatus server"""
         query = "%s" % query_obj
         if not self.allow_cache:
             query = remove_cache_regex.sub("", query)
 
-        if self.socket is None:
-            self.connect()
-
         if not query.endswith("\n"):
             query += "\n"
         query += self.auth_header + self.add_headers
-        query += "Localtime: %d\nOutputFormat: python\nKeepAlive: on\nResponseHeader: fixed16\n" % int(
-            time.time())
+        query += "Localtime: %d\nOutputFormat: %s\nKeepAlive: on\nResponseHeader: fixed16\n" % (int(
+            time.time()), self.output_format)
         query += add_headers
 
         if not query.endswith("\n"):
             query += "\n"
         query += "\n"
+        return query
+
+    def send_query(self, query_obj, add_headers="", do_reconnect=True):
+        orig_query = query_obj
+
+        query = self.build_query(query_obj, add_headers)
+
+        if self.socket is None:
+            self.connect()
 
         try:
             # socket.send() only works with byte strings
             query = ensure_bytestr(query)
             self.socket.send(query)
+            self._pending_responses += 1
         except IOError as e:
             if self.persist:
                 del persistent_connections[self.socketurl]
@@ -478,30 +695,21 @@ class SingleSiteConnection(Helpers):
     # the query again (once). This is due to timeouts during keepalive.
     def recv_response(self, query=None, add_headers="", timeout_at=None):
         try:
-            resp = self.receive_data(16)
-            code = resp[0:3]
-            try:
-                length = int(resp[4:15].lstrip())
-            except:
-                self.disconnect()
-                raise MKLivestatusSocketError(
-                    "Malformed output. Livestatus TCP socket might be unreachable or wrong"
-                    "encryption settings are used.")
-
+            code, length = self._receive_response_header()
             data = self.receive_data(length)
+            self._pending_responses -= 1
 
             if code == "200":
                 try:
-                    return ast.literal_eval(data)
+                    result = self._decode(data)
                 except:
                     self.disconnect()
                     raise MKLivestatusSocketError("Malformed output")
+                self._release_socket()
+                return result
 
-            elif code == "404":
-                raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
-
-            else:
-                raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+            self._release_socket()
+            self._raise_error_response(code, data)
 
         except (MKLivestatusSocketClosed, IOError) as e:
             # In case of an IO error or the other side having
@@ -535,6 +743,101 @@ class SingleSiteConnection(Helpers):
             # FIXME: ? self.disconnect()
             raise MKLivestatusSocketError("Unhandled exception: %s" % e)
 
+    def _receive_response_header(self):
+        resp = self.receive_data(16)
+        code = resp[0:3]
+        try:
+            length = int(resp[4:15].lstrip())
+        except:
+            self.disconnect()
+            raise MKLivestatusSocketError(
+                "Malformed output. Livestatus TCP socket might be unreachable or wrong"
+                "encryption settings are used.")
+        return code, length
+
+    def _raise_error_response(self, code, data):
+        if code == "404":
+            raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
+        raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+
+    def _decode(self, data):
+        if self.output_format == "json":
+            return json.loads(data)
+        return ast.literal_eval(data)
+
+    def set_output_format(self, output_format):
+        # type: (str) -> None
+        """Set the format in which the livestatus server sends the responses
+
+        The default format "python" is decoded with ast.literal_eval(). The
+        format "json" is decoded much faster, but the values of blob columns
+        are returned as unicode strings with one character per byte instead
+        of byte strings. All other values are the same in both formats."""
+        if output_format not in ["python", "json"]:
+            raise MKLivestatusConfigError("Invalid output format '%s'" % output_format)
+        self.output_format = output_format
+
+    def query_rows(self, query, add_headers=""):
+        """Iterate over the rows of the response to a query while it is received
+
+        Only one row is decoded and kept in memory at a time, instead of the
+        complete response. The socket can not be used for other queries
+        before the iteration has finished. When the iteration is stopped
+        early, the rest of the response is dropped together with the socket.
+        """
+        if self.limit is not None:
+            query += "Limit: %d\n" % self.limit
+
+        self.send_query(query, add_headers)
+        return self.recv_rows(query, add_headers)
+
+    def recv_rows(self, query, add_headers=""):
+        """Iterate over the rows of the response to a query sent with send_query()"""
+        # Timeout is only honored when connecting
+        self.socket.settimeout(None)
+        reader = _ResponseReader(self, streaming=True)
+        retried = False
+        try:
+            while not reader.complete:
+                try:
+                    rows = reader.read()
+                except (MKLivestatusSocketClosed, IOError):
+                    if reader.received_data or retried:
+                        raise
+                    # A kept alive connection may have been closed by the livestatus server
+                    retried = True
+                    self.disconnect()
+                    self.connect()
+                    self.send_query(query, add_headers)
+                    self.socket.settimeout(None)
+                    reader = _ResponseReader(self, streaming=True)
+                    continue
+
+                for row in rows:
+                    yield [''] + row if self.prepend_site else row
+        except IOError as e:
+            self.disconnect()
+            raise MKLivestatusSocketError(str(e))
+        except (GeneratorExit, MKLivestatusSocketError):
+            self.disconnect()
+            raise
+
+    # The python and json responses have one row per line: The first line
+    # starts with the "[" of the outer list, all lines but the last end with
+    # a "," and the last line ends with the "]" of the outer list. Newlines
+    # within the values are always escaped. Returns None for the line of an
+    # empty response.
+    def _decode_row_line(self, line):
+        line = line[:-1]
+        if not line:
+            return None
+        try:
+            if self.output_format == "json":
+                return json.loads(line)
+            return ast.literal_eval(line.decode("utf-8"))
+        except Exception:
+            raise MKLivestatusSocketError("Malformed output")
+
     def set_prepend_site(self, p):
         self.prepend_site = p
 
@@ -552,6 +855,58 @@ class SingleSiteConnection(Helpers):
             return [[''] + line for line in data]
         return data
 
+    # Maximum number of queries query_pipelined() sends before reading responses
+    max_pipeline_length = 100
+
+    def query_pipelined(self, queries, add_headers=""):
+        # type: (List[Union[str, Query]], str) -> List
+        """Send multiple queries over the connection and return their responses
+
+        All queries are sent before the first response is read. This saves the
+        round trip to the livestatus server for every query but the first one.
+        The responses are returned in the order of the queries. An error of one
+        of the queries is raised, the responses of the other queries are lost
+        in this case."""
+        if self.limit is not None:
+            add_headers += "Limit: %d\n" % self.limit
+
+        responses = []
+        for offset in range(0, len(queries), self.max_pipeline_length):
+            responses += self._send_pipeline(queries[offset:offset + self.max_pipeline_length],
+                                             add_headers)
+
+        if self.prepend_site:
+            return [[[''] + line for line in data] for data in responses]
+        return responses
+
+    def _send_pipeline(self, queries, add_headers, do_reconnect=True):
+        if self.socket is None:
+            self.connect()
+        # A kept alive connection may have been closed by the livestatus server
+        may_be_closed = self.successful_persistence
+
+        data = b"".join(ensure_bytestr(self.build_query(query, add_headers)) for query in queries)
+        responses = []  # type: List
+        try:
+            self.socket.sendall(data)
+            self._pending_responses += len(queries)
+            for _query in queries:
+                responses.append(self.recv_response())
+            return responses
+
+        except (IOError, MKLivestatusSocketError) as e:
+            self.disconnect()
+            if do_reconnect and may_be_closed and not responses:
+                return self._send_pipeline(queries, add_headers, do_reconnect=False)
+            if isinstance(e, IOError):
+                raise MKLivestatusSocketError("RC1:" + str(e))
+            raise
+
+        except Exception:
+            # Don't leave the responses of the remaining queries in the socket
+            self.disconnect()
+            raise
+
     def command(self, command, site=None):
         self.do_command(command)
 
@@ -562,6 +917,7 @@ class SingleSiteConnection(Helpers):
             command += "\n"
         try:
             self.socket.send("COMMAND " + command + "\n")
+            self._release_socket()
         except IOError as e:
             self.socket = None
             if self.persist:
@@ -600,6 +956,8 @@ class SingleSiteConnection(Helpers):
 # Keys in the dictionary:
 # socket:   socketurl (obligatory)
 # timeout:  timeout for tcp/unix in seconds
+# query_timeout: time in seconds to wait for the response to a query,
+#           overrides the one set with set_query_timeout()
 
 # TODO: Move the connect/disconnect stuff to separate methods. Then make
 # it possible to connect/disconnect duing existance of a single object.
@@ -617,6 +975,7 @@ class MultiSiteConnection(Helpers):
         self.only_sites = None
         self.limit = None
         self.parallelize = True
+        self.query_timeout = None  # type: Optional[float]
 
         # Status host: A status host helps to prevent trying to connect
         # to a remote site which is unreachable. This is done by looking
@@ -779,6 +1138,14 @@ class MultiSiteConnection(Helpers):
     def set_limit(self, limit=None):
         self.limit = limit
 
+    def set_query_timeout(self, timeout=None):
+        # type: (Optional[float]) -> None
+        """Set the time in seconds to wait for the response of a site to a query
+
+        A site which has not answered completely in time is marked as dead.
+        None waits without limit."""
+        self.query_timeout = timeout
+
     def dead_sites(self):
         return self.deadsites
 
@@ -799,6 +1166,10 @@ class MultiSiteConnection(Helpers):
         for _sitename, _site, connection in self.connections:
             connection.set_auth_domain(domain)
 
+    def set_output_format(self, output_format):
+        for _sitename, _site, connection in self.connections:
+            connection.set_output_format(output_format)
+
     def query(self, query, add_headers=""):
         if self.parallelize:
             return self.query_parallel(query, add_headers)
@@ -837,58 +1208,147 @@ class MultiSiteConnection(Helpers):
     # of Limit: since all sites are queried in parallel, the Limit: is simply
     # applied to all sites - resulting in possibly more results then Limit requests.
     def query_parallel(self, query, add_headers=""):
-        stillalive = []
-        if self.only_sites is not None:
-            connect_to_sites = [c for c in self.connections if c[0] in self.only_sites]
-            # Unused sites are assumed to be alive
-            stillalive.extend([c for c in self.connections if c[0] not in self.only_sites])
-        else:
-            connect_to_sites = self.connections
+        if self.limit is not None:
+            add_headers += "Limit: %d\n" % self.limit
 
-        limit = self.limit
-        if limit is not None:
-            limit_header = "Limit: %d\n" % limit
-        else:
-            limit_header = ""
+        connect_to_sites = self._sites_to_query()
+        failed_sites = set()  # type: Set[str]
+        rows_by_site = {}
+        for sitename, rows in self._read_responses(
+                connect_to_sites, query, add_headers, failed_sites, streaming=False):
+            rows_by_site[sitename] = rows
+        self._forget_failed_sites(failed_sites)
 
-        # First send all queries
-        for sitename, site, connection in connect_to_sites:
-            try:
-                connection.send_query(query, add_headers + limit_header)
-            except Exception as e:
-                self.deadsites[sitename] = {
-                    "exception": e,
-                    "site": site,
-                }
+        result = []
+        for sitename, _site, _connection in connect_to_sites:
+            rows = rows_by_site.get(sitename, [])
+            if self.prepend_site:
+                rows = [[sitename] + l for l in rows]
+            result += rows
+        return result
 
+    # Streaming version of query_parallel(), see SingleSiteConnection.query_rows().
+    # The rows of the sites are returned in the order in which they arrive, the
+    # rows of different sites may be interleaved. A site which fails while its
+    # rows are read is marked as dead, the rows already returned for it are not
+    # taken back.
+    def query_rows(self, query, add_headers=""):
+        if self.limit is not None:
+            add_headers += "Limit: %d\n" % self.limit
+
+        failed_sites = set()  # type: Set[str]
+        try:
+            for sitename, rows in self._read_responses(
+                    self._sites_to_query(), query, add_headers, failed_sites, streaming=True):
+                for row in rows:
+                    yield [sitename] + row if self.prepend_site else row
+        finally:
+            self._forget_failed_sites(failed_sites)
+
+    def _sites_to_query(self):
+        if self.only_sites is None:
+            return self.connections
+        return [c for c in self.connections if c[0] in self.only_sites]
+
+    def _forget_failed_sites(self, failed_sites):
+        self.connections = [c for c in self.connections if c[0] not in failed_sites]
+
+    def _query_deadline(self, site, now):
+        timeout = site.get("query_timeout", self.query_timeout)
+        if timeout is None:
+            return None
+        return now + timeout
+
+    def _read_responses(self, connect_to_sites, query, add_headers, failed_sites, streaming):
+        """Send a query to the given sites and read their responses concurrently
+
+        Yields pairs of the site name and a list of rows whenever rows of a
+        site have been received. Without streaming, all rows of a site are
+        yielded together after its response is complete. Sites which fail or
+        do not answer within their query timeout are marked as dead and added
+        to failed_sites."""
         if isinstance(query, Query):
             suppress_exceptions = tuple(query.suppress_exceptions)
         else:
             suppress_exceptions = tuple(Query.default_suppressed_exceptions)
 
-        # Then retrieve all answers. We will be as slow as the slowest of all
-        # connections.
-        result = []
+        def site_failed(sitename, site, connection, e):
+            connection.disconnect()
+            failed_sites.add(sitename)
+            self.deadsites[sitename] = {
+                "exception": e,
+                "site": site,
+            }
+
+        def send_query(sitename, site, connection, deadline, retried):
+            connection.send_query(query, add_headers)
+            # Timeout is only honored when connecting
+            connection.socket.settimeout(None)
+            reading[connection.socket] = (sitename, site, connection,
+                                          _ResponseReader(connection, streaming), deadline, retried)
+
+        # First send all queries
+        reading = {}  # type: Dict[socket.socket, Tuple]
+        now = time.time()
         for sitename, site, connection in connect_to_sites:
             try:
-                r = connection.recv_response(query, add_headers + limit_header)
-                stillalive.append((sitename, site, connection))
-                if self.prepend_site:
-                    r = [[sitename] + l for l in r]
-                result += r
-            except suppress_exceptions:  # pylint: disable=catching-non-exception
-                stillalive.append((sitename, site, connection))
-                continue
-
+                send_query(sitename, site, connection, self._query_deadline(site, now), False)
             except Exception as e:
-                connection.disconnect()
-                self.deadsites[sitename] = {
-                    "exception": e,
-                    "site": site,
-                }
+                site_failed(sitename, site, connection, e)
 
-        self.connections = stillalive
-        return result
+        # Then read from all sockets which have data available until all sites
+        # have answered or missed their deadline
+        try:
+            while reading:
+                deadlines = [entry[4] for entry in reading.values() if entry[4] is not None]
+                timeout = max(0.0, min(deadlines) - time.time()) if deadlines else None
+                try:
+                    readable = select.select(list(reading), [], [], timeout)[0]
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+
+                for sock in readable:
+                    sitename, site, connection, reader, deadline, retried = reading.pop(sock)
+                    try:
+                        rows = reader.read()
+                    except suppress_exceptions:  # pylint: disable=catching-non-exception
+                        continue
+                    except (MKLivestatusSocketClosed, IOError) as e:
+                        if reader.received_data or retried:
+                            site_failed(sitename, site, connection, e)
+                            continue
+                        # A kept alive connection may have been closed by the livestatus server
+                        try:
+                            connection.disconnect()
+                            connection.connect()
+                            send_query(sitename, site, connection, deadline, True)
+                        except Exception as e:
+                            site_failed(sitename, site, connection, e)
+                        continue
+                    except Exception as e:
+                        site_failed(sitename, site, connection, e)
+                        continue
+
+                    if not reader.complete:
+                        reading[sock] = (sitename, site, connection, reader, deadline, retried)
+                    if rows or (reader.complete and not streaming):
+                        yield sitename, rows
+
+                now = time.time()
+                for sock, (sitename, site, connection, _reader, deadline,
+                           _retried) in list(reading.items()):
+                    if deadline is not None and deadline <= now:
+                        del reading[sock]
+                        site_failed(
+                            sitename, site, connection,
+                            MKLivestatusSocketError("Timeout while waiting for the response"))
+        finally:
+            # The caller stopped the iteration: The rest of the responses is
+            # dropped together with the sockets
+            for _sitename, _site, connection, _reader, _deadline, _retried in reading.values():
+                connection.disconnect()
 
     def command(self, command, sitename="local"):
         if sitename in self.deadsites:
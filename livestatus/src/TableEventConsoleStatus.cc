@@ -94,6 +94,9 @@ TableEventConsoleStatus::TableEventConsoleStatus(MonitoringCore *mc)
         "The average status client request time"));
     addColumn(std::make_unique<DoubleEventConsoleColumn>(
         "status_average_sync_time", "The average sync time"));
+    addColumn(std::make_unique<IntEventConsoleColumn>(
+        "status_input_queue_length",
+        "The number of received inputs waiting to be processed"));
     addColumn(std::make_unique<StringEventConsoleColumn>(
         "status_replication_slavemode",
         "The replication slavemode (empty or one of sync/takeover)"));
@@ -127,6 +127,8 @@ def fake_version_and_paths():
     monkeypatch.setattr("cmk.utils.paths.piggyback_dir", Path(tmp_dir) / "var/check_mk/piggyback")
     monkeypatch.setattr("cmk.utils.paths.piggyback_source_dir",
                         Path(tmp_dir) / "var/check_mk/piggyback_sources")
+    monkeypatch.setattr("cmk.utils.paths.piggyback_index_dir",
+                        Path(tmp_dir) / "var/check_mk/piggyback_index")
 
 
 # Cleanup temporary directory created above
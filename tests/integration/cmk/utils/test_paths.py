@@ -8,6 +8,7 @@ pathlib_paths = [
     "discovered_service_labels_dir",
     "piggyback_dir",
     "piggyback_source_dir",
+    "piggyback_index_dir",
 ]
 
 
@@ -111,7 +111,7 @@ def snmpsim(site, request, tmp_path_factory):
 
 
 # Execute all tests for all SNMP backends
-@pytest.fixture(params=["inline_snmp", "classic_snmp", "stored_snmp"])
+@pytest.fixture(params=["inline_snmp", "classic_snmp", "stored_snmp", "native_snmp"])
 def snmp_config(request, snmpsim, monkeypatch):
     backend_name = request.param
 
@@ -135,6 +135,7 @@ def snmp_config(request, snmpsim, monkeypatch):
         character_encoding=None,
         is_usewalk_host=backend_name == "stored_snmp",
         is_inline_snmp_host=backend_name == "inline_snmp",
+        is_native_snmp_host=backend_name == "native_snmp",
     )
 
 
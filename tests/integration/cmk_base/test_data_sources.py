@@ -233,7 +233,7 @@ def test_mode_inventory_as_check(test_cfg, monkeypatch):
 def test_mode_discover_marked_hosts(test_cfg, monkeypatch):
     _patch_data_source_run(monkeypatch, _max_cachefile_age=120)  # inventory_max_cachefile_age
     # TODO: First configure auto discovery to make this test really work
-    cmk_base.modes.check_mk.mode_discover_marked_hosts()
+    cmk_base.modes.check_mk.mode_discover_marked_hosts({})
     #assert _counter_run == 2
 
 
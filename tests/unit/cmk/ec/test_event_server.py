@@ -0,0 +1,199 @@
+# pylint: disable=redefined-outer-name,protected-access
+
+import collections
+import multiprocessing
+import os
+import socket
+import pytest  # type: ignore
+from pathlib2 import Path
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.main
+import cmk.ec.settings
+from cmk.ec.main import ECLock, EventServer, EventStatus, Perfcounters, StatusTableEvents
+
+_Value = collections.namedtuple("_Value", ["value"])
+
+
+@pytest.fixture()
+def event_server(tmp_path, monkeypatch):
+    # Only the parts of the event server the input handling needs
+    server = EventServer.__new__(EventServer)
+    paths = collections.namedtuple("_Paths", ["spool_dir"])(_Value(Path(str(tmp_path))))
+    server.settings = collections.namedtuple("_Settings", ["paths"])(paths)
+    server._spool_files = collections.deque()
+    server._last_spool_dir_scan = 0.0
+    return server
+
+
+def test_drain_datagrams(event_server, monkeypatch):
+    monkeypatch.setattr(EventServer, "_max_datagrams", 3)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for nr in range(5):
+            sender.sendto("message %d" % nr, receiver.getsockname())
+
+        assert [d for d, _a in event_server._drain_datagrams(receiver)] == [
+            "message 0",
+            "message 1",
+            "message 2",
+        ]
+        assert [d for d, _a in event_server._drain_datagrams(receiver)] == [
+            "message 3",
+            "message 4",
+        ]
+        assert event_server._drain_datagrams(receiver) == []
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_next_spool_file(event_server, monkeypatch, tmp_path):
+    for name in ["b", "a", ".hidden"]:
+        tmp_path.joinpath(name).write_bytes(b"line\n")
+
+    now = 1000.0
+    monkeypatch.setattr("time.time", lambda: now)
+    assert event_server._next_spool_file().name == "a"
+
+    # New files are only seen with the next listing of the directory
+    tmp_path.joinpath("c").write_bytes(b"line\n")
+    assert event_server._next_spool_file().name == "b"
+    assert event_server._next_spool_file() is None
+
+    now += 1
+    assert event_server._next_spool_file().name == "a"
+
+
+class FakeHistory(object):
+    def add(self, event, what, who="", addinfo=""):
+        pass
+
+
+def _rule(rule_id, match, **kwargs):
+    rule = {
+        "id": rule_id,
+        "state": 1,
+        "match": match,
+        "sl": {
+            "value": 0,
+            "precedence": "message"
+        },
+        "actions": [],
+    }
+    rule.update(kwargs)
+    return rule
+
+
+def _rule_pack(pack_id, rules):
+    return {"id": pack_id, "disabled": False, "rules": rules}
+
+
+@pytest.fixture()
+def processing_event_server(tmp_path):
+    settings = cmk.ec.settings.settings("1.6.0", Path(str(tmp_path)), Path(str(tmp_path)),
+                                        ["mkeventd"])
+    for path in settings.paths:
+        path.value.parent.mkdir(parents=True, exist_ok=True)
+
+    config = cmk.ec.defaults.default_config()
+    logger = cmk.utils.log.get_logger("mkeventd")
+    perfcounters = Perfcounters(logger)
+    event_status = EventStatus(settings, config, perfcounters, FakeHistory(), logger)
+    server = EventServer(logger, settings, config, {"mode": "master"}, perfcounters, ECLock(logger),
+                         FakeHistory(), event_status, StatusTableEvents.columns)
+    count = {
+        "count": 2,
+        "period": 3600,
+        "algorithm": "interval",
+        "count_ack": False,
+        "separate_host": True,
+        "separate_application": False,
+        "separate_match_groups": False,
+    }
+    server.compile_rules([], [
+        _rule_pack("first", [
+            _rule("skip", "skipped", drop="skip_pack"),
+            _rule("never", "^never$"),
+        ]),
+        _rule_pack("second", [
+            _rule("count", r"^counted (\d+)$", count=count),
+            _rule("catch", ""),
+        ]),
+    ])
+    yield server, config, event_status
+    server.stop_workers()
+
+
+def _process_messages(server, event_status):
+    server._process_batch([
+        ("<78>Oct 18 10:00:00 host1 app: counted 1\n"
+         "<78>Oct 18 10:00:00 host2 app: skipped\n"
+         "\n", None),
+        ("<78>Oct 18 10:00:00 host1 app: counted 2\n"
+         "<78>Oct 18 10:00:00 host2 app: counted 3\n", ("127.0.0.1", 514)),
+        ("<78>Oct 18 10:00:00 host3 app: other\n", None),
+    ])
+    return sorted((e["rule_id"], e["host"], e["text"], e["phase"], e.get("count"),
+                   e["match_groups"]) for e in event_status.events())
+
+
+def test_process_batch_in_workers(processing_event_server):
+    server, config, event_status = processing_event_server
+    expected = _process_messages(server, event_status)
+    assert expected == [
+        ("catch", "host2", "skipped", "open", None, ()),
+        ("catch", "host3", "other", "open", None, ()),
+        ("count", "host1", "counted 2", "open", 2, ("2",)),
+        ("count", "host2", "counted 3", "counting", 1, ("3",)),
+    ]
+
+    event_status.flush()
+    config["event_workers"] = 2
+    assert _process_messages(server, event_status) == expected
+    assert server._worker_pool is not None
+
+    # The workers are replaced after the rules have been compiled again
+    pool = server._worker_pool
+    server.compile_rules([], [])
+    event_status.flush()
+    assert _process_messages(server, event_status) == []
+    assert server._worker_pool is not pool
+
+
+def _kill_worker(lines):
+    os._exit(1)
+
+
+def test_process_batch_with_dying_worker(processing_event_server, monkeypatch):
+    server, config, event_status = processing_event_server
+    expected = _process_messages(server, event_status)
+
+    event_status.flush()
+    config["event_workers"] = 2
+    monkeypatch.setattr(EventServer, "_worker_timeout", 1)
+    monkeypatch.setattr(cmk.ec.main, "_create_and_match_events", _kill_worker)
+    server._get_worker_pool()
+
+    # The messages are processed by the event server itself
+    assert _process_messages(server, event_status) == expected
+    assert server._worker_pool is None
+
+
+def test_workers_are_forked_without_configuration_lock(processing_event_server, monkeypatch):
+    server, config, _event_status = processing_event_server
+    config["event_workers"] = 1
+    locked = []
+    pool_class = multiprocessing.Pool
+
+    def pool(*args):
+        locked.append(server._lock_configuration._lock.locked())
+        return pool_class(*args)
+
+    monkeypatch.setattr(multiprocessing, "Pool", pool)
+    server.start_workers()
+    assert locked == [False]
+    assert server._worker_rules is server._rules
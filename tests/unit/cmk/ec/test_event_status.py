@@ -0,0 +1,301 @@
+# pylint: disable=redefined-outer-name
+
+import pytest  # type: ignore
+from pathlib2 import Path
+
+import cmk.utils.log
+import cmk.ec.settings
+from cmk.ec.main import EventStatus, Perfcounters, MKClientError
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+
+class FakeHistory(object):
+    def __init__(self):
+        self.entries = []
+
+    def add(self, event, what, who="", addinfo=""):
+        self.entries.append((event["id"], what))
+
+
+class FakeEventServer(object):
+    def __init__(self, event_status):
+        self._event_status = event_status
+
+    def new_event_respecting_limits(self, event):
+        self._event_status.new_event(event)
+
+
+@pytest.fixture()
+def status():
+    return EventStatus(None, {"debug_rules": False}, Perfcounters(logger), FakeHistory(), logger)
+
+
+@pytest.fixture()
+def settings(tmp_path):
+    settings = cmk.ec.settings.settings("1.6.0", Path(str(tmp_path)), Path(str(tmp_path)),
+                                        ["mkeventd"])
+    settings.paths.status_file.value.parent.mkdir(parents=True)
+    return settings
+
+
+def _saved_status(settings):
+    return EventStatus(settings, {"debug_rules": False}, Perfcounters(logger), FakeHistory(),
+                       logger)
+
+
+def _loaded_status(settings):
+    status = _saved_status(settings)
+    status.load_status(None)
+    return status
+
+
+def _event(rule_id, host, **kwargs):
+    event = {
+        "rule_id": rule_id,
+        "host": host,
+        "application": "",
+        "text": "",
+        "phase": "open",
+        "time": 100.0,
+        "first": 100.0,
+        "last": 100.0,
+        "priority": 3,
+        "facility": 1,
+        "match_groups": (),
+        "host_in_downtime": False,
+        "core_host": host,
+        "ipaddress": "",
+    }
+    event.update(kwargs)
+    return event
+
+
+def _new_event(rule_id, host):
+    event = _event(rule_id, host)
+    del event["phase"]
+    return event
+
+
+def _ids(events):
+    return [e["id"] for e in events]
+
+
+def _add(status, *events):
+    for event in events:
+        status.new_event(event)
+    return status.events()
+
+
+def test_event_lookups(status):
+    _add(status, _event("r1", "h1"), _event("r2", "h1"), _event("r1", "h2"))
+
+    assert _ids(status.events()) == [1, 2, 3]
+    assert _ids(status.events_of_rule("r1")) == [1, 3]
+    assert status.events_of_rule("r3") == []
+    assert status.event(2)["rule_id"] == "r2"
+    assert status.event(4) is None
+
+
+def test_events_can_be_removed_while_iterating(status):
+    _add(status, *[_event("r1", "h%d" % nr) for nr in range(5)])
+
+    for event in status.events():
+        status.remove_event(event)
+
+    assert status.events() == []
+    assert status.num_existing_events == 0
+    assert status.num_existing_events_by_host == {"h%d" % nr: 0 for nr in range(5)}
+
+
+def test_remove_oldest_event(status):
+    events = _add(status, _event("r1", "h1"), _event("r2", "h2"), _event("r1", "h2"),
+                  _event("r2", "h1"))
+
+    status.remove_oldest_event("by_host", {"host": "h2"})
+    assert _ids(status.events()) == [1, 3, 4]
+    status.remove_oldest_event("by_rule", {"rule_id": "r2"})
+    assert _ids(status.events()) == [1, 3]
+    status.remove_oldest_event("overall", events[0])
+    assert _ids(status.events()) == [3]
+    assert status.get_num_existing_events_by("by_rule", {"rule_id": "r1"}) == 1
+    assert status.get_num_existing_events_by("by_host", {"host": "h1"}) == 0
+
+
+def test_delete_event(status):
+    _add(status, _event("r1", "h1"), _event("r1", "h2"))
+
+    status.delete_event(1, "hans")
+    assert _ids(status.events()) == [2]
+    assert _ids(status.events_of_rule("r1")) == [2]
+
+    with pytest.raises(MKClientError):
+        status.delete_event(1, "hans")
+
+
+def test_count_event_keeps_order_when_host_changes(status):
+    count = {
+        "count": 3,
+        "count_ack": False,
+        "separate_host": False,
+        "separate_application": False,
+        "separate_match_groups": False,
+    }
+    server = FakeEventServer(status)
+    _add(status, _event("r1", "h1", phase="counting", count=1), _event("r2", "h2"))
+
+    # The counted event takes over the host of the new event
+    assert status.count_event(server, _new_event("r1", "h2"), {}, count) is False
+    assert status.event(1)["host"] == "h2"
+    assert status.event(1)["count"] == 2
+    assert status.num_existing_events_by_host == {"h1": 0, "h2": 2}
+
+    # It still is the oldest event of its new host
+    status.remove_oldest_event("by_host", {"host": "h2"})
+    assert _ids(status.events()) == [2]
+
+
+def test_count_event_separate_host(status):
+    count = {
+        "count": 2,
+        "count_ack": False,
+        "separate_host": True,
+        "separate_application": False,
+        "separate_match_groups": False,
+    }
+    server = FakeEventServer(status)
+
+    assert status.count_event(server, _new_event("r1", "h1"), {}, count) is False
+    assert status.count_event(server, _new_event("r1", "h2"), {}, count) is False
+    assert _ids(status.events()) == [1, 2]
+
+    found = status.count_event(server, _new_event("r1", "h2"), {}, count)
+    assert found["id"] == 2
+    assert found["phase"] == "open"
+
+
+def test_unpack_status_rebuilds_indexes(status):
+    _add(status, _event("r1", "h1"), _event("r2", "h1"))
+    packed = status.pack_status()
+
+    other = EventStatus(None, {"debug_rules": False}, Perfcounters(logger), FakeHistory(), logger)
+    other.unpack_status(packed)
+
+    assert _ids(other.events_of_rule("r2")) == [2]
+    assert other.num_existing_events == 2
+    assert other.num_existing_events_by_host == {"h1": 2}
+
+
+def test_save_and_load_status(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"), _event("r2", "h1", text=u"\xe4"))
+    status._rule_stats["r1"] = 2
+    status.save_status()
+
+    loaded = _loaded_status(settings)
+    assert loaded.events() == status.events()
+    assert loaded.pack_status() == status.pack_status()
+    assert _ids(loaded.events_of_rule("r2")) == [2]
+    assert not settings.paths.status_journal_file.value.exists()
+
+
+def test_save_status_appends_changes_to_journal(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"), _event("r1", "h2"), _event("r1", "h3"))
+    status.save_status()
+    snapshot = settings.paths.status_snapshot_file.value.read_bytes()
+    journal = settings.paths.status_journal_file.value
+
+    status.event(2)["text"] = "changed"
+    status.event_changed(status.event(2))
+    status.remove_event(status.event(1))
+    _add(status, _event("r2", "h1"))
+    status.save_status()
+    size = journal.stat().st_size
+    status.save_status()  # Nothing changed
+
+    assert settings.paths.status_snapshot_file.value.read_bytes() == snapshot
+    assert journal.stat().st_size == size
+    loaded = _loaded_status(settings)
+    assert loaded.events() == status.events()
+    assert loaded.pack_status() == status.pack_status()
+
+
+def test_save_status_only_writes_changed_events(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"), _event("r1", "h2"), _event("r1", "h3"))
+    status.save_status()
+
+    loaded = _loaded_status(settings)
+    loaded.event(1)["text"] = "not marked"
+    loaded.event(3)["text"] = "changed"
+    loaded.event_changed(loaded.event(3))
+    loaded.save_status()
+
+    journal = settings.paths.status_journal_file.value
+    assert "changed" in journal.read_bytes()
+    assert "not marked" not in journal.read_bytes()
+    assert _loaded_status(settings).event(3)["text"] == "changed"
+
+
+def test_save_status_writes_snapshot_after_unpack_status(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"))
+    status.save_status()
+
+    other = _saved_status(settings)
+    _add(other, _event("r2", "h2"), _event("r2", "h3"))
+    status.unpack_status(other.pack_status())
+    status.save_status()
+
+    assert not settings.paths.status_journal_file.value.exists()
+    assert _loaded_status(settings).events() == other.events()
+
+
+def test_journal_is_compacted(settings, monkeypatch):
+    monkeypatch.setattr(EventStatus, "_min_compaction_size", 0)
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"))
+    status.save_status()
+
+    for nr in range(10):
+        status.event(1)["text"] = "x" * 1000 + str(nr)
+        status.event_changed(status.event(1))
+        status.save_status()
+
+    assert settings.paths.status_snapshot_file.value.stat().st_size > 1000
+    journal = settings.paths.status_journal_file.value
+    assert not journal.exists() or journal.stat().st_size < 3000
+    assert _loaded_status(settings).event(1)["text"].endswith("9")
+
+
+def test_load_status_ignores_truncated_journal(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"))
+    status.save_status()
+    _add(status, _event("r1", "h2"))
+    status.save_status()
+    _add(status, _event("r1", "h3"))
+    status.save_status()
+
+    journal = settings.paths.status_journal_file.value
+    journal.write_bytes(journal.read_bytes()[:-5])
+    loaded = _loaded_status(settings)
+    assert _ids(loaded.events()) == [1, 2]
+
+    # Changes are appended after the last complete record
+    _add(loaded, _event("r1", "h4"))
+    loaded.save_status()
+    assert _ids(_loaded_status(settings).events()) == [1, 2, 4]
+
+
+def test_load_status_from_legacy_status_file(settings):
+    status = _saved_status(settings)
+    _add(status, _event("r1", "h1"))
+    settings.paths.status_file.value.write_bytes(repr(status.pack_status()) + "\n")
+
+    loaded = _loaded_status(settings)
+    assert loaded.events() == status.events()
+    loaded.save_status()
+    assert not settings.paths.status_file.value.exists()
+    assert _loaded_status(settings).events() == status.events()
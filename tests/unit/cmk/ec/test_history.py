@@ -0,0 +1,121 @@
+# pylint: disable=redefined-outer-name
+
+import time
+
+import pytest  # type: ignore
+from pathlib2 import Path
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.history
+import cmk.ec.settings
+from cmk.ec.main import QueryGET, StatusTableEvents, StatusTableHistory
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+
+class FakeStatusServer(object):
+    def __init__(self, history):
+        self._table_history = StatusTableHistory(logger, history)
+
+    def table(self, name):
+        assert name == "history"
+        return self._table_history
+
+
+@pytest.fixture()
+def settings(tmp_path):
+    return cmk.ec.settings.settings("1.6.0", Path(str(tmp_path)), Path(str(tmp_path)), ["mkeventd"])
+
+
+def _history(settings, archive_mode):
+    config = cmk.ec.defaults.default_config()
+    config["archive_mode"] = archive_mode
+    return cmk.ec.history.History(settings, config, logger, StatusTableEvents.columns,
+                                  StatusTableHistory.columns)
+
+
+def _event(event_id, host, **kwargs):
+    event = {
+        "id": event_id,
+        "count": 1,
+        "text": u"Text of event %d \xe4" % event_id,
+        "first": 100.0,
+        "last": 100.0,
+        "host": host,
+        "application": "app%d" % (event_id % 2),
+        "rule_id": "rule%d" % (event_id % 3),
+        "match_groups": ("a", "b"),
+        "contact_groups": None,
+        "host_in_downtime": event_id == 2,
+    }
+    event.update(kwargs)
+    return event
+
+
+def _get(history, *headers):
+    query = QueryGET(FakeStatusServer(history), ["GET history"] + list(headers), logger)
+    return list(query.table.query(query))[1:]
+
+
+def _without_line(rows):
+    return [row[1:] for row in rows]
+
+
+def _comparable(rows):
+    # The history files contain rounded times, only compare the seconds
+    return [[int(row[1])] + row[2:] for row in rows]
+
+
+def _add_events(history):
+    for event_id in range(1, 7):
+        history.add(_event(event_id, "host%d" % (event_id % 2)), "NEW")
+    history.add(_event(3, "host1", comment=u"comment"), "COMMENT", "hans", "with info")
+
+
+@pytest.mark.parametrize("headers", [
+    [],
+    ["Filter: event_host = host1"],
+    ["Filter: event_host = host1", "Limit: 2"],
+    ["Filter: event_id in 2 5 7", "Filter: history_what = NEW"],
+    ["Filter: event_rule_id ~ rule[12]", "Limit: 3"],
+    ["Filter: event_text ~~ EVENT 3", "Filter: event_comment = comment"],
+    ["Filter: event_host_in_downtime = 1"],
+    ["Filter: history_time >= 0", "Filter: event_first < 200"],
+])
+def test_sqlite_and_file_history_return_same_entries(settings, headers):
+    file_history = _history(settings, "file")
+    sqlite_history = _history(settings, "sqlite")
+    _add_events(file_history)
+    _add_events(sqlite_history)
+
+    sqlite_rows = _get(sqlite_history, *headers)
+    assert sqlite_rows
+    assert _comparable(sqlite_rows) == _comparable(_get(file_history, *headers))
+
+
+def test_sqlite_history_imports_history_files(settings):
+    file_history = _history(settings, "file")
+    _add_events(file_history)
+    expected = _without_line(_get(file_history))
+
+    sqlite_history = _history(settings, "sqlite")
+    assert _without_line(_get(sqlite_history)) == expected
+    assert [row[0] for row in _get(sqlite_history, "Limit: 2")] == [7, 6]
+
+    # The files are imported only once
+    assert len(_get(_history(settings, "sqlite"))) == len(expected)
+
+
+def test_sqlite_history_housekeeping(settings, monkeypatch):
+    history = _history(settings, "sqlite")
+    _add_events(history)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + history._config["history_lifetime"] * 86400)
+    history.add(_event(8, "host0"), "NEW")
+    history.housekeeping()
+    assert [row[5] for row in _get(history)] == [8]
+
+    history.flush()
+    assert _get(history) == []
@@ -117,6 +117,9 @@ def test_perfcounters_correct_status_values():
             counter_name = column_name.split("_")[-2]
             assert column_value == c._rates.get(counter_name, 0.0)
 
+        elif column_name[7:] in c._gauges:
+            assert column_value == c._gauges[column_name[7:]]
+
         elif column_name.startswith("status_"):
             counter_name = "_".join(column_name.split("_")[1:])
             assert column_value == c._counters[counter_name], "Invalid value %r: %r" % (
@@ -124,3 +127,13 @@ def test_perfcounters_correct_status_values():
 
         else:
             raise NotImplementedError()
+
+
+def test_perfcounters_gauge():
+    c = Perfcounters(logger)
+    status = dict(zip([n for n, d in c.status_columns()], c.get_status()))
+    assert status["status_input_queue_length"] == 0
+
+    c.set_gauge("input_queue_length", 42)
+    status = dict(zip([n for n, d in c.status_columns()], c.get_status()))
+    assert status["status_input_queue_length"] == 42
@@ -2,7 +2,7 @@ import pytest
 
 import cmk
 import cmk.utils.log
-from cmk.ec.main import RuleMatcher, SyslogPriority, EventServer
+from cmk.ec.main import RuleMatcher, RulePrefilter, SyslogPriority, EventServer, regex_literals
 
 
 @pytest.fixture()
@@ -292,3 +292,104 @@ def test_match_ipaddress(m, result, rule, event):
 ])
 def test_match_facility(m, result, rule, event):
     assert m.event_rule_matches_facility(rule, event) == result
+
+
+@pytest.mark.parametrize("pattern,literals", [
+    ("disk full", set(["disk full"])),
+    ("^Disk (sda|sdb) .*FULL$", set(["disk "])),
+    ("(error|warning): [0-9]+", set(["error", "warning"])),
+    ("(error|.*)", None),
+    ("a?b*", None),
+    ("[0-9]+ (Connection refused)", set(["connection refused"])),
+    ("x{2,3}yz", set(["yz"])),
+    ("[invalid", None),
+])
+def test_regex_literals(pattern, literals):
+    assert regex_literals(pattern) == literals
+
+
+def _prefilter_rule(**patterns):
+    rule = {"id": "rule", "pack": "pack"}
+    for key, value in patterns.items():
+        compiled = EventServer._compile_matching_value(key, value)
+        if compiled is not None:
+            rule[key] = compiled
+    return rule
+
+
+_PREFILTER_PATTERNS = [
+    "Disk full",
+    "disk (sda|sdb) (is )?full$",
+    "^(ERROR|WARN) [0-9]+",
+    "error|.*",
+    "Connection refused",
+    "connection.*refused",
+    "[0-9]+ fail",
+]
+
+_PREFILTER_TEXTS = [
+    "DISK FULL on /var",
+    "disk sdb is full",
+    "disk sdc full",
+    "ERROR 42",
+    "error 42",
+    "warn x",
+    "Connection refused by peer",
+    "connection to host refused",
+    "12 fail",
+    "",
+]
+
+
+@pytest.mark.parametrize("pattern", _PREFILTER_PATTERNS)
+@pytest.mark.parametrize("key", ["match", "match_ok", "match_host", "match_application"])
+def test_prefilter_keeps_all_matching_rules(m, key, pattern):
+    patterns = {key: pattern}
+    if key == "match_ok":
+        patterns["match"] = "will not match"
+    rule = _prefilter_rule(**patterns)
+    prefilter = RulePrefilter([rule])
+
+    for text in _PREFILTER_TEXTS:
+        event = {
+            "text": text,
+            "host": text,
+            "application": text,
+            "facility": 1,
+            "priority": 2,
+            "ipaddress": "127.0.0.1",
+        }
+        if m.event_rule_matches_non_inverted(rule, event) is not False:
+            assert prefilter.filter_rules([rule], event) == [rule], text
+
+
+def test_prefilter_filter_rules():
+    rules = [
+        _prefilter_rule(match="disk.*full"),
+        _prefilter_rule(match="error"),
+        _prefilter_rule(match="error", match_host="^web"),
+        _prefilter_rule(match=".*"),
+        _prefilter_rule(match="disk", match_ok="disk ok"),
+        _prefilter_rule(match="error"),
+        _prefilter_rule(match_ok="recovered"),
+        _prefilter_rule(match="x", match_application="sshd", cancel_application="[a-z]+"),
+    ]
+    rules[5]["invert_matching"] = True
+    prefilter = RulePrefilter(rules)
+    assert prefilter.num_filtered_rules == 5
+
+    def filtered(text, host="db01", application=""):
+        event = {"text": text, "host": host, "application": application}
+        return [rules.index(r) for r in prefilter.filter_rules(rules, event)]
+
+    assert filtered("Disk sda is full") == [0, 3, 4, 5, 6]
+    assert filtered("ERROR") == [1, 3, 5, 6]
+    assert filtered("ERROR", host="webserver") == [1, 2, 3, 5, 6]
+    assert filtered("nothing") == [3, 5, 6]
+    assert filtered("x", application="sshd") == [3, 5, 6, 7]
+    # The order of the given rules is kept and rules not known are dropped
+    assert prefilter.filter_rules([rules[1], rules[0]], {
+        "text": "disk full error",
+        "host": "",
+        "application": ""
+    }) == [rules[1], rules[0]]
@@ -0,0 +1,163 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import ast
+import json
+
+import pytest  # type: ignore
+
+import cmk.utils.log
+from cmk.ec.main import (EventStatus, MKClientError, Perfcounters, QueryGET, StatusServer,
+                         StatusTableEvents)
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+
+class FakeHistory(object):
+    def add(self, event, what, who="", addinfo=""):
+        pass
+
+
+class FakeStatusServer(object):
+    def __init__(self, event_status):
+        self._table_events = StatusTableEvents(logger, event_status)
+
+    def table(self, name):
+        assert name == "events"
+        return self._table_events
+
+
+class FakeSocket(object):
+    def __init__(self):
+        self.chunks = []
+
+    def sendall(self, data):
+        self.chunks.append(data)
+
+
+@pytest.fixture()
+def event_status():
+    event_status = EventStatus(None, {"debug_rules": False}, Perfcounters(logger), FakeHistory(),
+                               logger)
+    for nr in range(100):
+        event_status.new_event({
+            "host": "host%d" % (nr % 10),
+            "text": u"Event %d äöü" % nr,
+            "rule_id": "rule",
+            "phase": "open",
+            "match_groups": ("a", "b"),
+        })
+    return event_status
+
+
+@pytest.fixture()
+def status_server(monkeypatch):
+    monkeypatch.setattr(StatusServer, "_send_buffer_size", 1000)
+    return StatusServer.__new__(StatusServer)
+
+
+def _query(event_status, *headers):
+    return QueryGET(FakeStatusServer(event_status), ["GET events"] + list(headers), logger)
+
+
+def _answer(status_server, query):
+    client_socket = FakeSocket()
+    status_server._answer_query(client_socket, query, query.table.query(query))
+    return client_socket
+
+
+def _rows(event_status, *headers):
+    query = _query(event_status, *headers)
+    return list(query.table.query(query))
+
+
+def test_events_only_requested_columns_are_computed(event_status):
+    rows = _rows(event_status, "Columns: event_id event_text", "Filter: event_host = host3",
+                 "Limit: 2")
+    assert rows == [
+        ["event_id", "event_text"],
+        [4, u"Event 3 äöü"],
+        [14, u"Event 13 äöü"],
+    ]
+
+    query = _query(event_status, "Columns: event_id", "Filter: event_host = host3")
+    row = next(query.table._enumerate(query))
+    assert row[query.table.column_indices["event_host"]] == "host0"
+    assert row[query.table.column_indices["event_text"]] == ""
+
+
+@pytest.mark.parametrize("output_format, parse, serialize", [
+    ("python", ast.literal_eval, repr),
+    ("json", json.loads, json.dumps),
+    ("compact_json", json.loads, json.dumps),
+])
+def test_answer_query_is_streamed(event_status, status_server, output_format, parse, serialize):
+    client_socket = _answer(status_server, _query(event_status, "OutputFormat: %s" % output_format))
+
+    assert len(client_socket.chunks) > 1
+    assert all(len(chunk) < 2000 for chunk in client_socket.chunks)
+    response = "".join(client_socket.chunks)
+    assert response.endswith("]\n")
+    assert parse(response) == parse(serialize(_rows(event_status)))
+
+
+def _failing_rows():
+    for nr in range(1000):
+        yield [nr, "x" * 100]
+    raise MKClientError("Failed to produce a row")
+
+
+def test_answer_query_plain_sends_nothing_when_a_row_fails(event_status, status_server):
+    client_socket = FakeSocket()
+    query = _query(event_status, "OutputFormat: plain")
+    with pytest.raises(MKClientError):
+        status_server._answer_query(client_socket, query, _failing_rows())
+    assert client_socket.chunks == []
+
+
+@pytest.mark.parametrize("output_format, parse", [
+    ("python", ast.literal_eval),
+    ("json", json.loads),
+    ("compact_json", json.loads),
+])
+def test_answer_query_is_unterminated_when_a_row_fails(event_status, status_server, output_format,
+                                                       parse):
+    client_socket = FakeSocket()
+    query = _query(event_status, "OutputFormat: %s" % output_format)
+    with pytest.raises(MKClientError):
+        status_server._answer_query(client_socket, query, _failing_rows())
+
+    # The rows are sent while they are produced, but the client can not parse the response
+    assert len(client_socket.chunks) > 1
+    with pytest.raises((SyntaxError, ValueError)):
+        parse("".join(client_socket.chunks))
+
+
+def test_answer_query_python_is_repr_of_rows(event_status, status_server):
+    client_socket = _answer(status_server, _query(event_status, "Columns: event_id event_text"))
+    assert "".join(
+        client_socket.chunks) == repr(_rows(event_status, "Columns: event_id event_text")) + "\n"
+
+
+def test_answer_query_plain(event_status, status_server):
+    client_socket = _answer(
+        status_server,
+        _query(event_status, "OutputFormat: plain", "Columns: event_id event_match_groups",
+               "Limit: 2"))
+    assert "".join(client_socket.chunks) == "event_id\tevent_match_groups\n1\t\1a\1b\n2\t\1a\1b\n"
+
+
+def test_answer_query_json_is_dump_of_rows(event_status, status_server):
+    client_socket = _answer(
+        status_server, _query(event_status, "OutputFormat: json", "Columns: event_id event_text"))
+    assert "".join(client_socket.chunks) == json.dumps(
+        _rows(event_status, "Columns: event_id event_text")) + "\n"
+
+
+def test_answer_query_compact_json(event_status, status_server):
+    client_socket = _answer(
+        status_server,
+        _query(event_status, "OutputFormat: compact_json", "Columns: event_id event_match_groups",
+               "Limit: 2"))
+    assert "".join(client_socket.chunks) == \
+        '[["event_id","event_match_groups"],[1,["a","b"]],[2,["a","b"]]]\n'
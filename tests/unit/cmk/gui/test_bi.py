@@ -0,0 +1,221 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import pytest  # type: ignore
+
+import cmk.gui.config as config
+import cmk.gui.bi as bi
+
+
+def _status(host_state, service_state):
+    return [
+        host_state, host_state, "output", 0, 0, True,
+        [["svc", service_state, 1, "output", service_state, 1, 1, 0, 0, True]]
+    ]
+
+
+def _leaf(host, service=None):
+    node = {"type": bi.NT_LEAF, "host": ("s", host), "reqhosts": [("s", host)], "title": host}
+    if service:
+        node["service"] = service
+    return node
+
+
+def _rule(title, nodes):
+    return {
+        "type": bi.NT_RULE,
+        "title": title,
+        "func": "worst",
+        "reqhosts": set(h for n in nodes for h in n["reqhosts"]),
+        "nodes": nodes,
+    }
+
+
+@pytest.fixture()
+def livestatus(monkeypatch):
+    class FakeLivestatus(object):
+        def __init__(self):
+            self.status_info = {
+                ("s", "h1"): _status(0, 0),
+                ("s", "h2"): _status(0, 0),
+            }
+            self.fingerprints = {
+                ("s", "h1"): (1,),
+                ("s", "h2"): (1,),
+            }
+            self.fetched = []
+
+        def get_status_info(self, required_hosts):
+            self.fetched.append(sorted(required_hosts))
+            return {k: v for k, v in self.status_info.items() if k in required_hosts}
+
+    live = FakeLivestatus()
+    monkeypatch.setattr(bi, "get_status_info", live.get_status_info)
+    monkeypatch.setattr(bi, "get_status_fingerprints", lambda sites: dict(live.fingerprints))
+    monkeypatch.setattr(bi, "g_assumptions", {})
+    return live
+
+
+@pytest.fixture()
+def tree():
+    tree = _rule("aggr", [_rule("h1", [_leaf("h1")]), _rule("h2", [_leaf("h2", "svc")])])
+    tree.update({"use_hard_states": False, "downtime_aggr_warn": False})
+    return tree
+
+
+def _execute(incremental_state, tree):
+    status_info = incremental_state.update(tree["reqhosts"])
+    return incremental_state.execute_tree(tree, status_info)
+
+
+def test_incremental_state_fetches_only_changed_hosts(livestatus, tree):
+    incremental_state = bi.BIIncrementalState()
+    result = _execute(incremental_state, tree)
+    assert result == bi.execute_tree(tree, livestatus.status_info)
+    assert result[0]["state"] == bi.OK
+
+    # Nothing has changed: Nothing is fetched and executed again
+    assert _execute(incremental_state, tree) is result
+    assert livestatus.fetched == [[("s", "h1"), ("s", "h2")]]
+
+    livestatus.status_info[("s", "h2")] = _status(0, 2)
+    livestatus.fingerprints[("s", "h2")] = (2,)
+    changed_result = _execute(incremental_state, tree)
+
+    assert livestatus.fetched[1:] == [[("s", "h2")]]
+    assert changed_result[0]["state"] == bi.CRIT
+    assert changed_result == bi.execute_tree(tree, livestatus.status_info)
+    # The subtree of the unchanged host is reused
+    assert changed_result[3][0] is result[3][0]
+    assert changed_result[3][1] is not result[3][1]
+
+
+def test_incremental_state_removed_host(livestatus, tree):
+    incremental_state = bi.BIIncrementalState()
+    _execute(incremental_state, tree)
+
+    del livestatus.status_info[("s", "h1")]
+    del livestatus.fingerprints[("s", "h1")]
+    result = _execute(incremental_state, tree)
+
+    assert [subtree[2]["title"] for subtree in result[3]] == ["h2"]
+    assert result == bi.execute_tree(tree, livestatus.status_info)
+
+
+def test_incremental_state_honors_assumptions(livestatus, tree, monkeypatch):
+    incremental_state = bi.BIIncrementalState()
+    assert _execute(incremental_state, tree)[1] is None
+
+    monkeypatch.setattr(bi, "g_assumptions", {("s", "h2", "svc"): bi.WARN})
+    result = _execute(incremental_state, tree)
+    assert result[1]["state"] == bi.WARN
+    assert livestatus.fetched == [[("s", "h1"), ("s", "h2")]]
+
+    monkeypatch.setattr(bi, "g_assumptions", {})
+    assert _execute(incremental_state, tree)[1] is None
+
+
+def test_get_incremental_state(monkeypatch):
+    monkeypatch.setattr(bi, "g_incremental_states", {})
+    assert bi.get_incremental_state() is None
+
+    monkeypatch.setattr(config, "bi_incremental_evaluation", True)
+    incremental_state = bi.get_incremental_state()
+    assert isinstance(incremental_state, bi.BIIncrementalState)
+    assert bi.get_incremental_state() is incremental_state
+
+
+@pytest.mark.parametrize("pattern,prefix", [
+    ("CPU load", "CPU load"),
+    ("Filesystem /var", "Filesystem /var"),
+    ("Interface (.*)", "Interface "),
+    ("Disk IO SUMMARY$", "Disk IO SUMMARY"),
+    ("Memory|CPU", ""),
+    ("Mount options?", "Mount option"),
+    ("ab{2}", "a"),
+    ("OMD .+ apache", "OMD "),
+    (r"Disk\ IO", "Disk"),
+    ("(?i)cpu", ""),
+    (u"Lüfter", u"L"),
+    (config.HOST_STATE, ""),
+])
+def test_regex_literal_prefix(pattern, prefix):
+    assert bi.regex_literal_prefix(pattern) == prefix
+
+
+@pytest.fixture()
+def services(monkeypatch):
+    services = {
+        ("s", "h1"): (["lnx", "prod"], ["Interface 2", "CPU load", "Interface 1"], [], [], "a1"),
+        ("s", "h2"): (["win", "prod"], ["Interface 1", "CPU utilization"], [], [], "a2"),
+        ("s", "h3"): (["lnx", "test"], [u"Interface 3", "Memory"], [], [], "a3"),
+    }
+    by_hostname = {}
+    for (site, host), entry in services.items():
+        by_hostname.setdefault(host, []).append((site, entry))
+    monkeypatch.setattr(bi, "g_services", services)
+    monkeypatch.setattr(bi, "g_services_items", services.items())
+    monkeypatch.setattr(bi, "g_services_by_hostname", by_hostname)
+    return services
+
+
+def test_find_matching_services(services):
+    assert bi.find_matching_services(bi.AGGR_MULTI, config.FOREACH_SERVICE,
+                                     [["lnx"], "(.*)", "Interface (.*)"]) == [
+                                         (("h1", "a1"), ("h1", "1")),
+                                         (("h1", "a1"), ("h1", "2")),
+                                         (("h3", "a3"), ("h3", "3")),
+                                     ]
+    assert bi.find_matching_services(bi.AGGR_MULTI, config.FOREACH_SERVICE,
+                                     [["prod", "!lnx"], "(.*)", "CPU (.*)"]) == [
+                                         (("h2", "a2"), ("h2", "utilization")),
+                                     ]
+    assert bi.find_matching_services(bi.AGGR_MULTI, config.FOREACH_HOST,
+                                     [("alias", "a3"), config.HOST_STATE]) == [
+                                         (("h3", "a3"), ()),
+                                     ]
+    # The services are sorted by the index
+    assert services[("s", "h1")][1] == ["CPU load", "Interface 1", "Interface 2"]
+
+
+def test_compile_leaf_node(services):
+    assert [(n["host"], n["service"]) for n in bi.compile_leaf_node("h.*", "Interface 1")] == [
+        (("s", "h1"), "Interface 1"),
+        (("s", "h2"), "Interface 1"),
+    ]
+
+
+class FakeLive(object):
+    def __init__(self, tables):
+        self.tables = tables
+
+    def set_auth_domain(self, domain):
+        pass
+
+    def set_only_sites(self, only_sites):
+        pass
+
+    def set_prepend_site(self, prepend_site):
+        pass
+
+    def query(self, query):
+        return self.tables[query.split()[1]]
+
+
+def test_get_status_fingerprints(monkeypatch):
+    tables = {
+        "hosts": [["s", "h1", 0, 0, 1, 10, 10, 0, 0, 1], ["s", "h2", 0, 0, 1, 10, 10, 0, 0, 1]],
+        # Service 1 of h1 is acknowledged
+        "services": [["s", "h1", 2, 20, 20, 2, 0, 1, 2]],
+        "comments": [["s", "h1", 5]],
+        "downtimes": [],
+    }
+    monkeypatch.setattr(bi.sites, "live", lambda: FakeLive(tables))
+    fingerprints = bi.get_status_fingerprints(["s"])
+    assert sorted(fingerprints) == [("s", "h1"), ("s", "h2")]
+    assert fingerprints[("s", "h2")][-2:] == ((), ())
+
+    # Service 2 is acknowledged instead: The sums are the same, the comment ids not
+    tables["comments"] = [["s", "h1", 6]]
+    assert bi.get_status_fingerprints(["s"])[("s", "h1")] != fingerprints[("s", "h1")]
+    assert bi.get_status_fingerprints(["s"])[("s", "h2")] == fingerprints[("s", "h2")]
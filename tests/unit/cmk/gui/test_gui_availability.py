@@ -0,0 +1,307 @@
+# pylint: disable=redefined-outer-name
+
+import copy
+import time
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk.gui.config as config
+import cmk.gui.sites as sites
+import cmk.gui.availability as availability
+from cmk.gui.log import logger
+
+COLUMNS = [
+    "site",
+    "host_name",
+    "service_description",
+    "duration",
+    "from",
+    "until",
+    "state",
+    "host_down",
+    "in_downtime",
+    "in_host_downtime",
+    "in_notification_period",
+    "in_service_period",
+    "is_flapping",
+    "log_output",
+    "service_groups",
+]
+
+
+def _row(service, from_time, until_time, state, in_downtime=0, is_flapping=0, groups=None):
+    return [
+        "s", "h1", service, until_time - from_time, from_time, until_time, state, 0, in_downtime, 0,
+        1, 1, is_flapping,
+        "output %d" % from_time, groups or ["g1"]
+    ]
+
+
+ROWS = [
+    _row("svc1", 0, 100, 0),
+    _row("svc1", 100, 150, 0),
+    _row("svc1", 150, 160, 2),
+    _row("svc1", 160, 300, 0),
+    _row("svc1", 300, 400, 1, in_downtime=1),
+    _row("svc1", 400, 410, 1, is_flapping=1),
+    _row("svc1", 410, 500, None),
+    _row("svc1", 500, 600, -1),
+    _row("svc2", 0, 50, 3, groups=["g2"]),
+    _row("svc2", 60, 100, 3, groups=["g1", "g2"]),
+]
+
+
+def _rawdata(service, columnar):
+    rows = [row for row in ROWS if row[2] == service]
+    if not columnar:
+        return availability.spans_by_object([dict(zip(COLUMNS, row)) for row in rows], None)[0]
+
+    av_rawdata = {}
+    for row in rows:
+        av_rawdata.setdefault(("s", "h1"), {}).setdefault(row[2],
+                                                          availability.AVSpans(COLUMNS)).append(row)
+    return av_rawdata
+
+
+@pytest.fixture(autouse=True)
+def no_annotations(monkeypatch):
+    monkeypatch.setattr(availability, "load_annotations", lambda: {})
+
+
+def _avoptions(**kwargs):
+    avoptions = availability.get_default_avoptions()
+    avoptions["outage_statistics"] = (["min", "max", "avg", "cnt"], ["ok", "crit", "warn"])
+    avoptions.update(kwargs)
+    return avoptions
+
+
+def _timeline(av_data):
+    return [(entry["service"], [(span["from"], span["until"], span["duration"], s)
+                                for span, s in entry["timeline"]])
+            for entry in av_data]
+
+
+@pytest.mark.parametrize("service", ["svc1", "svc2"])
+@pytest.mark.parametrize("avoptions", [
+    _avoptions(),
+    _avoptions(dont_merge=True),
+    _avoptions(short_intervals=10),
+    _avoptions(grouping="service_groups"),
+    _avoptions(downtimes={
+        "include": "exclude",
+        "exclude_ok": False,
+    }),
+    _avoptions(consider={
+        "flapping": False,
+        "host_down": True,
+        "unmonitored": False,
+    }),
+])
+def test_compute_availability_of_columnar_spans(service, avoptions):
+    expected = availability.compute_availability("service", _rawdata(service, False),
+                                                 copy.deepcopy(avoptions))
+    av_data = availability.compute_availability("service", _rawdata(service, True), avoptions)
+
+    assert _timeline(av_data) == _timeline(expected)
+    for entry in av_data + expected:
+        del entry["timeline"]
+    assert av_data == expected
+
+
+def test_columnar_spans():
+    spans = availability.AVSpans(COLUMNS)
+    spans.append(ROWS[0])
+    spans.append(ROWS[6])
+
+    assert len(spans) == 2
+    assert spans[0] == dict(zip(COLUMNS, ROWS[0]))
+    assert list(spans)[1]["state"] is None
+    assert spans.last_value("log_output", None) == "output 410"
+    assert spans.last_value("host_alias", "h1") == "h1"
+
+
+@pytest.fixture()
+def live(monkeypatch):
+    class FakeLiveStatus(object):
+        def __getattr__(self, name):
+            return lambda *args: None
+
+        def query_rows(self, query):
+            self.query = query
+            return iter(copy.deepcopy(ROWS))
+
+    live = FakeLiveStatus()
+    monkeypatch.setattr(sites, "live", lambda: live)
+    return live
+
+
+def test_get_availability_rawdata(live):
+    context = {"servicegroups": {"servicegroups": "g2", "neg_servicegroups": "off"}}
+    av_rawdata, has_reached_logrow_limit = availability.get_availability_rawdata(
+        "service", context, "", None, None, True, False,
+        _avoptions(grouping="service_groups", logrow_limit=9))
+
+    assert "Limit: 10\n" in live.query
+    # svc2 may be incomplete, because the row limit was exceeded
+    assert has_reached_logrow_limit
+    assert av_rawdata.keys() == [("s", "h1")]
+    assert av_rawdata[("s", "h1")].keys() == ["svc1"]
+
+    spans = av_rawdata[("s", "h1")]["svc1"]
+    assert isinstance(spans, availability.AVSpans)
+    assert list(spans) == [dict(zip(COLUMNS, row[:-1] + [[]])) for row in ROWS[:8]]
+
+
+class FakeStatehist(object):
+    """Answers statehist queries from a list of spans, which are cut to the queried time range"""
+
+    def __init__(self, history):
+        self.history = history
+        self.queries = []
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+    def alive_sites(self):
+        return ["s"]
+
+    def query_rows(self, query):
+        self.queries.append(query)
+        headers = dict(line.split(": ", 1) for line in query.splitlines()[1:] if ": " in line)
+        from_time = int(query.split("Filter: time >= ")[1].split("\n")[0])
+        until_time = int(query.split("Filter: time < ")[1].split("\n")[0])
+        columns = ["site"] + headers["Columns"].split()
+
+        rows = []
+        for span in self.history:
+            if span["until"] <= from_time or span["from"] >= until_time:
+                continue
+            if "service_description !=\n" in query and not span["service_description"] or \
+                    "service_description =\n" in query and span["service_description"]:
+                continue
+            span = dict(span, **{"from": max(span["from"], from_time)})
+            span["until"] = min(span["until"], until_time)
+            span["duration"] = span["until"] - span["from"]
+            rows.append([span[column] for column in columns])
+        return iter(rows)
+
+
+@pytest.fixture()
+def statehist(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+
+    today = availability.day_start(time.time())
+    first_day = availability.day_start(today - 3 * 86400 + 3600)
+    history = []
+    for service, period in [("", 7 * 3600), ("svc1", 5 * 3600), ("svc2", 11 * 3600)]:
+        for nr, from_time in enumerate(range(first_day - 86400, today + 86400, period)):
+            span = dict(zip(COLUMNS, _row(service, from_time, from_time + period, nr % 3 % 2)))
+            span.update({
+                "host_alias": "alias",
+                "service_display_name": service.upper(),
+                "host_groups": ["hg"],
+                "in_downtime": int(nr % 5 == 0),
+            })
+            history.append(span)
+
+    live = FakeStatehist(history)
+    monkeypatch.setattr(sites, "live", lambda: live)
+    return live
+
+
+def _query_times(live):
+    return [(int(query.split("Filter: time >= ")[1].split("\n")[0]),
+             int(query.split("Filter: time < ")[1].split("\n")[0])) for query in live.queries]
+
+
+def test_update_rollups(statehist, tmp_path):
+    (tmp_path / "availability_rollups" / "s").mkdir(parents=True)
+    (tmp_path / "availability_rollups" / "s" / "2000-01-01").write_bytes("")
+
+    assert availability.update_rollups(3, logger) == 3
+    assert availability.update_rollups(3, logger) == 0
+    assert sorted(p.name for p in (tmp_path / "availability_rollups" / "s").iterdir()) == sorted(
+        time.strftime("%Y-%m-%d", time.localtime(day)) for day, _until in _query_times(statehist))
+
+    day = _query_times(statehist)[-1][0]
+    rollups = availability.load_rollups("s", day)
+    runs, object_values = rollups[("h1", "svc2")]
+    assert sum(run[0] for run in runs) == availability.next_day_start(day) - day
+    assert object_values["service_display_name"] == "SVC2"
+
+
+@pytest.mark.parametrize("what", ["host", "service"])
+@pytest.mark.parametrize("range_offsets", [(-7200, 3600), (0, 0)])
+def test_get_availability_rawdata_from_rollups(statehist, monkeypatch, what, range_offsets):
+    availability.update_rollups(3, logger)
+    today = availability.day_start(time.time())
+    first_day = availability.day_start(today - 3 * 86400 + 3600)
+    time_range = (first_day + range_offsets[0], today + range_offsets[1])
+    avoptions = _avoptions(
+        range=(time_range, ""),
+        grouping="service_groups",
+        labelling=["show_alias", "use_display_name"])
+
+    def availability_of_objects():
+        av_rawdata = availability.get_availability_rawdata(what, {}, "", None, None, False, False,
+                                                           avoptions)[0]
+        av_data = {}
+        for site_host, service_entries in av_rawdata.items():
+            for service, spans in service_entries.items():
+                av_data[site_host + (service,)] = availability.compute_availability(
+                    what, {site_host: {
+                        service: spans
+                    }}, avoptions)
+        return av_data
+
+    expected = availability_of_objects()
+    assert _query_times(statehist)[-1] == time_range
+
+    monkeypatch.setattr(config, "availability_rollup_days", 3)
+    del statehist.queries[:]
+    av_data = availability_of_objects()
+
+    assert len(av_data) == (1 if what == "host" else 2)
+    assert av_data == expected
+    # Only the partial days at the edges are queried
+    if range_offsets[0]:
+        assert _query_times(statehist) == [
+            (time_range[0], first_day),
+            (today, time_range[1]),
+        ]
+    else:
+        assert _query_times(statehist) == [
+            (first_day, first_day + 1),
+            (today - 1, today),
+        ]
+
+
+@pytest.mark.parametrize("filterheaders, see_all, from_rollups", [
+    ("", True, True),
+    ("", False, False),
+    ("Filter: host_name = h1\n", True, False),
+])
+def test_get_availability_rawdata_objects_within_rollups(
+        register_builtin_html, statehist, monkeypatch, filterheaders, see_all, from_rollups):
+    today = availability.day_start(time.time())
+    first_day = availability.day_start(today - 3 * 86400 + 3600)
+    middle_day = availability.next_day_start(first_day)
+    span = dict(zip(COLUMNS, _row("svc3", middle_day + 3600, middle_day + 7200, 2)))
+    span.update({"host_alias": "alias", "service_display_name": "SVC3", "host_groups": ["hg"]})
+    statehist.history.append(span)
+    availability.update_rollups(3, logger)
+
+    monkeypatch.setattr(config, "availability_rollup_days", 3)
+    monkeypatch.setattr(config.user, "may", lambda x: see_all)
+    del statehist.queries[:]
+    av_rawdata = availability.get_availability_rawdata(
+        "service", {}, filterheaders, None, None, False, False,
+        _avoptions(range=((first_day, today), "")))[0]
+
+    # The service only existed within the rolled up days
+    assert sorted(av_rawdata[("s", "h1")]) == ["svc1", "svc2", "svc3"]
+    assert [entry["duration"] for entry in av_rawdata[("s", "h1")]["svc3"]] == [3600]
+    if from_rollups:
+        assert _query_times(statehist) == [(first_day, first_day + 1), (today - 1, today)]
+    else:
+        assert _query_times(statehist)[-1] == (first_day, today)
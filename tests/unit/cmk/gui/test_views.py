@@ -5716,6 +5716,88 @@ def test_register_sorter(monkeypatch):
     assert sorter.title == "A B C"
     assert sorter.columns == ["x"]
     assert sorter.cmp.__name__ == cmpfunc.__name__
+    assert sorter.key is None
+
+
+def test_declare_simple_sorter_key(monkeypatch):
+    monkeypatch.setattr(cmk.gui.plugins.views.utils, "sorter_registry",
+                        cmk.gui.plugins.views.utils.SorterRegistry())
+
+    cmk.gui.plugins.views.utils.declare_simple_sorter("abc", "A B C", "x",
+                                                      cmk.gui.plugins.views.utils.cmp_simple_number)
+
+    sorter = cmk.gui.plugins.views.utils.sorter_registry["abc"]()
+    rows = [{"x": 10}, {"x": 2}, {"x": 5}]
+    assert sorted(rows, key=sorter.key) == sorted(rows, cmp=sorter.cmp)
+
+
+def _service_row(host_name, service_description, state, join=None):
+    return {
+        "site": "s",
+        "host_name": host_name,
+        "service_description": service_description,
+        "service_state": state,
+        "service_has_been_checked": 1,
+        "service_next_check": len(service_description),
+        "JOIN": join or {},
+    }
+
+
+def _sorter_entry(name, negate=False, join_key=None):
+    return cmk.gui.views.SorterEntry(sorter=cmk.gui.plugins.views.utils.sorter_registry[name](),
+                                     negate=negate,
+                                     join_key=join_key)
+
+
+def test_sort_data(load_plugins):
+    rows = [
+        _service_row("h2", "CPU load", 2),
+        _service_row("h10", "Check_MK", 0),
+        _service_row("h2", "Check_MK", 0),
+        _service_row("h2", "Memory", 3),
+        _service_row("h1", "Disk 10", 2),
+        _service_row("h1", "Disk 9", 2),
+    ]
+
+    cmk.gui.views.sort_data(rows, [
+        _sorter_entry("svcstate", negate=True),
+        _sorter_entry("site_host"),
+        _sorter_entry("svcdescr"),
+    ])
+    assert [(r["host_name"], r["service_description"]) for r in rows] == [
+        ("h1", "Disk 9"),
+        ("h1", "Disk 10"),
+        ("h2", "CPU load"),
+        ("h2", "Memory"),
+        ("h2", "Check_MK"),
+        ("h10", "Check_MK"),
+    ]
+
+
+def test_sort_data_without_key(load_plugins):
+    rows = [
+        _service_row("h1", "CPU", 0),
+        _service_row("h1", "Check_MK", 0),
+        _service_row("h1", "Memory", 0),
+    ]
+
+    # Sorters declared with reverse=True only have a comparison function
+    sorter_entry = _sorter_entry("svc_next_check")
+    assert sorter_entry.sorter.key is None
+
+    cmk.gui.views.sort_data(rows, [sorter_entry])
+    assert [r["service_description"] for r in rows] == ["Check_MK", "Memory", "CPU"]
+
+
+def test_sort_data_join(load_plugins):
+    rows = [
+        _service_row("h1", "CPU load", 0, {"Check_MK": _service_row("h1", "Check_MK", 2)}),
+        _service_row("h2", "CPU load", 0),
+        _service_row("h3", "CPU load", 0, {"Check_MK": _service_row("h3", "Check_MK", 0)}),
+    ]
+
+    cmk.gui.views.sort_data(rows, [_sorter_entry("svcstate", join_key="Check_MK")])
+    assert [r["host_name"] for r in rows] == ["h2", "h3", "h1"]
 
 
 def test_get_needed_regular_columns(view):
@@ -1228,6 +1228,7 @@ def test_grouped_rulespecs():
             'snmpv3_contexts',
             'snmp_timing',
             'non_inline_snmp_hosts',
+            'native_snmp_hosts',
             'usewalk_hosts',
             'snmp_ports',
             'snmp_limit_oid_range',
@@ -10722,6 +10723,21 @@ expected_rulespecs = {
         'title': u'MSSQL Datafile and Transactionlog Discovery',
         'valuespec_class_name': 'Dictionary'
     },
+    'native_snmp_hosts': {
+        'factory_default': [],
+        'group_name': 'agent/snmp',
+        'help': u'The native SNMP implementation talks SNMP v1 and v2c to the devices directly from within the Check_MK process using a single UDP socket per host. Multiple columns of SNMP tables are fetched with a single request and multiple requests are sent to the device without waiting for the previous answers. This reduces the time needed to fetch large tables significantly. Hosts using SNMPv3 are always monitored with Inline SNMP or classic SNMP.',
+        'is_deprecated': False,
+        'is_optional': False,
+        'item_enum': None,
+        'item_help': None,
+        'item_name': None,
+        'item_spec_class_name': 'NoneType',
+        'item_type': None,
+        'match_type': 'first',
+        'title': u'Hosts using the native SNMP implementation',
+        'valuespec_class_name': 'NoneType'
+    },
     'non_inline_snmp_hosts': {
         'factory_default': [],
         'group_name': 'agent/snmp',
@@ -99,6 +99,7 @@ def test_registered_configvars():
         'cmc_timeperiod_horizon',
         'config',
         'context_buttons_to_show',
+        'counters_storage',
         'crash_report_target',
         'custom_service_attributes',
         'dcd_log_levels',
@@ -108,13 +109,17 @@ def test_registered_configvars():
         'debug_rules',
         'default_user_profile',
         'delay_precompile',
+        'discovery_host_timeout',
+        'discovery_max_num_processes',
         'diskspace_cleanup',
         'enable_rulebased_notifications',
         'enable_sounds',
         'escape_plugin_output',
         'event_limit',
+        'event_workers',
         'eventsocket_queue_len',
         'failed_notification_horizon',
+        'fetch_data_sources_concurrently',
         'graph_timeranges',
         'hard_query_limit',
         'history_lifetime',
@@ -152,6 +157,7 @@ def test_registered_configvars():
         'pagetitle_date_format',
         'password_policy',
         'piggyback_max_cachefile_age',
+        'piggyback_storage',
         'profile',
         'quicksearch_dropdown_limit',
         'quicksearch_search_order',
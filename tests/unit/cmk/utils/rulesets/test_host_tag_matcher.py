@@ -0,0 +1,59 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+import pytest  # type: ignore
+from cmk.utils.rulesets.host_tag_matcher import HostTagMatcher
+
+HOST_TAGS = {
+    "prod1": set(["prod", "lan", "cmk-agent", "/wato/a/"]),
+    "prod2": set(["prod", "lan", "cmk-agent", "/wato/b/"]),
+    "test1": set(["test", "lan", "snmp-v1", "/wato/a/"]),
+    "test2": set(["test", "dmz", "snmp-v2", "/wato/b/"]),
+}
+
+HOST_FOLDERS = {
+    hostname: (tags & set(["/wato/a/", "/wato/b/"])).pop() for hostname, tags in HOST_TAGS.items()
+}
+
+
+@pytest.fixture()
+def matcher():
+    return HostTagMatcher(HOST_TAGS, HOST_FOLDERS)
+
+
+@pytest.mark.parametrize("tags,result", [
+    ([], ["prod1", "prod2", "test1", "test2"]),
+    (["prod"], ["prod1", "prod2"]),
+    (["prod", "lan"], ["prod1", "prod2"]),
+    (["prod", "dmz"], []),
+    (["!prod"], ["test1", "test2"]),
+    (["lan", "!prod"], ["test1"]),
+    (["unknown"], []),
+    (["!unknown"], ["prod1", "prod2", "test1", "test2"]),
+    (["snmp-+"], ["test1", "test2"]),
+    (["!snmp-+"], ["prod1", "prod2"]),
+    (["unknown+"], []),
+    (["/wato/a/"], ["prod1", "test1"]),
+    (["!/wato/a/", "lan"], ["prod2"]),
+    (["/wato/+", "test"], ["test1", "test2"]),
+])
+def test_matching_hosts(matcher, tags, result):
+    assert sorted(matcher.matching_hosts(tags, set(HOST_TAGS))) == result
+    assert sorted(h for h in HOST_TAGS if matcher.host_matches(h, tags)) == result
+
+
+def test_matching_hosts_only_valid_hosts(matcher):
+    assert matcher.matching_hosts(["lan"], set(["prod1", "test2"])) == set(["prod1"])
+
+
+def test_matching_hosts_without_prefix_match(matcher):
+    assert matcher.matching_hosts(["snmp-+"], set(HOST_TAGS), prefix_match=False) == set()
+
+
+def test_compile_cache(matcher):
+    assert matcher.compile(["prod", "!lan"]) is matcher.compile(["prod", "!lan"])
+    assert matcher.compile(["unknown"]) is None
+
+
+def test_host_matches_unknown_host(matcher):
+    with pytest.raises(KeyError):
+        matcher.host_matches("unknown", ["prod"])
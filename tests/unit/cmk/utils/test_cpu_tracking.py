@@ -82,3 +82,31 @@ def test_cpu_tracking_add_times(monkeypatch):
     assert times["TOTAL"][4] == 7.0
     assert times["busy"][4] == 2.0
     assert times["agent"][4] == 5.0
+
+
+def test_cpu_tracking_add_phase_duration(monkeypatch):
+    monkeypatch.setattr("time.time", lambda: 0.0)
+    cpu_tracking.start("busy")
+
+    cpu_tracking.push_phase("snmp")
+    monkeypatch.setattr("time.time", lambda: 4.0)
+    cpu_tracking.pop_phase()
+
+    # The agent was fetched in a thread while the SNMP data source was executed
+    cpu_tracking.add_phase_duration("agent", 3.0)
+
+    cpu_tracking.push_phase("agent")
+    monkeypatch.setattr("time.time", lambda: 5.0)
+    cpu_tracking.pop_phase()
+
+    cpu_tracking.end()
+
+    times = cpu_tracking.get_times()
+    assert times["TOTAL"][4] == 5.0
+    assert times["snmp"][4] == 4.0
+    assert times["agent"][4] == 4.0
+
+
+def test_add_phase_duration_without_tracking():
+    cpu_tracking.add_phase_duration("agent", 1.0)
+    assert cpu_tracking._is_not_tracking()
@@ -24,6 +24,7 @@ def test_snmp_port_spec(port, expected):
         character_encoding=None,
         is_usewalk_host=False,
         is_inline_snmp_host=False,
+        is_native_snmp_host=False,
     )
     assert classic_snmp.ClassicSNMPBackend()._snmp_port_spec(snmp_config) == expected
 
@@ -48,6 +49,7 @@ def test_snmp_proto_spec(monkeypatch, is_ipv6, expected):
         character_encoding=None,
         is_usewalk_host=False,
         is_inline_snmp_host=False,
+        is_native_snmp_host=False,
     )
     assert classic_snmp.ClassicSNMPBackend()._snmp_proto_spec(snmp_config) == expected
 
@@ -78,6 +80,7 @@ SNMPSettings = collections.namedtuple("SNMPSettings", [
             character_encoding=None,
             is_usewalk_host=False,
             is_inline_snmp_host=False,
+            is_native_snmp_host=False,
         ),
         context_name=None,
     ), [
@@ -103,6 +106,7 @@ SNMPSettings = collections.namedtuple("SNMPSettings", [
             character_encoding=None,
             is_usewalk_host=False,
             is_inline_snmp_host=False,
+            is_native_snmp_host=False,
         ),
         context_name="blabla",
     ), [
@@ -128,6 +132,7 @@ SNMPSettings = collections.namedtuple("SNMPSettings", [
             character_encoding=None,
             is_usewalk_host=False,
             is_inline_snmp_host=False,
+            is_native_snmp_host=False,
         ),
         context_name="blabla",
     ), [
@@ -153,6 +158,7 @@ SNMPSettings = collections.namedtuple("SNMPSettings", [
             character_encoding=None,
             is_usewalk_host=False,
             is_inline_snmp_host=False,
+            is_native_snmp_host=False,
         ),
         context_name=None,
     ), [
@@ -178,6 +184,7 @@ SNMPSettings = collections.namedtuple("SNMPSettings", [
             character_encoding=None,
             is_usewalk_host=False,
             is_inline_snmp_host=False,
+            is_native_snmp_host=False,
         ),
         context_name=None,
     ), [
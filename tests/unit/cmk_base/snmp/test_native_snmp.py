@@ -0,0 +1,264 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import bisect
+import os
+import re
+import socket
+import threading
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk_base.snmp as snmp
+import cmk_base.native_snmp as native_snmp
+import cmk_base.snmp_utils as snmp_utils
+from cmk_base.exceptions import MKSNMPError
+
+WALK_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "integration", "cmk_base", "snmp", "snmp_data",
+    "cmk-walk")
+
+
+def _oid_key(oid):
+    return tuple(int(p) for p in oid.strip(".").split("."))
+
+
+def _typed_value(value):
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+        if re.match(r"^([0-9A-F]{2} )+$", value):
+            return native_snmp._TAG_OCTET_STRING, "".join(chr(int(h, 16)) for h in value.split())
+        return native_snmp._TAG_OCTET_STRING, value
+    if re.match(r"^(\.\d+){2,}$", value):
+        return native_snmp._TAG_OID, native_snmp.encode_value(native_snmp._TAG_OID, value)
+    if re.match(r"^\d+\.\d+\.\d+\.\d+$", value):
+        return native_snmp._TAG_IP_ADDRESS, native_snmp.encode_value(native_snmp._TAG_IP_ADDRESS,
+                                                                     value)
+    if re.match(r"^-?\d+$", value):
+        tag = native_snmp._TAG_INTEGER if int(value) < 2**31 else native_snmp._TAG_COUNTER64
+        return tag, native_snmp.encode_value(tag, value)
+    return native_snmp._TAG_OCTET_STRING, value
+
+
+class FakeSNMPAgent(threading.Thread):
+    """Answers SNMP v1/v2c requests with the data of a stored walk"""
+
+    def __init__(self, walk_path, community="public"):
+        super(FakeSNMPAgent, self).__init__()
+        self.daemon = True
+        self.community = community
+        self.drop_requests = 0
+        self.requests = []
+        self._oids = []
+        self._varbinds = []
+        for line in open(walk_path):
+            oid, value = (line.rstrip("\n").split(" ", 1) + [""])[:2]
+            self._oids.append(_oid_key(oid))
+            self._varbinds.append((oid,) + _typed_value(value))
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+
+    def run(self):
+        while True:
+            data, address = self._socket.recvfrom(65535)
+            if not data:
+                return
+            version, community, pdu_type, request_id, non_repeaters, max_repetitions, oids = \
+                native_snmp.decode_request(data)
+            self.requests.append((pdu_type, oids))
+            if community != self.community:
+                continue
+            if self.drop_requests:
+                self.drop_requests -= 1
+                continue
+
+            error_status, error_index, varbinds = self._answer(version, pdu_type, max_repetitions,
+                                                               oids)
+            self._socket.sendto(
+                native_snmp.encode_response(version, community, request_id, error_status,
+                                            error_index, varbinds), address)
+
+    def stop(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto("", ("127.0.0.1", self.port))
+        self.join()
+        self._socket.close()
+
+    def _answer(self, version, pdu_type, max_repetitions, oids):
+        if pdu_type == native_snmp._PDU_GET:
+            varbinds = []
+            for oid in oids:
+                index = bisect.bisect_left(self._oids, _oid_key(oid))
+                if index < len(self._oids) and self._oids[index] == _oid_key(oid):
+                    varbinds.append(self._varbinds[index])
+                else:
+                    varbinds.append((oid, native_snmp._TAG_NO_SUCH_OBJECT, ""))
+            return 0, 0, varbinds
+
+        repetitions = max_repetitions if pdu_type == native_snmp._PDU_GETBULK else 1
+        varbinds = []
+        next_oids = list(oids)
+        for _repetition in range(repetitions):
+            for column, oid in enumerate(next_oids):
+                index = bisect.bisect_right(self._oids, _oid_key(oid))
+                if index >= len(self._oids):
+                    if version == 0:
+                        return native_snmp._ERROR_NO_SUCH_NAME, column + 1, []
+                    varbinds.append((oid, native_snmp._TAG_END_OF_MIB_VIEW, ""))
+                    continue
+                varbinds.append(self._varbinds[index])
+                next_oids[column] = self._varbinds[index][0]
+        return 0, 0, varbinds
+
+
+@pytest.fixture()
+def agent():
+    fake_agent = FakeSNMPAgent(os.path.join(WALK_DIR, "localhost"))
+    fake_agent.start()
+    yield fake_agent
+    fake_agent.stop()
+    native_snmp.cleanup_sessions()
+
+
+def _snmp_config(agent, **kwargs):
+    attributes = dict(
+        is_ipv6_primary=False,
+        hostname="localhost",
+        ipaddress="127.0.0.1",
+        credentials="public",
+        port=agent.port,
+        is_bulkwalk_host=True,
+        is_snmpv2or3_without_bulkwalk_host=False,
+        bulk_walk_size_of=10,
+        timing={
+            "timeout": 0.1,
+            "retries": 1
+        },
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=False,
+        is_inline_snmp_host=False,
+        is_native_snmp_host=True,
+    )
+    attributes.update(kwargs)
+    return snmp_utils.SNMPHostConfig(**attributes)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 255, 256, -1, -128, -129, 2**31, 2**64 - 1])
+def test_integer_encoding(value):
+    raw = native_snmp._encode_integer(value)[2:]
+    assert native_snmp._decode_integer(raw) == value
+
+
+@pytest.mark.parametrize("oid", [".1.3.6.1.2.1.1.1.0", ".1.3.6.1.4.1.2021.4294967295", ".2.999.1"])
+def test_oid_encoding(oid):
+    assert native_snmp._decode_oid(native_snmp._encode_oid(oid)[2:]) == oid
+
+
+def test_request_encoding():
+    data = native_snmp.encode_request(1, "public", native_snmp._PDU_GETBULK, 4711, 0, 10,
+                                      [".1.3.6.1.2.1.2.2.1.2", ".1.3.6.1.2.1.2.2.1.3"])
+    assert native_snmp.decode_request(data) == (1, "public", native_snmp._PDU_GETBULK, 4711, 0, 10,
+                                                [".1.3.6.1.2.1.2.2.1.2", ".1.3.6.1.2.1.2.2.1.3"])
+
+
+@pytest.mark.parametrize("tag,raw,expected", [
+    (native_snmp._TAG_OCTET_STRING, " abc \0", "abc"),
+    (native_snmp._TAG_OCTET_STRING, "\x00\x12yb\xf9@", "\x00\x12yb\xf9@"),
+    (native_snmp._TAG_INTEGER, "\xff", "-1"),
+    (native_snmp._TAG_COUNTER32, "\xff\xff\xff\xff", "4294967295"),
+    (native_snmp._TAG_IP_ADDRESS, "\xc3\xda\xfe\x61", "195.218.254.97"),
+    (native_snmp._TAG_OID, "\x2b\x06\x01", ".1.3.6.1"),
+])
+def test_format_value(tag, raw, expected):
+    assert native_snmp._format_value(tag, raw) == expected
+
+
+@pytest.mark.parametrize("bulk,v2c", [(True, False), (False, True), (False, False)])
+@pytest.mark.parametrize("oid", [
+    ".1.3.6.1.2.1.1",
+    ".1.3.6.1.2.1.2.2.1.6",
+    ".1.3.6.1.2.1.4.21.1.1",
+    ".1.3.6.1.6.3",
+    ".1.3.6.1.2.1.99",
+])
+def test_walk_equals_stored_walk(monkeypatch, agent, oid, bulk, v2c):
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", WALK_DIR)
+    snmp_config = _snmp_config(agent, is_bulkwalk_host=bulk, is_snmpv2or3_without_bulkwalk_host=v2c)
+
+    expected = snmp.StoredWalkSNMPBackend().walk(snmp_config, oid)
+    assert native_snmp.NativeSNMPBackend().walk(snmp_config, oid) == expected
+
+
+def test_walk_columns_with_few_requests(agent):
+    snmp_config = _snmp_config(agent, bulk_walk_size_of=5)
+    columns = [".1.3.6.1.2.1.2.2.1.%d" % c for c in range(1, 11)]
+
+    rows = native_snmp.NativeSNMPBackend().walk_columns(snmp_config, columns)
+
+    assert [len(r) for r in rows] == [2] * 10
+    assert rows[1] == [(".1.3.6.1.2.1.2.2.1.2.1", "lo"), (".1.3.6.1.2.1.2.2.1.2.2", "eth0")]
+    # All columns are requested with a single GETBULK
+    assert agent.requests == [(native_snmp._PDU_GETBULK, columns)]
+
+
+def test_walk_scalar_oid(agent):
+    snmp_config = _snmp_config(agent)
+    assert native_snmp.NativeSNMPBackend().walk(snmp_config, ".1.3.6.1.2.1.1.5.0") == [
+        (".1.3.6.1.2.1.1.5.0", "new system name"),
+    ]
+
+
+def test_get(agent):
+    backend = native_snmp.NativeSNMPBackend()
+    snmp_config = _snmp_config(agent)
+    assert backend.get(snmp_config, ".1.3.6.1.2.1.1.5.0") == "new system name"
+    assert backend.get(snmp_config, ".1.3.6.1.2.1.1.9.1.*") == ".1.3.6.1.6.3.10.3.1.1"
+    assert backend.get(snmp_config, ".1.3.6.1.2.1.2.2.1.6.2") == "00 12 79 62 F9 40 "
+    assert backend.get(snmp_config, ".1.3.100.200.300.400") is None
+
+
+def test_lost_requests_are_repeated(agent):
+    agent.drop_requests = 1
+    snmp_config = _snmp_config(agent)
+    assert native_snmp.NativeSNMPBackend().get(snmp_config,
+                                               ".1.3.6.1.2.1.1.5.0") == "new system name"
+    assert len(agent.requests) == 2
+
+
+def test_timeout(agent):
+    snmp_config = _snmp_config(agent, credentials="dingdong")
+    with pytest.raises(MKSNMPError, match="Timeout: No Response from"):
+        native_snmp.NativeSNMPBackend().walk(snmp_config, ".1.3.6.1.2.1.1")
+    assert native_snmp.NativeSNMPBackend().get(snmp_config, ".1.3.6.1.2.1.1.5.0") is None
+
+
+def test_get_snmp_table(agent):
+    table = snmp.get_snmp_table(
+        _snmp_config(agent),
+        check_plugin_name=None,
+        oid_info=(".1.3.6.1.2.1.2.2.1", ["1", "2", "3", "6", snmp_utils.OID_END]),
+        use_snmpwalk_cache=False)
+
+    assert table == [
+        [u"1", u"lo", u"24", u"", u"1"],
+        [u"2", u"eth0", u"6", u"\x00\x12yb\xf9@", u"2"],
+    ]
+    assert len(agent.requests) == 1
+
+
+def test_backend_factory(agent):
+    snmp_config = _snmp_config(agent)
+    assert isinstance(
+        snmp.SNMPBackendFactory.factory(snmp_config, enforce_stored_walks=False),
+        native_snmp.NativeSNMPBackend)
+
+    # SNMPv3 is not supported by the native backend
+    snmp_config = _snmp_config(agent, credentials=("noAuthNoPriv", "user"))
+    assert not isinstance(
+        snmp.SNMPBackendFactory.factory(snmp_config, enforce_stored_walks=False),
+        native_snmp.NativeSNMPBackend)
@@ -5,6 +5,7 @@ from testlib.base import Scenario
 
 import cmk_base.config as config
 import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
 
 
 @pytest.mark.parametrize(
@@ -38,3 +39,72 @@ def test_is_bulkwalk_host(monkeypatch):
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config("abc").snmp_config("").is_bulkwalk_host is False
     assert config_cache.get_host_config("localhost").snmp_config("").is_bulkwalk_host is True
+
+
+class _CountingWalkBackend(snmp_utils.ABCSNMPBackend):
+    def __init__(self, rows):
+        super(_CountingWalkBackend, self).__init__()
+        self.rows = rows
+        self.walked = []
+
+    def get(self, snmp_config, oid, context_name=None):
+        return None
+
+    def walk(self, snmp_config, oid, check_plugin_name=None, table_base_oid=None,
+             context_name=None):
+        self.walked.append(oid)
+        return [(o, v) for o, v in self.rows if o.startswith(oid + ".")]
+
+
+@pytest.fixture()
+def counting_backend(monkeypatch):
+    backend = _CountingWalkBackend([
+        (".1.3.6.1.2.1.2.2.1.1.1", "1"),
+        (".1.3.6.1.2.1.2.2.1.1.2", "2"),
+        (".1.3.6.1.2.1.2.2.1.2.1", "lo"),
+        (".1.3.6.1.2.1.2.2.1.2.2", "eth0"),
+        (".1.3.6.1.2.1.2.2.1.3.1", "24"),
+        (".1.3.6.1.2.1.2.2.1.3.2", "6"),
+    ])
+    monkeypatch.setattr(snmp.SNMPBackendFactory, "factory",
+                        staticmethod(lambda snmp_config, enforce_stored_walks: backend))
+    snmp.cleanup_host_caches()
+    yield backend
+    snmp.cleanup_host_caches()
+
+
+@pytest.fixture()
+def snmp_config(monkeypatch):
+    config_cache = Scenario().add_host("localhost").apply(monkeypatch)
+    return config_cache.get_host_config("localhost").snmp_config("127.0.0.1")
+
+
+def test_subtree_cache_answers_columns_of_walked_subtree(counting_backend, snmp_config):
+    assert snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2.2.1", [""]),
+                               False) == [[u"1"], [u"2"], [u"lo"], [u"eth0"], [u"24"], [u"6"]]
+    assert counting_backend.walked == [".1.3.6.1.2.1.2.2.1"]
+
+    assert snmp.get_snmp_table(snmp_config, "if64", (".1.3.6.1.2.1.2.2.1", ["2", "3"]),
+                               False) == [[u"lo", u"24"], [u"eth0", u"6"]]
+    assert snmp.get_snmp_table(snmp_config, "if64", (".1.3.6.1.2.1.2.2.1.3", ["1"]),
+                               False) == [[u"24"]]
+    assert counting_backend.walked == [".1.3.6.1.2.1.2.2.1"]
+    assert snmp._g_subtree_cache_stats == {"hits": 3, "misses": 1}
+
+
+def test_subtree_cache_walks_outermost_subtree_once(counting_backend, snmp_config):
+    snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2", ["2.1.2", "", "2.1.3"]), False)
+    assert counting_backend.walked == [".1.3.6.1.2.1.2"]
+
+
+def test_subtree_cache_does_not_answer_parent_subtrees(counting_backend, snmp_config):
+    snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2.2.1", ["2"]), False)
+    snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2.2", ["1"]), False)
+    assert counting_backend.walked == [".1.3.6.1.2.1.2.2.1.2", ".1.3.6.1.2.1.2.2.1"]
+
+
+def test_subtree_cache_is_cleaned_up(counting_backend, snmp_config):
+    snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2.2.1", ["2"]), False)
+    snmp.cleanup_host_caches()
+    snmp.get_snmp_table(snmp_config, "if", (".1.3.6.1.2.1.2.2.1", ["2"]), False)
+    assert counting_backend.walked == [".1.3.6.1.2.1.2.2.1.2"] * 2
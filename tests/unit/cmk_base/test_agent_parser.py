@@ -0,0 +1,150 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import pytest  # type: ignore
+from testlib.base import Scenario
+
+import cmk_base.config as config
+from cmk_base.data_sources.agent_parser import AgentOutputParser, AgentSectionContent
+from cmk_base.data_sources.host_sections import LazySections
+
+
+@pytest.fixture()
+def parser(monkeypatch):
+    Scenario().add_host("heute").apply(monkeypatch)
+    monkeypatch.setattr(config, "fallback_agent_output_encoding", "latin-1")
+    return AgentOutputParser("heute")
+
+
+def test_parse_sections(parser):
+    host_sections = parser.parse("\n".join([
+        "garbage before first section",
+        "<<<check_mk>>>",
+        "Version: 1.6.0",
+        "  AgentOS: linux \r",
+        "",
+        "<<<empty>>>",
+        "<<<df>>>",
+        "/dev/sda1 ext4 100 50 50 50% /",
+    ]))
+
+    assert isinstance(host_sections.sections, LazySections)
+    assert sorted(host_sections.sections.keys()) == ["check_mk", "df", "empty"]
+    assert host_sections.sections == {
+        "check_mk": [[u"Version:", u"1.6.0"], [u"AgentOS:", u"linux"]],
+        "empty": [],
+        "df": [[u"/dev/sda1", u"ext4", u"100", u"50", u"50", u"50%", u"/"]],
+    }
+    assert host_sections.piggybacked_raw_data == {}
+    assert host_sections.persisted_sections == {}
+
+
+def test_parse_section_options(parser):
+    host_sections = parser.parse("\n".join([
+        "<<<sep:sep(124)>>>",
+        " a b|c ",
+        "<<<nostrip:nostrip:sep(59)>>>",
+        "  a;b  \r",
+        " \t ",
+        "<<<cached:cached(100,60)>>>",
+        "x",
+    ]))
+
+    assert host_sections.sections == {
+        "sep": [[u"a b", u"c"]],
+        "nostrip": [[u"  a", u"b  "]],
+        "cached": [[u"x"]],
+    }
+    assert host_sections.cache_info == {"cached": (100, 60)}
+
+
+def test_parse_repeated_section(parser):
+    host_sections = parser.parse("\n".join([
+        "<<<local>>>",
+        "0 a - A",
+        "<<<other>>>",
+        "x",
+        "<<<local:sep(124)>>>",
+        "0 b|B",
+        "<<<local>>>",
+        "0 c - C",
+    ]))
+
+    assert host_sections.sections["local"] == [
+        [u"0", u"a", u"-", u"A"],
+        [u"0 b", u"B"],
+        [u"0", u"c", u"-", u"C"],
+    ]
+
+
+def test_parse_encoding(parser):
+    host_sections = parser.parse("\n".join([
+        "<<<utf8>>>",
+        "\xc3\xa4 \xc2\xa0",
+        "<<<latin1:encoding(latin-1)>>>",
+        "\xe4",
+        "<<<mixed>>>",
+        "\xc3\xa4",
+        "\xe4",
+    ]))
+
+    assert host_sections.sections == {
+        "utf8": [[u"ä"]],
+        "latin1": [[u"ä"]],
+        # The line that is no valid UTF-8 is decoded with the fallback encoding
+        "mixed": [[u"ä"], [u"ä"]],
+    }
+
+
+def test_parse_piggyback(parser):
+    host_sections = parser.parse("\n".join([
+        "<<<local>>>",
+        "0 a - A",
+        "<<<<other host>>>>",
+        "<<<local>>>",
+        "",
+        "0 b - B\r",
+        "<<<<heute>>>>",
+        "0 c - C",
+        "<<<<other host>>>>",
+        "<<<df>>>",
+        "<<<<>>>>",
+        "0 d - D",
+        "",
+    ]))
+
+    assert host_sections.sections == {
+        "local": [
+            [u"0", u"a", u"-", u"A"],
+            [u"0", u"c", u"-", u"C"],
+            [u"0", u"d", u"-", u"D"],
+        ],
+    }
+    assert host_sections.piggybacked_raw_data == {
+        "other_host": ["<<<local>>>", "", "0 b - B", "<<<df>>>"],
+    }
+
+
+def test_parse_persisted_section(parser, monkeypatch):
+    monkeypatch.setattr("time.time", lambda: 1000)
+    host_sections = parser.parse("\n".join([
+        "<<<persisted:persist(1100)>>>",
+        "a",
+        "<<<other>>>",
+        "<<<persisted>>>",
+        "b",
+    ]))
+
+    assert host_sections.cache_info == {"persisted": (1000, 100)}
+    assert host_sections.persisted_sections == {
+        "persisted": (1000, 1100, [[u"a"], [u"b"]]),
+    }
+
+
+def test_section_content_is_materialized_on_access(parser):
+    host_sections = parser.parse("<<<a>>>\nx\n<<<b>>>\ny")
+
+    assert isinstance(dict.__getitem__(host_sections.sections, "a"), AgentSectionContent)
+    assert host_sections.sections.get("a") == [[u"x"]]
+    assert dict.__getitem__(host_sections.sections, "a") == [[u"x"]]
+    assert isinstance(dict.__getitem__(host_sections.sections, "b"), AgentSectionContent)
@@ -1614,3 +1614,53 @@ def test_host_config_service_level(monkeypatch, hostname, result):
     )
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config(hostname).service_level == result
+
+
+def _ruleset_match_index_scenario(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    ts = Scenario()
+    for num in range(100):
+        ts.add_host("host%02d" % num, tags={"criticality": "test" if num % 3 else "prod"})
+    return ts
+
+
+RULE_CONDITIONS = [
+    ([], config.ALL_HOSTS),
+    (["test"], config.ALL_HOSTS),
+    (["!test"], config.ALL_HOSTS),
+    ([], ["host01", "host02"]),
+    (["prod"], ["~host1", "!host20"]),
+]
+
+
+def test_ruleset_match_index(monkeypatch, tmp_path):
+    ts = _ruleset_match_index_scenario(monkeypatch, tmp_path)
+    config_cache = ts.apply(monkeypatch)
+    expected = [
+        config_cache.all_matching_hosts(tags, hostlist, False) for tags, hostlist in RULE_CONDITIONS
+    ]
+    config_cache.save_ruleset_match_index()
+
+    config_cache = ts.apply(monkeypatch)
+    config_cache.set_all_processed_hosts(["host10", "host11", "host12"])
+    assert config_cache.all_matching_hosts(["prod"], ["~host1", "!host20"], False) == \
+        set(["host12"])
+
+    # The matches are taken from the index without computing them
+    config_cache = ts.apply(monkeypatch)
+    monkeypatch.setattr(config, "in_extraconf_hostlist", lambda *args: 1 / 0)
+    monkeypatch.setattr(config_cache, "_match_hosts_by_tags", lambda *args: 1 / 0)
+    assert [
+        config_cache.all_matching_hosts(tags, hostlist, False) for tags, hostlist in RULE_CONDITIONS
+    ] == expected
+
+
+def test_ruleset_match_index_invalidated(monkeypatch, tmp_path):
+    ts = _ruleset_match_index_scenario(monkeypatch, tmp_path)
+    config_cache = ts.apply(monkeypatch)
+    config_cache.all_matching_hosts(["test"], config.ALL_HOSTS, False)
+    config_cache.save_ruleset_match_index()
+
+    ts.add_host("host100", tags={"criticality": "test"})
+    config_cache = ts.apply(monkeypatch)
+    assert "host100" in config_cache.all_matching_hosts(["test"], config.ALL_HOSTS, False)
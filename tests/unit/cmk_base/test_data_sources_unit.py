@@ -1,8 +1,11 @@
 # pylint: disable=redefined-outer-name
 
+import threading
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+from cmk.utils.exceptions import MKTimeout
+
 import cmk_base
 import cmk_base.caching
 import cmk_base.data_sources
@@ -225,3 +228,116 @@ def test_data_sources_of_hosts(monkeypatch, hostname, settings):
     sources = cmk_base.data_sources.DataSources(hostname, "127.0.0.1")
     source_names = [s.__class__.__name__ for s in sources.get_data_sources()]
     assert settings["sources"] == source_names, "Wrong sources for %s" % hostname
+
+
+def test_fetch_in_background_supported(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    assert cmk_base.data_sources.tcp.TCPDataSource("hostname",
+                                                   "127.0.0.1").fetch_in_background_supported()
+    assert not cmk_base.data_sources.snmp.SNMPDataSource(
+        "hostname", "127.0.0.1").fetch_in_background_supported()
+
+
+def test_run_fetched_in_background(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_max_cachefile_age(0)
+    monkeypatch.setattr(source, "_execute", lambda: "<<<check_mk>>>\nVersion: 1.6.0\n")
+    monkeypatch.setattr(source, "_write_cache_file", lambda raw_data: None)
+
+    source.start_fetching_in_background()
+    host_sections = source.run()
+
+    assert source.exception() is None
+    assert host_sections.sections == {"check_mk": [[u"Version:", u"1.6.0"]]}
+    # The fetched data is only used once
+    assert source._fetch_result is None
+    assert source._fetch_thread is None
+
+
+def test_run_fetched_in_background_exception(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_max_cachefile_age(0)
+
+    def _execute():
+        raise cmk_base.exceptions.MKAgentError("Communication failed")
+
+    monkeypatch.setattr(source, "_execute", _execute)
+
+    source.start_fetching_in_background()
+    source.run()
+
+    assert isinstance(source.exception(), cmk_base.exceptions.MKAgentError)
+    assert "Communication failed" in str(source.exception())
+
+
+def test_run_fetched_in_background_writes_cache_file_in_main_thread(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_max_cachefile_age(0)
+    monkeypatch.setattr(source, "_execute", lambda: "<<<check_mk>>>\n")
+    written = []
+    monkeypatch.setattr(source, "_write_cache_file", written.append)
+
+    source.start_fetching_in_background()
+    source._fetch_thread.join()
+    assert written == []
+
+    source.run()
+    assert written == ["<<<check_mk>>>\n"]
+
+
+def test_timed_out_background_fetching_is_discarded(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_max_cachefile_age(0)
+    proceed = threading.Event()
+
+    def _execute():
+        proceed.wait()
+        return "<<<check_mk>>>\n"
+
+    monkeypatch.setattr(source, "_execute", _execute)
+    written = []
+    monkeypatch.setattr(source, "_write_cache_file", written.append)
+
+    def _join(timeout=None):
+        raise MKTimeout()
+
+    source.start_fetching_in_background()
+    thread = source._fetch_thread
+    thread.join = _join
+    with pytest.raises(MKTimeout):
+        source._wait_for_background_fetching()
+    assert not source.is_fetching_in_background()
+
+    proceed.set()
+    del thread.join
+    thread.join()
+    assert source._fetch_result is None
+    assert written == []
+
+
+def test_get_host_sections_fetches_concurrently(monkeypatch):
+    ts = Scenario().add_host("ds-host", tags={"agent": "all-agents", "snmp_ds": "snmp-v2"})
+    ts.set_ruleset("datasource_programs", [
+        ('echo 1', [], ['ds-host'], {}),
+    ])
+    ts.set_option("special_agents", {"jolokia": [({}, [], ['ds-host'], {}),]})
+    ts.set_option("fetch_data_sources_concurrently", True)
+    ts.apply(monkeypatch)
+
+    started = []
+    monkeypatch.setattr(cmk_base.data_sources.abstract.DataSource,
+                        "start_fetching_in_background", lambda self: started.append(self.id()))
+    monkeypatch.setattr(cmk_base.data_sources.abstract.DataSource,
+                        "run", lambda self: cmk_base.data_sources.host_sections.HostSections())
+    monkeypatch.setattr(cmk_base.piggyback, "store_piggyback_raw_data", lambda *args: None)
+
+    sources = cmk_base.data_sources.DataSources("ds-host", "127.0.0.1")
+    assert [s.id() for s in sources.get_data_sources()] == [
+        "agent", "snmp", "special_jolokia", "piggyback"
+    ]
+    sources.get_host_sections()
+    assert started == ["agent", "special_jolokia"]
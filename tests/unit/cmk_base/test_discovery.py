@@ -0,0 +1,129 @@
+# pylint: disable=redefined-outer-name
+
+import os
+import time
+import pytest  # type: ignore
+from testlib.base import Scenario
+
+import cmk.utils.paths
+import cmk_base.config as config
+import cmk_base.discovery as discovery
+
+
+def _job(hostname, suffix):
+    if hostname == "failing":
+        raise Exception("Failed: %s" % hostname)
+    if hostname == "hanging":
+        time.sleep(5)
+    if hostname == "dying":
+        os._exit(1)
+    if hostname == "unpicklable":
+        return lambda: None
+    return hostname + suffix
+
+
+@pytest.fixture()
+def worker_pool(monkeypatch):
+    monkeypatch.setattr(config, "discovery_max_num_processes", 3)
+    monkeypatch.setattr(config, "discovery_host_timeout", 1)
+
+
+def test_run_in_worker_pool(worker_pool):
+    hostnames = ["host%d" % num for num in range(10)] + ["failing", "hanging"]
+    results = {}
+    for hostname, result, error, phase_times in discovery._run_in_worker_pool(
+            _job, hostnames, ("-x",)):
+        results[hostname] = (result, error)
+        assert "busy" in phase_times
+
+    assert sorted(results) == sorted(hostnames)
+    assert results["host3"] == ("host3-x", None)
+    assert results["failing"] == (None, "Failed: failing")
+    assert results["hanging"] == (None, "Timed out after 1 seconds")
+
+
+def test_run_in_worker_pool_failing_workers(worker_pool, monkeypatch):
+    monkeypatch.setattr(discovery, "_worker_timeout_margin", 1)
+    hostnames = ["dying", "unpicklable"] + ["host%d" % num for num in range(5)]
+    results = {}
+    for hostname, result, error, _phase_times in discovery._run_in_worker_pool(
+            _job, hostnames, ("-x",)):
+        results[hostname] = (result, error)
+
+    assert sorted(results) == sorted(hostnames)
+    assert results["host4"] == ("host4-x", None)
+    assert results["dying"] == (None, "Worker process did not finish within 2 seconds")
+    assert results["unpicklable"][0] is None
+    assert "pickl" in results["unpicklable"][1]
+
+
+def test_run_in_worker_pool_deadline(worker_pool):
+    hostnames = ["host%d" % num for num in range(10)]
+    results = list(discovery._run_in_worker_pool(_job, hostnames, ("",), deadline=time.time()))
+    assert results == []
+
+
+def test_run_in_worker_pool_deadline_limits_jobs(worker_pool, monkeypatch):
+    monkeypatch.setattr(config, "discovery_host_timeout", 10)
+    start_time = time.time()
+    results = list(discovery._run_in_worker_pool(_job, ["hanging"], ("",), deadline=start_time + 1))
+    assert results[0][:3] == ("hanging", None, "Timed out after 1 seconds")
+    assert time.time() - start_time < 5
+
+
+def _discover_autochecks_of(hostname, check_plugin_names, only_new, use_caches):
+    if hostname == "failing":
+        raise Exception("Failed")
+    return [("df", u"/%s" % hostname, "{}")], {"df": 1}, 1
+
+
+def test_do_discovery_in_worker_pool(worker_pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path))
+    monkeypatch.setattr(discovery, "_discover_autochecks_of", _discover_autochecks_of)
+
+    discovery._do_discovery_in_worker_pool(["host1", "host2", "failing"], None, True, True)
+
+    assert discovery.parse_autochecks_file("host1") == [("df", u"/host1", "{}")]
+    assert discovery.parse_autochecks_file("host2") == [("df", u"/host2", "{}")]
+    assert not (tmp_path / "failing.mk").exists()
+
+
+def test_discover_marked_host_in_worker_does_not_write_autochecks(monkeypatch, tmp_path):
+    Scenario().add_host("heute").apply(monkeypatch)
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path))
+    old_items = [("df", u"/", "{}")]
+    discovery._save_autochecks_file("heute", old_items)
+    new_items = {("df", u"/"): "{'levels': (80.0, 90.0)}"}
+
+    def discover_autochecks_on_host(config_cache, host_config, mode, *args, **kwargs):
+        assert mode == "refresh"
+        return {}, new_items, None
+
+    monkeypatch.setattr(discovery, "_get_rediscovery_options", lambda h: ("refresh", False, None))
+    monkeypatch.setattr(discovery, "_discover_autochecks_on_host", discover_autochecks_on_host)
+
+    assert discovery._discover_marked_host_in_worker("heute") == ({}, new_items, None)
+    assert discovery.parse_autochecks_file("heute") == old_items
+
+
+def test_save_discovered_autochecks(monkeypatch, tmp_path):
+    Scenario().add_host("heute").apply(monkeypatch)
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path))
+    discovery._save_autochecks_file("heute", [("df", u"/", "{}")])
+    host_config = config.get_config_cache().get_host_config("heute")
+    assert discovery._count_own_autochecks(host_config) == 1
+
+    # Only the "refresh" mode replaces the parameters of the kept autochecks
+    discovery._save_discovered_autochecks(host_config, "new", {("df", u"/"): "{'new': 1}"})
+    assert discovery.parse_autochecks_file("heute") == [("df", u"/", "{}")]
+    discovery._save_discovered_autochecks(host_config, "refresh", {("df", u"/"): "{'new': 1}"})
+    assert discovery.parse_autochecks_file("heute") == [("df", u"/", "{'new': 1}")]
+
+
+def test_discovery_throughput():
+    throughput = discovery.DiscoveryThroughput()
+    throughput.add(None, {"agent": [0, 0, 0, 0, 2.0], "busy": [0, 0, 0, 0, 1.0], "TOTAL": []})
+    throughput.add("error", {"snmp": [0, 0, 0, 0, 4.0], "TOTAL": []})
+    assert throughput._num_hosts == 2
+    assert throughput._num_failed == 1
+    assert throughput._phase_durations == {"agent": 2.0, "busy": 1.0, "snmp": 4.0}
@@ -91,3 +91,62 @@ def test_get_section_content(monkeypatch, hostname, nodes, host_entries, cluster
         hostname, "127.0.0.1", "check_plugin_name", False, service_description=service_descr)
     assert expected_result == section_content,\
            "Section content: Expected '%s' but got '%s'" % (expected_result, section_content)
+
+
+class _CountingSectionContent(host_sections.LazySectionContent):
+    def __init__(self, section_content):
+        super(_CountingSectionContent, self).__init__()
+        self._section_content = section_content
+        self.materialized = 0
+
+    def materialize(self):
+        self.materialized += 1
+        return list(self._section_content)
+
+
+def test_update_keeps_sections_lazy():
+    lazy_node1 = _CountingSectionContent(node1)
+    lazy_node2 = _CountingSectionContent(node2)
+
+    merged = host_sections.HostSections()
+    merged.update(host_sections.HostSections(sections={"a": lazy_node1, "b": [["b"]]}))
+    merged.update(host_sections.HostSections(sections={"a": lazy_node2, "b": [["c"]]}))
+
+    assert sorted(merged.sections.keys()) == ["a", "b"]
+    assert lazy_node1.materialized == lazy_node2.materialized == 0
+
+    assert merged.sections["a"] == node1 + node2
+    assert merged.sections["a"] == node1 + node2
+    assert lazy_node1.materialized == lazy_node2.materialized == 1
+    assert merged.sections["b"] == [["b"], ["c"]]
+
+
+def test_update_does_not_share_section_content():
+    source = host_sections.HostSections(sections={"a": [["x"]]})
+    merged = host_sections.HostSections()
+    merged.update(source)
+    merged.update(host_sections.HostSections(sections={"a": [["y"]]}))
+
+    assert source.sections["a"] == [["x"]]
+    assert merged.sections["a"] == [["x"], ["y"]]
+
+
+def test_get_section_content_materializes_requested_section_only(monkeypatch):
+    ts = Scenario().add_host("heute")
+    ts.apply(monkeypatch)
+
+    lazy_a = _CountingSectionContent(node1)
+    lazy_b = _CountingSectionContent(node2)
+
+    multi_host_sections = host_sections.MultiHostSections()
+    multi_host_sections.add_or_get_host_sections("heute", "127.0.0.1").update(
+        host_sections.HostSections(sections={
+            "a": lazy_a,
+            "b": lazy_b
+        }))
+
+    for _unused in range(2):
+        assert multi_host_sections.get_section_content("heute", "127.0.0.1", "a", False) == node1
+
+    assert lazy_a.materialized == 1
+    assert lazy_b.materialized == 0
@@ -0,0 +1,164 @@
+# pylint: disable=redefined-outer-name
+
+import marshal
+import os
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk.utils.store as store
+import cmk_base.item_state as item_state
+import cmk_base.item_state_binary as item_state_binary
+from cmk_base.item_state_binary import BinaryItemStateFile
+
+
+@pytest.fixture(autouse=True)
+def counters_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "counters_dir", str(tmp_path / "counters"))
+    monkeypatch.setattr(cmk.utils.paths, "counters_binary_dir", str(tmp_path / "counters_binary"))
+    monkeypatch.setattr(item_state, "_storage", "binary")
+    yield
+    item_state._cached_item_states.reset()
+
+
+def _path(hostname):
+    return os.path.join(cmk.utils.paths.counters_binary_dir, hostname)
+
+
+ITEM_STATES = {
+    ("if", "1", "in"): (1000.5, 123456789012),
+    ("if", "1", "out"): (1000.5, 1.5),
+    ("if", u"\xe4", "x"): (1000, 12),
+    ("df", "/", "trend"): (1000, 0.5),
+    ("logwatch", None, "x"): {
+        "a": [1, 2, (3, "b")]
+    },
+    ("x", None, "y"): (1.0, 2.0, 3.0),
+    ("x", None, "z"): (True, 2.0),
+}
+
+
+def test_load_missing_file():
+    assert BinaryItemStateFile("heute").load() == {}
+
+
+def test_save_and_load():
+    BinaryItemStateFile("heute").save(ITEM_STATES, ITEM_STATES.keys())
+    item_states = BinaryItemStateFile("heute").load()
+
+    assert item_states == ITEM_STATES
+    for key, value in ITEM_STATES.iteritems():
+        assert type(item_states[key]) is type(value)
+        if isinstance(value, tuple):
+            assert [type(v) for v in item_states[key]] == [type(v) for v in value]
+
+
+def test_counters_are_updated_in_place():
+    binary_file = BinaryItemStateFile("heute")
+    binary_file.save(ITEM_STATES, ITEM_STATES.keys())
+    size = os.path.getsize(_path("heute"))
+
+    item_states = dict(ITEM_STATES)
+    item_states[("if", "1", "in")] = (1060.5, 123456789999)
+    item_states[("df", "/", "trend")] = (1060.0, 1)
+    binary_file.save(item_states, [("if", "1", "in"), ("df", "/", "trend")])
+
+    assert os.path.getsize(_path("heute")) == size
+    assert BinaryItemStateFile("heute").load() == item_states
+
+
+def test_counters_with_changed_key_length_are_appended():
+    # Marshal refers to repeated interned strings of the key instead of repeating them
+    key = ("".join(["if_", "name"]), None, "".join(["if_", "name"]))
+    interned_key = (intern("if_name"), None, intern("if_name"))
+    assert len(marshal.dumps(key)) != len(marshal.dumps(interned_key))
+
+    binary_file = BinaryItemStateFile("heute")
+    binary_file.save({key: (1000.0, 1), "b": (1000.0, 2)}, [key, "b"])
+    binary_file.save({interned_key: (1060.0, 3), "b": (1000.0, 2)}, [interned_key])
+
+    assert BinaryItemStateFile("heute").load() == {key: (1060.0, 3), "b": (1000.0, 2)}
+
+
+def test_changed_and_removed_values():
+    binary_file = BinaryItemStateFile("heute")
+    binary_file.save(ITEM_STATES, ITEM_STATES.keys())
+
+    item_states = dict(ITEM_STATES)
+    item_states[("logwatch", None, "x")] = {}
+    item_states[("if", "1", "out")] = "no counter"
+    del item_states[("if", "1", "in")]
+    binary_file.save(item_states, [("logwatch", None, "x"), ("if", "1", "out"), ("if", "1", "in")])
+
+    assert BinaryItemStateFile("heute").load() == item_states
+
+
+def test_concurrent_writers_keep_other_keys():
+    binary_file1 = BinaryItemStateFile("heute")
+    binary_file1.load()
+    binary_file2 = BinaryItemStateFile("heute")
+    binary_file2.load()
+
+    binary_file1.save({"a": "x" * 100}, ["a"])
+    binary_file2.save({"b": (1.0, 2)}, ["b"])
+    binary_file1.save({"a": (3.0, 4)}, ["a"])
+
+    assert BinaryItemStateFile("heute").load() == {"a": (3.0, 4), "b": (1.0, 2)}
+
+
+def test_interrupted_write_is_ignored():
+    BinaryItemStateFile("heute").save({"a": (1.0, 2)}, ["a"])
+    with open(_path("heute"), "ab") as f:
+        f.write("\x01\x05")
+
+    binary_file = BinaryItemStateFile("heute")
+    assert binary_file.load() == {"a": (1.0, 2)}
+    binary_file.save({"a": (1.0, 2), "b": [1]}, ["b"])
+    assert BinaryItemStateFile("heute").load() == {"a": (1.0, 2), "b": [1]}
+
+
+def test_compaction(monkeypatch):
+    monkeypatch.setattr(item_state_binary, "_COMPACTION_MIN_SIZE", 0)
+    binary_file = BinaryItemStateFile("heute")
+    for num in range(10):
+        binary_file.save({"a": [num], "b": (1.0, num)}, ["a", "b"])
+
+    assert BinaryItemStateFile("heute").load() == {"a": [9], "b": (1.0, 9)}
+    assert os.path.getsize(_path("heute")) < 100
+
+
+def test_get_rate_with_binary_storage():
+    item_state.load("heute")
+    item_state.set_item_state_prefix("if", "1")
+    with pytest.raises(item_state.MKCounterWrapped):
+        item_state.get_rate("in", 1000, 100, onwrap=item_state.RAISE)
+    item_state.save("heute")
+
+    item_state.load("heute")
+    item_state.set_item_state_prefix("if", "1")
+    assert item_state.get_rate("in", 1010, 200) == 10.0
+    item_state.cleanup_item_states()
+    item_state.save("heute")
+
+    item_state.load("heute")
+    assert item_state.get_all_item_states() == {}
+
+
+def test_migrate_storage():
+    store.makedirs(cmk.utils.paths.counters_dir)
+    store.save_data_to_file(os.path.join(cmk.utils.paths.counters_dir, "heute"), ITEM_STATES)
+
+    assert item_state.migrate_storage() == 1
+    assert os.listdir(cmk.utils.paths.counters_dir) == []
+    item_state.load("heute")
+    assert item_state.get_all_item_states() == ITEM_STATES
+
+    item_state.set_storage("text")
+    assert item_state.migrate_storage() == 1
+    assert os.listdir(cmk.utils.paths.counters_binary_dir) == []
+    item_state.load("heute")
+    assert item_state.get_all_item_states() == ITEM_STATES
+
+
+def test_set_invalid_storage():
+    with pytest.raises(Exception):
+        item_state.set_storage("nix")
@@ -0,0 +1,210 @@
+# pylint: disable=redefined-outer-name
+
+import os
+import time
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk_base.piggyback as piggyback
+import cmk_base.piggyback_index as piggyback_index
+from cmk_base.config import piggyback_max_cachefile_age
+
+
+@pytest.fixture(autouse=True)
+def indexed_storage(monkeypatch):
+    for path in [cmk.utils.paths.piggyback_dir, cmk.utils.paths.piggyback_source_dir]:
+        path.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
+        for f in path.glob("*/*"):
+            f.unlink()
+        for f in path.glob("*"):
+            if f.is_file():
+                f.unlink()
+
+    piggyback_index.export_piggyback_files()  # Cleans up the index
+    for f in cmk.utils.paths.piggyback_dir.glob("*/*"):
+        f.unlink()
+
+    monkeypatch.setattr(piggyback, "_storage", "indexed")
+    yield
+    piggyback_index._cached_index = None
+
+
+def _get(hostname):
+    return sorted(piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age, hostname))
+
+
+def _forget_loaded_index():
+    piggyback_index._cached_index = None
+    for mapped in piggyback_index._mapped_segments.values():
+        mapped.close()
+    piggyback_index._mapped_segments.clear()
+
+
+def test_set_invalid_storage():
+    with pytest.raises(Exception):
+        piggyback.set_storage("nix")
+
+
+def test_get_piggyback_raw_data_no_data():
+    assert _get("nohost") == []
+    assert piggyback.has_piggyback_raw_data(piggyback_max_cachefile_age, "nohost") is False
+
+
+def test_store_and_get_piggyback_raw_data():
+    piggyback.store_piggyback_raw_data("source1", {
+        "pig1": [u"<<<check_mk>>>", u"lala"],
+        "pig2": [u"<<<check_mk>>>", u"lulu"],
+    })
+    piggyback.store_piggyback_raw_data("source2", {"pig1": ["<<<check_mk>>>", "lolo"]})
+
+    assert _get("pig1") == [
+        ("source1", "<<<check_mk>>>\nlala\n"),
+        ("source2", "<<<check_mk>>>\nlolo\n"),
+    ]
+    assert _get("pig2") == [("source1", "<<<check_mk>>>\nlulu\n")]
+    assert piggyback.has_piggyback_raw_data(piggyback_max_cachefile_age, "pig2") is True
+
+    # Other processes read the same data from the index files
+    _forget_loaded_index()
+    assert _get("pig2") == [("source1", "<<<check_mk>>>\nlulu\n")]
+
+
+def test_get_piggyback_raw_data_not_updated_by_source():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"], "pig2": ["b"]})
+    piggyback.store_piggyback_raw_data("source1", {"pig2": ["c"]})
+
+    assert _get("pig1") == []
+    assert _get("pig2") == [("source1", "c\n")]
+    assert piggyback.has_piggyback_raw_data(piggyback_max_cachefile_age, "pig1") is False
+
+
+def test_get_piggyback_raw_data_source_not_sending_anymore():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    piggyback.store_piggyback_raw_data("source1", {})
+    assert _get("pig1") == []
+
+
+def _file_stat(path):
+    st = os.stat(str(path))
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+def _index_dir_stats():
+    return sorted((p.name, _file_stat(p)) for p in cmk.utils.paths.piggyback_index_dir.iterdir())
+
+
+def test_store_no_data_leaves_index_untouched():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    index_dir_stats = _index_dir_stats()
+
+    piggyback.store_piggyback_raw_data("source2", {})
+
+    assert _index_dir_stats() == index_dir_stats
+    assert _get("pig1") == [("source1", "a\n")]
+
+
+def test_changes_are_appended_to_the_journal():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    index = piggyback_index.load_index()
+    index_stat = _file_stat(piggyback_index._index_path())
+
+    piggyback.store_piggyback_raw_data("source2", {"pig1": ["b"]})
+    piggyback.store_piggyback_raw_data("source1", {"pig2": ["c"]})
+
+    assert _file_stat(piggyback_index._index_path()) == index_stat
+    # Readers only apply the new records of the journal to the loaded index
+    assert piggyback_index.load_index() is index
+    assert _get("pig1") == [("source2", "b\n")]
+    assert _get("pig2") == [("source1", "c\n")]
+
+    _forget_loaded_index()
+    assert _get("pig1") == [("source2", "b\n")]
+    assert _get("pig2") == [("source1", "c\n")]
+
+
+def test_journal_is_merged_into_index(monkeypatch):
+    monkeypatch.setattr(piggyback_index, "_JOURNAL_MIN_SIZE", 0)
+    monkeypatch.setattr(piggyback_index, "_JOURNAL_FACTOR", 0)
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    piggyback.store_piggyback_raw_data("source2", {"pig1": ["b"]})
+
+    index = piggyback_index.load_index()
+    assert not os.path.exists(piggyback_index._journal_path(index.journal_id - 1))
+    assert index.journal_offset == 0
+
+    _forget_loaded_index()
+    assert _get("pig1") == [("source1", "a\n"), ("source2", "b\n")]
+
+
+def test_get_piggyback_raw_data_too_old(monkeypatch):
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + piggyback_max_cachefile_age + 10)
+    assert _get("pig1") == []
+
+
+def test_remove_source_status_file():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    assert piggyback.remove_source_status_file("source1") is True
+    assert piggyback.remove_source_status_file("source1") is False
+    assert _get("pig1") == []
+
+
+def test_segments_are_compacted(monkeypatch):
+    monkeypatch.setattr(piggyback_index, "_COMPACTION_MIN_SIZE", 0)
+    for num in range(5):
+        piggyback.store_piggyback_raw_data("source1", {"pig1": ["a%d" % num]})
+
+    assert _get("pig1") == [("source1", "a4\n")]
+    segment_name = piggyback_index.load_index().segments["source1"][0]
+    assert os.path.getsize(piggyback_index._segment_path(segment_name)) == 3
+
+
+def test_cleanup_piggyback_files(monkeypatch):
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"], "pig2": ["b"]})
+    piggyback.store_piggyback_raw_data("source1", {"pig2": ["c"]})
+    piggyback.store_piggyback_raw_data("source2", {"pig3": ["d"]})
+
+    now = time.time()
+    piggyback_index.cleanup_piggyback_files(piggyback_max_cachefile_age)
+    index = piggyback_index.load_index()
+    assert sorted(index.hosts) == ["pig2", "pig3"]
+
+    monkeypatch.setattr(time, "time", lambda: now + piggyback_max_cachefile_age + 10)
+    piggyback.cleanup_piggyback_files(piggyback_max_cachefile_age)
+    index = piggyback_index.load_index()
+    assert index.hosts == {}
+    assert index.sources == {}
+    assert os.listdir(piggyback_index._segment_dir()) == []
+
+
+def test_migrate_storage():
+    monkeypatch_storage = piggyback._storage
+    piggyback.set_storage("files")
+    try:
+        piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"], "pig2": ["b"]})
+        piggyback.store_piggyback_raw_data("source2", {"pig1": ["c"]})
+        expected = _get("pig1")
+
+        piggyback.set_storage("indexed")
+        assert piggyback.migrate_storage() == 3
+        assert _get("pig1") == expected
+        assert list(cmk.utils.paths.piggyback_dir.glob("*/*")) == []
+
+        piggyback.set_storage("files")
+        assert piggyback.migrate_storage() == 3
+        assert _get("pig1") == expected
+        assert _get("pig2") == [("source1", "b\n")]
+    finally:
+        piggyback.set_storage(monkeypatch_storage)
+
+
+def test_segment_names_are_not_reused():
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["a"]})
+    segment_name = piggyback_index.load_index().segments["source1"][0]
+
+    assert piggyback.remove_source_status_file("source1") is True
+    piggyback.store_piggyback_raw_data("source1", {"pig1": ["b"]})
+
+    assert piggyback_index.load_index().segments["source1"][0] != segment_name
+    assert _get("pig1") == [("source1", "b\n")]
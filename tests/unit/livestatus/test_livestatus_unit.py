@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import errno
+import json
 import socket
 import ssl
+import threading
+import time
 from contextlib import closing
 try:
     from pathlib import Path  # Py3 first
@@ -190,3 +193,229 @@ def test_create_socket_no_cert(tmpdir):
         "unix:/tmp/xyz", tls=True, verify=True, ca_file_path="%s/z.pem" % tmpdir)
     with pytest.raises(livestatus.MKLivestatusConfigError, match="unknown error"):
         live._create_socket(socket.AF_INET)
+
+
+class FakeLivestatusServer(threading.Thread):
+    """Answers each query with the given rows or a row containing the first line
+    of the query, keeps connections alive"""
+
+    def __init__(self, path):
+        super(FakeLivestatusServer, self).__init__()
+        self.daemon = True
+        self.connects = 0
+        self.close_after_response = False
+        self.hang_after_first_row = False
+        self.rows = None
+        self._sock = socket.socket(socket.AF_UNIX)
+        self._sock.bind("%s" % path)
+        self._sock.listen(5)
+
+    def run(self):
+        while True:
+            conn = self._sock.accept()[0]
+            self.connects += 1
+            handler = threading.Thread(target=self._handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def _handle(self, conn):
+        with closing(conn.makefile("rwb")) as f:
+            lines = []
+            for line in iter(f.readline, b""):
+                if line != b"\n":
+                    lines.append(line.rstrip(b"\n").decode("utf-8"))
+                    continue
+                data = self._response(lines)
+                f.write(b"%3d %11d\n" % (200, len(data)))
+                if self.hang_after_first_row:
+                    f.write(data[:data.index(b"\n") + 1])
+                    f.flush()
+                    time.sleep(3600)
+                f.write(data)
+                f.flush()
+                lines = []
+                if self.close_after_response:
+                    break
+        conn.close()
+
+    def _response(self, lines):
+        rows = [lines[:1]] if self.rows is None else self.rows
+        # Rendered like livestatus does it: One row per line
+        if "OutputFormat: json" in lines:
+            rendered = [json.dumps(row, separators=(",", ":")) for row in rows]
+        else:
+            rendered = [repr(row) for row in rows]
+        return ("[" + ",\n".join(rendered) + "]\n").encode("utf-8")
+
+
+@pytest.fixture()
+def livestatus_server(tmpdir):
+    server = FakeLivestatusServer("%s/live" % tmpdir)
+    server.start()
+    yield server
+    livestatus.connection_pool.clear()
+
+
+def _pooled_connection(tmpdir):
+    return livestatus.SingleSiteConnection("unix:%s/live" % tmpdir, pooled=True)
+
+
+def test_pooled_connections_reuse_socket(livestatus_server, tmpdir):
+    for nr in range(3):
+        assert _pooled_connection(tmpdir).query("GET hosts %d" % nr) == [[u"GET hosts %d" % nr]]
+    assert livestatus_server.connects == 1
+
+    # A second connection is needed while the first socket is in use
+    live1, live2 = _pooled_connection(tmpdir), _pooled_connection(tmpdir)
+    live1.send_query("GET hosts 1")
+    assert live2.query("GET hosts 2") == [[u"GET hosts 2"]]
+    assert live1.recv_response() == [[u"GET hosts 1"]]
+    assert livestatus_server.connects == 2
+
+
+def test_pooled_connection_closed_by_server(livestatus_server, tmpdir):
+    livestatus_server.close_after_response = True
+    assert _pooled_connection(tmpdir).query("GET hosts") == [[u"GET hosts"]]
+    time.sleep(0.1)  # Let the server close the connection
+
+    assert _pooled_connection(tmpdir).query("GET services") == [[u"GET services"]]
+    assert livestatus_server.connects == 2
+
+
+def test_connection_pool_limits_idle_sockets(livestatus_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(livestatus.connection_pool, "max_idle_per_site", 1)
+    connections = [_pooled_connection(tmpdir) for _nr in range(3)]
+    for live in connections:
+        live.send_query("GET hosts")
+    for live in connections:
+        live.recv_response()
+    assert len(livestatus.connection_pool._idle["unix:%s/live" % tmpdir]) == 1
+
+    monkeypatch.setattr(livestatus.connection_pool, "max_idle_time", -1)
+    assert livestatus.connection_pool.get("unix:%s/live" % tmpdir) is None
+
+
+def test_connection_pool_closes_expired_sockets(livestatus_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(livestatus.connection_pool, "max_idle_time", 0.1)
+    assert _pooled_connection(tmpdir).query("GET hosts") == [[u"GET hosts"]]
+    assert len(livestatus.connection_pool._idle["unix:%s/live" % tmpdir]) == 1
+
+    # Without using the pool again
+    time.sleep(0.5)
+    assert livestatus.connection_pool._idle["unix:%s/live" % tmpdir] == []
+
+
+def test_query_pipelined(livestatus_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(livestatus.SingleSiteConnection, "max_pipeline_length", 2)
+    live = _pooled_connection(tmpdir)
+    live.set_prepend_site(True)
+
+    queries = ["GET hosts %d" % nr for nr in range(5)]
+    assert live.query_pipelined(queries) == [[[u"", query]] for query in queries]
+    assert live.query_pipelined([]) == []
+    assert livestatus_server.connects == 1
+
+
+@pytest.mark.parametrize("output_format", ["python", "json"])
+@pytest.mark.parametrize("rows", [
+    [],
+    [[u"x"]],
+    [[[1, 2], u"a\nb],\n[", 1], [u"\xe4", 2.5, None], [[], u"", -1]],
+])
+def test_query_rows(livestatus_server, tmpdir, output_format, rows):
+    livestatus_server.rows = rows
+    live = _pooled_connection(tmpdir)
+    live.set_output_format(output_format)
+
+    assert list(live.query_rows("GET hosts")) == rows
+    assert live.query("GET hosts") == rows
+    live.set_prepend_site(True)
+    assert list(live.query_rows("GET hosts")) == [[u""] + row for row in rows]
+    assert livestatus_server.connects == 1
+
+
+def test_query_rows_stopped_early(livestatus_server, tmpdir):
+    livestatus_server.rows = [[nr] for nr in range(10000)]
+    live = _pooled_connection(tmpdir)
+
+    for row in live.query_rows("GET hosts"):
+        assert row == [0]
+        break
+    assert live.query("GET hosts") == livestatus_server.rows
+    assert livestatus_server.connects == 2
+
+
+def test_multisite_query_rows(livestatus_server, tmpdir):
+    livestatus_server.rows = [[u"a"], [u"b"]]
+    live = livestatus.MultiSiteConnection({
+        "site1": {
+            "socket": "unix:%s/live" % tmpdir
+        },
+        "site2": {
+            "socket": "unix:%s/nothing" % tmpdir
+        },
+        "site3": {
+            "socket": "unix:%s/live" % tmpdir
+        },
+    })
+    live.set_output_format("json")
+    live.set_prepend_site(True)
+
+    assert sorted(live.query_rows("GET hosts")) == [
+        [u"site1", u"a"],
+        [u"site1", u"b"],
+        [u"site3", u"a"],
+        [u"site3", u"b"],
+    ]
+    assert live.dead_sites().keys() == ["site2"]
+
+
+def test_multisite_query_rows_with_hanging_site(livestatus_server, tmpdir):
+    hanging_server = FakeLivestatusServer("%s/hanging" % tmpdir)
+    hanging_server.hang_after_first_row = True
+    hanging_server.start()
+    livestatus_server.rows = hanging_server.rows = [[u"a"], [u"b"]]
+    live = livestatus.MultiSiteConnection({
+        "site1": {
+            "socket": "unix:%s/hanging" % tmpdir
+        },
+        "site2": {
+            "socket": "unix:%s/live" % tmpdir
+        },
+    })
+    live.set_prepend_site(True)
+    live.set_query_timeout(0.5)
+
+    # The rows of the hanging site received before its deadline are returned
+    before = time.time()
+    assert sorted(live.query_rows("GET hosts")) == [
+        [u"site1", u"a"],
+        [u"site2", u"a"],
+        [u"site2", u"b"],
+    ]
+    assert time.time() - before < 5
+    assert live.dead_sites().keys() == ["site1"]
+    assert "Timeout" in str(live.dead_sites()["site1"]["exception"])
+    assert [c[0] for c in live.connections] == ["site2"]
+
+
+def test_multisite_query_parallel(livestatus_server, tmpdir):
+    hanging_server = FakeLivestatusServer("%s/hanging" % tmpdir)
+    hanging_server.hang_after_first_row = True
+    hanging_server.rows = [[u"a"], [u"b"]]
+    hanging_server.start()
+    sites = {"site%d" % nr: {"socket": "unix:%s/live" % tmpdir} for nr in range(1, 5)}
+    sites["site3"] = {"socket": "unix:%s/hanging" % tmpdir, "query_timeout": 0.5}
+    live = livestatus.MultiSiteConnection(sites)
+    live.set_prepend_site(True)
+
+    # The rows are returned in the order of the sites, a site which does not
+    # answer completely in time does not contribute any rows
+    expected = [[c[0], u"GET hosts"] for c in live.connections if c[0] != "site3"]
+    assert live.query_parallel("GET hosts") == expected
+    assert live.dead_sites().keys() == ["site3"]
+
+
+def test_invalid_output_format():
+    with pytest.raises(livestatus.MKLivestatusConfigError, match="Invalid output format"):
+        livestatus.SingleSiteConnection("unix:/tmp/xyz").set_output_format("csv")